@@ -15,7 +15,6 @@ from django.http import JsonResponse
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.db import transaction
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
@@ -38,90 +37,106 @@ except ImportError:
     OpenApiTypes = None
     DRF_SPECTACULAR_AVAILABLE = False
 
-from apps.billing.models import UsageQuota, UserSubscription
+from apps.billing.entitlements import get_entitlements
+from apps.billing.quotas import consume_quota, quota_usage, row_defaults
+from apps.core.async_views import AsyncAPIView
+from apps.core.event_loop import run_sync
+from apps.core.idempotency import IdempotencyStore
 from apps.ai_services.rag_service import get_rag_agent, OptimizationRequest
 from apps.templates.models import PromptOptimization
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Completed and in-flight results, keyed by request_idempotency_key
+optimize_replays = IdempotencyStore("rag_agent")
+answer_replays = IdempotencyStore("rag_answer")
+
 
 class CreditTracker:
-    """Handles credit tracking and budget enforcement"""
-    
+    """
+    Handles credit tracking and budget enforcement.
+
+    Subscription state comes from the entitlement cache and usage from the
+    daily quota counters, so reserve_credits checks and consumes in one
+    counter round trip.
+    """
+
+    @staticmethod
+    def _result(subscription, has_credits, available, requested):
+        return {
+            "has_credits": has_credits,
+            "available": available,
+            "requested": requested,
+            "subscription_active": subscription["is_active"],
+            "is_trial": subscription["is_trial"],
+        }
+
     @staticmethod
     def check_user_credits(user, requested_credits: int) -> Dict[str, Any]:
-        """Check if user has sufficient credits"""
-        try:
-            subscription = UserSubscription.objects.get(user=user)
-            
-            # Get today's quota
-            today = timezone.now().date()
-            quota, created = UsageQuota.objects.get_or_create(
-                user=user,
-                quota_type='daily',
-                quota_date=today,
-                defaults={
-                    'template_limit': subscription.plan.daily_template_limit,
-                    'copy_limit': subscription.plan.daily_copy_limit,
-                    'api_call_limit': 50  # Default API limit
-                }
-            )
-            
-            # Check if user can afford the request
-            available_credits = quota.api_call_limit - quota.api_calls_made
-            
-            return {
-                "has_credits": available_credits >= requested_credits,
-                "available": available_credits,
-                "requested": requested_credits,
-                "subscription_active": subscription.is_active,
-                "is_trial": subscription.is_trial
-            }
-            
-        except UserSubscription.DoesNotExist:
+        """Check if user has sufficient credits, without consuming them"""
+        subscription = get_entitlements(user.pk)["subscription"]
+        if not subscription["exists"]:
             # No subscription - trial user
-            return {
-                "has_credits": requested_credits <= 3,  # Trial limit
-                "available": 3,
-                "requested": requested_credits,
-                "subscription_active": False,
-                "is_trial": True
-            }
-    
+            limit = subscription["api_call_limit"]
+            return CreditTracker._result(subscription, requested_credits <= limit, limit, requested_credits)
+
+        available = subscription["api_call_limit"] - quota_usage(user.pk)
+        return CreditTracker._result(
+            subscription, available >= requested_credits, available, requested_credits
+        )
+
+    @staticmethod
+    def reserve_credits(user, requested_credits: int) -> Dict[str, Any]:
+        """
+        Check and consume credits in one step; has_credits tells whether they
+        were consumed. Give them back with refund_credits if the call fails.
+        """
+        subscription = get_entitlements(user.pk)["subscription"]
+        defaults = row_defaults(subscription)
+        if not subscription["exists"]:
+            # Trial users are limited per request, not per day
+            limit = subscription["api_call_limit"]
+            has_credits = requested_credits <= limit
+            if has_credits:
+                consume_quota(user.pk, requested_credits, defaults=defaults)
+            return CreditTracker._result(subscription, has_credits, limit, requested_credits)
+
+        limit = subscription["api_call_limit"]
+        if consume_quota(user.pk, requested_credits, limit=limit, defaults=defaults):
+            return CreditTracker._result(subscription, True, None, requested_credits)
+        return CreditTracker._result(
+            subscription, False, limit - quota_usage(user.pk), requested_credits
+        )
+
     @staticmethod
-    def consume_credits(user, credits_used: int, tokens_in: int, tokens_out: int) -> bool:
-        """Consume credits and track usage"""
+    def refund_credits(user, credits: int) -> None:
+        """Give back credits taken by reserve_credits"""
         try:
-            with transaction.atomic():
-                today = timezone.now().date()
-                quota, created = UsageQuota.objects.get_or_create(
-                    user=user,
-                    quota_type='daily',
-                    quota_date=today,
-                    defaults={
-                        'template_limit': 50,
-                        'copy_limit': 30,
-                        'api_call_limit': 50
-                    }
-                )
-                
-                # Update usage
-                quota.api_calls_made += credits_used
-                quota.save()
-                
-                # Create optimization record
-                PromptOptimization.objects.create(
-                    user=user,
-                    original_prompt="[RAG Agent Request]",
-                    optimized_prompt="[RAG Agent Response]",
-                    processing_time_ms=0,  # Will be updated
-                    tokens_used=tokens_in + tokens_out,
-                    credits_consumed=credits_used
-                )
-                
-                return True
-                
+            consume_quota(user.pk, -credits)
+        except Exception as e:
+            logger.error(f"Failed to refund credits: {e}")
+
+    @staticmethod
+    def consume_credits(user, credits_used: int, tokens_in: int, tokens_out: int, reserved: bool = False) -> bool:
+        """Consume credits (unless already reserved) and track usage"""
+        try:
+            if not reserved:
+                subscription = get_entitlements(user.pk)["subscription"]
+                consume_quota(user.pk, credits_used, defaults=row_defaults(subscription))
+
+            # Create optimization record
+            PromptOptimization.objects.create(
+                user=user,
+                original_prompt="[RAG Agent Request]",
+                optimized_prompt="[RAG Agent Response]",
+                processing_time_ms=0,  # Will be updated
+                tokens_used=tokens_in + tokens_out,
+                credits_consumed=credits_used
+            )
+
+            return True
+
         except Exception as e:
             logger.error(f"Failed to consume credits: {e}")
             return False
@@ -133,6 +148,19 @@ def generate_idempotency_key(session_id: str, content: str) -> str:
     return hashlib.sha256(combined.encode()).hexdigest()[:16]
 
 
+def request_idempotency_key(request, session_id: str, content: str) -> str:
+    """Per-user replay key: the Idempotency-Key header if sent, else session_id + content"""
+    header = request.headers.get("Idempotency-Key")
+    key = generate_idempotency_key("header", header) if header else generate_idempotency_key(session_id or "", content)
+    return f"{request.user.id}:{key}"
+
+
+def replay_response(payload: Dict[str, Any]) -> Response:
+    response = Response(payload)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
 @extend_schema(
     summary="Optimize prompt using RAG agent",
     description="""
@@ -249,8 +277,15 @@ def optimize_prompt(request):
         credits_needed = 1 if mode == 'fast' else 3
         credits_needed = min(credits_needed, max_credits)
         
-        # Check credits
-        credit_check = CreditTracker.check_user_credits(request.user, credits_needed)
+        # Duplicates of a completed request replay it without being charged
+        idempotency_key = request_idempotency_key(request, session_id, f"{mode}:{original}")
+        cached_result = optimize_replays.get(idempotency_key)
+        if cached_result is not None:
+            logger.info(f"Returning cached result for {idempotency_key}")
+            return replay_response(cached_result)
+        
+        # Check and reserve credits in one step; early exits below refund them
+        credit_check = CreditTracker.reserve_credits(request.user, credits_needed)
         if not credit_check["has_credits"]:
             return Response({
                 "error": "Insufficient credits",
@@ -259,19 +294,11 @@ def optimize_prompt(request):
                 "subscription_active": credit_check["subscription_active"]
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
         
-        # Check for idempotent request
-        idempotency_key = generate_idempotency_key(session_id, original)
-        cache_key = f"rag_agent:{request.user.id}:{idempotency_key}"
-        
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            logger.info(f"Returning cached result for {idempotency_key}")
-            return Response(cached_result)
-        
         # Rate limiting
         rate_key = f"rag_rate:{request.user.id}"
         rate_count = cache.get(rate_key, 0)
         if rate_count >= 20:  # 20 requests per hour
+            CreditTracker.refund_credits(request.user, credits_needed)
             return Response(
                 {"error": "Rate limit exceeded"},
                 status=status.HTTP_429_TOO_MANY_REQUESTS
@@ -290,55 +317,53 @@ def optimize_prompt(request):
             }
         )
         
-        # Get RAG agent and optimize
-        rag_agent = get_rag_agent()
+        def optimize():
+            result = run_sync(get_rag_agent().optimize_prompt(opt_request))
+            
+            return {
+                "optimized": result.optimized,
+                "citations": [
+                    {
+                        "id": c.id,
+                        "title": c.title,
+                        "source": c.source,
+                        "score": c.score
+                    }
+                    for c in result.citations
+                ],
+                "diff_summary": result.diff_summary,
+                "usage": result.usage,
+                "run_id": result.run_id,
+                "processing_time_ms": int((time.time() - start_time) * 1000)
+            }
         
+        # Concurrent duplicates wait for this run and share its result
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(rag_agent.optimize_prompt(opt_request))
-            finally:
-                loop.close()
+            response_data, replayed = optimize_replays.execute(idempotency_key, optimize)
         except Exception as e:
             logger.error(f"RAG optimization failed: {e}")
+            CreditTracker.refund_credits(request.user, credits_needed)
             return Response(
                 {"error": "Optimization service unavailable"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
         
+        if replayed:
+            CreditTracker.refund_credits(request.user, credits_needed)
+            return replay_response(response_data)
+        
         # Consume credits
         success = CreditTracker.consume_credits(
             request.user,
             credits_needed,
-            result.usage["tokens_in"],
-            result.usage["tokens_out"]
+            response_data["usage"]["tokens_in"],
+            response_data["usage"]["tokens_out"],
+            reserved=True
         )
         
         if not success:
             logger.error("Failed to consume credits after optimization")
         
-        # Prepare response
-        response_data = {
-            "optimized": result.optimized,
-            "citations": [
-                {
-                    "id": c.id,
-                    "title": c.title,
-                    "source": c.source,
-                    "score": c.score
-                }
-                for c in result.citations
-            ],
-            "diff_summary": result.diff_summary,
-            "usage": result.usage,
-            "run_id": result.run_id,
-            "processing_time_ms": int((time.time() - start_time) * 1000)
-        }
-        
-        # Cache result for idempotency
-        cache.set(cache_key, response_data, timeout=3600)  # 1 hour
-        
         # Update rate limiting
         cache.set(rate_key, rate_count + 1, timeout=3600)
         
@@ -403,15 +428,12 @@ def agent_stats(request):
         
         # Get user usage stats
         today = timezone.now().date()
-        user_quota = UsageQuota.objects.filter(
-            user=request.user,
-            quota_date=today
-        ).first()
+        subscription = get_entitlements(request.user.pk)["subscription"]
         
         user_usage = {
-            "api_calls_today": user_quota.api_calls_made if user_quota else 0,
-            "api_limit": user_quota.api_call_limit if user_quota else 0,
-            "subscription_active": hasattr(request.user, 'subscription') and request.user.subscription.is_active
+            "api_calls_today": quota_usage(request.user.pk, today),
+            "api_limit": subscription["api_call_limit"] if subscription["exists"] else 0,
+            "subscription_active": subscription["is_active"]
         }
         
         # System metrics
@@ -439,27 +461,16 @@ def agent_stats(request):
         )
 
 
-@extend_schema(
-    summary="Retrieve documents for a query",
-    description="Return top-k retrieved documents from the RAG index",
-    responses={200: OpenApiTypes.OBJECT} if DRF_SPECTACULAR_AVAILABLE else None
-)
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def rag_retrieve(request):
+def _retrieve(request):
+    """Shared body of rag_retrieve and RAGRetrieveView"""
     try:
         query = request.data.get('query')
         top_k = int(request.data.get('top_k', 5))
         if not query:
             return Response({"error": "query is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        from apps.ai_services.rag_service import get_document_indexer
-        indexer = get_document_indexer()
-        retriever = indexer
-        # Use RAGRetriever via get_rag_agent for consistent interface
-        from apps.ai_services.rag_service import RAGRetriever
-        retr = RAGRetriever()
-        docs = retr.retrieve_documents(query, top_k=top_k)
+        # The process-wide agent's retriever keeps the index loaded
+        docs = get_rag_agent().retriever.retrieve_documents(query, top_k=top_k)
 
         results = [
             {
@@ -478,6 +489,60 @@ def rag_retrieve(request):
         return Response({'error': 'internal_error', 'details': str(e)}, status=500)
 
 
+async def _answer(request):
+    """Shared body of rag_answer and RAGAnswerView"""
+    try:
+        query = request.data.get('query')
+        if not query:
+            return Response({"error": "query is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        session_id = request.data.get('session_id') or ''
+
+        async def answer():
+            # use get_rag_agent to perform retrieval + optimization/answer
+            opt_request = OptimizationRequest(session_id=session_id or str(uuid.uuid4()), original=query, mode='fast')
+            # The first call builds the agent and loads its index; keep that off the event loop
+            agent = await asyncio.to_thread(get_rag_agent)
+            result = await agent.optimize_prompt(opt_request)
+
+            return {
+                'optimized': result.optimized,
+                'citations': [
+                    {
+                        'id': c.id,
+                        'title': c.title,
+                        'source': c.source,
+                        'score': c.score,
+                        'snippet': c.snippet
+                    } for c in result.citations
+                ],
+                'diff_summary': result.diff_summary,
+                'usage': result.usage,
+                'run_id': result.run_id
+            }
+
+        idempotency_key = request_idempotency_key(request, session_id, query)
+        response_data, replayed = await answer_replays.aexecute(idempotency_key, answer)
+        if replayed:
+            return replay_response(response_data)
+
+        return Response(response_data)
+    except Exception as e:
+        logger.error(f"rag_answer error: {e}")
+        return Response({'error': 'internal_error', 'details': str(e)}, status=500)
+
+
+@extend_schema(
+    summary="Retrieve documents for a query",
+    description="Return top-k retrieved documents from the RAG index",
+    responses={200: OpenApiTypes.OBJECT} if DRF_SPECTACULAR_AVAILABLE else None
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def rag_retrieve(request):
+    return _retrieve(request)
+
+
 @extend_schema(
     summary="RAG answer endpoint",
     description="Run retrieval and generate an answer (non-streaming).",
@@ -486,40 +551,31 @@ def rag_retrieve(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def rag_answer(request):
-    try:
-        query = request.data.get('query')
-        if not query:
-            return Response({"error": "query is required"}, status=status.HTTP_400_BAD_REQUEST)
+    # WSGI: run on the process-wide loop instead of a new loop per request
+    return run_sync(_answer(request))
 
-        # use get_rag_agent to perform retrieval + optimization/answer
-        rag_agent = get_rag_agent()
-        opt_request = OptimizationRequest(session_id=str(uuid.uuid4()), original=query, mode='fast')
 
-        # Run optimization / answer
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(rag_agent.optimize_prompt(opt_request))
-        finally:
-            loop.close()
-
-        response_data = {
-            'optimized': result.optimized,
-            'citations': [
-                {
-                    'id': c.id,
-                    'title': c.title,
-                    'source': c.source,
-                    'score': c.score,
-                    'snippet': c.snippet
-                } for c in result.citations
-            ],
-            'diff_summary': result.diff_summary,
-            'usage': result.usage,
-            'run_id': result.run_id
-        }
+class RAGRetrieveView(AsyncAPIView):
+    """rag_retrieve for ASGI; retrieval runs in a thread, off the event loop"""
+    permission_classes = [IsAuthenticated]
 
-        return Response(response_data)
-    except Exception as e:
-        logger.error(f"rag_answer error: {e}")
-        return Response({'error': 'internal_error', 'details': str(e)}, status=500)
\ No newline at end of file
+    @extend_schema(
+        summary="Retrieve documents for a query",
+        description="Return top-k retrieved documents from the RAG index",
+        responses={200: OpenApiTypes.OBJECT} if DRF_SPECTACULAR_AVAILABLE else None
+    )
+    async def post(self, request):
+        return await asyncio.to_thread(_retrieve, request)
+
+
+class RAGAnswerView(AsyncAPIView):
+    """rag_answer for ASGI, awaiting the agent on the server's event loop"""
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="RAG answer endpoint",
+        description="Run retrieval and generate an answer (non-streaming).",
+        responses={200: OpenApiTypes.OBJECT} if DRF_SPECTACULAR_AVAILABLE else None
+    )
+    async def post(self, request):
+        return await _answer(request)
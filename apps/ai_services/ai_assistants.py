@@ -12,12 +12,13 @@ from django.conf import settings
 from django.utils import timezone
 
 from .models import AssistantMessage, AssistantThread
-from apps.templates.deepseek_integration import create_deepseek_llm
-from apps.templates.openrouter_integration import create_openrouter_llm
-try:
-    from tavily import TavilyClient
-except ImportError:  # pragma: no cover
-    TavilyClient = None
+from apps.core.lazy_imports import lazy_import, modules_available
+
+# The app imports this registry at startup; the LLM clients (and httpx behind
+# them) are imported when an assistant first needs one
+create_deepseek_llm = lazy_import('apps.templates.deepseek_integration', 'create_deepseek_llm')
+create_openrouter_llm = lazy_import('apps.templates.openrouter_integration', 'create_openrouter_llm')
+TavilyClient = lazy_import('tavily', 'TavilyClient') if modules_available('tavily') else None
 
 logger = logging.getLogger(__name__)
 
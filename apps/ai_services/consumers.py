@@ -6,6 +6,7 @@ import json
 import time
 import asyncio
 import logging
+import uuid
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
@@ -15,13 +16,19 @@ from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
+from apps.core.timer_wheel import HeartbeatMixin
+from apps.core.ws_protocol import FrameProtocolMixin
 from .ai_assistants import AssistantRegistry
+from .live_search import LiveSearch, SearchHit, run_search
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class AIProcessingConsumer(AsyncWebsocketConsumer):
+class AIProcessingConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time AI processing operations"""
+
+    heartbeat_interval = 30
+    idle_timeout = 300
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -417,14 +424,18 @@ class AIProcessingConsumer(AsyncWebsocketConsumer):
         }))
 
 
-class SearchConsumer(AsyncWebsocketConsumer):
+class SearchConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time search with AI enhancement"""
+
+    heartbeat_interval = 30
+    idle_timeout = 300
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.session_id = None
         self.user = None
         self.room_group_name = None
+        self.live_search = LiveSearch(self._search_prompts, self._send_real_time_results)
         
     async def connect(self):
         """Handle search WebSocket connection"""
@@ -459,6 +470,7 @@ class SearchConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Handle search WebSocket disconnection"""
+        self.live_search.cancel()
         if self.room_group_name:
             await self.channel_layer.group_discard(
                 self.room_group_name,
@@ -485,67 +497,92 @@ class SearchConsumer(AsyncWebsocketConsumer):
             await self._send_error("Search processing failed")
     
     async def handle_real_time_search(self, data: Dict[str, Any]):
-        """Handle real-time search as user types"""
-        try:
-            query = data.get('query', '').strip()
-            
-            if len(query) < 2:
-                return  # Too short for meaningful search
-            
-            # Import here to avoid circular imports
-            from apps.templates.search_services import search_service
-            
-            # Perform search
-            results, metrics = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                search_service.search_prompts,
-                query, None, None, 10, self.session_id
+        """Handle real-time search as user types (debounced, see LiveSearch)"""
+        self.live_search.submit(data.get('query', '').strip())
+    
+    def _search_prompts(self, query: str, max_results: int) -> List[SearchHit]:
+        """Blocking prompt search, run in the live search pool"""
+        # Import here to avoid circular imports
+        from apps.templates.search_services import search_service
+        
+        results, metrics = search_service.search_prompts(query, None, None, max_results, self.session_id)
+        return [
+            SearchHit(
+                id=str(result.prompt.id),
+                title=result.prompt.title,
+                content=result.prompt.content,
+                score=result.score,
+                category=result.prompt.category,
+                tags=list(result.prompt.tags or [])
             )
-            
-            # Format for WebSocket
-            formatted_results = [
-                {
-                    'id': str(result.prompt.id),
-                    'title': result.prompt.title,
-                    'content': result.prompt.content[:300],
-                    'score': result.score,
-                    'category': result.prompt.category
-                }
-                for result in results[:5]  # Limit for real-time
-            ]
-            
-            await self.send(text_data=json.dumps({
-                'type': 'real_time_results',
-                'query': query,
-                'results': formatted_results,
-                'search_time_ms': metrics.get('total_time_ms', 0),
-                'timestamp': timezone.now().isoformat()
-            }))
-            
-        except Exception as e:
-            logger.error(f"Real-time search error: {e}")
+            for result in results
+        ]
+    
+    async def _send_real_time_results(self, query: str, hits: List[SearchHit], meta: Dict[str, Any]):
+        await self.send(text_data=json.dumps({
+            'type': 'real_time_results',
+            'query': query,
+            'results': [hit.as_dict() for hit in hits[:5]],  # Limit for real-time
+            'source': meta['source'],
+            'search_time_ms': meta['latency_ms'],
+            'timestamp': timezone.now().isoformat()
+        }))
     
     async def handle_semantic_search(self, data: Dict[str, Any]):
-        """Handle AI-powered semantic search"""
+        """Handle AI-powered semantic search ('hybrid' fuses it with full-text search)"""
         try:
             query = data.get('query', '').strip()
+            mode = data.get('mode', 'hybrid')
             
             if not query:
                 await self._send_error("Query required for semantic search")
                 return
+            if mode not in ('semantic', 'hybrid'):
+                await self._send_error("Search mode must be 'semantic' or 'hybrid'")
+                return
+            try:
+                limit = max(1, min(int(data.get('limit', 10)), 50))
+            except (TypeError, ValueError):
+                await self._send_error("Limit must be an integer")
+                return
             
-            # Placeholder for semantic search implementation
-            # In production, this would use embeddings and vector similarity
+            start_time = time.time()
+            hits = await run_search(self._semantic_search, query, mode, limit)
             
             await self.send(text_data=json.dumps({
                 'type': 'semantic_results',
                 'query': query,
-                'message': 'Semantic search will be available with vector embeddings',
+                'mode': mode,
+                'results': [hit.as_dict() for hit in hits],
+                'search_time_ms': int((time.time() - start_time) * 1000),
                 'timestamp': timezone.now().isoformat()
             }))
             
         except Exception as e:
             logger.error(f"Semantic search error: {e}")
+            await self._send_error("Semantic search failed")
+    
+    def _semantic_search(self, query: str, mode: str, limit: int) -> List[SearchHit]:
+        """Blocking semantic search, run in the live search pool"""
+        from apps.templates.models import PromptLibrary
+        from apps.templates.semantic_search import semantic_search
+        
+        ranked = semantic_search(query, limit, mode)
+        prompts = PromptLibrary.objects.filter(is_active=True).in_bulk([prompt_id for prompt_id, _ in ranked])
+        hits = []
+        for prompt_id, score in ranked:
+            # in_bulk keys are UUIDs
+            prompt = prompts.get(uuid.UUID(prompt_id))
+            if prompt is not None:
+                hits.append(SearchHit(
+                    id=prompt_id,
+                    title=prompt.title,
+                    content=prompt.content,
+                    score=round(score, 4),
+                    category=prompt.category,
+                    tags=list(prompt.tags or [])
+                ))
+        return hits
     
     async def handle_get_suggestions(self, data: Dict[str, Any]):
         """Provide search suggestions"""
@@ -570,24 +607,9 @@ class SearchConsumer(AsyncWebsocketConsumer):
     
     async def _get_search_suggestions(self, partial_query: str) -> List[str]:
         """Get search suggestions based on partial query"""
-        # Simple implementation - in production, use more sophisticated methods
-        common_searches = [
-            "write a professional email",
-            "create marketing copy",
-            "technical documentation",
-            "creative writing prompts",
-            "data analysis prompts",
-            "business proposal template",
-            "social media content",
-            "educational materials"
-        ]
+        from apps.templates.semantic_search import search_suggestions
         
-        suggestions = [
-            s for s in common_searches 
-            if partial_query.lower() in s.lower()
-        ]
-        
-        return suggestions[:5]
+        return await database_sync_to_async(search_suggestions)(partial_query, 5)
     
     async def _send_error(self, error_message: str):
         """Send error message to client"""
@@ -598,8 +620,12 @@ class SearchConsumer(AsyncWebsocketConsumer):
         }))
 
 
-class AnalyticsConsumer(AsyncWebsocketConsumer):
+class AnalyticsConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time analytics and insights"""
+
+    # Clients only listen here, so silence is not idleness
+    heartbeat_interval = 30
+    idle_timeout = None
     
     async def connect(self):
         """Handle analytics WebSocket connection"""
@@ -624,18 +650,22 @@ class AnalyticsConsumer(AsyncWebsocketConsumer):
         }))
 
 
-class AIStreamingConsumer(AsyncWebsocketConsumer):
+class AIStreamingConsumer(FrameProtocolMixin, HeartbeatMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for streaming AI responses"""
+
+    # Clients wait on long streams without sending anything
+    heartbeat_interval = 30
+    idle_timeout = None
     
     async def connect(self):
         """Handle streaming connection"""
         await self.accept()
         
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'streaming_connected',
             'message': 'AI streaming ready',
             'timestamp': timezone.now().isoformat()
-        }))
+        })
     
     async def disconnect(self, close_code):
         """Handle streaming disconnection"""
@@ -667,17 +697,20 @@ class AIStreamingConsumer(AsyncWebsocketConsumer):
         for i, part in enumerate(response_parts):
             await asyncio.sleep(0.5)  # Simulate processing delay
             
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'stream_chunk',
                 'chunk': part,
                 'chunk_index': i,
                 'is_final': i == len(response_parts) - 1,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
 
-class AssistantConsumer(AsyncWebsocketConsumer):
+class AssistantConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
     """WebSocket interface for the custom assistant registry."""
 
+    heartbeat_interval = 30
+    idle_timeout = 300
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.assistant_id: str = "deepseek_chat"
@@ -0,0 +1,167 @@
+"""
+As-you-type search for WebSocket connections.
+
+Each connection gets a `LiveSearch`. A keystroke schedules a search after a
+quiet window (DEBOUNCE_MS) and cancels the one scheduled or running before
+it, so only the query the user paused on is searched. A query equal to the
+last one searched (typing a character and deleting it again) is answered
+with the last results. Longer queries are always searched again: the
+backing search ranks full-text matches, so a query's results are not a
+subset of its prefix's.
+
+Searches run in a dedicated thread pool rather than the loop's default
+executor, behind a per-loop semaphore with one slot per worker: queries wait
+for a slot on the event loop, where a superseded query is cancelled before
+it ever reaches a thread.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIVE_SEARCH_SETTINGS = {
+    # Quiet window after the last keystroke before searching
+    'DEBOUNCE_MS': 150,
+    'MIN_QUERY_LENGTH': 2,
+    'MAX_RESULTS': 10,
+    # Threads in the search pool, and searches running at once per process
+    'WORKERS': 4,
+}
+
+
+def get_live_search_settings():
+    return {**DEFAULT_LIVE_SEARCH_SETTINGS, **getattr(settings, 'LIVE_SEARCH', {})}
+
+
+@dataclass
+class SearchHit:
+    id: str
+    title: str
+    content: str
+    score: float
+    category: str = ''
+    tags: List[str] = field(default_factory=list)
+
+    def as_dict(self, content_chars: int = 300) -> Dict:
+        return {
+            'id': self.id,
+            'title': self.title,
+            'content': self.content[:content_chars],
+            'score': self.score,
+            'category': self.category,
+        }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = weakref.WeakKeyDictionary()
+
+
+def _search_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_live_search_settings()['WORKERS'], thread_name_prefix='live-search'
+                )
+    return _executor
+
+
+def _slot() -> asyncio.Semaphore:
+    # asyncio primitives belong to one loop
+    loop = asyncio.get_running_loop()
+    if loop not in _slots:
+        _slots[loop] = asyncio.Semaphore(get_live_search_settings()['WORKERS'])
+    return _slots[loop]
+
+
+def _call_with_db(fn, *args):
+    # As database_sync_to_async does for its threads
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_search(fn, *args):
+    """Run a blocking search in the search pool once a slot is free"""
+    loop = asyncio.get_running_loop()
+    slot = _slot()
+    await slot.acquire()
+
+    def release(_):
+        # The slot is held until the thread is done, even if the caller was cancelled
+        try:
+            loop.call_soon_threadsafe(slot.release)
+        except RuntimeError:
+            pass  # Loop closed
+
+    try:
+        future = _search_executor().submit(_call_with_db, fn, *args)
+    except BaseException:
+        slot.release()
+        raise
+    future.add_done_callback(release)
+    return await asyncio.wrap_future(future)
+
+
+class LiveSearch:
+    """
+    Debounced, cancellable search for one connection. `search(query, limit)`
+    is a blocking function returning SearchHits; `send(query, hits, meta)` is
+    awaited with the results of each query that survives the quiet window.
+    """
+
+    def __init__(self, search: Callable[[str, int], List[SearchHit]],
+                 send: Callable[[str, List[SearchHit], Dict], Awaitable[None]]):
+        self.search = search
+        self.send = send
+        self._task: Optional[asyncio.Task] = None
+        self._last_query = None
+        self._last_hits: List[SearchHit] = []
+
+    def submit(self, query: str):
+        """Schedule a search for query, superseding any pending or running one"""
+        self.cancel()
+        if len(query) >= get_live_search_settings()['MIN_QUERY_LENGTH']:
+            self._task = asyncio.create_task(self._run(query, time.perf_counter()))
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def _reuse(self, query: str) -> Optional[List[SearchHit]]:
+        return self._last_hits if query == self._last_query else None
+
+    async def _run(self, query: str, submitted: float):
+        config = get_live_search_settings()
+        try:
+            await asyncio.sleep(config['DEBOUNCE_MS'] / 1000)
+
+            hits = self._reuse(query)
+            source = 'cache' if hits is not None else 'search'
+            if hits is None:
+                hits = await run_search(self.search, query, config['MAX_RESULTS'])
+            self._last_query, self._last_hits = query, hits
+
+            await self.send(query, hits, {
+                'source': source,
+                'latency_ms': int((time.perf_counter() - submitted) * 1000),
+            })
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Live search error for {query!r}: {e}")
@@ -0,0 +1,191 @@
+"""
+Async token streaming from OpenAI-compatible chat APIs (DeepSeek, OpenRouter).
+
+`StreamingLLMClient.stream_chat` posts a `stream: true` chat completion and
+yields the content deltas as they arrive over SSE. One httpx.AsyncClient is
+kept per event loop, so the persistent background loop (apps.core.event_loop)
+and the ASGI server loop each reuse their connections.
+
+`DeltaBuffer` sits between the provider and a slow client: deltas that
+arrive while the client is still sending the previous frame are coalesced
+into the next one, and reading from the provider pauses once MAX_PENDING_CHARS
+are waiting, so nothing buffers without bound.
+"""
+
+import asyncio
+import json
+import logging
+import weakref
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RAG_STREAMING_SETTINGS = {
+    # Provider to stream from: 'deepseek', 'openrouter' or '' for the first one configured
+    'PROVIDER': '',
+    # Send the running checksum and length with every Nth chunk (and the last)
+    'CHECKSUM_EVERY': 20,
+    # Characters a slow client may fall behind before the provider read pauses
+    'MAX_PENDING_CHARS': 16384,
+    'CONNECT_TIMEOUT_S': 10,
+    # Longest gap between two tokens
+    'READ_TIMEOUT_S': 60,
+}
+
+PROVIDER_SETTINGS = {
+    'deepseek': 'DEEPSEEK_CONFIG',
+    'openrouter': 'OPENROUTER_CONFIG',
+}
+
+
+def get_rag_streaming_settings():
+    return {**DEFAULT_RAG_STREAMING_SETTINGS, **getattr(settings, 'RAG_STREAMING', {})}
+
+
+class LLMStreamError(Exception):
+    """The provider rejected the request or the stream broke off"""
+
+
+@dataclass
+class StreamUsage:
+    """Token counts reported by the provider at the end of a stream, if any"""
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+
+
+class StreamingLLMClient:
+    """Streams chat completions from one OpenAI-compatible endpoint"""
+
+    def __init__(self, base_url: str, api_key: str, model: str, max_tokens: int = 1024,
+                 temperature: float = 0.7, name: str = 'llm'):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.name = name
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self) -> httpx.AsyncClient:
+        # httpx clients are bound to the loop they were first used on
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            config = get_rag_streaming_settings()
+            client = self._clients[loop] = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Accept": "text/event-stream"},
+                timeout=httpx.Timeout(config['READ_TIMEOUT_S'], connect=config['CONNECT_TIMEOUT_S']),
+            )
+        return client
+
+    async def stream_chat(self, messages: List[Dict[str, str]], usage: StreamUsage = None,
+                          **params) -> AsyncIterator[str]:
+        """Yield content deltas; `usage` is filled in from the final chunk"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            **params,
+        }
+        async with self._client().stream("POST", "/chat/completions", json=payload) as response:
+            if response.status_code != 200:
+                body = (await response.aread())[:200]
+                raise LLMStreamError(f"{self.name} returned HTTP {response.status_code}: {body!r}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed {self.name} stream line: {data[:100]}")
+                    continue
+
+                if usage is not None and chunk.get("usage"):
+                    usage.prompt_tokens = chunk["usage"].get("prompt_tokens")
+                    usage.completion_tokens = chunk["usage"].get("completion_tokens")
+                for choice in chunk.get("choices") or []:
+                    if usage is not None and choice.get("finish_reason"):
+                        usage.finish_reason = choice["finish_reason"]
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+        raise LLMStreamError(f"{self.name} stream ended without [DONE]")
+
+
+_streaming_client = None
+
+
+def get_streaming_llm_client() -> Optional[StreamingLLMClient]:
+    """The configured provider's client, or None when no API key is set"""
+    global _streaming_client
+    if _streaming_client is None:
+        provider = get_rag_streaming_settings()['PROVIDER']
+        for name in ([provider] if provider else PROVIDER_SETTINGS):
+            provider_config = getattr(settings, PROVIDER_SETTINGS[name], {})
+            if provider_config.get('API_KEY'):
+                _streaming_client = StreamingLLMClient(
+                    base_url=provider_config['BASE_URL'],
+                    api_key=provider_config['API_KEY'],
+                    model=provider_config['DEFAULT_MODEL'],
+                    max_tokens=provider_config.get('MAX_TOKENS', 1024),
+                    temperature=provider_config.get('TEMPERATURE', 0.7),
+                    name=name,
+                )
+                break
+    return _streaming_client
+
+
+class DeltaBuffer:
+    """
+    Hands text deltas from a producer task to a consumer that may be slower.
+    get() returns everything that arrived since the last call as one string;
+    put() waits while more than max_pending characters are unread.
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._pending: List[str] = []
+        self._size = 0
+        self._closed = False
+        self._error = None
+        self._changed = asyncio.Condition()
+
+    async def put(self, delta: str):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._size < self.max_pending)
+            self._pending.append(delta)
+            self._size += len(delta)
+            self._changed.notify_all()
+
+    async def close(self, error: BaseException = None):
+        async with self._changed:
+            self._closed = True
+            self._error = error
+            self._changed.notify_all()
+
+    async def get(self) -> Optional[str]:
+        """The coalesced pending text, or None once closed and drained"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._pending or self._closed)
+            if not self._pending:
+                if self._error is not None:
+                    raise self._error
+                return None
+            text = "".join(self._pending)
+            self._pending.clear()
+            self._size = 0
+            self._changed.notify_all()
+            return text
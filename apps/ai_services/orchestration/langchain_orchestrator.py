@@ -10,10 +10,11 @@ Production-ready LangChain orchestration service that provides:
 """
 
 import os
+import json
 import logging
 import asyncio
 from typing import Dict, Any, Optional, AsyncGenerator, List
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 
 # LangChain imports (updated for LangChain 0.3.x)
@@ -27,7 +28,8 @@ from langchain_core.documents import Document
 
 # Django imports
 from django.conf import settings
-from django.core.cache import cache
+
+from apps.core.llm_cache import get_response_cache
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -67,6 +69,7 @@ class LangChainOrchestrator:
         """Initialize the orchestrator with proper configuration"""
         self.api_key = self._get_api_key()
         self.base_url = self._get_base_url()
+        self.response_cache = get_response_cache()
         
         # Initialize LLM with proper configuration
         self.llm = self._initialize_llm()
@@ -224,12 +227,21 @@ Enhanced Prompt:"""
             OptimizationResult with optimized prompt and metadata
         """
         try:
-            # Check cache first
-            cache_key = f"prompt_opt_{hash(original_prompt)}_{hash(str(context))}"
-            cached_result = cache.get(cache_key)
-            if cached_result:
-                logger.info("Returning cached optimization result")
-                return cached_result
+            # Check cache first: the same prompt, or one close enough to it, for the same context,
+            # audience and outcome
+            cached = await self.response_cache.alookup(
+                'optimize', getattr(self.llm, 'model_name', 'deepseek-chat'), original_prompt,
+                system=json.dumps({
+                    "context": context or {},
+                    "target_audience": target_audience,
+                    "desired_outcome": desired_outcome,
+                }, sort_keys=True, default=str)
+            )
+            if cached.hit:
+                logger.info(f"Returning cached optimization result ({cached.tier})")
+                # A semantic hit was optimized from a neighbouring prompt
+                return replace(cached.result, original_prompt=original_prompt,
+                               metadata={**cached.result.metadata, "cached": cached.tier})
             
             # Prepare input data
             input_data = {
@@ -246,7 +258,7 @@ Enhanced Prompt:"""
             parsed_result = self._parse_optimization_result(original_prompt, result)
             
             # Cache the result
-            cache.set(cache_key, parsed_result, timeout=3600)  # Cache for 1 hour
+            await self.response_cache.astore(cached, parsed_result)
             
             logger.info(f"Successfully optimized prompt with confidence {parsed_result.confidence_score}")
             return parsed_result
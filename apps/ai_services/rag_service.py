@@ -12,6 +12,7 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
 import asyncio
+import threading
 import uuid
 
 from django.conf import settings
@@ -19,19 +20,18 @@ from django.core.cache import cache
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 
-# LangChain imports (updated for LangChain 0.3.x)
-try:
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-    from langchain_core.documents import Document
-    from langchain_community.vectorstores import FAISS
-    from langchain_huggingface import HuggingFaceEmbeddings
-    from langchain_core.runnables import RunnableSequence
-    from langchain_core.retrievers import BaseRetriever
-    from langchain_core.prompts import ChatPromptTemplate
-    from langchain_core.output_parsers import StrOutputParser
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
+from apps.core.lazy_imports import lazy_import, modules_available
+
+# LangChain imports (updated for LangChain 0.3.x), imported on first use
+LANGCHAIN_AVAILABLE = modules_available(
+    'langchain_text_splitters', 'langchain_core', 'langchain_community', 'langchain_huggingface'
+)
+if LANGCHAIN_AVAILABLE:
+    RecursiveCharacterTextSplitter = lazy_import('langchain_text_splitters', 'RecursiveCharacterTextSplitter')
+    Document = lazy_import('langchain_core.documents', 'Document')
+    FAISS = lazy_import('langchain_community.vectorstores', 'FAISS')
+    HuggingFaceEmbeddings = lazy_import('langchain_huggingface', 'HuggingFaceEmbeddings')
+else:
     Document = None  # type: ignore
 # Local imports
 from apps.templates.models import PromptLibrary
@@ -504,8 +504,8 @@ EXPLANATION:
         run_id = str(uuid.uuid4())
         start_time = timezone.now()
         
-        # Retrieve relevant context
-        retrieved_docs = self.retriever.retrieve_documents(request.original, top_k=6)
+        # Retrieve relevant context (embedding + search is blocking; keep it off the loop)
+        retrieved_docs = await asyncio.to_thread(self.retriever.retrieve_documents, request.original, 6)
         citations = self.retriever.create_citations(retrieved_docs)
         
         # Prepare context
@@ -618,19 +618,25 @@ EXPLANATION:
 # Global instances
 _document_indexer = None
 _rag_agent = None
+# Loading the index takes seconds; concurrent first requests must not each build one
+_instances_lock = threading.Lock()
 
 def get_document_indexer() -> DocumentIndexer:
     """Get global document indexer instance"""
     global _document_indexer
     if _document_indexer is None:
-        _document_indexer = DocumentIndexer()
+        with _instances_lock:
+            if _document_indexer is None:
+                _document_indexer = DocumentIndexer()
     return _document_indexer
 
 def get_rag_agent() -> RAGAgent:
     """Get global RAG agent instance"""
     global _rag_agent
     if _rag_agent is None:
-        _rag_agent = RAGAgent()
+        with _instances_lock:
+            if _rag_agent is None:
+                _rag_agent = RAGAgent()
     return _rag_agent
 
 # Celery task for background indexing
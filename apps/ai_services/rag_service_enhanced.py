@@ -3,16 +3,20 @@ Enhanced RAG (Retrieval-Augmented Generation) Service for Prompt Optimization
 Includes streaming support and robust fallback mechanisms
 """
 
-import os
+import re
 import json
 import hashlib
 import logging
+from collections import Counter
 from typing import Dict, List, Optional, Any, Tuple, Union, AsyncGenerator
 from pathlib import Path
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
 import asyncio
+import threading
 import uuid
+import zlib
+import httpx
 import numpy as np
 
 from django.conf import settings
@@ -20,16 +24,23 @@ from django.core.cache import cache
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 
-# LangChain imports (updated for LangChain 0.3.x)
-try:
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-    from langchain_core.documents import Document
-    from langchain_community.vectorstores import FAISS
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
+from apps.core.lazy_imports import lazy_import, modules_available
+from apps.core.vector_index import normalize_rows, replacing_directory, top_k_indices
+
+# LangChain (updated for LangChain 0.3.x) and SciPy, imported on first use
+LANGCHAIN_AVAILABLE = modules_available('langchain_text_splitters', 'langchain_core', 'langchain_community')
+if LANGCHAIN_AVAILABLE:
+    RecursiveCharacterTextSplitter = lazy_import('langchain_text_splitters', 'RecursiveCharacterTextSplitter')
+    Document = lazy_import('langchain_core.documents', 'Document')
+    FAISS = lazy_import('langchain_community.vectorstores', 'FAISS')
+
+SCIPY_AVAILABLE = modules_available('scipy')
+scipy_sparse = lazy_import('scipy.sparse') if SCIPY_AVAILABLE else None
 
 # Local imports
+from apps.ai_services.llm_stream import (
+    DeltaBuffer, LLMStreamError, StreamUsage, get_rag_streaming_settings, get_streaming_llm_client
+)
 from apps.templates.models import PromptLibrary
 from apps.billing.models import UsageQuota, UserSubscription
 
@@ -75,80 +86,252 @@ class OptimizationResponse:
     usage: Dict[str, int]
     run_id: str
 
+class SparseRows:
+    """
+    Row vectors in CSR layout: row i's non-zero weights are
+    data[indptr[i]:indptr[i + 1]] in columns indices[indptr[i]:indptr[i + 1]].
+    Backed by a SciPy csr_matrix when SciPy is installed, plain NumPy otherwise.
+    """
+
+    def __init__(self, data, indices, indptr, n_cols: int):
+        # asanyarray keeps memory-mapped arrays mapped
+        self.data = np.asanyarray(data, dtype=np.float32)
+        self.indices = np.asanyarray(indices, dtype=np.int32)
+        self.indptr = np.asanyarray(indptr, dtype=np.int64)
+        self.shape = (len(self.indptr) - 1, int(n_cols))
+        if SCIPY_AVAILABLE:
+            self._matrix = scipy_sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+        else:
+            self._matrix = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def dot(self, vector: np.ndarray) -> np.ndarray:
+        """Dot product of every row with a dense vector"""
+        if self._matrix is not None:
+            return self._matrix @ vector
+        scores = np.zeros(self.shape[0], dtype=np.float32)
+        products = self.data * vector[self.indices]
+        if len(products):
+            # reduceat needs the start of every summed segment to be in range
+            starts = self.indptr[:-1]
+            nonempty = starts < self.indptr[1:]
+            scores[nonempty] = np.add.reduceat(products, starts[nonempty])
+        return scores
+
+    def toarray(self) -> np.ndarray:
+        dense = np.zeros(self.shape, dtype=np.float32)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+
 class SimpleEmbeddings:
-    """Simple TF-IDF based embeddings as fallback"""
-    
+    """Simple TF-IDF based embeddings as fallback (sparse, L2-normalized)"""
+
+    TOKEN_RE = re.compile(r'\b\w+\b')
+
     def __init__(self):
         self.vocab = {}
-        self.idf = {}
+        self.idf = np.zeros(0, dtype=np.float32)
         self.fitted = False
-        
+
     def _tokenize(self, text: str) -> List[str]:
         """Simple tokenization"""
-        import re
-        # Convert to lowercase and split on non-alphanumeric
-        tokens = re.findall(r'\b\w+\b', text.lower())
-        return tokens
-    
-    def _compute_tf(self, tokens: List[str]) -> Dict[str, float]:
-        """Compute term frequency"""
-        tf = {}
-        total_tokens = len(tokens)
-        if total_tokens == 0:
-            return tf
-        for token in tokens:
-            tf[token] = tf.get(token, 0) + 1
-        # Normalize
-        for token in tf:
-            tf[token] = tf[token] / total_tokens
-        return tf
-    
+        # Lowercase and split on non-alphanumeric
+        return self.TOKEN_RE.findall(text.lower())
+
     def fit(self, documents: List[str]):
-        """Fit the embeddings on documents"""
-        # Build vocabulary and compute IDF
+        """Fit the vocabulary and IDF weights on documents"""
         doc_count = len(documents)
-        word_doc_count = {}
-        
+        word_doc_count = Counter()
         for doc in documents:
-            tokens = set(self._tokenize(doc))
-            for token in tokens:
-                word_doc_count[token] = word_doc_count.get(token, 0) + 1
-        
-        # Compute IDF
-        import math
-        for word, count in word_doc_count.items():
-            self.idf[word] = math.log(doc_count / count) if count > 0 else 0
-        
-        self.vocab = {word: i for i, word in enumerate(word_doc_count.keys())}
+            word_doc_count.update(set(self._tokenize(doc)))
+
+        self.vocab = {word: i for i, word in enumerate(word_doc_count)}
+        counts = np.fromiter(word_doc_count.values(), dtype=np.float64, count=len(word_doc_count))
+        self.idf = np.log(doc_count / counts).astype(np.float32)
         self.fitted = True
         logger.info(f"✅ SimpleEmbeddings fitted on {doc_count} documents with {len(self.vocab)} vocab")
-    
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Convert texts to embeddings"""
+
+    def _weights(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Columns and L2-normalized TF-IDF weights of the text's known terms"""
+        counts = Counter(token for token in self._tokenize(text) if token in self.vocab)
+        columns = np.fromiter((self.vocab[token] for token in counts), dtype=np.int32, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts)) * self.idf[columns]
+        # Terms present in every document carry no weight
+        nonzero = weights > 0
+        columns, weights = columns[nonzero], weights[nonzero]
+        norm = np.linalg.norm(weights)
+        return columns, weights / norm if norm > 0 else weights
+
+    def transform(self, texts: List[str]) -> SparseRows:
+        """TF-IDF vectors of texts as one sparse matrix"""
         if not self.fitted:
             self.fit(texts)
-            
-        embeddings = []
-        
+
+        columns, weights, indptr = [], [], [0]
         for text in texts:
-            tokens = self._tokenize(text)
-            tf = self._compute_tf(tokens)
-            
-            # Create TF-IDF vector
-            vector = [0.0] * len(self.vocab)
-            for word, tf_val in tf.items():
-                if word in self.vocab:
-                    idx = self.vocab[word]
-                    idf_val = self.idf.get(word, 0)
-                    vector[idx] = tf_val * idf_val
-            
-            embeddings.append(vector)
-        
-        return embeddings
-    
+            text_columns, text_weights = self._weights(text)
+            columns.append(text_columns)
+            weights.append(text_weights)
+            indptr.append(indptr[-1] + len(text_columns))
+
+        return SparseRows(
+            np.concatenate(weights) if weights else [],
+            np.concatenate(columns) if columns else [],
+            indptr,
+            len(self.vocab),
+        )
+
+    def query_vector(self, text: str) -> np.ndarray:
+        """Dense TF-IDF vector of a query, for SparseRows.dot"""
+        vector = np.zeros(len(self.vocab), dtype=np.float32)
+        columns, weights = self._weights(text)
+        vector[columns] = weights
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Convert texts to dense embeddings (LangChain interface)"""
+        return self.transform(texts).toarray().tolist()
+
     def embed_query(self, text: str) -> List[float]:
         """Convert single text to embedding"""
-        return self.embed_documents([text])[0]
+        return self.query_vector(text).tolist()
+
+    def save(self, path: Path):
+        """Write the fitted vocabulary and IDF weights to an .npz file"""
+        # Tokens never contain a newline, so the vocabulary is one byte string
+        vocab = np.frombuffer('\n'.join(self.vocab).encode(), dtype=np.uint8)
+        with open(path, 'wb') as f:
+            np.savez(f, vocab=vocab, idf=self.idf)
+
+    @classmethod
+    def load(cls, path: Path) -> 'SimpleEmbeddings':
+        """Pre-fitted embeddings written by save()"""
+        embeddings = cls()
+        with np.load(path) as saved:
+            words = saved['vocab'].tobytes().decode()
+            embeddings.idf = saved['idf']
+        embeddings.vocab = {word: i for i, word in enumerate(words.split('\n'))} if words else {}
+        embeddings.fitted = True
+        return embeddings
+
+
+class DocumentStore:
+    """
+    Documents as JSON lines with an offsets array, both memory-mapped, so a
+    document is read and parsed only when it is returned
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offsets = np.load(self.offsets_path(path), mmap_mode='r')
+        # A mapping (not reopening the path) keeps reading this version after the index is replaced
+        if self.offsets[-1] > 0:
+            self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+    @staticmethod
+    def offsets_path(path: Path) -> Path:
+        return path.with_suffix('.offsets.npy')
+
+    @classmethod
+    def write(cls, path: Path, documents):
+        offsets = [0]
+        with open(path, 'wb') as f:
+            for document in documents:
+                line = json.dumps(document, default=str).encode() + b'\n'
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        np.save(cls.offsets_path(path), np.asarray(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return json.loads(self.data[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes())
+
+
+class SimpleIndex:
+    """
+    The index used without FAISS, stored as a directory:
+
+    - vocab.npz: the fitted SimpleEmbeddings vocabulary and IDF weights
+    - data.npy, indices.npy, indptr.npy: the TF-IDF document matrix (CSR),
+      or vectors.npy with normalized vectors from other embeddings
+    - documents.jsonl and documents.offsets.npy: the documents
+
+    Arrays are opened as memory maps, so worker processes share one copy
+    through the page cache instead of each loading the index, and only the
+    top-k documents of a query are read.
+    """
+
+    CSR_ARRAYS = ('data', 'indices', 'indptr')
+
+    def __init__(self, embeddings, vectors, documents):
+        self.embeddings = embeddings
+        self.vectors = vectors
+        self.documents = documents
+
+    def __len__(self):
+        return len(self.documents)
+
+    @classmethod
+    def write(cls, path: Path, embeddings, vectors, documents):
+        """Write the index to path, replacing any previous one"""
+        with replacing_directory(path) as tmp_path:
+            if isinstance(vectors, SparseRows):
+                embeddings.save(tmp_path / 'vocab.npz')
+                for name in cls.CSR_ARRAYS:
+                    np.save(tmp_path / f'{name}.npy', getattr(vectors, name))
+            else:
+                np.save(tmp_path / 'vectors.npy', np.asarray(vectors, dtype=np.float32))
+            DocumentStore.write(tmp_path / 'documents.jsonl', documents)
+
+    @classmethod
+    def load(cls, path: Path, get_embeddings) -> 'SimpleIndex':
+        """Open an index; get_embeddings() supplies query embeddings for dense vectors"""
+        documents = DocumentStore(path / 'documents.jsonl')
+        if (path / 'vectors.npy').exists():
+            return cls(get_embeddings(), np.load(path / 'vectors.npy', mmap_mode='r'), documents)
+
+        embeddings = SimpleEmbeddings.load(path / 'vocab.npz')
+        arrays = [np.load(path / f'{name}.npy', mmap_mode='r') for name in cls.CSR_ARRAYS]
+        return cls(embeddings, SparseRows(*arrays, len(embeddings.vocab)), documents)
+
+    @classmethod
+    def from_legacy_json(cls, path: Path, embeddings) -> 'SimpleIndex':
+        """An in-memory index from the dense JSON file written by older versions"""
+        with open(path, 'r') as f:
+            legacy_index = json.load(f)
+        documents = legacy_index['documents']
+
+        if isinstance(embeddings, SimpleEmbeddings):
+            doc_texts = [doc['content'] for doc in documents]
+            embeddings.fit(doc_texts)
+            vectors = embeddings.transform(doc_texts)
+        else:
+            vectors = normalize_rows(np.asarray(legacy_index['embeddings'], dtype=np.float32))
+        return cls(embeddings, vectors, documents)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """(cosine similarity, document) of the top_k documents, best first"""
+        if isinstance(self.embeddings, SimpleEmbeddings):
+            query_vector = self.embeddings.query_vector(query)
+        else:
+            query_vector = normalize_rows(
+                np.asarray([self.embeddings.embed_query(query)], dtype=np.float32)
+            )[0]
+        scores = self.vectors.dot(query_vector)
+        return [(float(scores[i]), self.documents[i]) for i in top_k_indices(scores, top_k)]
+
+
+SIMPLE_INDEX_DIR = "simple"
+# Dense JSON vectors written by older versions; still loadable
+LEGACY_SIMPLE_INDEX_FILE = "simple_index.json"
 
 class EnhancedDocumentIndexer:
     """Enhanced document indexer with robust fallbacks"""
@@ -344,7 +527,7 @@ class EnhancedDocumentIndexer:
         
         return documents
     
-    def chunk_documents(self, documents: List[RAGDocument]) -> List[Document]:
+    def chunk_documents(self, documents: List[RAGDocument]) -> List['Document']:
         """Chunk documents for vector storage"""
         chunked_docs = []
         
@@ -387,7 +570,7 @@ class EnhancedDocumentIndexer:
         
         index_file = self.index_path / "index.faiss"
         metadata_file = self.index_path / "metadata.json"
-        simple_index_file = self.index_path / "simple_index.json"
+        simple_index_file = self.index_path / SIMPLE_INDEX_DIR
         
         # Check if rebuild needed
         if not force_rebuild and (index_file.exists() or simple_index_file.exists()):
@@ -433,19 +616,7 @@ class EnhancedDocumentIndexer:
                 # Build simple index
                 logger.info(f"🚀 Building simple index with {len(documents)} documents...")
                 
-                # Fit embeddings if needed
-                doc_texts = [doc.content for doc in documents]
-                if hasattr(self.embeddings, 'fit'):
-                    self.embeddings.fit(doc_texts)
-                
-                # Create simple index
-                simple_index = {
-                    "documents": [asdict(doc) for doc in documents],
-                    "embeddings": self.embeddings.embed_documents(doc_texts)
-                }
-                
-                with open(simple_index_file, 'w') as f:
-                    json.dump(simple_index, f, default=str)
+                self.write_simple_index(documents)
                 
                 # Save metadata
                 metadata = {
@@ -469,6 +640,22 @@ class EnhancedDocumentIndexer:
             traceback.print_exc()
             return False
 
+    def write_simple_index(self, documents: List[RAGDocument]):
+        """Write the SimpleIndex: sparse TF-IDF vectors, or dense ones from other embeddings"""
+        doc_texts = [doc.content for doc in documents]
+
+        if isinstance(self.embeddings, SimpleEmbeddings):
+            self.embeddings.fit(doc_texts)
+            vectors = self.embeddings.transform(doc_texts)
+        else:
+            vectors = normalize_rows(np.asarray(self.embeddings.embed_documents(doc_texts), dtype=np.float32))
+
+        SimpleIndex.write(
+            self.index_path / SIMPLE_INDEX_DIR, self.embeddings, vectors, (asdict(doc) for doc in documents)
+        )
+        # Replaced by the index directory
+        (self.index_path / LEGACY_SIMPLE_INDEX_FILE).unlink(missing_ok=True)
+
 class StreamingRAGAgent:
     """Streaming RAG agent for real-time prompt optimization"""
     
@@ -483,7 +670,6 @@ class StreamingRAGAgent:
         """Load existing index"""
         # Try FAISS first
         index_file = self.index_path / "index.faiss"
-        simple_index_file = self.index_path / "simple_index.json"
         
         if index_file.exists() and LANGCHAIN_AVAILABLE:
             try:
@@ -500,20 +686,24 @@ class StreamingRAGAgent:
                 logger.error(f"Failed to load FAISS index: {e}")
         
         # Try simple index
-        if simple_index_file.exists() and not self.vector_store:
+        if not self.vector_store:
+            def get_embeddings():
+                return EnhancedDocumentIndexer()._get_embeddings()
+
             try:
-                with open(simple_index_file, 'r') as f:
-                    self.simple_index = json.load(f)
-                
-                # Recreate embeddings
-                indexer = EnhancedDocumentIndexer()
-                self.embeddings = indexer._get_embeddings()
-                if hasattr(self.embeddings, 'fit'):
-                    doc_texts = [doc['content'] for doc in self.simple_index['documents']]
-                    self.embeddings.fit(doc_texts)
-                
-                logger.info("✅ Simple index loaded successfully")
+                if (self.index_path / SIMPLE_INDEX_DIR).exists():
+                    self.simple_index = SimpleIndex.load(self.index_path / SIMPLE_INDEX_DIR, get_embeddings)
+                elif (self.index_path / LEGACY_SIMPLE_INDEX_FILE).exists():
+                    self.simple_index = SimpleIndex.from_legacy_json(
+                        self.index_path / LEGACY_SIMPLE_INDEX_FILE, get_embeddings()
+                    )
+                    logger.warning("Loaded a legacy JSON simple index; rebuild the index to convert it")
+                else:
+                    return
+                self.embeddings = self.simple_index.embeddings
+                logger.info(f"✅ Simple index loaded successfully ({len(self.simple_index)} documents)")
             except Exception as e:
+                self.simple_index = None
                 logger.error(f"Failed to load simple index: {e}")
     
     def retrieve_documents(self, query: str, top_k: int = 6) -> List[Dict]:
@@ -545,48 +735,17 @@ class StreamingRAGAgent:
             return []
     
     def _retrieve_simple(self, query: str, top_k: int) -> List[Dict]:
-        """Retrieve using simple cosine similarity"""
+        """Retrieve using cosine similarity against the simple index"""
         try:
-            query_embedding = self.embeddings.embed_query(query)
-            doc_embeddings = self.simple_index['embeddings']
-            
-            # Calculate cosine similarities
-            similarities = []
-            for i, doc_embedding in enumerate(doc_embeddings):
-                similarity = self._cosine_similarity(query_embedding, doc_embedding)
-                similarities.append((similarity, i))
-            
-            # Sort by similarity and get top_k
-            similarities.sort(reverse=True)
-            top_docs = []
-            
-            for sim_score, doc_idx in similarities[:top_k]:
-                doc = self.simple_index['documents'][doc_idx]
-                top_docs.append({
-                    "content": doc['content'],
-                    "metadata": doc['metadata'],
-                    "score": sim_score
-                })
-            
-            return top_docs
+            return [{
+                "content": doc['content'],
+                "metadata": doc['metadata'],
+                "score": score
+            } for score, doc in self.simple_index.search(query, top_k)]
         except Exception as e:
             logger.error(f"Simple retrieval failed: {e}")
             return []
     
-    def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
-        """Calculate cosine similarity between two vectors"""
-        if not a or not b or len(a) != len(b):
-            return 0.0
-        
-        dot_product = sum(x * y for x, y in zip(a, b))
-        norm_a = sum(x * x for x in a) ** 0.5
-        norm_b = sum(x * x for x in b) ** 0.5
-        
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        
-        return dot_product / (norm_a * norm_b)
-    
     async def optimize_prompt_stream(self, request: OptimizationRequest) -> AsyncGenerator[Dict[str, Any], None]:
         """Stream prompt optimization with real-time updates"""
         run_id = str(uuid.uuid4())
@@ -598,8 +757,8 @@ class StreamingRAGAgent:
             "run_id": run_id
         }
         
-        # Retrieve documents
-        retrieved_docs = self.retrieve_documents(request.original, top_k=6)
+        # Retrieve documents (CPU-bound, kept off the event loop)
+        retrieved_docs = await asyncio.to_thread(self.retrieve_documents, request.original, 6)
         
         yield {
             "type": "status", 
@@ -630,25 +789,43 @@ class StreamingRAGAgent:
             "run_id": run_id
         }
         
-        # Generate optimization (streaming simulation)
+        # Stream the optimization as it is generated
         context = "\n\n".join([
             f"Source: {doc['metadata'].get('title', 'Unknown')}\n{doc['content'][:500]}"
             for doc in retrieved_docs[:3]
         ])
-        
-        # Simulate streaming optimization
-        optimized_parts = await self._generate_optimization_stream(request.original, context)
-        
-        full_optimized = ""
-        for part in optimized_parts:
-            full_optimized += part
-            yield {
-                "type": "optimization_chunk",
-                "chunk": part,
-                "full_text": full_optimized,
-                "run_id": run_id
-            }
-            await asyncio.sleep(0.1)  # Simulate processing time
+        config = get_rag_streaming_settings()
+        buffer = DeltaBuffer(config['MAX_PENDING_CHARS'])
+        llm_usage = StreamUsage()
+        max_tokens = (request.budget or {}).get('tokens_out')
+        producer = asyncio.create_task(
+            self._produce_optimization(request.original, context, buffer, llm_usage, max_tokens)
+        )
+        
+        # Chunks carry only the new text; every CHECKSUM_EVERY chunks (and on
+        # completion) the length and CRC32 of the text so far let clients
+        # check what they have assembled
+        parts = []
+        length = checksum = 0
+        try:
+            while (delta := await buffer.get()) is not None:
+                parts.append(delta)
+                length += len(delta)
+                checksum = zlib.crc32(delta.encode(), checksum)
+                chunk = {
+                    "type": "optimization_chunk",
+                    "delta": delta,
+                    "index": len(parts),
+                    "run_id": run_id
+                }
+                if len(parts) % config['CHECKSUM_EVERY'] == 0:
+                    chunk.update(length=length, checksum=f"{checksum:08x}")
+                yield chunk
+            source = await producer
+        finally:
+            # The client went away: stop reading from the provider
+            producer.cancel()
+        full_optimized = "".join(parts)
         
         # Generate improvements summary
         improvements = await self._generate_improvements(request.original, full_optimized, retrieved_docs)
@@ -661,20 +838,73 @@ class StreamingRAGAgent:
         
         # Final response
         usage = {
-            "tokens_in": len(request.original.split()) * 2,
-            "tokens_out": len(full_optimized.split()) * 2,
+            "tokens_in": llm_usage.prompt_tokens or len(request.original.split()) * 2,
+            "tokens_out": llm_usage.completion_tokens or len(full_optimized.split()) * 2,
             "credits": 1 if request.mode == "fast" else 3
         }
         
         yield {
             "type": "complete",
             "optimized": full_optimized,
+            "length": length,
+            "checksum": f"{checksum:08x}",
+            "source": source,
             "citations": citations,
             "improvements": improvements,
             "usage": usage,
             "run_id": run_id
         }
     
+    async def _produce_optimization(self, original: str, context: str, buffer: DeltaBuffer,
+                                    usage: StreamUsage, max_tokens: Optional[int]) -> str:
+        """
+        Feed the optimization into buffer from the LLM, or from the rule-based
+        fallback when no provider is configured or it fails before the first
+        token. Returns the source used; errors are raised from buffer.get().
+        """
+        client = get_streaming_llm_client()
+        error = None
+        source = "rules"
+        try:
+            streamed = False
+            if client is not None:
+                params = {"max_tokens": max_tokens} if max_tokens else {}
+                try:
+                    async for delta in client.stream_chat(
+                        self._optimization_messages(original, context), usage=usage, **params
+                    ):
+                        streamed = True
+                        await buffer.put(delta)
+                    source = client.name
+                except (httpx.HTTPError, LLMStreamError) as e:
+                    if streamed:
+                        raise
+                    logger.warning(f"LLM streaming failed, using rule-based optimization: {e}")
+            
+            if source == "rules":
+                for part in await self._generate_optimization_stream(original, context):
+                    await buffer.put(part)
+        except Exception as e:
+            error = e
+        await buffer.close(error)
+        return source
+    
+    def _optimization_messages(self, original: str, context: str) -> List[Dict[str, str]]:
+        prompt = f"Prompt to improve:\n{original}"
+        if context:
+            prompt = f"Reference material:\n{context}\n\n{prompt}"
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You improve prompts for large language models. Rewrite the user's prompt so it is "
+                    "clear, specific and complete, using the reference material where it helps. "
+                    "Reply with the improved prompt only."
+                )
+            },
+            {"role": "user", "content": prompt}
+        ]
+    
     async def _generate_optimization_stream(self, original: str, context: str) -> List[str]:
         """Generate optimization in chunks for streaming"""
         # Enhanced rule-based optimization
@@ -740,9 +970,17 @@ def get_document_indexer():
     """Get enhanced document indexer instance"""
     return EnhancedDocumentIndexer()
 
+_rag_agent = None
+_rag_agent_lock = threading.Lock()
+
 def get_rag_agent():
-    """Get streaming RAG agent instance"""
-    return StreamingRAGAgent()
+    """Get the process-wide streaming RAG agent (loads the index once)"""
+    global _rag_agent
+    if _rag_agent is None:
+        with _rag_agent_lock:
+            if _rag_agent is None:
+                _rag_agent = StreamingRAGAgent()
+    return _rag_agent
 
 # Export enhanced classes
 __all__ = [
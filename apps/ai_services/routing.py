@@ -3,21 +3,22 @@ WebSocket routing for AI services - real-time AI processing and streaming
 """
 
 from django.urls import re_path, path
-from . import consumers
+
+from apps.core.lazy_routing import lazy_consumer
 
 websocket_urlpatterns = [
     # AI Processing WebSocket for real-time AI operations
-    path('ws/ai/process/<str:session_id>/', consumers.AIProcessingConsumer.as_asgi()),
+    path('ws/ai/process/<str:session_id>/', lazy_consumer('apps.ai_services.consumers.AIProcessingConsumer')),
     
     # Streaming AI responses for long-form content generation
-    path('ws/ai/stream/<str:session_id>/', consumers.AIStreamingConsumer.as_asgi()),
+    path('ws/ai/stream/<str:session_id>/', lazy_consumer('apps.ai_services.consumers.AIStreamingConsumer')),
     
     # Real-time search with AI enhancement
-    path('ws/search/<str:session_id>/', consumers.SearchConsumer.as_asgi()),
+    path('ws/search/<str:session_id>/', lazy_consumer('apps.ai_services.consumers.SearchConsumer')),
     
     # AI Assistant interactive WebSocket
-    path('ws/assistant/<str:assistant_id>/<str:session_id>/', consumers.AssistantConsumer.as_asgi()),
+    path('ws/assistant/<str:assistant_id>/<str:session_id>/', lazy_consumer('apps.ai_services.consumers.AssistantConsumer')),
 
     # AI analytics and insights WebSocket
-    path('ws/analytics/<str:session_id>/', consumers.AnalyticsConsumer.as_asgi()),
+    path('ws/analytics/<str:session_id>/', lazy_consumer('apps.ai_services.consumers.AnalyticsConsumer')),
 ]
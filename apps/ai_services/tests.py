@@ -2,10 +2,13 @@
 Tests for RAG Agent system
 """
 
+import os
 import json
 import asyncio
-from unittest.mock import patch, MagicMock
-from django.test import TestCase, AsyncTransactionTestCase
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase
@@ -106,7 +109,7 @@ class RAGAgentAPITest(APITestCase):
     
     def test_optimize_prompt_endpoint(self):
         """Test the prompt optimization endpoint"""
-        url = reverse('agent-optimize')
+        url = reverse('ai_services_v2:agent-optimize')
         data = {
             'session_id': 'test-session-123',
             'original': 'Write a good email',
@@ -127,9 +130,30 @@ class RAGAgentAPITest(APITestCase):
         self.assertIn('usage', response_data)
         self.assertIn('citations', response_data)
     
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_duplicate_optimize_replays_without_charging(self):
+        """A retried request replays the first result and is charged once"""
+        url = reverse('ai_services_v2:agent-optimize')
+        data = {'session_id': 'retry-session', 'original': 'Write a good email', 'mode': 'deep'}
+        agent = MagicMock()
+        agent.optimize_prompt = AsyncMock(return_value=SimpleNamespace(
+            optimized='Write a concise, friendly email', citations=[], diff_summary='tightened',
+            usage={'tokens_in': 10, 'tokens_out': 20, 'credits': 3}, run_id='run-1',
+        ))
+
+        with patch('apps.ai_services.agent_views.get_rag_agent', return_value=agent):
+            first = self.client.post(url, data, format='json')
+            retry = self.client.post(url, data, format='json')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(agent.optimize_prompt.await_count, 1)
+        self.assertEqual(UsageQuota.objects.get(user=self.user).api_calls_made, 3)
+    
     def test_optimize_prompt_invalid_data(self):
         """Test endpoint with invalid data"""
-        url = reverse('agent-optimize')
+        url = reverse('ai_services_v2:agent-optimize')
         data = {
             'session_id': 'test-session-123',
             # Missing 'original' field
@@ -141,7 +165,7 @@ class RAGAgentAPITest(APITestCase):
     
     def test_optimize_prompt_too_long(self):
         """Test endpoint with overly long prompt"""
-        url = reverse('agent-optimize')
+        url = reverse('ai_services_v2:agent-optimize')
         data = {
             'session_id': 'test-session-123',
             'original': 'x' * 15000,  # Too long
@@ -153,7 +177,7 @@ class RAGAgentAPITest(APITestCase):
     
     def test_agent_stats_endpoint(self):
         """Test the agent stats endpoint"""
-        url = reverse('agent-stats')
+        url = reverse('ai_services_v2:agent-stats')
         
         # Only staff users can access stats
         self.user.is_staff = True
@@ -169,7 +193,7 @@ class RAGAgentAPITest(APITestCase):
     
     def test_agent_stats_non_staff(self):
         """Test stats endpoint access denied for non-staff"""
-        url = reverse('agent-stats')
+        url = reverse('ai_services_v2:agent-stats')
         
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -288,3 +312,699 @@ class MockLangChainTest(TestCase):
             # Should return empty results gracefully
             docs = retriever.retrieve_documents("test query")
             self.assertEqual(docs, [])
+
+
+def make_rag_document(doc_id, content):
+    from datetime import datetime
+    from apps.ai_services.rag_service_enhanced import RAGDocument
+
+    return RAGDocument(
+        id=doc_id, content=content, metadata={'doc_id': doc_id, 'title': doc_id}, source='test',
+        title=doc_id, path='', updated_at=datetime(2026, 1, 1), hash=doc_id,
+    )
+
+
+SIMPLE_CORPUS = {
+    'refunds': "Refund policy: customers can request a refund within 30 days of purchase.",
+    'emails': "Write a friendly email to a customer. Keep the email short and polite.",
+    'code': "Explain the Python code step by step and suggest unit tests for the code.",
+    'summary': "Summarize the meeting notes into action items for the team.",
+}
+
+
+class SimpleEmbeddingsTest(TestCase):
+    """Sparse TF-IDF embeddings and the .npz simple index"""
+
+    def setUp(self):
+        import tempfile
+        from apps.ai_services.rag_service_enhanced import SimpleEmbeddings
+
+        self.embeddings = SimpleEmbeddings()
+        self.documents = [make_rag_document(doc_id, text) for doc_id, text in SIMPLE_CORPUS.items()]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_sparse_scores_are_cosine_similarities(self):
+        import numpy as np
+
+        matrix = self.embeddings.transform(list(SIMPLE_CORPUS.values()))
+        query = self.embeddings.query_vector("refund within 30 days")
+        dense = matrix.toarray()
+
+        self.assertEqual(matrix.shape, (4, len(self.embeddings.vocab)))
+        self.assertLess(len(matrix.data), dense.size / 2)
+        np.testing.assert_allclose(np.linalg.norm(dense, axis=1), 1, rtol=1e-5)
+        np.testing.assert_allclose(matrix.dot(query), dense @ query, rtol=1e-5)
+        self.assertEqual(int(np.argmax(matrix.dot(query))), 0)
+
+    def test_index_loads_without_refitting(self):
+        from apps.ai_services.rag_service_enhanced import (
+            EnhancedDocumentIndexer, SimpleEmbeddings, StreamingRAGAgent
+        )
+
+        with override_settings(BASE_DIR=self.tmp.name):
+            indexer = EnhancedDocumentIndexer()
+            indexer.embeddings = self.embeddings
+            indexer.write_simple_index(self.documents)
+
+            with patch.object(SimpleEmbeddings, 'fit', side_effect=AssertionError("refit")):
+                agent = StreamingRAGAgent()
+            results = agent.retrieve_documents("how do I write a polite customer email", top_k=2)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['metadata']['doc_id'], 'emails')
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_index_is_memory_mapped_and_read_on_demand(self):
+        import numpy as np
+        from apps.ai_services.rag_service_enhanced import (
+            DocumentStore, EnhancedDocumentIndexer, StreamingRAGAgent
+        )
+
+        with override_settings(BASE_DIR=self.tmp.name):
+            indexer = EnhancedDocumentIndexer()
+            indexer.embeddings = self.embeddings
+            indexer.write_simple_index(self.documents)
+            agent = StreamingRAGAgent()
+
+            for array in (agent.simple_index.vectors.data, agent.simple_index.documents.offsets):
+                self.assertIsInstance(array, np.memmap)
+            with patch.object(DocumentStore, '__getitem__', autospec=True,
+                              side_effect=DocumentStore.__getitem__) as read:
+                results = agent.retrieve_documents("unit tests for python code", top_k=1)
+            self.assertEqual(read.call_count, 1)
+            self.assertEqual(results[0]['metadata']['doc_id'], 'code')
+
+            # A rebuild replaces the directory; the loaded index keeps its version
+            indexer.write_simple_index([make_rag_document('other', "Something else entirely")])
+            self.assertEqual(agent.retrieve_documents("python code", top_k=1)[0]['metadata']['doc_id'], 'code')
+            self.assertEqual(len(StreamingRAGAgent().simple_index), 1)
+
+    def test_legacy_json_index_still_loads(self):
+        from dataclasses import asdict
+        from pathlib import Path
+        from apps.ai_services.rag_service_enhanced import StreamingRAGAgent
+
+        index_path = Path(self.tmp.name) / 'rag_index'
+        index_path.mkdir()
+        texts = list(SIMPLE_CORPUS.values())
+        with open(index_path / 'simple_index.json', 'w') as f:
+            json.dump({
+                'documents': [asdict(doc) for doc in self.documents],
+                'embeddings': self.embeddings.embed_documents(texts),
+            }, f, default=str)
+
+        with override_settings(BASE_DIR=self.tmp.name):
+            results = StreamingRAGAgent().retrieve_documents("summarize meeting notes", top_k=1)
+        self.assertEqual(results[0]['metadata']['doc_id'], 'summary')
+
+
+@pytest.mark.slow
+def test_benchmark_simple_index_50k_documents(tmp_path):
+    """Index size, load time and query latency of the sparse simple index on 50k documents"""
+    import time
+    import numpy as np
+    from apps.ai_services.rag_service_enhanced import (
+        EnhancedDocumentIndexer, SimpleEmbeddings, StreamingRAGAgent
+    )
+
+    n_docs, words_per_doc, vocab_size = 50_000, 60, 30_000
+    rng = np.random.default_rng(0)
+    words = np.array([f"term{i}" for i in range(vocab_size)])
+    ranks = np.minimum(rng.zipf(1.2, size=(n_docs, words_per_doc)), vocab_size) - 1
+    documents = [make_rag_document(f"doc{i}", " ".join(words[row])) for i, row in enumerate(ranks)]
+    queries = [" ".join(words[rng.integers(0, 2000, size=5)]) for _ in range(50)]
+
+    with override_settings(BASE_DIR=str(tmp_path)):
+        indexer = EnhancedDocumentIndexer()
+        indexer.embeddings = SimpleEmbeddings()
+        start = time.perf_counter()
+        indexer.write_simple_index(documents)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        agent = StreamingRAGAgent()
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            assert len(agent.retrieve_documents(query, top_k=6)) == 6
+        query_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    vectors = tmp_path / 'rag_index' / 'simple'
+    index_mb = sum(f.stat().st_size for f in vectors.iterdir() if f.suffix in ('.npy', '.npz')) / 1e6
+    vocab = len(agent.embeddings.vocab)
+
+    # The dense JSON index cannot be built at this size; measure 200 documents and scale
+    sample = 200
+    dense = agent.embeddings.embed_documents([doc.content for doc in documents[:sample]])
+    legacy_json = json.dumps(dense)
+    start = time.perf_counter()
+    json.loads(legacy_json)
+    legacy_load_s = (time.perf_counter() - start) * n_docs / sample
+    query = agent.embeddings.embed_query(queries[0])
+    start = time.perf_counter()
+    for row in dense:
+        sum(x * y for x, y in zip(query, row)), sum(x * x for x in row) ** 0.5
+    legacy_query_ms = (time.perf_counter() - start) * 1000 * n_docs / sample
+
+    print(
+        f"{n_docs} documents, {vocab} terms: build {build_s:.1f}s; "
+        f"vectors {index_mb:.1f}MB vs dense JSON ~{len(legacy_json) * n_docs / sample / 1e9:.1f}GB; "
+        f"load {load_s * 1000:.0f}ms (no refit) vs ~{legacy_load_s:.0f}s + refit; "
+        f"query {query_ms:.1f}ms vs ~{legacy_query_ms / 1000:.0f}s pairwise in Python"
+    )
+    assert index_mb < 100
+    assert query_ms < 200
+
+
+def _memory_kb():
+    with open('/proc/self/status') as f:
+        fields = dict(line.split(':', 1) for line in f)
+    return {name: int(fields[name].split()[0]) for name in ('RssAnon', 'RssFile')}
+
+
+def _simple_index_worker(path, copy, queue):
+    import time
+    import numpy as np
+    from apps.ai_services.rag_service_enhanced import SimpleIndex, SparseRows
+
+    before = _memory_kb()
+    start = time.perf_counter()
+    index = SimpleIndex.load(path, get_embeddings=None)
+    if copy:
+        # What each worker held before: every array and document in its own memory
+        vectors = index.vectors
+        index.vectors = SparseRows(
+            np.array(vectors.data), np.array(vectors.indices), np.array(vectors.indptr), vectors.shape[1]
+        )
+        with open(index.documents.path, 'rb') as f:
+            index.documents = [json.loads(line) for line in f]
+    startup_s = time.perf_counter() - start
+    loaded = _memory_kb()
+    results = index.search("term1 term20 term300", 6)
+    first_query_s = time.perf_counter() - start - startup_s
+    queried = _memory_kb()
+    queue.put((
+        len(results), startup_s, first_query_s, loaded['RssAnon'] - before['RssAnon'],
+        queried['RssAnon'] - before['RssAnon'], queried['RssFile'] - before['RssFile'],
+    ))
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason="needs /proc")
+def test_benchmark_memory_mapped_index_workers(tmp_path):
+    """Startup time and per-worker memory of 8 workers serving one 200k-chunk index"""
+    import multiprocessing
+    import numpy as np
+    from apps.ai_services.rag_service_enhanced import SimpleEmbeddings, SimpleIndex, SparseRows
+
+    n_docs, terms_per_doc, vocab_size, workers = 200_000, 30, 50_000, 8
+    rng = np.random.default_rng(0)
+    embeddings = SimpleEmbeddings()
+    embeddings.vocab = {f"term{i}": i for i in range(vocab_size)}
+    embeddings.idf = rng.uniform(0.5, 8, vocab_size).astype(np.float32)
+    embeddings.fitted = True
+    nnz = n_docs * terms_per_doc
+    vectors = SparseRows(
+        np.full(nnz, terms_per_doc ** -0.5, dtype=np.float32),
+        np.sort(rng.integers(0, vocab_size, size=(n_docs, terms_per_doc)), axis=1).ravel(),
+        np.arange(0, nnz + 1, terms_per_doc),
+        vocab_size,
+    )
+    text = " ".join(f"term{i}" for i in range(80))
+    documents = ({'content': f"chunk {i}: {text}", 'metadata': {'doc_id': i}} for i in range(n_docs))
+    path = tmp_path / 'simple'
+    SimpleIndex.write(path, embeddings, vectors, documents)
+    index_mb = sum(f.stat().st_size for f in path.iterdir()) / 1e6
+
+    def run(copy):
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=_simple_index_worker, args=(path, copy, queue)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        results = [queue.get(timeout=120) for _ in processes]
+        for process in processes:
+            process.join()
+        assert all(found == 6 for found, *_ in results)
+        return [sum(column) / workers for column in list(zip(*results))[1:]]
+
+    copied = run(copy=True)
+    mapped = run(copy=False)
+
+    def describe(startup_s, query_s, loaded_kb, queried_kb, file_kb):
+        return (
+            f"startup {startup_s * 1000:.0f}ms, first query {query_s * 1000:.0f}ms, "
+            f"private {loaded_kb / 1024:.0f}MB after load / {queried_kb / 1024:.0f}MB after query, "
+            f"file-backed (shared) {file_kb / 1024:.0f}MB"
+        )
+
+    print(
+        f"{n_docs} chunks ({index_mb:.0f}MB on disk), {workers} workers, per worker: "
+        f"copied {describe(*copied)}; memory-mapped {describe(*mapped)}"
+    )
+    assert mapped[0] < copied[0]
+    assert mapped[2] < copied[2] / 4
+    assert mapped[3] < copied[3]
+
+
+class FakeLLMServer:
+    """A local OpenAI-compatible endpoint streaming `tokens` over SSE"""
+
+    def __init__(self, tokens, delay=0.0, status=200):
+        self.tokens = tokens
+        self.delay = delay
+        self.status = status
+        self.requests = []
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def client(self):
+        from apps.ai_services.llm_stream import StreamingLLMClient
+
+        return StreamingLLMClient(self.base_url, 'test-key', 'fake-model', name='fake')
+
+    @staticmethod
+    def _event(writer, data):
+        body = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+        writer.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+
+    async def _handle(self, reader, writer):
+        await reader.readline()
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        self.requests.append(json.loads(await reader.readexactly(int(headers['content-length']))))
+
+        if self.status != 200:
+            body = b'{"error": "overloaded"}'
+            writer.write(
+                f"HTTP/1.1 {self.status} Error\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+        else:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+            )
+            for token in self.tokens:
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                self._event(writer, {"choices": [{"delta": {"content": token}}]})
+                await writer.drain()
+            self._event(writer, {
+                "choices": [{"delta": {}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": len(self.tokens)},
+            })
+            self._event(writer, "[DONE]")
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+
+async def collect_stream(agent, original="Write an email", client_delay=0.0):
+    from apps.ai_services.rag_service_enhanced import OptimizationRequest
+
+    events = []
+    async for event in agent.optimize_prompt_stream(OptimizationRequest(session_id='s', original=original)):
+        events.append(event)
+        if client_delay:
+            await asyncio.sleep(client_delay)
+    return events
+
+
+class OptimizationStreamTest(TestCase):
+    """Token streaming from the LLM in StreamingRAGAgent.optimize_prompt_stream"""
+
+    def setUp(self):
+        import tempfile
+        from apps.ai_services.rag_service_enhanced import StreamingRAGAgent
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with override_settings(BASE_DIR=tmp.name):
+            self.agent = StreamingRAGAgent()
+
+    def stream(self, server, **kwargs):
+        async def run():
+            async with server:
+                with patch('apps.ai_services.rag_service_enhanced.get_streaming_llm_client',
+                           return_value=server.client()):
+                    return await collect_stream(self.agent, **kwargs)
+        return asyncio.run(run())
+
+    def test_streams_deltas_with_checksums(self):
+        import zlib
+
+        tokens = [f"word{i} " for i in range(45)]
+        with override_settings(RAG_STREAMING={'CHECKSUM_EVERY': 2}):
+            events = self.stream(FakeLLMServer(tokens, delay=0.001))
+
+        chunks = [e for e in events if e['type'] == 'optimization_chunk']
+        self.assertNotIn('full_text', chunks[0])
+        text = ""
+        for chunk in chunks:
+            text += chunk['delta']
+            if 'checksum' in chunk:
+                self.assertEqual(chunk['length'], len(text))
+                self.assertEqual(chunk['checksum'], f"{zlib.crc32(text.encode()):08x}")
+        self.assertTrue(any('checksum' in chunk for chunk in chunks))
+
+        complete = events[-1]
+        self.assertEqual(complete['type'], 'complete')
+        self.assertEqual((complete['optimized'], complete['source']), ("".join(tokens), 'fake'))
+        self.assertEqual(complete['checksum'], f"{zlib.crc32(text.encode()):08x}")
+        self.assertEqual(complete['usage']['tokens_out'], 45)
+
+    def test_falls_back_to_rules_when_provider_fails(self):
+        events = self.stream(FakeLLMServer([], status=503), original="Write an email")
+
+        complete = events[-1]
+        self.assertEqual(complete['source'], 'rules')
+        self.assertEqual(complete['optimized'], "Write an email.")
+
+    def test_slow_client_gets_coalesced_chunks(self):
+        tokens = [f"t{i} " for i in range(200)]
+        events = self.stream(FakeLLMServer(tokens), client_delay=0.005)
+
+        chunks = [e for e in events if e['type'] == 'optimization_chunk']
+        self.assertLess(len(chunks), len(tokens) / 2)
+        self.assertEqual("".join(chunk['delta'] for chunk in chunks), "".join(tokens))
+
+    def test_buffer_bounds_pending_text(self):
+        from apps.ai_services.llm_stream import DeltaBuffer
+
+        async def run():
+            buffer = DeltaBuffer(max_pending=100)
+
+            async def produce():
+                for _ in range(100):
+                    await buffer.put("x" * 10)
+                await buffer.close()
+
+            producer = asyncio.create_task(produce())
+            sizes = []
+            while (text := await buffer.get()) is not None:
+                sizes.append(len(text))
+                await asyncio.sleep(0.001)
+            await producer
+            return sizes
+
+        sizes = asyncio.run(run())
+        self.assertEqual(sum(sizes), 1000)
+        self.assertLessEqual(max(sizes), 100)
+
+
+@pytest.mark.slow
+def test_benchmark_optimization_stream():
+    """Time to first token and bytes sent for a 300-token optimization"""
+    import tempfile
+    import time
+    from apps.ai_services.rag_service_enhanced import OptimizationRequest, StreamingRAGAgent
+
+    tokens = [f"token{i} " for i in range(300)]
+    with tempfile.TemporaryDirectory() as tmp, override_settings(BASE_DIR=tmp):
+        agent = StreamingRAGAgent()
+
+    async def measure(run):
+        start = time.perf_counter()
+        first = None
+        sent = 0
+        async for event in run():
+            if first is None and event['type'] == 'optimization_chunk':
+                first = time.perf_counter() - start
+            sent += len(json.dumps(event))
+        return first, time.perf_counter() - start, sent
+
+    async def main():
+        async with FakeLLMServer(tokens, delay=0.001) as server:
+            client = server.client()
+
+            # Before: the whole response, then five chunks each re-sending the full text
+            async def buffered_full_text():
+                text = "".join([delta async for delta in client.stream_chat([])])
+                words = text.split()
+                step = max(1, len(words) // 5)
+                for i in range(0, len(words), step):
+                    yield {"type": "optimization_chunk", "chunk": " ".join(words[i:i + step]) + " ",
+                           "full_text": " ".join(words[:i + step]), "run_id": "r"}
+                    await asyncio.sleep(0.1)
+
+            # Token streaming that still re-sends the full text
+            async def streamed_full_text():
+                text = ""
+                async for delta in client.stream_chat([]):
+                    text += delta
+                    yield {"type": "optimization_chunk", "chunk": delta, "full_text": text, "run_id": "r"}
+
+            async def delta_stream():
+                with patch('apps.ai_services.rag_service_enhanced.get_streaming_llm_client', return_value=client):
+                    request = OptimizationRequest(session_id='bench', original='Write an email')
+                    async for event in agent.optimize_prompt_stream(request):
+                        yield event
+
+            return [await measure(run) for run in (buffered_full_text, streamed_full_text, delta_stream)]
+
+    results = asyncio.run(main())
+    names = ("buffered, 5 full-text chunks", "per-token full text", "delta chunks")
+    print("; ".join(
+        f"{name}: first token {first * 1000:.0f}ms, total {total * 1000:.0f}ms, {sent / 1024:.0f}KB"
+        for name, (first, total, sent) in zip(names, results)
+    ))
+    (buffered_first, _, _), (_, _, full_text_bytes), (delta_first, _, delta_bytes) = results
+    assert delta_first < buffered_first / 5
+    assert delta_bytes < full_text_bytes / 10
+
+
+def make_search_hits(query, count):
+    from apps.ai_services.live_search import SearchHit
+
+    return [
+        SearchHit(id=str(i), title=f"{query} template {i}", content=f"Prompt {i} about {query}", score=1.0)
+        for i in range(count)
+    ]
+
+
+@override_settings(LIVE_SEARCH={'DEBOUNCE_MS': 20, 'MAX_RESULTS': 10, 'WORKERS': 2})
+class LiveSearchTest(TestCase):
+    """Debouncing, cancellation and result reuse for as-you-type search"""
+
+    def type_queries(self, search, queries, gap=0.005, settle=0.1):
+        from apps.ai_services.live_search import LiveSearch
+
+        sent = []
+
+        async def send(query, hits, meta):
+            sent.append((query, hits, meta))
+
+        async def run():
+            live = LiveSearch(search, send)
+            for query in queries:
+                if query is None:
+                    await asyncio.sleep(settle)  # A pause in typing
+                    continue
+                live.submit(query)
+                await asyncio.sleep(gap)
+            await asyncio.sleep(settle)
+            live.cancel()
+
+        asyncio.run(run())
+        return sent
+
+    def test_only_the_query_typed_last_is_searched(self):
+        searched = []
+
+        def search(query, limit):
+            searched.append(query)
+            return make_search_hits(query, limit)
+
+        sent = self.type_queries(search, ["em", "ema", "emai", "email"])
+
+        self.assertEqual(searched, ["email"])
+        self.assertEqual([query for query, _, _ in sent], ["email"])
+        self.assertEqual(sent[0][2]['source'], 'search')
+
+    def test_short_queries_are_ignored(self):
+        search = MagicMock(return_value=[])
+        self.assertEqual(self.type_queries(search, ["e"]), [])
+        search.assert_not_called()
+
+    def test_newer_query_cancels_search_in_flight(self):
+        import threading
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def search(query, limit):
+            if query == "slow":
+                started.set()
+                release.wait(5)
+            return make_search_hits(query, limit)
+
+        from apps.ai_services.live_search import LiveSearch
+
+        sent = []
+
+        async def send(query, hits, meta):
+            sent.append(query)
+
+        async def run():
+            live = LiveSearch(search, send)
+            live.submit("slow")
+            await asyncio.to_thread(started.wait, 5)
+            live.submit("fast")
+            await asyncio.sleep(0.1)
+            release.set()
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+        self.assertEqual(sent, ["fast"])
+
+    def test_repeated_query_reuses_last_results(self):
+        searched = []
+
+        def search(query, limit):
+            searched.append(query)
+            return make_search_hits(query, 3)
+
+        # "emai" is typed and deleted again within the quiet window
+        sent = self.type_queries(search, ["ema", None, "emai", "ema"])
+
+        self.assertEqual(searched, ["ema"])
+        query, hits, meta = sent[-1]
+        self.assertEqual((query, meta['source'], hits), ("ema", 'cache', sent[0][1]))
+
+    def test_extended_query_is_searched_again(self):
+        searched = []
+
+        def search(query, limit):
+            searched.append(query)
+            # Full-text search can rank results the prefix's results lacked
+            return make_search_hits(query, 2)
+
+        sent = self.type_queries(search, ["ema", None, "email"])
+        self.assertEqual(searched, ["ema", "email"])
+        self.assertEqual(sent[-1][2]['source'], 'search')
+
+    def test_searches_are_bounded_by_worker_count(self):
+        import threading
+        import time
+        from apps.ai_services.live_search import LiveSearch
+
+        lock = threading.Lock()
+        running = [0, 0]  # current, peak
+
+        def search(query, limit):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return []
+
+        async def send(query, hits, meta):
+            pass
+
+        async def run():
+            sessions = [LiveSearch(search, send) for _ in range(20)]
+            for i, live in enumerate(sessions):
+                live.submit(f"query {i}")
+            await asyncio.sleep(0.3)
+
+        asyncio.run(run())
+        self.assertEqual(running[1], 2)
+
+
+@pytest.mark.slow
+def test_benchmark_live_search_typing_session():
+    """Searches run and result latency for 1k sockets typing the same query"""
+    import random
+    import time
+    from apps.ai_services.live_search import LiveSearch
+
+    sockets = 1000
+    # "email" typed at ~60 wpm, a pause, then the rest of the query
+    keystrokes = ["email"[:i] for i in range(1, 6)] + [None] + ["email template"[:i] for i in range(6, 15)]
+    corpus = make_search_hits("email", 20) + make_search_hits("essay", 20) + make_search_hits("code", 500)
+    searches = [0]
+
+    def search(query, limit):
+        # Stands in for the ORM query: a DB round trip plus ranking in Python
+        searches[0] += 1
+        time.sleep(0.002)
+        return [hit for hit in corpus if query in hit.title.lower()][:limit]
+
+    async def type_query(submit, latencies, received):
+        await asyncio.sleep(random.random() * 0.05)
+        for query in keystrokes:
+            if query is None:
+                await asyncio.sleep(0.4)
+                continue
+            submit(query)
+            await asyncio.sleep(0.05)
+        typed = time.perf_counter() - 0.05
+        while keystrokes[-1] not in received:
+            await asyncio.sleep(0.005)
+        latencies.append(received[keystrokes[-1]] - typed)
+
+    async def legacy():
+        # Before: every keystroke of two or more characters searched on the default executor
+        loop = asyncio.get_running_loop()
+        latencies = []
+
+        async def session():
+            received = {}
+
+            async def run(query):
+                await loop.run_in_executor(None, search, query, 10)
+                received.setdefault(query, time.perf_counter())
+
+            def submit(query):
+                if len(query) >= 2:
+                    asyncio.ensure_future(run(query))
+
+            await type_query(submit, latencies, received)
+
+        await asyncio.gather(*(session() for _ in range(sockets)))
+        return latencies
+
+    async def debounced():
+        latencies = []
+
+        async def session():
+            received = {}
+
+            async def send(query, hits, meta):
+                received[query] = time.perf_counter()
+
+            await type_query(LiveSearch(search, send).submit, latencies, received)
+
+        await asyncio.gather(*(session() for _ in range(sockets)))
+        return latencies
+
+    results = []
+    for run in (legacy, debounced):
+        searches[0] = 0
+        # A pool sized by this test's settings, not whichever test created it first
+        with patch('apps.ai_services.live_search._executor', None):
+            latencies = sorted(asyncio.run(run()))
+        results.append((searches[0], latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]))
+
+    print("; ".join(
+        f"{name}: {count} searches, p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms"
+        for name, (count, p50, p95) in zip(("per keystroke", "debounced"), results)
+    ))
+    (legacy_searches, _, legacy_p95), (searches_run, _, p95) = results
+    assert searches_run <= legacy_searches / 5
+    assert p95 < legacy_p95
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
@@ -6,6 +7,13 @@ from . import askme_views
 
 router = DefaultRouter()
 
+if getattr(settings, 'ASYNC_AI_VIEWS', False):
+    rag_retrieve_view = agent_views.RAGRetrieveView.as_view()
+    rag_answer_view = agent_views.RAGAnswerView.as_view()
+else:
+    rag_retrieve_view = agent_views.rag_retrieve
+    rag_answer_view = agent_views.rag_answer
+
 urlpatterns = [
     # AI service endpoints
     path('providers/', views.AIProviderListView.as_view(), name='ai-providers'),
@@ -39,8 +47,8 @@ urlpatterns = [
     path('agent/optimize/', agent_views.optimize_prompt, name='agent-optimize'),
     path('agent/stats/', agent_views.agent_stats, name='agent-stats'),
     # RAG retrieval and answer endpoints
-    path('rag/retrieve/', agent_views.rag_retrieve, name='rag-retrieve'),
-    path('rag/answer/', agent_views.rag_answer, name='rag-answer'),
+    path('rag/retrieve/', rag_retrieve_view, name='rag-retrieve'),
+    path('rag/answer/', rag_answer_view, name='rag-answer'),
 
     # Ask-Me Prompt Builder endpoints
     path('askme/start/', askme_views.askme_start_api, name='askme-start'),
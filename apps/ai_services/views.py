@@ -27,6 +27,8 @@ except ImportError:
 
 from .models import AssistantThread, AssistantMessage
 from .ai_assistants import AssistantRegistry
+from apps.core.event_loop import run_sync
+from apps.core.idempotency import IdempotencyStore
 # Import DeepSeek services
 try:
     from apps.templates.deepseek_service import get_deepseek_service, DeepSeekService
@@ -997,6 +999,31 @@ class AssistantThreadListView(APIView):
         return Response({"threads": serialized, "total": len(serialized)})
 
 
+# Results of PromptOptimizationSSEView and PromptOptimizationView, which share a payload shape
+optimization_replays = IdempotencyStore('ai_optimization')
+
+
+def _optimization_payload(result, start):
+    citations = []
+    for c in getattr(result, 'citations', []):
+        citations.append({
+            'id': getattr(c, 'id', ''),
+            'title': getattr(c, 'title', ''),
+            'source': getattr(c, 'source', ''),
+            'score': getattr(c, 'score', 0),
+        })
+
+    return {
+        'optimized': result.optimized,
+        'citations': citations,
+        'diff_summary': getattr(result, 'diff_summary', ''),
+        'usage': getattr(result, 'usage', {}),
+        'run_id': getattr(result, 'run_id', ''),
+        'processing_time_ms': int((time.time() - start) * 1000),
+        'success': True,
+    }
+
+
 class PromptOptimizationSSEView(APIView):
     """SSE streaming endpoint for prompt optimization.
 
@@ -1027,7 +1054,10 @@ class PromptOptimizationSSEView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        from apps.ai_services.agent_views import request_idempotency_key
+
         request_id = str(_uuid.uuid4())[:8]
+        idempotency_key = request_idempotency_key(request, data.get('session_id'), f"{mode}:{original}")
 
         def sse_generator():
             """Yield SSE events while performing RAG-powered optimisation."""
@@ -1056,41 +1086,23 @@ class PromptOptimizationSSEView(APIView):
 
                 yield f"event: progress\ndata: {{\"step\":\"retrieval\", \"message\":\"Retrieving relevant context…\"}}\n\n"
 
-                rag_agent = get_rag_agent()
+                def optimize():
+                    result = run_sync(get_rag_agent().optimize_prompt(opt_request))
+                    return _optimization_payload(result, start)
 
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    result = loop.run_until_complete(rag_agent.optimize_prompt(opt_request))
-                finally:
-                    loop.close()
+                # Retries of the same request replay its result instead of regenerating
+                result, replayed = optimization_replays.execute(idempotency_key, optimize)
 
                 yield f"event: progress\ndata: {{\"step\":\"optimizing\", \"message\":\"Generating optimised prompt…\"}}\n\n"
 
-                # Build citations list
-                citations = []
-                for c in getattr(result, 'citations', []):
-                    citations.append({
-                        'id': getattr(c, 'id', ''),
-                        'title': getattr(c, 'title', ''),
-                        'source': getattr(c, 'source', ''),
-                        'score': getattr(c, 'score', 0),
-                    })
-
-                processing_ms = int((_time.time() - start) * 1000)
-
-                payload = json.dumps({
-                    'optimized': result.optimized,
-                    'citations': citations,
-                    'diff_summary': getattr(result, 'diff_summary', ''),
-                    'usage': getattr(result, 'usage', {}),
-                    'run_id': getattr(result, 'run_id', ''),
-                    'processing_time_ms': processing_ms,
-                    'success': True,
-                })
+                processing_ms = result['processing_time_ms']
+                payload = json.dumps(result)
 
                 yield f"event: result\ndata: {payload}\n\n"
-                yield f"event: stream_complete\ndata: {{\"request_id\":\"{request_id}\", \"processing_time_ms\":{processing_ms}}}\n\n"
+                yield (
+                    f"event: stream_complete\ndata: {{\"request_id\":\"{request_id}\", "
+                    f"\"processing_time_ms\":{processing_ms}, \"replayed\":{json.dumps(replayed)}}}\n\n"
+                )
 
             except Exception as exc:
                 logger.error(f"SSE optimization error: {exc}")
@@ -1130,6 +1142,7 @@ class PromptOptimizationView(APIView):
             )
 
         try:
+            from apps.ai_services.agent_views import replay_response, request_idempotency_key
             from apps.ai_services.rag_service import get_rag_agent, OptimizationRequest
 
             opt_request = OptimizationRequest(
@@ -1144,34 +1157,17 @@ class PromptOptimizationView(APIView):
                 },
             )
 
-            rag_agent = get_rag_agent()
             start = time.time()
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(rag_agent.optimize_prompt(opt_request))
-            finally:
-                loop.close()
-
-            citations = []
-            for c in getattr(result, 'citations', []):
-                citations.append({
-                    'id': getattr(c, 'id', ''),
-                    'title': getattr(c, 'title', ''),
-                    'source': getattr(c, 'source', ''),
-                    'score': getattr(c, 'score', 0),
-                })
+            def optimize():
+                result = run_sync(get_rag_agent().optimize_prompt(opt_request))
+                return _optimization_payload(result, start)
 
-            return Response({
-                'optimized': result.optimized,
-                'citations': citations,
-                'diff_summary': getattr(result, 'diff_summary', ''),
-                'usage': getattr(result, 'usage', {}),
-                'run_id': getattr(result, 'run_id', ''),
-                'processing_time_ms': int((time.time() - start) * 1000),
-                'success': True,
-            })
+            idempotency_key = request_idempotency_key(request, data.get('session_id'), f"{mode}:{original}")
+            payload, replayed = optimization_replays.execute(idempotency_key, optimize)
+            if replayed:
+                return replay_response(payload)
+            return Response(payload)
 
         except Exception as exc:
             logger.error(f"Optimization error: {exc}")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AnalyticsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.analytics"
+
+    def ready(self):
+        # Keep dashboard snapshots in step with achievements, prompts and levels
+        from . import signals  # noqa: F401
@@ -0,0 +1,201 @@
+"""
+Materialized per-user dashboard data.
+
+AnalyticsDashboardView and UserInsightsView show an achievements count, the
+rank for the user's level, recent prompt history, favourite categories and
+achievement progress, each of which used to be its own query on every load.
+`compute_dashboard_data` runs them once and UserDashboardSnapshot stores
+the result.
+
+Signal handlers (apps.analytics.signals) queue a user in a dirty set when an
+achievement unlocks or progresses, a prompt is saved or the level changes,
+and the periodic `recompute_dashboard_snapshots` task drains the set, so a
+burst of events costs one recomputation and the snapshot is at most one task
+interval behind. Reads serve the snapshot with one primary-key query and fall
+back to live computation (stored for the next read) when there is none, it
+was computed for another level or format version, or it is older than
+DASHBOARD_SNAPSHOT_MAX_AGE_S, which bounds staleness where no beat drains
+the dirty set. Counters kept on the user row (XP, streak, credits) are
+always read live from request.user.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.core.dirty_set import DirtySet
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of compute_dashboard_data() changes
+SNAPSHOT_VERSION = 1
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_MAX_AGE_S = 300
+
+dashboard_dirty = DirtySet('analytics:dashboard:dirty')
+
+
+def _recent_activity(user):
+    from apps.prompt_history.models import PromptHistory
+
+    recent_activity = []
+    try:
+        for ph in PromptHistory.objects.filter(user=user).order_by('-created_at')[:10]:
+            recent_activity.append({
+                'template_name': getattr(ph, 'title', '') or getattr(ph, 'prompt_text', '')[:60] or 'Prompt',
+                'used_at': ph.created_at.isoformat() if hasattr(ph, 'created_at') else timezone.now().isoformat(),
+                'category': getattr(ph, 'category', '') or '',
+            })
+    except Exception:
+        pass
+    return recent_activity
+
+
+def _favorite_categories(user):
+    from apps.prompt_history.models import PromptHistory
+
+    try:
+        cat_qs = (
+            PromptHistory.objects
+            .filter(user=user)
+            .values('category')
+            .annotate(count=Count('id'))
+            .order_by('-count')[:5]
+        )
+        return [item['category'] for item in cat_qs if item.get('category')]
+    except Exception:
+        return []
+
+
+def _achievements_progress(user):
+    from apps.gamification.models import UserAchievement
+
+    achievements_progress = []
+    try:
+        ua_qs = UserAchievement.objects.filter(
+            user=user, is_unlocked=False
+        ).select_related('achievement').order_by('-progress_value')[:5]
+        for ua in ua_qs:
+            achievements_progress.append({
+                'name': ua.achievement.name,
+                'progress': ua.progress_value,
+                'required': ua.achievement.requirement_value,
+                'percentage': ua.progress_percentage,
+            })
+    except Exception:
+        pass
+    return achievements_progress
+
+
+def compute_dashboard_data(user):
+    """Everything the dashboard and insights views read from other tables"""
+    from apps.gamification.models import UserAchievement, UserLevel
+
+    level = getattr(user, 'level', 1)
+    rank = 'Temple Initiate'
+    try:
+        level_obj = UserLevel.objects.filter(level=level).first()
+        if level_obj:
+            rank = level_obj.name
+    except Exception:
+        pass
+
+    return {
+        'achievements_unlocked': UserAchievement.objects.filter(user=user, is_unlocked=True).count(),
+        'rank': rank,
+        'recent_activity': _recent_activity(user),
+        'favorite_categories': _favorite_categories(user),
+        'achievements_progress': _achievements_progress(user),
+    }
+
+
+def _snapshot_rows(users):
+    from .models import UserDashboardSnapshot
+
+    return [
+        UserDashboardSnapshot(
+            user=user,
+            level=getattr(user, 'level', 1),
+            version=SNAPSHOT_VERSION,
+            data=compute_dashboard_data(user),
+        )
+        for user in users
+    ]
+
+
+def _store(rows):
+    from .models import UserDashboardSnapshot
+
+    UserDashboardSnapshot.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['level', 'version', 'data', 'computed_at'],
+    )
+
+
+def get_dashboard_data(user):
+    """Snapshot data for user, computed live and stored on a miss"""
+    from .models import UserDashboardSnapshot
+
+    snapshot = (
+        UserDashboardSnapshot.objects
+        .filter(user_id=user.pk)
+        .values('level', 'version', 'data', 'computed_at')
+        .first()
+    )
+    max_age_s = getattr(settings, 'DASHBOARD_SNAPSHOT_MAX_AGE_S', DEFAULT_MAX_AGE_S)
+    if (
+        snapshot is not None
+        and snapshot['version'] == SNAPSHOT_VERSION
+        and snapshot['level'] == getattr(user, 'level', 1)
+        and (max_age_s is None or snapshot['computed_at'] > timezone.now() - timedelta(seconds=max_age_s))
+    ):
+        return snapshot['data']
+
+    rows = _snapshot_rows([user])
+    try:
+        with transaction.atomic():
+            _store(rows)
+    except IntegrityError:
+        # The user was deleted meanwhile; still answer with the live data
+        logger.warning(f"Could not store dashboard snapshot for user {user.pk}")
+    return rows[0].data
+
+
+def mark_dashboard_dirty(*user_ids):
+    """Queue users for the next snapshot recomputation once the transaction commits"""
+    dashboard_dirty.add_on_commit(user_ids)
+
+
+def recompute_snapshots(user_ids):
+    """Recompute and store the snapshots of user_ids; returns the number stored"""
+    from django.contrib.auth import get_user_model
+
+    users = list(get_user_model().objects.filter(pk__in=user_ids))
+    if not users:
+        return 0
+    _store(_snapshot_rows(users))
+    return len(users)
+
+
+def recompute_dirty_snapshots(batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """Drain the dirty set in batches; returns the number of snapshots stored"""
+    stored = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        user_ids = dashboard_dirty.pop(batch_size)
+        if not user_ids:
+            break
+        try:
+            stored += recompute_snapshots(user_ids)
+        except Exception:
+            # Put the batch back so the next run retries it
+            dashboard_dirty.add(user_ids)
+            raise
+        batches += 1
+    return stored
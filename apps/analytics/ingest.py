@@ -0,0 +1,294 @@
+"""
+Batched ingestion for front-end analytics events.
+
+The batch endpoint parses a JSON array, an {"events": [...]} object or
+NDJSON (optionally gzip-encoded), validates every event in one pass and
+hands the resulting AnalyticsEvent rows to a process-local EventBuffer.
+The buffer writes them with bulk_create once it holds FLUSH_SIZE events or
+its oldest event is FLUSH_INTERVAL_S old, so a page view costs a fraction
+of an INSERT instead of one INSERT and one request.
+
+The buffer is bounded: events arriving while it holds MAX_QUEUE rows are
+dropped and counted rather than growing memory. Buffered events are lost
+if the process dies before a flush; analytics are best-effort, and the
+loss window is FLUSH_INTERVAL_S.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGEST_SETTINGS = {
+    'FLUSH_SIZE': 500,
+    'FLUSH_INTERVAL_S': 2.0,
+    'MAX_QUEUE': 20000,
+    'BATCH_SIZE': 500,
+    'MAX_EVENTS_PER_REQUEST': 500,
+    'MAX_BODY_BYTES': 1024 * 1024,
+    'BACKGROUND_FLUSH': True,
+}
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Optional per-event string fields and the model's max_length for each
+EVENT_STRING_FIELDS = {
+    'session_id': 100,
+    'page_url': 500,
+    'referrer': 500,
+    'device_type': 20,
+    'platform': 20,
+    'browser': 50,
+}
+
+
+class PayloadError(ValueError):
+    """The request body could not be decoded into a list of events"""
+
+
+def get_ingest_settings():
+    options = dict(DEFAULT_INGEST_SETTINGS)
+    options.update(getattr(settings, 'ANALYTICS_INGEST', {}))
+    return options
+
+
+def _gunzip(body, max_bytes):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, max_bytes + 1)
+    except zlib.error as e:
+        raise PayloadError(f"Invalid gzip body: {e}")
+    if len(data) > max_bytes or decompressor.unconsumed_tail:
+        raise PayloadError(f"Decompressed body exceeds {max_bytes} bytes")
+    return data
+
+
+def parse_event_payload(body, content_type='', content_encoding='', max_bytes=None):
+    """
+    Decode a request body into a list of raw event dicts.
+
+    Accepts a JSON array, a JSON object with an "events" array, or NDJSON
+    (one event per line, selected by content type or detected when the body
+    is not a single JSON document).
+    """
+    max_bytes = max_bytes or get_ingest_settings()['MAX_BODY_BYTES']
+    if 'gzip' in (content_encoding or '').lower():
+        body = _gunzip(body, max_bytes)
+    elif len(body) > max_bytes:
+        raise PayloadError(f"Body exceeds {max_bytes} bytes")
+
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise PayloadError("Body is not valid UTF-8")
+
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type not in NDJSON_CONTENT_TYPES:
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            payload = None
+        else:
+            if isinstance(payload, dict) and isinstance(payload.get('events'), list):
+                return payload['events']
+            if isinstance(payload, list):
+                return payload
+            if isinstance(payload, dict):
+                return [payload]
+            raise PayloadError("Expected a JSON array of events")
+
+    events = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise PayloadError(f"Invalid JSON on line {line_number}: {e.msg}")
+    return events
+
+
+def build_events(raw_events, user=None, ip_address=None, user_agent=''):
+    """
+    Validate raw events and build unsaved AnalyticsEvent instances.
+
+    Returns (events, errors) where errors is a list of {'index', 'error'}
+    for the rejected entries. Request-level context (user, IP, user agent)
+    is applied to every event.
+    """
+    from .models import AnalyticsEvent
+
+    valid_types = {choice for choice, _ in AnalyticsEvent.EVENT_TYPES}
+    user_agent = (user_agent or '')[:1000]
+    events = []
+    errors = []
+    for index, raw in enumerate(raw_events):
+        if not isinstance(raw, dict):
+            errors.append({'index': index, 'error': 'Event must be an object'})
+            continue
+        event_name = raw.get('event_type') or raw.get('event_name')
+        if not isinstance(event_name, str) or not event_name.strip():
+            errors.append({'index': index, 'error': 'event_type or event_name is required'})
+            continue
+        properties = raw.get('properties', raw.get('data')) or {}
+        if not isinstance(properties, dict):
+            errors.append({'index': index, 'error': 'properties must be an object'})
+            continue
+
+        fields = {}
+        for name, max_length in EVENT_STRING_FIELDS.items():
+            value = raw.get(name)
+            if value is not None:
+                fields[name] = str(value)[:max_length]
+        metadata = {}
+        if raw.get('timestamp') is not None:
+            # timestamp is auto_now_add, so keep the client's clock separately
+            metadata['client_timestamp'] = str(raw['timestamp'])[:64]
+
+        events.append(AnalyticsEvent(
+            user=user,
+            event_type=event_name if event_name in valid_types else 'api_request',
+            event_name=event_name[:100],
+            properties=properties,
+            metadata=metadata,
+            ip_address=ip_address,
+            user_agent=user_agent,
+            **fields
+        ))
+    return events, errors
+
+
+def write_events(events, batch_size):
+    """Insert events with bulk_create; returns the number of INSERT statements"""
+    from .models import AnalyticsEvent
+
+    AnalyticsEvent.objects.bulk_create(events, batch_size=batch_size)
+    # bulk_create also caps batches at the backend's bind parameter limit
+    fields = AnalyticsEvent._meta.concrete_fields
+    batch_size = min(batch_size, max(connection.ops.bulk_batch_size(fields, events), 1))
+    return -(-len(events) // batch_size)
+
+
+class EventBuffer:
+    """
+    Bounded process-local buffer of unsaved AnalyticsEvent rows.
+
+    With background flushing a daemon thread writes the buffer when either
+    threshold is reached; without it (tests, management commands) the
+    thread adding the crossing event flushes inline.
+    """
+
+    def __init__(self, writer=write_events, options=None, clock=time.monotonic):
+        self._writer = writer
+        self._options = options
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._events = []
+        self._oldest = None
+        self._thread = None
+        self._pid = None
+        self.counters = {
+            'accepted': 0, 'dropped': 0, 'flushed': 0,
+            'flushes': 0, 'inserts': 0, 'failed': 0,
+        }
+
+    @property
+    def options(self):
+        return self._options or get_ingest_settings()
+
+    def __len__(self):
+        return len(self._events)
+
+    def _due(self):
+        options = self.options
+        return bool(self._events) and (
+            len(self._events) >= options['FLUSH_SIZE']
+            or self._clock() - self._oldest >= options['FLUSH_INTERVAL_S']
+        )
+
+    def add(self, events):
+        """Queue events; returns (accepted, dropped)"""
+        options = self.options
+        with self._lock:
+            room = max(options['MAX_QUEUE'] - len(self._events), 0)
+            accepted = events[:room]
+            dropped = len(events) - len(accepted)
+            if accepted:
+                if not self._events:
+                    self._oldest = self._clock()
+                self._events.extend(accepted)
+            self.counters['accepted'] += len(accepted)
+            self.counters['dropped'] += dropped
+            due = self._due()
+
+        if dropped:
+            logger.warning(f"Analytics buffer full, dropped {dropped} events")
+        if options['BACKGROUND_FLUSH']:
+            self._ensure_thread()
+            if due:
+                self._wakeup.set()
+        elif due:
+            self.flush()
+        return len(accepted), dropped
+
+    def flush(self):
+        """Write everything buffered; returns the number of events written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                self._oldest = None
+            if not events:
+                return 0
+            try:
+                inserts = self._writer(events, self.options['BATCH_SIZE'])
+            except Exception as e:
+                with self._lock:
+                    self.counters['failed'] += len(events)
+                logger.error(f"Analytics buffer flush failed, {len(events)} events lost: {e}")
+                return 0
+            with self._lock:
+                self.counters['flushed'] += len(events)
+                self.counters['flushes'] += 1
+                self.counters['inserts'] += inserts or 0
+            return len(events)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, buffered=len(self._events))
+
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            # Started lazily so forked workers each get their own flusher
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.options['FLUSH_INTERVAL_S'] / 2)
+            self._wakeup.clear()
+            with self._lock:
+                due = self._due()
+            if due:
+                close_old_connections()
+                self.flush()
+
+
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.analytics.partitions import (
+    get_partition_settings, is_partitioned, list_partitions, maintain_partitions, partition_existing_table,
+    partition_name, supports_partitioning,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Create future monthly partitions of analytics_events and detach (archive or drop) '
+        'partitions past the retention window. PostgreSQL only.'
+    )
+
+    def add_arguments(self, parser):
+        options = get_partition_settings()
+        parser.add_argument(
+            '--months-ahead', type=int, default=options['MONTHS_AHEAD'],
+            help='Future months to keep created (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--retain-months', type=int, default=options['RETAIN_MONTHS'],
+            help='Months of events to keep attached (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--archive-schema', default=options['ARCHIVE_SCHEMA'],
+            help='Schema detached partitions are moved to (default: %(default)s)',
+        )
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of archiving them')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='First convert a plain analytics_events table to monthly partitions. Copies every row '
+                 'under an exclusive lock; run it in a maintenance window.',
+        )
+        parser.add_argument(
+            '--lock-timeout', default='5s',
+            help='Give up converting if the table lock is not granted within this time (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        if options['convert'] and supports_partitioning(connection) and not is_partitioned(connection):
+            if options['dry_run']:
+                self.stdout.write('Would convert analytics_events to monthly partitions')
+                return
+            partition_existing_table(
+                connection, months_ahead=options['months_ahead'], lock_timeout=options['lock_timeout'],
+            )
+            self.stdout.write(self.style.SUCCESS('Converted analytics_events to monthly partitions'))
+
+        if not is_partitioned(connection):
+            hint = ' Run with --convert to partition it.' if supports_partitioning(connection) else ''
+            self.stdout.write(
+                f'analytics_events is not partitioned on this database ({connection.vendor}); '
+                f'dashboards use the rollup tables only. Nothing to do.{hint}'
+            )
+            return
+
+        result = maintain_partitions(
+            months_ahead=options['months_ahead'],
+            retain_months=options['retain_months'],
+            archive_schema=options['archive_schema'],
+            drop=options['drop'],
+            dry_run=options['dry_run'],
+        )
+        prefix = 'Would ' if options['dry_run'] else ''
+        for name in result['created']:
+            self.stdout.write(f'{prefix}create {name}' if prefix else f'Created {name}')
+        for name in result['detached']:
+            action = 'drop' if options['drop'] else f'archive to {options["archive_schema"]}'
+            self.stdout.write(f'{prefix}detach and {action}: {name}' if prefix else f'Detached {name} ({action})')
+
+        attached = ', '.join(partition_name(month) for month in list_partitions(connection))
+        self.stdout.write(self.style.SUCCESS(f'Attached partitions: {attached or "none"}'))
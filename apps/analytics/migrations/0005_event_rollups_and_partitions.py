@@ -0,0 +1,62 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_analyticsevent_conversionfunnel_funneluserjourney_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('event_type', models.CharField(choices=[('template_view', 'Template View'), ('template_usage_start', 'Template Usage Start'), ('template_completion', 'Template Completion'), ('template_copy', 'Template Copy'), ('template_search', 'Template Search'), ('category_browse', 'Category Browse'), ('user_upgrade', 'User Upgrade'), ('user_login', 'User Login'), ('user_registration', 'User Registration'), ('api_request', 'API Request'), ('page_view', 'Page View'), ('button_click', 'Button Click'), ('form_submission', 'Form Submission'), ('error', 'Error')], max_length=50)),
+                ('event_name', models.CharField(max_length=100)),
+                ('event_count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'analytics_event_rollups_daily',
+                'ordering': ['-bucket'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('event_type', models.CharField(choices=[('template_view', 'Template View'), ('template_usage_start', 'Template Usage Start'), ('template_completion', 'Template Completion'), ('template_copy', 'Template Copy'), ('template_search', 'Template Search'), ('category_browse', 'Category Browse'), ('user_upgrade', 'User Upgrade'), ('user_login', 'User Login'), ('user_registration', 'User Registration'), ('api_request', 'API Request'), ('page_view', 'Page View'), ('button_click', 'Button Click'), ('form_submission', 'Form Submission'), ('error', 'Error')], max_length=50)),
+                ('event_name', models.CharField(max_length=100)),
+                ('event_count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'analytics_event_rollups_hourly',
+                'ordering': ['-bucket'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water_mark', models.DateTimeField(blank=True, null=True)),
+                ('events_processed', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'analytics_rollup_state',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='analyticshourlyrollup',
+            constraint=models.UniqueConstraint(fields=('bucket', 'event_type', 'event_name'), name='analytics_hourly_rollup_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='analyticsdailyrollup',
+            constraint=models.UniqueConstraint(fields=('bucket', 'event_type', 'event_name'), name='analytics_daily_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('analytics', '0005_event_rollups_and_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.IntegerField(default=1)),
+                ('version', models.PositiveSmallIntegerField(default=1)),
+                ('data', models.JSONField(default=dict)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_snapshot', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_dashboard_snapshots',
+                'indexes': [models.Index(fields=['level'], name='user_dashbo_level_4a9985_idx')],
+            },
+        ),
+    ]
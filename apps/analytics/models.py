@@ -73,6 +73,82 @@ class AnalyticsEvent(models.Model):
         return f"{self.event_type}: {self.event_name} ({self.timestamp})"
 
 
+class AnalyticsEventRollup(models.Model):
+    """Event counts per time bucket, maintained by apps.analytics.rollups"""
+
+    bucket = models.DateTimeField()
+    event_type = models.CharField(max_length=50, choices=AnalyticsEvent.EVENT_TYPES)
+    event_name = models.CharField(max_length=100)
+    event_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:00} {self.event_type}/{self.event_name}: {self.event_count}"
+
+
+class AnalyticsHourlyRollup(AnalyticsEventRollup):
+    """Hourly event counts; pruned after ANALYTICS_ROLLUPS['HOURLY_RETENTION_DAYS']"""
+
+    class Meta:
+        db_table = 'analytics_event_rollups_hourly'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'event_type', 'event_name'], name='analytics_hourly_rollup_key'
+            ),
+        ]
+        ordering = ['-bucket']
+
+
+class AnalyticsDailyRollup(AnalyticsEventRollup):
+    """Daily event counts (UTC days); kept indefinitely"""
+
+    class Meta:
+        db_table = 'analytics_event_rollups_daily'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'event_type', 'event_name'], name='analytics_daily_rollup_key'
+            ),
+        ]
+        ordering = ['-bucket']
+
+
+class AnalyticsRollupState(models.Model):
+    """High-water mark of the events already counted into the rollups"""
+
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    events_processed = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'analytics_rollup_state'
+
+    def __str__(self):
+        return f"{self.name} through {self.high_water_mark}"
+
+
+class UserDashboardSnapshot(models.Model):
+    """Precomputed dashboard and insights data, maintained by apps.analytics.dashboard"""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='dashboard_snapshot')
+    # The user's level when computed; a level change makes the snapshot stale
+    level = models.IntegerField(default=1)
+    version = models.PositiveSmallIntegerField(default=1)
+    data = models.JSONField(default=dict)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_dashboard_snapshots'
+        indexes = [
+            models.Index(fields=['level']),
+        ]
+
+    def __str__(self):
+        return f"Dashboard snapshot for {self.user_id} ({self.computed_at})"
+
+
 class UserSessionAnalytics(models.Model):
     """Track user session analytics"""
     
@@ -0,0 +1,246 @@
+"""
+Monthly range partitioning of analytics_events on PostgreSQL.
+
+`manage.py manage_analytics_partitions --convert` turns analytics_events
+into a table partitioned by RANGE (timestamp) with one partition per
+calendar month (UTC) and a default partition for anything outside the
+created ranges. Converting copies every row while holding an exclusive
+lock on the table, so it is an explicit step for a maintenance window,
+not part of `migrate`. Because a partitioned
+table's primary key must contain the partition key, the key becomes
+(id, timestamp); ids are still random UUIDs, so the ORM keeps treating id
+as the primary key.
+
+`maintain_partitions` keeps MONTHS_AHEAD future months created and
+detaches months older than RETAIN_MONTHS once the rollups have counted
+them, moving them to ARCHIVE_SCHEMA (or dropping them). Detaching is a
+metadata change, so retention costs no DELETE and no vacuum. On other
+backends every function here is a no-op and the table stays a plain table.
+"""
+
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'analytics_events'
+DEFAULT_PARTITION = 'analytics_events_default'
+PARTITION_NAME_RE = re.compile(r'^analytics_events_y(\d{4})m(\d{2})$')
+
+DEFAULT_PARTITION_SETTINGS = {
+    'MONTHS_AHEAD': 3,
+    'RETAIN_MONTHS': 13,
+    'ARCHIVE_SCHEMA': 'analytics_archive',
+}
+
+
+def get_partition_settings():
+    options = dict(DEFAULT_PARTITION_SETTINGS)
+    options.update(getattr(settings, 'ANALYTICS_PARTITIONS', {}))
+    return options
+
+
+def month_start(value):
+    """First instant (UTC) of the month containing value"""
+    value = value.astimezone(dt_timezone.utc) if value.tzinfo else value.replace(tzinfo=dt_timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def supports_partitioning(connection=None):
+    connection = connection or default_connection
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(connection=None):
+    connection = connection or default_connection
+    if not supports_partitioning(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection=None):
+    """Monthly partitions attached to analytics_events as sorted month datetimes"""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_table_is_visible(p.oid)",
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc))
+    return sorted(months)
+
+
+def create_partition(cursor, month):
+    """Create the partition for one month if it does not exist yet"""
+    upper = add_months(month, 1)
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{PARENT_TABLE}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+    )
+
+
+def detach_partition(cursor, month, archive_schema=None, drop=False):
+    """Detach one month; then drop it, move it to archive_schema, or leave it in place"""
+    name = partition_name(month)
+    cursor.execute(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION "{name}"')
+    if drop:
+        cursor.execute(f'DROP TABLE "{name}"')
+    elif archive_schema:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"')
+        cursor.execute(f'ALTER TABLE "{name}" SET SCHEMA "{archive_schema}"')
+
+
+def maintain_partitions(now=None, months_ahead=None, retain_months=None, archive_schema=None,
+                        drop=False, dry_run=False, connection=None):
+    """
+    Create future monthly partitions and detach expired ones.
+
+    A month is only detached once the rollup high-water mark has passed its
+    end, so dashboards never lose events that were not yet counted.
+    Returns {'created': [...], 'detached': [...]} of partition names.
+    """
+    from .models import AnalyticsRollupState
+    from .rollups import ROLLUP_STATE_NAME
+
+    connection = connection or default_connection
+    result = {'created': [], 'detached': []}
+    if not is_partitioned(connection):
+        return result
+
+    options = get_partition_settings()
+    months_ahead = options['MONTHS_AHEAD'] if months_ahead is None else months_ahead
+    retain_months = options['RETAIN_MONTHS'] if retain_months is None else retain_months
+    archive_schema = options['ARCHIVE_SCHEMA'] if archive_schema is None else archive_schema
+
+    current = month_start(now or datetime.now(dt_timezone.utc))
+    existing = set(list_partitions(connection))
+    wanted = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    to_create = [month for month in wanted if month not in existing]
+
+    state = AnalyticsRollupState.objects.filter(name=ROLLUP_STATE_NAME).first()
+    counted_through = state.high_water_mark if state else None
+    oldest_kept = add_months(current, -retain_months)
+    to_detach = [
+        month for month in sorted(existing)
+        if month < oldest_kept
+        and counted_through is not None and add_months(month, 1) <= counted_through
+    ]
+
+    result['created'] = [partition_name(month) for month in to_create]
+    result['detached'] = [partition_name(month) for month in to_detach]
+    if dry_run:
+        return result
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for month in to_create:
+            create_partition(cursor, month)
+        for month in to_detach:
+            detach_partition(cursor, month, archive_schema=archive_schema, drop=drop)
+    for name in result['detached']:
+        logger.info(f"Detached analytics partition {name}")
+    return result
+
+
+def partition_existing_table(connection=None, months_ahead=None, lock_timeout='5s'):
+    """
+    Convert a plain analytics_events table into the partitioned layout.
+
+    Rows are copied into monthly partitions covering the existing data plus
+    months_ahead future months; the original indexes and foreign keys are
+    recreated on the partitioned parent under their original names so later
+    schema migrations still find them. Runs in one transaction, so a failure
+    leaves the plain table as it was; lock_timeout makes it give up rather
+    than queue behind (and block) live writers. Returns False when there was
+    nothing to convert.
+    """
+    connection = connection or default_connection
+    if not supports_partitioning(connection) or is_partitioned(connection):
+        return False
+    if months_ahead is None:
+        months_ahead = get_partition_settings()['MONTHS_AHEAD']
+    legacy = f'{PARENT_TABLE}_unpartitioned'
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if lock_timeout:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+        cursor.execute(f'LOCK TABLE "{PARENT_TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()",
+            [PARENT_TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')",
+            [PARENT_TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(f'SELECT min("timestamp"), max("timestamp") FROM "{PARENT_TABLE}"')
+        first, last = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{PARENT_TABLE}" RENAME TO "{legacy}"')
+        for name, contype, _ in constraints:
+            cursor.execute(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{name}"')
+        primary_key_indexes = {name for name, contype, _ in constraints if contype == 'p'}
+        for name, _ in indexes:
+            if name not in primary_key_indexes:
+                cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+        cursor.execute(
+            f'CREATE TABLE "{PARENT_TABLE}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE ("timestamp")'
+        )
+        for name, contype, _ in constraints:
+            if contype == 'p':
+                cursor.execute(
+                    f'ALTER TABLE "{PARENT_TABLE}" ADD CONSTRAINT "{name}" PRIMARY KEY ("id", "timestamp")'
+                )
+        cursor.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{PARENT_TABLE}" DEFAULT')
+
+        current = month_start(datetime.now(dt_timezone.utc))
+        month = min(month_start(first), current) if first else current
+        end = add_months(current, months_ahead)
+        if last:
+            end = max(end, month_start(last))
+        while month <= end:
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+        for name, definition in indexes:
+            if name not in primary_key_indexes:
+                cursor.execute(definition)
+        for name, contype, definition in constraints:
+            if contype == 'f':
+                cursor.execute(f'ALTER TABLE "{PARENT_TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+        cursor.execute(f'INSERT INTO "{PARENT_TABLE}" SELECT * FROM "{legacy}"')
+        cursor.execute(f'DROP TABLE "{legacy}"')
+    logger.info(f"Converted {PARENT_TABLE} to monthly partitions")
+    return True
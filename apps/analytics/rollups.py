@@ -0,0 +1,203 @@
+"""
+Incremental hourly and daily rollups of AnalyticsEvent.
+
+`roll_up_events` (run by the `roll_up_analytics_events` Celery task) counts
+only the events stored since the previous run: it reads the high-water mark
+from AnalyticsRollupState, groups the events in (mark, now - LAG_S] by hour,
+event_type and event_name in one query, adds the counts to the hourly and
+daily rollup rows and advances the mark, all in one transaction. LAG_S
+leaves room for buffered writers whose rows are timestamped shortly before
+they commit; an event committed more than LAG_S after its timestamp is not
+counted.
+
+Dashboards read `event_counts`, which sums rollup rows instead of scanning
+analytics_events. On PostgreSQL the few minutes after the mark are added
+from the raw table, where partition pruning keeps the scan to the current
+month; other backends serve the rollups only.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_STATE_NAME = 'analytics_events'
+GRANULARITIES = ('hour', 'day')
+
+DEFAULT_ROLLUP_SETTINGS = {
+    'LAG_S': 300,
+    'WINDOW_HOURS': 24,
+    'MAX_WINDOWS': 48,
+    'HOURLY_RETENTION_DAYS': 90,
+}
+
+
+def get_rollup_settings():
+    options = dict(DEFAULT_ROLLUP_SETTINGS)
+    options.update(getattr(settings, 'ANALYTICS_ROLLUPS', {}))
+    return options
+
+
+def _add_counts(model, counts):
+    """Add {(bucket, event_type, event_name): count} onto existing rollup rows"""
+    if not counts:
+        return
+    existing = {
+        (row.bucket, row.event_type, row.event_name): row
+        for row in model.objects.filter(bucket__in={key[0] for key in counts})
+    }
+    created = []
+    updated = []
+    for (bucket, event_type, event_name), count in counts.items():
+        row = existing.get((bucket, event_type, event_name))
+        if row is None:
+            created.append(model(bucket=bucket, event_type=event_type, event_name=event_name, event_count=count))
+        else:
+            row.event_count += count
+            updated.append(row)
+    model.objects.bulk_create(created, batch_size=500)
+    model.objects.bulk_update(updated, ['event_count'], batch_size=500)
+
+
+def _roll_up_window(start, end):
+    """Count events in (start, end] into the rollups; returns the number counted"""
+    from .models import AnalyticsDailyRollup, AnalyticsEvent, AnalyticsHourlyRollup
+
+    rows = (
+        AnalyticsEvent.objects
+        .filter(timestamp__gt=start, timestamp__lte=end)
+        .annotate(hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .values('hour', 'event_type', 'event_name')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    hourly = {}
+    daily = defaultdict(int)
+    for row in rows:
+        hourly[(row['hour'], row['event_type'], row['event_name'])] = row['count']
+        day = row['hour'].replace(hour=0)
+        daily[(day, row['event_type'], row['event_name'])] += row['count']
+
+    _add_counts(AnalyticsHourlyRollup, hourly)
+    _add_counts(AnalyticsDailyRollup, daily)
+    return sum(hourly.values())
+
+
+def roll_up_events(now=None, lag_s=None, window_hours=None, max_windows=None):
+    """
+    Count new events into the rollups and advance the high-water mark.
+
+    Works through at most max_windows windows of window_hours each, one
+    transaction per window, so a large backlog (first run, or after an
+    outage) is caught up over several runs without long transactions.
+    Returns the number of events counted.
+    """
+    from .models import AnalyticsEvent, AnalyticsHourlyRollup, AnalyticsRollupState
+
+    options = get_rollup_settings()
+    lag = timedelta(seconds=options['LAG_S'] if lag_s is None else lag_s)
+    window = timedelta(hours=window_hours or options['WINDOW_HOURS'])
+    max_windows = max_windows or options['MAX_WINDOWS']
+    now = now or timezone.now()
+    cutoff = now - lag
+
+    counted = 0
+    for _ in range(max_windows):
+        with transaction.atomic():
+            state, _ = AnalyticsRollupState.objects.select_for_update().get_or_create(name=ROLLUP_STATE_NAME)
+            start = state.high_water_mark
+            if start is None:
+                first = AnalyticsEvent.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+                if first is None:
+                    break
+                start = first - timedelta(microseconds=1)
+            if start >= cutoff:
+                break
+            end = min(cutoff, start + window)
+            window_count = _roll_up_window(start, end)
+            state.high_water_mark = end
+            state.events_processed += window_count
+            state.save(update_fields=['high_water_mark', 'events_processed', 'updated_at'])
+        counted += window_count
+
+    retention = timedelta(days=options['HOURLY_RETENTION_DAYS'])
+    AnalyticsHourlyRollup.objects.filter(bucket__lt=now - retention).delete()
+    return counted
+
+
+def rollup_high_water_mark():
+    from .models import AnalyticsRollupState
+
+    return (
+        AnalyticsRollupState.objects
+        .filter(name=ROLLUP_STATE_NAME)
+        .values_list('high_water_mark', flat=True)
+        .first()
+    )
+
+
+def event_counts(start, end=None, granularity='day', event_types=None, include_live=None):
+    """
+    Event counts per bucket and event_type between start and end.
+
+    Returns {'granularity', 'through', 'series': [{'bucket', 'event_type',
+    'count'}], 'totals': {event_type: count}}. 'through' is the time up to
+    which the counts are complete: the rollup mark, or end when the live
+    tail is included (the default on PostgreSQL only).
+    """
+    from .models import AnalyticsDailyRollup, AnalyticsEvent, AnalyticsHourlyRollup
+
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    end = end or timezone.now()
+    if include_live is None:
+        include_live = connection.vendor == 'postgresql'
+    model, trunc = (
+        (AnalyticsHourlyRollup, TruncHour) if granularity == 'hour' else (AnalyticsDailyRollup, TruncDay)
+    )
+    first_bucket = start.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        first_bucket = first_bucket.replace(hour=0)
+
+    counts = defaultdict(int)
+    rollups = model.objects.filter(bucket__gte=first_bucket, bucket__lt=end)
+    if event_types:
+        rollups = rollups.filter(event_type__in=event_types)
+    for row in rollups.values('bucket', 'event_type').annotate(count=Sum('event_count')).order_by():
+        counts[(row['bucket'], row['event_type'])] += row['count']
+
+    through = rollup_high_water_mark()
+    if include_live and (through is None or through < end):
+        live = AnalyticsEvent.objects.filter(timestamp__gte=first_bucket, timestamp__lt=end)
+        if through is not None:
+            live = live.filter(timestamp__gt=through)
+        if event_types:
+            live = live.filter(event_type__in=event_types)
+        live = (
+            live.annotate(bucket=trunc('timestamp', tzinfo=dt_timezone.utc))
+            .values('bucket', 'event_type')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for row in live:
+            counts[(row['bucket'], row['event_type'])] += row['count']
+        through = end
+
+    totals = defaultdict(int)
+    series = []
+    for (bucket, event_type), count in sorted(counts.items()):
+        totals[event_type] += count
+        series.append({'bucket': bucket, 'event_type': event_type, 'count': count})
+    return {
+        'granularity': granularity,
+        'through': through,
+        'series': series,
+        'totals': dict(totals),
+    }
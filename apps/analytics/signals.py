@@ -0,0 +1,45 @@
+"""
+Signal handlers that keep dashboard snapshots fresh.
+
+Each handler only queues the affected user (see apps.analytics.dashboard);
+the recomputation happens in the periodic task.
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .dashboard import mark_dashboard_dirty
+
+
+@receiver(post_save, sender='gamification.UserAchievement', dispatch_uid='dashboard_achievement_saved')
+@receiver(post_delete, sender='gamification.UserAchievement', dispatch_uid='dashboard_achievement_deleted')
+def achievement_changed(sender, instance, **kwargs):
+    """Unlocks and progress updates change the achievement count and progress list"""
+    mark_dashboard_dirty(instance.user_id)
+
+
+@receiver(post_save, sender='prompt_history.PromptHistory', dispatch_uid='dashboard_prompt_saved')
+@receiver(post_delete, sender='prompt_history.PromptHistory', dispatch_uid='dashboard_prompt_deleted')
+def prompt_saved(sender, instance, **kwargs):
+    mark_dashboard_dirty(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='dashboard_user_level_saved')
+def level_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Level-up saves name their fields (GamificationService.check_level_up), so
+    only those are queued; a full save that changes the level is caught on
+    read, where the snapshot's level no longer matches the user's.
+    """
+    if not created and update_fields and 'level' in update_fields:
+        mark_dashboard_dirty(instance.pk)
+
+
+@receiver(post_save, sender='gamification.UserLevel', dispatch_uid='dashboard_level_definition_saved')
+@receiver(post_delete, sender='gamification.UserLevel', dispatch_uid='dashboard_level_definition_deleted')
+def level_definition_changed(sender, instance, **kwargs):
+    """A renamed level changes the rank of every user at it; drop their snapshots"""
+    from .models import UserDashboardSnapshot
+
+    UserDashboardSnapshot.objects.filter(level=instance.level).delete()
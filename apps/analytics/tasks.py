@@ -0,0 +1,54 @@
+"""
+Celery tasks for the analytics app.
+"""
+import logging
+from celery import shared_task
+
+from .dashboard import DEFAULT_BATCH_SIZE, recompute_dirty_snapshots
+from .partitions import maintain_partitions
+from .rollups import roll_up_events
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def roll_up_analytics_events():
+    """
+    Count events stored since the last run into the hourly and daily rollups.
+
+    Returns:
+        Number of events counted
+    """
+    counted = roll_up_events()
+    if counted:
+        logger.info(f"Rolled up {counted} analytics events")
+    return counted
+
+
+@shared_task
+def maintain_analytics_partitions():
+    """
+    Create upcoming monthly partitions of analytics_events and detach expired ones
+    (PostgreSQL only).
+
+    Returns:
+        {'created': [...], 'detached': [...]} partition names
+    """
+    return maintain_partitions()
+
+
+@shared_task
+def recompute_dashboard_snapshots(batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Recompute the dashboard snapshot of every user queued since the last run.
+
+    Args:
+        batch_size: Users per batch
+
+    Returns:
+        Number of snapshots stored
+    """
+    stored = recompute_dirty_snapshots(batch_size=batch_size)
+    if stored:
+        logger.info(f"Recomputed {stored} dashboard snapshots")
+    return stored
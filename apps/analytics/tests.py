@@ -1,3 +1,610 @@
-from django.test import TestCase
+import gzip
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import TruncDay
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as timezone_now
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.analytics import dashboard, ingest, partitions
+from apps.analytics.ingest import EventBuffer, PayloadError, build_events, parse_event_payload
+from apps.analytics.models import (
+    AnalyticsDailyRollup, AnalyticsEvent, AnalyticsHourlyRollup, AnalyticsRollupState,
+    UserDashboardSnapshot,
+)
+from apps.analytics.rollups import event_counts, roll_up_events
+from apps.analytics.tasks import recompute_dashboard_snapshots
+from apps.analytics.views import (
+    AnalyticsBatchTrackView, AnalyticsDashboardView, AnalyticsTrackView, EventSummaryView, UserInsightsView,
+)
+from apps.gamification.models import Achievement, UserAchievement, UserLevel
+from apps.prompt_history.models import PromptHistory
+
+
+def ingest_options(**overrides):
+    options = dict(ingest.get_ingest_settings(), BACKGROUND_FLUSH=False)
+    options.update(overrides)
+    return options
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def store_events(at, count=1, **fields):
+    """Insert events stamped at `at` (timestamp is auto_now_add)"""
+    fields.setdefault("event_type", "page_view")
+    fields.setdefault("event_name", fields["event_type"])
+    with mock.patch("django.utils.timezone.now", return_value=at):
+        AnalyticsEvent.objects.bulk_create([AnalyticsEvent(**fields) for _ in range(count)])
+
+
+# ===========================================================================
+# 1. Payload parsing — JSON array, {"events": [...]}, NDJSON, gzip
+# ===========================================================================
+
+class PayloadParsingTests(TestCase):
+
+    events = [{"event_type": "page_view"}, {"event_name": "clicked_cta", "properties": {"id": 3}}]
+
+    def test_json_array_and_events_object(self):
+        body = json.dumps(self.events).encode()
+        self.assertEqual(parse_event_payload(body, "application/json"), self.events)
+        body = json.dumps({"events": self.events}).encode()
+        self.assertEqual(parse_event_payload(body, "application/json"), self.events)
+
+    def test_ndjson(self):
+        body = "\n".join(json.dumps(event) for event in self.events).encode() + b"\n\n"
+        self.assertEqual(parse_event_payload(body, "application/x-ndjson"), self.events)
+        # Detected without the content type, too
+        self.assertEqual(parse_event_payload(body, "text/plain"), self.events)
+
+    def test_gzip(self):
+        body = gzip.compress(json.dumps(self.events).encode())
+        self.assertEqual(parse_event_payload(body, "application/json", "gzip"), self.events)
+
+    def test_gzip_bomb_is_rejected(self):
+        body = gzip.compress(b"[" + b" " * 10_000 + b"]")
+        with self.assertRaises(PayloadError):
+            parse_event_payload(body, "application/json", "gzip", max_bytes=1000)
+
+    def test_invalid_ndjson_line(self):
+        with self.assertRaisesMessage(PayloadError, "line 2"):
+            parse_event_payload(b'{"event_type": "a"}\n{oops', "application/x-ndjson")
+
+    def test_bulk_validation_reports_indexes(self):
+        events, errors = build_events([
+            {"event_type": "page_view", "page_url": "https://x.test/" + "a" * 600},
+            "not-an-object",
+            {"properties": {}},
+            {"event_name": "custom", "properties": [1]},
+            {"event_name": "custom", "timestamp": "2026-01-01T00:00:00Z"},
+        ])
+        self.assertEqual([error["index"] for error in errors], [1, 2, 3])
+        self.assertEqual(len(events[0].page_url), 500)
+        self.assertEqual(events[1].event_type, "api_request")
+        self.assertEqual(events[1].metadata, {"client_timestamp": "2026-01-01T00:00:00Z"})
+
+
+# ===========================================================================
+# 2. EventBuffer — thresholds, bounded queue, background flushing
+# ===========================================================================
+
+class EventBufferTests(TestCase):
+
+    def make_events(self, count):
+        return build_events([{"event_type": "page_view"}] * count)[0]
+
+    def test_flushes_on_size_with_batched_inserts(self):
+        buffer = EventBuffer(options=ingest_options(FLUSH_SIZE=250, BATCH_SIZE=100))
+        buffer.add(self.make_events(249))
+        self.assertEqual(AnalyticsEvent.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as ctx:
+            buffer.add(self.make_events(1))
+        # bulk_create may split further on backends with a bind parameter limit
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertGreaterEqual(len(inserts), 3)
+        self.assertLessEqual(len(inserts), 5)
+        self.assertEqual(AnalyticsEvent.objects.count(), 250)
+        self.assertEqual(buffer.stats()["inserts"], len(inserts))
+
+    def test_flushes_on_age(self):
+        now = [100.0]
+        buffer = EventBuffer(options=ingest_options(FLUSH_INTERVAL_S=2.0), clock=lambda: now[0])
+        buffer.add(self.make_events(5))
+        now[0] += 2.5
+        buffer.add(self.make_events(1))
+        self.assertEqual(AnalyticsEvent.objects.count(), 6)
+        self.assertEqual(len(buffer), 0)
+
+    def test_bounded_queue_counts_drops(self):
+        buffer = EventBuffer(options=ingest_options(MAX_QUEUE=10, FLUSH_SIZE=1000))
+        self.assertEqual(buffer.add(self.make_events(8)), (8, 0))
+        self.assertEqual(buffer.add(self.make_events(5)), (2, 3))
+        stats = buffer.stats()
+        self.assertEqual((stats["accepted"], stats["dropped"], stats["buffered"]), (10, 3, 10))
+
+    def test_failed_flush_is_counted(self):
+        def failing_writer(events, batch_size):
+            raise RuntimeError("db down")
+
+        buffer = EventBuffer(writer=failing_writer, options=ingest_options())
+        buffer.add(self.make_events(3))
+        with self.assertLogs("apps.analytics.ingest", level="ERROR"):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats()["failed"], 3)
+
+    def test_background_thread_flushes(self):
+        written = []
+        flushed = threading.Event()
+
+        def writer(events, batch_size):
+            written.extend(events)
+            flushed.set()
+            return 1
+
+        buffer = EventBuffer(
+            writer=writer,
+            options=ingest_options(BACKGROUND_FLUSH=True, FLUSH_SIZE=10, FLUSH_INTERVAL_S=0.05),
+        )
+        buffer.add(self.make_events(3))
+        self.assertEqual(written, [])
+        self.assertTrue(flushed.wait(2))
+        self.assertEqual(len(written), 3)
+
+
+# ===========================================================================
+# 3. Batch endpoint
+# ===========================================================================
+
+class BatchTrackViewTests(TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.buffer = EventBuffer(options=ingest_options(FLUSH_SIZE=1000))
+        patcher = mock.patch.object(ingest, "event_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body, content_type="application/json", user=None, **extra):
+        request = self.factory.generic("POST", "/api/v2/analytics/track/batch/", body, content_type, **extra)
+        if user is not None:
+            force_authenticate(request, user=user)
+        return AnalyticsBatchTrackView.as_view()(request)
+
+    def test_accepts_gzip_ndjson_and_rejects_invalid(self):
+        user = get_user_model().objects.create_user(
+            username="tracker", email="tracker@example.com", password="pass1234"
+        )
+        lines = [{"event_type": "page_view", "session_id": "s1"}] * 4 + [{"nope": 1}]
+        body = gzip.compress("\n".join(json.dumps(line) for line in lines).encode())
+        response = self.post(
+            body, "application/x-ndjson", user=user,
+            HTTP_CONTENT_ENCODING="gzip", HTTP_USER_AGENT="pytest", REMOTE_ADDR="10.0.0.1",
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data["accepted"], response.data["rejected"]), (4, 1))
+        self.assertEqual(response.data["errors"][0]["index"], 4)
+
+        self.buffer.flush()
+        event = AnalyticsEvent.objects.first()
+        self.assertEqual(AnalyticsEvent.objects.filter(user=user, session_id="s1").count(), 4)
+        self.assertEqual((event.ip_address, event.user_agent), ("10.0.0.1", "pytest"))
+
+    def test_limits(self):
+        self.assertEqual(self.post(b"{not json").status_code, 400)
+        with override_settings(ANALYTICS_INGEST=ingest_options(MAX_EVENTS_PER_REQUEST=2)):
+            response = self.post(json.dumps([{"event_type": "page_view"}] * 3).encode())
+        self.assertEqual(response.status_code, 413)
+
+    def test_full_buffer_returns_503(self):
+        self.buffer._options = ingest_options(MAX_QUEUE=0)
+        response = self.post(json.dumps([{"event_type": "page_view"}]).encode())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data["dropped"], 1)
+
+
+# ===========================================================================
+# 4. Rollups, high-water mark and partition maintenance
+# ===========================================================================
+
+class EventRollupTests(TestCase):
+
+    def hourly(self):
+        return {
+            (row.bucket, row.event_type): row.event_count
+            for row in AnalyticsHourlyRollup.objects.all()
+        }
+
+    def test_incremental_rollup_counts_each_event_once(self):
+        store_events(utc(2026, 3, 1, 10, 5), 3)
+        store_events(utc(2026, 3, 1, 11, 59), 2, event_type="button_click")
+        self.assertEqual(roll_up_events(now=utc(2026, 3, 1, 12, 30), lag_s=0), 5)
+
+        store_events(utc(2026, 3, 1, 12, 40), 4)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(roll_up_events(now=utc(2026, 3, 1, 13, 0), lag_s=0), 4)
+        aggregate = [q for q in ctx.captured_queries if 'FROM "analytics_events"' in q["sql"]]
+        self.assertEqual(len(aggregate), 1)
+        self.assertIn('"timestamp" >', aggregate[0]["sql"])
+        self.assertEqual(roll_up_events(now=utc(2026, 3, 1, 13, 0), lag_s=0), 0)
+
+        self.assertEqual(self.hourly(), {
+            (utc(2026, 3, 1, 10), "page_view"): 3,
+            (utc(2026, 3, 1, 11), "button_click"): 2,
+            (utc(2026, 3, 1, 12), "page_view"): 4,
+        })
+        daily = AnalyticsDailyRollup.objects.get(bucket=utc(2026, 3, 1), event_type="page_view")
+        self.assertEqual(daily.event_count, 7)
+        state = AnalyticsRollupState.objects.get()
+        self.assertEqual((state.high_water_mark, state.events_processed), (utc(2026, 3, 1, 13), 9))
+
+    def test_lag_and_windows_bound_each_run(self):
+        store_events(utc(2026, 3, 1, 0, 30), 1)
+        store_events(utc(2026, 3, 1, 1, 30), 1)
+        store_events(utc(2026, 3, 1, 2, 30), 1)
+        store_events(utc(2026, 3, 1, 2, 58), 1)
+        now = utc(2026, 3, 1, 3, 0)
+
+        self.assertEqual(roll_up_events(now=now, lag_s=300, window_hours=1, max_windows=1), 1)
+        self.assertEqual(roll_up_events(now=now, lag_s=300, window_hours=1, max_windows=10), 2)
+        # The 02:58 event is inside the lag until a later run
+        self.assertEqual(roll_up_events(now=now + timedelta(minutes=5), lag_s=300), 1)
+
+    def test_hourly_rollups_are_pruned(self):
+        store_events(utc(2026, 1, 1, 9), 2)
+        roll_up_events(now=utc(2026, 1, 1, 10), lag_s=0)
+        roll_up_events(now=utc(2026, 6, 1), lag_s=0)
+        self.assertFalse(AnalyticsHourlyRollup.objects.exists())
+        self.assertEqual(AnalyticsDailyRollup.objects.get().event_count, 2)
+
+    def test_event_counts_read_rollups(self):
+        store_events(utc(2026, 3, 1, 10), 3)
+        store_events(utc(2026, 3, 2, 10), 2, event_type="error")
+        roll_up_events(now=utc(2026, 3, 2, 12), lag_s=0)
+        store_events(utc(2026, 3, 2, 12, 30), 5)
+
+        with self.assertNumQueries(2):
+            summary = event_counts(utc(2026, 3, 1, 8), utc(2026, 3, 3), include_live=False)
+        self.assertEqual(summary["through"], utc(2026, 3, 2, 12))
+        self.assertEqual(summary["totals"], {"page_view": 3, "error": 2})
+        self.assertEqual(summary["series"][0], {"bucket": utc(2026, 3, 1), "event_type": "page_view", "count": 3})
+
+        live = event_counts(utc(2026, 3, 1, 8), utc(2026, 3, 3), include_live=True)
+        self.assertEqual(live["totals"], {"page_view": 8, "error": 2})
+        self.assertEqual(live["through"], utc(2026, 3, 3))
+
+        hourly = event_counts(utc(2026, 3, 2), utc(2026, 3, 3), granularity="hour", event_types=["error"])
+        self.assertEqual(hourly["series"], [{"bucket": utc(2026, 3, 2, 10), "event_type": "error", "count": 2}])
+
+    def test_summary_view(self):
+        User = get_user_model()
+        staff = User.objects.create_user(username="ops", email="ops@example.com", password="pass1234", is_staff=True)
+        member = User.objects.create_user(username="member", email="member@example.com", password="pass1234")
+        store_events(timezone_now() - timedelta(days=1), 4)
+        roll_up_events(lag_s=0)
+
+        factory = APIRequestFactory()
+        request = factory.get("/api/v2/analytics/events/summary/", {"days": 7})
+        force_authenticate(request, user=member)
+        self.assertEqual(EventSummaryView.as_view()(request).status_code, 403)
+
+        request = factory.get("/api/v2/analytics/events/summary/", {"days": 7})
+        force_authenticate(request, user=staff)
+        response = EventSummaryView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["totals"], {"page_view": 4})
+
+        request = factory.get("/api/v2/analytics/events/summary/", {"granularity": "week"})
+        force_authenticate(request, user=staff)
+        self.assertEqual(EventSummaryView.as_view()(request).status_code, 400)
+
+
+class PartitionMaintenanceTests(TestCase):
+
+    def test_month_arithmetic(self):
+        month = partitions.month_start(utc(2026, 12, 31, 23, 59))
+        self.assertEqual(month, utc(2026, 12, 1))
+        self.assertEqual(partitions.add_months(month, 1), utc(2027, 1, 1))
+        self.assertEqual(partitions.add_months(month, -13), utc(2025, 11, 1))
+        self.assertEqual(partitions.partition_name(month), "analytics_events_y2026m12")
+        self.assertTrue(partitions.PARTITION_NAME_RE.match(partitions.partition_name(month)))
+
+    def test_no_op_without_postgresql_partitioning(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("covers the non-PostgreSQL fallback")
+        self.assertFalse(partitions.is_partitioned())
+        self.assertEqual(partitions.maintain_partitions(), {"created": [], "detached": []})
+        out = StringIO()
+        call_command("manage_analytics_partitions", "--dry-run", stdout=out)
+        self.assertIn("not partitioned", out.getvalue())
+
+    def test_migrations_leave_the_table_unpartitioned(self):
+        self.assertFalse(partitions.is_partitioned())
+        call_command("manage_analytics_partitions", "--convert", "--dry-run", stdout=StringIO())
+        self.assertFalse(partitions.is_partitioned())
+
+    def test_convert_command_partitions_existing_rows(self):
+        if not partitions.supports_partitioning():
+            self.skipTest("needs PostgreSQL (set TEST_DATABASE_URL)")
+        now = datetime.now(dt_timezone.utc)
+        store_events(utc(2025, 1, 15, 12), 2)
+        store_events(now, 3, event_type="button_click")
+
+        out = StringIO()
+        call_command("manage_analytics_partitions", "--convert", "--months-ahead", "1", stdout=out)
+        self.assertIn("Converted analytics_events", out.getvalue())
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(AnalyticsEvent.objects.count(), 5)
+
+        current = partitions.month_start(now)
+        months = partitions.list_partitions()
+        self.assertEqual(months[0], utc(2025, 1, 1))
+        self.assertIn(partitions.add_months(current, 1), months)
+
+        AnalyticsEvent.objects.create(event_type="page_view", event_name="page_view")
+        self.assertEqual(AnalyticsEvent.objects.filter(event_type="page_view").count(), 3)
+        self.assertFalse(partitions.partition_existing_table())
+
+
+# ===========================================================================
+# 5. Dashboard snapshots — read path, signals and debounced recompute
+# ===========================================================================
+
+class DashboardSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="dash", email="dash@example.com", password="pass1234"
+        )
+        self.factory = APIRequestFactory()
+        UserLevel.objects.create(level=1, name="Novice", experience_required=0)
+        UserLevel.objects.create(level=2, name="Adept", experience_required=100)
+        self.achievements = [
+            Achievement.objects.create(
+                name=f"Achievement {i}", description="", requirement_type="templates_created", requirement_value=10
+            )
+            for i in range(3)
+        ]
+        dashboard.dashboard_dirty.local.clear()
+        self.addCleanup(dashboard.dashboard_dirty.local.clear)
+
+    def get(self, view_class):
+        request = self.factory.get("/api/v2/analytics/dashboard/")
+        force_authenticate(request, user=self.user)
+        return view_class.as_view()(request).data
+
+    def unlock(self, achievement):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserAchievement.objects.create(
+                user=self.user, achievement=achievement, progress_value=10, is_unlocked=True
+            )
+
+    def test_miss_computes_live_then_serves_snapshot(self):
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[0], progress_value=4)
+        PromptHistory.objects.create(user=self.user, original_prompt="hello")
+
+        first = self.get(AnalyticsDashboardView)
+        self.assertEqual(UserDashboardSnapshot.objects.get(user=self.user).level, self.user.level)
+        with self.assertNumQueries(1):
+            second = self.get(AnalyticsDashboardView)
+        self.assertEqual(first, second)
+        self.assertEqual(second["gamification"]["rank"], "Novice")
+        self.assertEqual(len(second["recent_activity"]), 1)
+
+        with self.assertNumQueries(1):
+            insights = self.get(UserInsightsView)
+        self.assertEqual(insights["achievements_progress"][0]["progress"], 4)
+
+    def test_signals_queue_one_recompute_per_user(self):
+        self.get(AnalyticsDashboardView)
+        for achievement in self.achievements[:2]:
+            self.unlock(achievement)
+        with self.captureOnCommitCallbacks(execute=True):
+            PromptHistory.objects.create(user=self.user, original_prompt="hello")
+
+        # Still the old snapshot until the task runs
+        self.assertEqual(self.get(AnalyticsDashboardView)["gamification"]["achievements_unlocked"], 0)
+        self.assertEqual(dashboard.dashboard_dirty.count(), 1)
+        self.assertEqual(recompute_dashboard_snapshots(), 1)
+        self.assertEqual(dashboard.dashboard_dirty.count(), 0)
+
+        data = self.get(AnalyticsDashboardView)
+        self.assertEqual(data["gamification"]["achievements_unlocked"], 2)
+        self.assertEqual(len(data["recent_activity"]), 1)
+
+    def test_level_change(self):
+        self.get(AnalyticsDashboardView)
+        self.user.level = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=["level"])
+        self.assertEqual(dashboard.dashboard_dirty.count(), 1)
+
+        # A save without update_fields is caught on read by the level check
+        dashboard.dashboard_dirty.local.clear()
+        self.user.level = 1
+        self.user.save()
+        self.assertEqual(dashboard.dashboard_dirty.count(), 0)
+        self.assertEqual(self.get(AnalyticsDashboardView)["gamification"]["rank"], "Novice")
+        self.user.level = 2
+        self.user.save()
+        self.assertEqual(self.get(AnalyticsDashboardView)["gamification"]["rank"], "Adept")
+
+    def test_level_rename_drops_snapshots(self):
+        self.get(AnalyticsDashboardView)
+        UserLevel.objects.filter(level=1).update(name="Initiate")
+        UserLevel.objects.get(level=1).save()
+        self.assertFalse(UserDashboardSnapshot.objects.exists())
+        self.assertEqual(self.get(AnalyticsDashboardView)["gamification"]["rank"], "Initiate")
+
+    def test_stale_snapshot_is_recomputed_without_a_beat(self):
+        self.get(AnalyticsDashboardView)
+        # Unlocked without draining the dirty set, as when no beat runs
+        self.unlock(self.achievements[0])
+        dashboard.dashboard_dirty.local.clear()
+        self.assertEqual(self.get(AnalyticsDashboardView)["gamification"]["achievements_unlocked"], 0)
+
+        UserDashboardSnapshot.objects.update(computed_at=timezone_now() - timedelta(minutes=10))
+        with self.settings(DASHBOARD_SNAPSHOT_MAX_AGE_S=300):
+            self.assertEqual(self.get(AnalyticsDashboardView)["gamification"]["achievements_unlocked"], 1)
+        self.assertGreater(
+            UserDashboardSnapshot.objects.get(user=self.user).computed_at, timezone_now() - timedelta(minutes=1)
+        )
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_batch_vs_single_event_ingestion(monkeypatch):
+    factory = APIRequestFactory()
+    total = 1000
+    event = {"event_type": "page_view", "properties": {"path": "/templates/"}}
+
+    def run(send):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            send()
+            elapsed = time.perf_counter() - start
+        inserts = sum(1 for q in ctx.captured_queries if q["sql"].startswith("INSERT"))
+        return total / elapsed, inserts
+
+    def single():
+        view = AnalyticsTrackView.as_view()
+        for _ in range(total):
+            view(factory.post("/track/", event, format="json"))
+
+    buffer = EventBuffer(options=ingest_options(FLUSH_SIZE=500, BATCH_SIZE=500))
+    monkeypatch.setattr(ingest, "event_buffer", buffer)
+
+    def batched():
+        view = AnalyticsBatchTrackView.as_view()
+        body = json.dumps([event] * 100).encode()
+        for _ in range(total // 100):
+            view(factory.generic("POST", "/track/batch/", body, "application/json"))
+        buffer.flush()
+
+    single_rate, single_inserts = run(single)
+    batch_rate, batch_inserts = run(batched)
+    print(
+        f"single: {single_rate:.0f} events/s, {single_inserts} INSERTs per 1k; "
+        f"batch of 100: {batch_rate:.0f} events/s, {batch_inserts} INSERTs per 1k"
+    )
+    assert AnalyticsEvent.objects.count() == 2 * total
+    assert batch_inserts < total // 50
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_dashboard_aggregation_raw_vs_rollups():
+    hours = 30 * 24
+    per_hour = 100
+    types = ["page_view", "button_click", "template_view", "template_search", "error"]
+    end = utc(2026, 3, 31)
+    start = end - timedelta(hours=hours)
+
+    insert_start = time.perf_counter()
+    for hour in range(hours):
+        at = start + timedelta(hours=hour, minutes=30)
+        with mock.patch("django.utils.timezone.now", return_value=at):
+            AnalyticsEvent.objects.bulk_create(
+                [AnalyticsEvent(event_type=types[i % 5], event_name=types[i % 5]) for i in range(per_hour)],
+                batch_size=500,
+            )
+    total = hours * per_hour
+    insert_rate = total / (time.perf_counter() - insert_start)
+
+    def timed(fn, runs=5):
+        best = float("inf")
+        for _ in range(runs):
+            begin = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - begin)
+        return best, result
+
+    def raw_dashboard():
+        return list(
+            AnalyticsEvent.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(day=TruncDay("timestamp")).values("day", "event_type")
+            .annotate(count=Count("id")).order_by()
+        )
+
+    raw_s, raw_rows = timed(raw_dashboard)
+    rollup_start = time.perf_counter()
+    assert roll_up_events(now=end, lag_s=0, max_windows=100) == total
+    rollup_rate = total / (time.perf_counter() - rollup_start)
+    rollup_s, summary = timed(lambda: event_counts(start, end, include_live=False))
+
+    # One 5-minute batch at the sampled rate, as the periodic task sees it
+    store_events(end + timedelta(minutes=1), per_hour // 12)
+    increment_s, _ = timed(lambda: roll_up_events(now=end + timedelta(minutes=5), lag_s=0), runs=1)
+
+    scale = 50_000_000 / total
+    print(
+        f"{total} events: insert {insert_rate:.0f}/s; raw 30-day aggregate {raw_s * 1000:.1f}ms "
+        f"(~{raw_s * scale:.0f}s extrapolated to 50M); rollup read {rollup_s * 1000:.2f}ms "
+        f"({len(summary['series'])} rows, independent of event count); "
+        f"catch-up {rollup_rate:.0f} events/s; 5-minute increment {increment_s * 1000:.1f}ms"
+    )
+    assert sum(summary["totals"].values()) == total == sum(row["count"] for row in raw_rows)
+    assert rollup_s < raw_s
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_dashboard_snapshot_read_path():
+    User = get_user_model()
+    user_count = 1000
+    User.objects.bulk_create([
+        User(username=f"bench{i}", email=f"bench{i}@example.com") for i in range(user_count)
+    ], batch_size=500)
+    users = list(User.objects.order_by("pk"))
+    achievements = [
+        Achievement.objects.create(name=f"A{i}", description="", requirement_type="x", requirement_value=5)
+        for i in range(10)
+    ]
+    UserAchievement.objects.bulk_create([
+        UserAchievement(user=user, achievement=achievement, progress_value=3, is_unlocked=i % 2 == 0)
+        for user in users for i, achievement in enumerate(achievements)
+    ], batch_size=500)
+    PromptHistory.objects.bulk_create([
+        PromptHistory(user=user, original_prompt=f"prompt {i}") for user in users for i in range(10)
+    ], batch_size=500)
+    factory = APIRequestFactory()
+    view = AnalyticsDashboardView.as_view()
+
+    def measure(sample):
+        latencies = []
+        with CaptureQueriesContext(connection) as ctx:
+            for user in sample:
+                request = factory.get("/api/v2/analytics/dashboard/")
+                force_authenticate(request, user=user)
+                start = time.perf_counter()
+                view(request)
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return latencies[int(len(latencies) * 0.95)] * 1000, len(ctx.captured_queries) / len(sample)
+
+    sample = users[::4]
+    with mock.patch.object(dashboard, "get_dashboard_data", dashboard.compute_dashboard_data):
+        live_p95, live_queries = measure(sample)
+    dashboard.recompute_snapshots([user.pk for user in users])
+    snapshot_p95, snapshot_queries = measure(sample)
+
+    print(
+        f"{user_count} users: live p95 {live_p95:.2f}ms, {live_queries:.1f} queries/request; "
+        f"snapshot p95 {snapshot_p95:.2f}ms, {snapshot_queries:.1f} queries/request"
+    )
+    assert snapshot_queries == 1
+    assert snapshot_p95 < live_p95
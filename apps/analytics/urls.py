@@ -7,7 +7,9 @@ from apps.analytics.views import (
     TemplateAnalyticsView,
     ABTestView,
     RecommendationView,
-    AnalyticsTrackView
+    AnalyticsTrackView,
+    AnalyticsBatchTrackView,
+    EventSummaryView,
 )
 
 router = DefaultRouter()
@@ -20,6 +22,8 @@ urlpatterns = [
     path('ab-tests/', ABTestView.as_view(), name='ab-tests'),
     path('recommendations/', RecommendationView.as_view(), name='recommendations'),
     path('track/', AnalyticsTrackView.as_view(), name='analytics-track'),
+    path('track/batch/', AnalyticsBatchTrackView.as_view(), name='analytics-track-batch'),
+    path('events/summary/', EventSummaryView.as_view(), name='analytics-event-summary'),
     
     # Include router URLs
     path('', include(router.urls)),
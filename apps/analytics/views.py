@@ -3,28 +3,12 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count, Avg, Q
+from django.db.models import Avg, Q
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
-def _get_prompt_history_model():
-    try:
-        from apps.prompt_history.models import PromptHistory
-        return PromptHistory
-    except ImportError:
-        return None
-
-
-def _get_gamification_models():
-    try:
-        from apps.gamification.models import UserAchievement
-        return UserAchievement
-    except ImportError:
-        return None
-
-
 def _get_template_model():
     try:
         from apps.propmtcraft.models import PromptTemplate
@@ -39,12 +23,17 @@ def _get_template_model():
 
 class AnalyticsDashboardView(APIView):
     """
-    Analytics dashboard — real DB aggregations from User, PromptHistory, and Gamification models.
+    Analytics dashboard — User counters plus the precomputed dashboard snapshot
+    (achievements, rank, recent PromptHistory; see apps.analytics.dashboard).
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
+        from apps.analytics.dashboard import get_dashboard_data
+
         user = request.user
+        # Achievements, rank and recent activity come from the precomputed snapshot
+        snapshot = get_dashboard_data(user)
 
         # Gamification data directly from User model
         experience = getattr(user, 'experience_points', 0)
@@ -52,55 +41,23 @@ class AnalyticsDashboardView(APIView):
         daily_streak = getattr(user, 'daily_streak', 0)
         templates_created = getattr(user, 'templates_created', 0)
         templates_completed = getattr(user, 'templates_completed', 0)
-
-        # Count unlocked achievements
-        achievements_unlocked = 0
-        UserAchievement = _get_gamification_models()
-        if UserAchievement:
-            achievements_unlocked = UserAchievement.objects.filter(
-                user=user, is_unlocked=True
-            ).count()
+        achievements_unlocked = snapshot['achievements_unlocked']
 
         # Compute XP needed for next level (100 XP per level)
         next_level_xp = max(0, ((level) * 100) - experience)
 
-        # Level name from UserLevel table (or fallback)
-        rank = 'Temple Initiate'
-        try:
-            from apps.gamification.models import UserLevel
-            level_obj = UserLevel.objects.filter(level=level).first()
-            if level_obj:
-                rank = level_obj.name
-        except Exception:
-            pass
-
-        # Recent activity from PromptHistory
-        recent_activity = []
-        PromptHistory = _get_prompt_history_model()
-        if PromptHistory:
-            try:
-                recent_qs = PromptHistory.objects.filter(user=user).order_by('-created_at')[:10]
-                for ph in recent_qs:
-                    recent_activity.append({
-                        'template_name': getattr(ph, 'title', '') or getattr(ph, 'prompt_text', '')[:60] or 'Prompt',
-                        'used_at': ph.created_at.isoformat() if hasattr(ph, 'created_at') else timezone.now().isoformat(),
-                        'category': getattr(ph, 'category', '') or '',
-                    })
-            except Exception:
-                pass
-
         return Response({
             'total_templates_used': templates_completed,
             'total_renders': getattr(user, 'total_prompts_generated', 0),
             'favorite_categories': [],
-            'recent_activity': recent_activity,
+            'recent_activity': snapshot['recent_activity'],
             'gamification': {
                 'level': level,
                 'experience_points': experience,
                 'daily_streak': daily_streak,
                 'achievements_unlocked': achievements_unlocked,
                 'badges_earned': achievements_unlocked,
-                'rank': rank,
+                'rank': snapshot['rank'],
                 'next_level_xp': next_level_xp,
             },
             # Legacy shape for backward-compat
@@ -115,48 +72,16 @@ class AnalyticsDashboardView(APIView):
 
 class UserInsightsView(APIView):
     """
-    User-specific insights — aggregated from real DB data.
+    User-specific insights — favourite categories and achievement progress
+    from the dashboard snapshot.
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
+        from apps.analytics.dashboard import get_dashboard_data
 
-        # Favorite categories from prompt history
-        favorite_categories = []
-        PromptHistory = _get_prompt_history_model()
-        if PromptHistory:
-            try:
-                cat_qs = (
-                    PromptHistory.objects
-                    .filter(user=user)
-                    .values('category')
-                    .annotate(count=Count('id'))
-                    .order_by('-count')[:5]
-                )
-                favorite_categories = [
-                    item['category'] for item in cat_qs if item.get('category')
-                ]
-            except Exception:
-                pass
-
-        # Achievements progress
-        achievements_progress = []
-        UserAchievement = _get_gamification_models()
-        if UserAchievement:
-            try:
-                ua_qs = UserAchievement.objects.filter(
-                    user=user, is_unlocked=False
-                ).select_related('achievement').order_by('-progress_value')[:5]
-                for ua in ua_qs:
-                    achievements_progress.append({
-                        'name': ua.achievement.name,
-                        'progress': ua.progress_value,
-                        'required': ua.achievement.requirement_value,
-                        'percentage': ua.progress_percentage,
-                    })
-            except Exception:
-                pass
+        user = request.user
+        snapshot = get_dashboard_data(user)
 
         return Response({
             'usage_patterns': {
@@ -164,7 +89,7 @@ class UserInsightsView(APIView):
                 'templates_created': getattr(user, 'templates_created', 0),
                 'templates_used': getattr(user, 'templates_completed', 0),
             },
-            'favorite_categories': favorite_categories,
+            'favorite_categories': snapshot['favorite_categories'],
             'performance_metrics': {
                 'completion_rate': user.template_completion_rate if hasattr(user, 'template_completion_rate') else 0,
                 'daily_streak': getattr(user, 'daily_streak', 0),
@@ -173,7 +98,7 @@ class UserInsightsView(APIView):
                 'Try creating templates for your most common prompts',
                 'Explore new template categories to expand your creativity',
             ],
-            'achievements_progress': achievements_progress,
+            'achievements_progress': snapshot['achievements_progress'],
         })
 
 
@@ -294,3 +219,102 @@ class AnalyticsTrackView(APIView):
             'user_id': getattr(user, 'id', None),
             'timestamp': timezone.now().isoformat(),
         }, status=status.HTTP_201_CREATED)
+
+
+class AnalyticsBatchTrackView(APIView):
+    """
+    Track many analytics events per request through the buffered writer.
+
+    Body: a JSON array, {"events": [...]} or NDJSON, optionally sent with
+    `Content-Encoding: gzip`. Each event takes the same fields as the
+    single-event endpoint plus session_id, page_url, referrer, device_type,
+    platform, browser and timestamp. Valid events are accepted even when
+    others in the batch are rejected.
+    """
+    permission_classes = [permissions.AllowAny]
+    parser_classes = []  # the body is decoded by apps.analytics.ingest
+
+    def post(self, request):
+        from apps.analytics.ingest import (
+            PayloadError, build_events, event_buffer, get_ingest_settings, parse_event_payload
+        )
+
+        options = get_ingest_settings()
+        try:
+            raw_events = parse_event_payload(
+                request.body,
+                content_type=request.META.get('CONTENT_TYPE', ''),
+                content_encoding=request.META.get('HTTP_CONTENT_ENCODING', ''),
+                max_bytes=options['MAX_BODY_BYTES'],
+            )
+        except PayloadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(raw_events) > options['MAX_EVENTS_PER_REQUEST']:
+            return Response({
+                'error': f"At most {options['MAX_EVENTS_PER_REQUEST']} events per request",
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        user = request.user if request.user and request.user.is_authenticated else None
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        events, errors = build_events(
+            raw_events,
+            user=user,
+            ip_address=forwarded_for.split(',')[0].strip() if forwarded_for else request.META.get('REMOTE_ADDR'),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+        accepted, dropped = event_buffer.add(events)
+
+        body = {
+            'status': 'accepted',
+            'accepted': accepted,
+            'rejected': len(errors),
+            'dropped': dropped,
+            'errors': errors[:20],
+        }
+        if dropped and not accepted:
+            body['status'] = 'dropped'
+            return Response(body, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        return Response(body, status=status.HTTP_202_ACCEPTED)
+
+
+class EventSummaryView(APIView):
+    """
+    Site-wide event counts per hour or day, served from the rollup tables.
+
+    Query params: days (default 30), granularity ('day' or 'hour') and
+    event_type (comma-separated). Staff only.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    MAX_DAYS = 400
+
+    def get(self, request):
+        from apps.analytics.rollups import GRANULARITIES, event_counts, get_rollup_settings
+
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return Response(
+                {'error': f"granularity must be one of {', '.join(GRANULARITIES)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_days = self.MAX_DAYS if granularity == 'day' else get_rollup_settings()['HOURLY_RETENTION_DAYS']
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        days = min(max(days, 1), max_days)
+        event_types = [t for t in request.query_params.get('event_type', '').split(',') if t]
+
+        end = timezone.now()
+        summary = event_counts(end - timedelta(days=days), end, granularity=granularity, event_types=event_types)
+        return Response({
+            'days': days,
+            'granularity': granularity,
+            'through': summary['through'].isoformat() if summary['through'] else None,
+            'totals': summary['totals'],
+            'series': [
+                {'bucket': row['bucket'].isoformat(), 'event_type': row['event_type'], 'count': row['count']}
+                for row in summary['series']
+            ],
+        })
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class BillingConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.billing"
+
+    def ready(self):
+        # Invalidate cached entitlements when subscriptions or plans change
+        from . import signals  # noqa: F401
@@ -0,0 +1,167 @@
+"""
+Cached per-user entitlements.
+
+UserEntitlementsView reads plan perks and the AI endpoints read subscription
+state and limits before every call. Both come from `get_entitlements`, which
+caches one entry per user in the default cache together with the versions it
+was computed under: a per-user version bumped whenever the user's
+subscription is saved or deleted, and a global one bumped whenever a plan
+changes (apps.billing.signals). A read fetches the entry and both versions
+with one get_many, so a bump invalidates without having to find and delete
+entries. Entries also expire with the subscription they describe.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENTITLEMENT_SETTINGS = {
+    'TTL_S': 3600,
+    # API calls per day with a subscription; without one, the trial allowance
+    'DAILY_API_CALL_LIMIT': 50,
+    'TRIAL_API_CALL_LIMIT': 3,
+}
+
+# Plan perks for users without an active plan
+FREE_ENTITLEMENTS = {
+    'daily_template_limit': 5,
+    'daily_copy_limit': 3,
+    'premium_templates': False,
+    'ads_free': False,
+    'priority_support': False,
+    'analytics': False,
+    'api_access': False,
+    'collaboration': False,
+    'plan_name': 'free',
+    'plan_type': 'free',
+}
+
+GLOBAL_VERSION_KEY = 'billing:entitlements:version'
+
+
+def get_entitlement_settings():
+    return {**DEFAULT_ENTITLEMENT_SETTINGS, **getattr(settings, 'BILLING_ENTITLEMENTS', {})}
+
+
+def _entry_key(user_id):
+    return f'billing:entitlements:{user_id}'
+
+
+def _version_key(user_id):
+    return f'billing:entitlements:version:{user_id}'
+
+
+def compute_entitlements(user_id):
+    """
+    Entitlements straight from the database.
+
+    'entitlements' are the plan perks UserEntitlementsView returns;
+    'subscription' holds what CreditTracker needs to meter AI calls.
+    """
+    from .models import UserSubscription
+
+    config = get_entitlement_settings()
+    subscription = UserSubscription.objects.filter(user_id=user_id).select_related('plan').first()
+
+    entitlements = dict(FREE_ENTITLEMENTS)
+    if subscription is not None and subscription.status in ('active', 'trialing'):
+        plan = subscription.plan
+        entitlements.update({
+            'daily_template_limit': plan.daily_template_limit,
+            'daily_copy_limit': plan.daily_copy_limit,
+            'premium_templates': plan.premium_templates_access,
+            'ads_free': plan.ads_free,
+            'priority_support': plan.priority_support,
+            'analytics': plan.analytics_access,
+            'api_access': plan.api_access,
+            'collaboration': plan.collaboration_features,
+            'plan_name': plan.name,
+            'plan_type': plan.plan_type,
+        })
+
+    if subscription is None:
+        metering = {
+            'exists': False,
+            'is_active': False,
+            'is_trial': True,
+            'api_call_limit': config['TRIAL_API_CALL_LIMIT'],
+            'template_limit': FREE_ENTITLEMENTS['daily_template_limit'],
+            'copy_limit': FREE_ENTITLEMENTS['daily_copy_limit'],
+        }
+    else:
+        metering = {
+            'exists': True,
+            'is_active': subscription.is_active,
+            'is_trial': subscription.is_trial,
+            'api_call_limit': config['DAILY_API_CALL_LIMIT'],
+            'template_limit': subscription.plan.daily_template_limit,
+            'copy_limit': subscription.plan.daily_copy_limit,
+        }
+
+    return {
+        'entitlements': entitlements,
+        'subscription': metering,
+        'expires_at': subscription.expires_at if subscription is not None else None,
+    }
+
+
+def _timeout(data):
+    """Cache lifetime, cut short when the subscription expires sooner"""
+    timeout = get_entitlement_settings()['TTL_S']
+    expires_at = data['expires_at']
+    if expires_at is not None:
+        remaining = (expires_at - timezone.now()).total_seconds()
+        if remaining > 0:
+            timeout = min(timeout, max(1, int(remaining)))
+    return timeout
+
+
+def get_entitlements(user_id):
+    """Entitlements of user_id, from the cache when its versions still match"""
+    entry_key, version_key = _entry_key(user_id), _version_key(user_id)
+    try:
+        values = cache.get_many([entry_key, version_key, GLOBAL_VERSION_KEY])
+    except Exception as e:
+        logger.warning(f"Entitlement cache unavailable: {e}")
+        return compute_entitlements(user_id)
+
+    versions = [values.get(GLOBAL_VERSION_KEY, 0), values.get(version_key, 0)]
+    entry = values.get(entry_key)
+    if entry is not None and entry['versions'] == versions:
+        return entry['data']
+
+    data = compute_entitlements(user_id)
+    try:
+        cache.set(entry_key, {'versions': versions, 'data': data}, _timeout(data))
+    except Exception as e:
+        logger.warning(f"Failed to cache entitlements for user {user_id}: {e}")
+    return data
+
+
+def _bump(key):
+    # Version keys never expire: a version that fell back to an earlier
+    # value could revalidate an entry computed under it
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except Exception as e:
+        # Cached entries stay valid until they time out
+        logger.warning(f"Failed to bump entitlement version {key}: {e}")
+
+
+def invalidate_entitlements(*user_ids):
+    """Invalidate the cached entitlements of user_ids"""
+    for user_id in user_ids:
+        _bump(_version_key(user_id))
+
+
+def invalidate_all_entitlements():
+    """Invalidate every cached entry, e.g. after a plan changed"""
+    _bump(GLOBAL_VERSION_KEY)
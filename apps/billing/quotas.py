@@ -0,0 +1,225 @@
+"""
+Daily API-call quota counters.
+
+With a Redis cache, consuming quota is one round trip: a Lua script checks
+the user's counter for the day against the limit, INCRBYs it, sets it to
+expire after the day ends and adds it to a dirty set. The periodic
+`flush_quota_counters` task copies dirty counters into their UsageQuota rows,
+so the database sees one write per active user per flush instead of a
+get_or_create and a save per call. A counter that is missing mid-day (the
+day's first call, or Redis lost it) is seeded from UsageQuota first.
+
+Without Redis the counts go straight to UsageQuota with a conditional
+UPDATE, which is also the fallback when Redis is unreachable (the next flush
+overwrites counts taken that way with the Redis value).
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps.core.dirty_set import DirtySet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUOTA_SETTINGS = {
+    # Counters outlive their day by this long so the last flush still sees them
+    'EXPIRY_GRACE_S': 6 * 3600,
+    'FLUSH_BATCH_SIZE': 500,
+}
+
+COUNTER_PREFIX = 'billing:quota:'
+
+quota_dirty = DirtySet('billing:quota:dirty')
+
+# KEYS: counter, dirty set; ARGV: amount, limit (-1 for none), expire-at, dirty member.
+# Returns {status, used}: 1 consumed, 0 over the limit, -1 counter not seeded.
+CONSUME_SCRIPT = """
+local used = redis.call('GET', KEYS[1])
+if not used then
+    return {-1, 0}
+end
+used = tonumber(used)
+local amount = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if amount > 0 and limit >= 0 and used + amount > limit then
+    return {0, used}
+end
+if used + amount < 0 then
+    amount = -used
+end
+used = redis.call('INCRBY', KEYS[1], amount)
+redis.call('EXPIREAT', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+return {1, used}
+"""
+
+_consume_script = None
+
+
+def get_quota_settings():
+    return {**DEFAULT_QUOTA_SETTINGS, **getattr(settings, 'BILLING_QUOTAS', {})}
+
+
+def today():
+    return timezone.now().date()
+
+
+def _member(user_id, day):
+    return f'{day.isoformat()}:{user_id}'
+
+
+def counter_key(user_id, day):
+    return COUNTER_PREFIX + _member(user_id, day)
+
+
+def _expire_at(day):
+    day_end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+    return int(day_end.timestamp()) + get_quota_settings()['EXPIRY_GRACE_S']
+
+
+def row_defaults(subscription):
+    """UsageQuota limits for a new row, from get_entitlements()['subscription']"""
+    return {
+        'template_limit': subscription['template_limit'],
+        'copy_limit': subscription['copy_limit'],
+        'api_call_limit': subscription['api_call_limit'],
+    }
+
+
+def _daily_rows(user_id, day):
+    from .models import UsageQuota
+
+    return UsageQuota.objects.filter(user_id=user_id, quota_type='daily', quota_date=day)
+
+
+def _stored_usage(user_id, day):
+    return _daily_rows(user_id, day).values_list('api_calls_made', flat=True).first() or 0
+
+
+def _consume_redis(client, user_id, amount, limit, day):
+    global _consume_script
+    if _consume_script is None:
+        _consume_script = client.register_script(CONSUME_SCRIPT)
+
+    key = counter_key(user_id, day)
+    expire_at = _expire_at(day)
+    args = [amount, -1 if limit is None else limit, expire_at, _member(user_id, day)]
+    status, _ = _consume_script(keys=[key, quota_dirty.key], args=args, client=client)
+    if status == -1:
+        client.set(key, _stored_usage(user_id, day), nx=True, exat=expire_at)
+        status, _ = _consume_script(keys=[key, quota_dirty.key], args=args, client=client)
+    return status == 1
+
+
+def _consume_db(user_id, amount, limit, defaults, day):
+    from .models import UsageQuota
+
+    rows = _daily_rows(user_id, day)
+    if limit is not None and amount > 0:
+        rows = rows.filter(api_calls_made__lte=limit - amount)
+    # A refund never takes the count below zero, as in CONSUME_SCRIPT
+    counted = Greatest(F('api_calls_made') + amount, 0)
+    if rows.update(api_calls_made=counted):
+        return True
+
+    # No row for the day yet, or the limit is reached
+    UsageQuota.objects.get_or_create(
+        user_id=user_id, quota_type='daily', quota_date=day, defaults=defaults
+    )
+    return bool(rows.update(api_calls_made=counted))
+
+
+def consume_quota(user_id, amount, limit=None, defaults=None, day=None):
+    """
+    Count `amount` API calls against user_id's daily quota unless that would
+    exceed `limit` (None for no limit; a negative amount refunds).
+
+    `defaults` are the limits stored on a UsageQuota row created for the day
+    (see row_defaults). Returns whether the calls were counted.
+    """
+    day = day or today()
+    client = quota_dirty.redis_client()
+    if client is not None:
+        try:
+            return _consume_redis(client, user_id, amount, limit, day)
+        except Exception as e:
+            logger.warning(f"Quota counter unavailable, counting in the database: {e}")
+    return _consume_db(user_id, amount, limit, defaults or {}, day)
+
+
+def quota_usage(user_id, day=None):
+    """API calls user_id has made on `day` (today by default)"""
+    day = day or today()
+    client = quota_dirty.redis_client()
+    if client is not None:
+        try:
+            value = client.get(counter_key(user_id, day))
+            if value is not None:
+                return int(value)
+        except Exception as e:
+            logger.warning(f"Quota counter unavailable, reading the database: {e}")
+    return _stored_usage(user_id, day)
+
+
+def flush_quota_counters(batch_size=None):
+    """
+    Write dirty Redis counters into their UsageQuota rows.
+
+    Returns the number of rows written; 0 without Redis, where the rows are
+    always current.
+    """
+    from django.contrib.auth import get_user_model
+
+    from .entitlements import get_entitlements
+    from .models import UsageQuota
+
+    client = quota_dirty.redis_client()
+    if client is None:
+        return 0
+    batch_size = batch_size or get_quota_settings()['FLUSH_BATCH_SIZE']
+
+    flushed = 0
+    while True:
+        members = quota_dirty.pop(batch_size)
+        if not members:
+            break
+        try:
+            counts = client.mget([COUNTER_PREFIX + member for member in members])
+            parsed = [
+                (member.split(':', 1), int(count))
+                for member, count in zip(members, counts)
+                if count is not None
+            ]
+            existing = {
+                str(pk) for pk in get_user_model().objects.filter(
+                    pk__in={user_id for (_, user_id), _ in parsed}
+                ).values_list('pk', flat=True)
+            }
+            rows = [
+                UsageQuota(
+                    user_id=user_id,
+                    quota_type='daily',
+                    quota_date=date.fromisoformat(day),
+                    api_calls_made=count,
+                    **row_defaults(get_entitlements(user_id)['subscription']),
+                )
+                for (day, user_id), count in parsed
+                if user_id in existing
+            ]
+            UsageQuota.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'quota_type', 'quota_date'],
+                update_fields=['api_calls_made', 'updated_at'],
+            )
+        except Exception:
+            # Put the batch back so the next run retries it
+            quota_dirty.add(members)
+            raise
+        flushed += len(rows)
+    return flushed
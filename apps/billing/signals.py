@@ -0,0 +1,26 @@
+"""
+Signal handlers that invalidate cached entitlements (apps.billing.entitlements).
+
+Versions are bumped once the transaction commits, so a concurrent read
+cannot cache the old rows under the new version.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .entitlements import invalidate_all_entitlements, invalidate_entitlements
+
+
+@receiver(post_save, sender='billing.UserSubscription', dispatch_uid='entitlements_subscription_saved')
+@receiver(post_delete, sender='billing.UserSubscription', dispatch_uid='entitlements_subscription_deleted')
+def subscription_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_entitlements(user_id))
+
+
+@receiver(post_save, sender='billing.SubscriptionPlan', dispatch_uid='entitlements_plan_saved')
+@receiver(post_delete, sender='billing.SubscriptionPlan', dispatch_uid='entitlements_plan_deleted')
+def plan_changed(sender, instance, **kwargs):
+    """Plans are shared by many users; invalidate every cached entry"""
+    transaction.on_commit(invalidate_all_entitlements)
@@ -0,0 +1,23 @@
+"""
+Celery tasks for the billing app.
+"""
+import logging
+from celery import shared_task
+
+from .quotas import flush_quota_counters as flush_counters
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_quota_counters():
+    """
+    Copy the Redis quota counters changed since the last run into UsageQuota.
+
+    Returns:
+        Number of UsageQuota rows written
+    """
+    flushed = flush_counters()
+    if flushed:
+        logger.info(f"Flushed {flushed} quota counters")
+    return flushed
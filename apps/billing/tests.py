@@ -0,0 +1,231 @@
+import os
+import time
+import unittest
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.ai_services.agent_views import CreditTracker
+from apps.billing import entitlements as entitlement_cache
+from apps.billing.entitlements import get_entitlements
+from apps.billing.models import SubscriptionPlan, UsageQuota, UserSubscription
+from apps.billing.quotas import consume_quota, flush_quota_counters, quota_dirty, quota_usage
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'billing-tests'}}
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
+
+
+def redis_available():
+    try:
+        import redis
+
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.2).ping()
+    except Exception:
+        return False
+
+
+def make_user(username):
+    return get_user_model().objects.create_user(
+        username=username, email=f"{username}@example.com", password="pass1234"
+    )
+
+
+def make_plan(**fields):
+    fields = {'name': 'Pro', 'plan_type': 'premium', 'billing_interval': 'monthly', **fields}
+    return SubscriptionPlan.objects.create(**fields)
+
+
+def statements(ctx):
+    return [q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+
+
+# ===========================================================================
+# 1. Entitlement cache — versioned entries
+# ===========================================================================
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EntitlementCacheTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = make_user("subscriber")
+        self.plan = make_plan(ads_free=True, daily_template_limit=40)
+
+    def subscribe(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return UserSubscription.objects.create(user=self.user, plan=self.plan, **fields)
+
+    def test_free_user(self):
+        data = get_entitlements(self.user.pk)
+        self.assertEqual(data['entitlements']['plan_type'], 'free')
+        self.assertFalse(data['subscription']['exists'])
+        self.assertTrue(data['subscription']['is_trial'])
+
+    def test_cached_until_subscription_changes(self):
+        subscription = self.subscribe()
+        with self.assertNumQueries(1):
+            self.assertTrue(get_entitlements(self.user.pk)['entitlements']['ads_free'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_entitlements(self.user.pk)['entitlements']['daily_template_limit'], 40)
+
+        subscription.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.save()
+        data = get_entitlements(self.user.pk)
+        self.assertEqual(data['entitlements']['plan_type'], 'free')
+        self.assertFalse(data['subscription']['is_active'])
+
+    def test_plan_change_invalidates_every_user(self):
+        self.subscribe()
+        other = make_user("other")
+        get_entitlements(self.user.pk), get_entitlements(other.pk)
+
+        self.plan.daily_template_limit = 100
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.save()
+        self.assertEqual(get_entitlements(self.user.pk)['entitlements']['daily_template_limit'], 100)
+        with self.assertNumQueries(1):
+            get_entitlements(other.pk)
+
+    def test_entry_expires_with_subscription(self):
+        self.subscribe(expires_at=timezone.now() + timedelta(minutes=10))
+        self.assertLessEqual(entitlement_cache._timeout(get_entitlements(self.user.pk)), 600)
+
+
+# ===========================================================================
+# 2. Quota counters — database fallback
+# ===========================================================================
+
+class QuotaCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("metered")
+        self.defaults = {'template_limit': 5, 'copy_limit': 3, 'api_call_limit': 5}
+
+    def test_consume_within_limit(self):
+        self.assertTrue(consume_quota(self.user.pk, 3, limit=5, defaults=self.defaults))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(consume_quota(self.user.pk, 2, limit=5, defaults=self.defaults))
+        self.assertEqual([sql.split()[0] for sql in statements(ctx)], ["UPDATE"])
+
+        self.assertFalse(consume_quota(self.user.pk, 1, limit=5, defaults=self.defaults))
+        quota = UsageQuota.objects.get(user=self.user)
+        self.assertEqual((quota.api_calls_made, quota.api_call_limit), (5, 5))
+
+    def test_refund(self):
+        consume_quota(self.user.pk, 3, defaults=self.defaults)
+        consume_quota(self.user.pk, -2)
+        self.assertEqual(quota_usage(self.user.pk), 1)
+        # A refund larger than the day's count stops at zero
+        consume_quota(self.user.pk, -5)
+        self.assertEqual(quota_usage(self.user.pk), 0)
+
+
+class CreditTrackerTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("tracked")
+        UserSubscription.objects.create(user=self.user, plan=make_plan())
+
+    def test_check_does_not_write(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = CreditTracker.check_user_credits(self.user, 2)
+        self.assertTrue(all(sql.startswith("SELECT") for sql in statements(ctx)))
+        self.assertEqual(result["available"], 50)
+        self.assertFalse(UsageQuota.objects.exists())
+
+    def test_reserve_and_refund(self):
+        self.assertTrue(CreditTracker.reserve_credits(self.user, 3)["has_credits"])
+        CreditTracker.refund_credits(self.user, 1)
+        self.assertEqual(CreditTracker.check_user_credits(self.user, 1)["available"], 48)
+
+        UsageQuota.objects.filter(user=self.user).update(api_calls_made=49)
+        result = CreditTracker.reserve_credits(self.user, 3)
+        self.assertFalse(result["has_credits"])
+        self.assertEqual(result["available"], 1)
+
+
+# ===========================================================================
+# 3. Quota counters — Redis
+# ===========================================================================
+
+@unittest.skipUnless(redis_available(), "Redis is not reachable")
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': REDIS_URL + '/15',
+}})
+class RedisQuotaCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("redis")
+        self.defaults = {'template_limit': 5, 'copy_limit': 3, 'api_call_limit': 5}
+        quota_dirty.redis_client().flushdb()
+
+    def test_counts_in_redis_and_flushes(self):
+        UsageQuota.objects.create(
+            user=self.user, quota_type='daily', quota_date=timezone.now().date(),
+            api_calls_made=2, **self.defaults
+        )
+        # Seeded from the existing row, then counted without touching it
+        self.assertTrue(consume_quota(self.user.pk, 2, limit=5))
+        with self.assertNumQueries(0):
+            self.assertTrue(consume_quota(self.user.pk, 1, limit=5))
+            self.assertFalse(consume_quota(self.user.pk, 1, limit=5))
+            self.assertEqual(quota_usage(self.user.pk), 5)
+        self.assertEqual(UsageQuota.objects.get().api_calls_made, 2)
+
+        self.assertEqual(flush_quota_counters(), 1)
+        self.assertEqual(UsageQuota.objects.get().api_calls_made, 5)
+        self.assertEqual(flush_quota_counters(), 0)
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_credit_check_overhead():
+    user = make_user("bench")
+    UserSubscription.objects.create(user=user, plan=make_plan())
+    calls = 1000
+
+    # The previous CreditTracker: get_or_create on check, get_or_create and save on consume
+    def legacy_call():
+        today = timezone.now().date()
+        quota, _ = UsageQuota.objects.get_or_create(
+            user=user, quota_type='daily', quota_date=today,
+            defaults={'template_limit': 5, 'copy_limit': 3, 'api_call_limit': 1_000_000},
+        )
+        UserSubscription.objects.select_related('plan').get(user=user)
+        quota, _ = UsageQuota.objects.get_or_create(user=user, quota_type='daily', quota_date=today)
+        quota.api_calls_made += 1
+        quota.save()
+
+    def run(fn):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            for _ in range(calls):
+                fn()
+            elapsed = time.perf_counter() - start
+        sql = statements(ctx)
+        writes = sum(1 for q in sql if q.split()[0] in ("INSERT", "UPDATE", "DELETE"))
+        return elapsed / calls * 1e6, len(sql), writes
+
+    legacy_us, legacy_sql, legacy_writes = run(legacy_call)
+    UsageQuota.objects.all().delete()
+    with override_settings(CACHES=LOCMEM_CACHE, BILLING_ENTITLEMENTS={'DAILY_API_CALL_LIMIT': 1_000_000}):
+        reserve_us, reserve_sql, reserve_writes = run(lambda: CreditTracker.reserve_credits(user, 1))
+
+    print(
+        f"per call: legacy {legacy_us:.0f}us, {legacy_sql} statements, {legacy_writes} writes per {calls}; "
+        f"reserve_credits {reserve_us:.0f}us, {reserve_sql} statements, {reserve_writes} writes per {calls} "
+        f"(with Redis counters: 0 per call, one upsert per user per flush)"
+    )
+    assert UsageQuota.objects.get(user=user).api_calls_made == calls
+    # One conditional UPDATE per call, plus the day's INSERT and the first entitlement read
+    assert reserve_sql <= calls + 4
+    assert reserve_sql < legacy_sql / 2
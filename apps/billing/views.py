@@ -144,101 +144,68 @@ class UserEntitlementsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        _, UserSubscription, _ = _get_billing_models()
-        user = request.user
-
-        # Defaults (free tier)
-        entitlements = {
-            'daily_template_limit': 5,
-            'daily_copy_limit': 3,
-            'premium_templates': False,
-            'ads_free': False,
-            'priority_support': False,
-            'analytics': False,
-            'api_access': False,
-            'collaboration': False,
-            'plan_name': 'free',
-            'plan_type': 'free',
-        }
+        from apps.billing.entitlements import FREE_ENTITLEMENTS, get_entitlements
 
-        if UserSubscription:
-            try:
-                sub = UserSubscription.objects.filter(
-                    user=user, status__in=['active', 'trialing']
-                ).select_related('plan').first()
-                if sub and sub.plan:
-                    plan = sub.plan
-                    entitlements.update({
-                        'daily_template_limit': getattr(plan, 'daily_template_limit', 5),
-                        'daily_copy_limit': getattr(plan, 'daily_copy_limit', 3),
-                        'premium_templates': getattr(plan, 'premium_templates_access', False),
-                        'ads_free': getattr(plan, 'ads_free', False),
-                        'priority_support': getattr(plan, 'priority_support', False),
-                        'analytics': getattr(plan, 'analytics_access', False),
-                        'api_access': getattr(plan, 'api_access', False),
-                        'collaboration': getattr(plan, 'collaboration_features', False),
-                        'plan_name': getattr(plan, 'name', 'free'),
-                        'plan_type': getattr(plan, 'plan_type', 'free'),
-                    })
-            except Exception as e:
-                logger.error(f"UserEntitlements error: {e}")
+        try:
+            entitlements = get_entitlements(request.user.pk)['entitlements']
+        except Exception as e:
+            logger.error(f"UserEntitlements error: {e}")
+            entitlements = dict(FREE_ENTITLEMENTS)
 
         return Response({'entitlements': entitlements})
 
 
 class UserUsageView(APIView):
-    """Get the user's current AI usage against their quota."""
+    """Get the user's current AI usage against their quota (read-only)."""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Re-use the AIUsageQuota from billing or ai_services
+        from apps.billing.entitlements import get_entitlements
+        from apps.billing.quotas import quota_usage
+
+        today = timezone.now().date()
+        usage = {
+            'tokens_today': 0,
+            'tokens_monthly': 0,
+            'daily_limit': 50000,
+            'monthly_limit': 1000000,
+        }
         try:
-            from apps.billing.models import UsageQuota
-            quota, _ = UsageQuota.objects.get_or_create(user=request.user)
-            today = timezone.now().date()
-            # Reset daily counter if needed
-            last_reset = getattr(quota, 'last_reset_date', None)
-            if last_reset != today:
-                quota.tokens_used_today = 0
-                quota.last_reset_date = today
-                quota.save(update_fields=['tokens_used_today', 'last_reset_date'])
-
-            daily_limit = getattr(quota, 'daily_token_limit', 50000)
-            monthly_limit = getattr(quota, 'monthly_token_limit', 1000000)
-            used_today = getattr(quota, 'tokens_used_today', 0)
-            used_monthly = getattr(quota, 'tokens_used_monthly', 0)
+            from apps.ai_services.models import AIUsageQuota
+            quota = AIUsageQuota.objects.filter(user=request.user).values(
+                'daily_tokens_used', 'monthly_tokens_used', 'daily_tokens_limit', 'monthly_tokens_limit'
+            ).first()
+            if quota:
+                usage.update({
+                    'tokens_today': quota['daily_tokens_used'],
+                    'tokens_monthly': quota['monthly_tokens_used'],
+                    'daily_limit': quota['daily_tokens_limit'],
+                    'monthly_limit': quota['monthly_tokens_limit'],
+                })
+        except Exception as e:
+            logger.error(f"UserUsage token quota error: {e}")
 
-            return Response({
-                'usage': {
-                    'tokens_today': used_today,
-                    'tokens_monthly': used_monthly,
-                    'daily_limit': daily_limit,
-                    'monthly_limit': monthly_limit,
-                    'remaining_today': max(0, daily_limit - used_today),
-                    'remaining_monthly': max(0, monthly_limit - used_monthly),
-                    'cost_estimate_today': round(used_today * 0.0014 / 1000, 4),
-                    'cost_estimate_monthly': round(used_monthly * 0.0014 / 1000, 4),
-                    'reset_date': today.isoformat(),
-                }
-            })
+        used_today, used_monthly = usage['tokens_today'], usage['tokens_monthly']
+        usage.update({
+            'remaining_today': max(0, usage['daily_limit'] - used_today),
+            'remaining_monthly': max(0, usage['monthly_limit'] - used_monthly),
+            'cost_estimate_today': round(used_today * 0.0014 / 1000, 4),
+            'cost_estimate_monthly': round(used_monthly * 0.0014 / 1000, 4),
+            'reset_date': today.isoformat(),
+        })
+
+        try:
+            api_limit = get_entitlements(request.user.pk)['subscription']['api_call_limit']
+            api_used = quota_usage(request.user.pk, today)
+            usage['api_calls'] = {
+                'used_today': api_used,
+                'daily_limit': api_limit,
+                'remaining_today': max(0, api_limit - api_used),
+            }
         except Exception as e:
-            logger.error(f"UserUsage billing error: {e}")
-            # Try ai_services.AIUsageQuota as fallback
-            try:
-                from apps.ai_services.models import AIUsageQuota
-                quota, _ = AIUsageQuota.objects.get_or_create(user=request.user)
-                return Response({
-                    'usage': {
-                        'tokens_today': getattr(quota, 'tokens_used_today', 0),
-                        'tokens_monthly': getattr(quota, 'tokens_used_monthly', 0),
-                        'daily_limit': getattr(quota, 'daily_limit', 50000),
-                        'monthly_limit': getattr(quota, 'monthly_limit', 1000000),
-                        'remaining_today': max(0, getattr(quota, 'daily_limit', 50000) - getattr(quota, 'tokens_used_today', 0)),
-                        'remaining_monthly': max(0, getattr(quota, 'monthly_limit', 1000000) - getattr(quota, 'tokens_used_monthly', 0)),
-                    }
-                })
-            except Exception:
-                return Response({'usage': {'tokens_today': 0, 'daily_limit': 50000, 'remaining_today': 50000}})
+            logger.error(f"UserUsage API quota error: {e}")
+
+        return Response({'usage': usage})
 
 
 class CheckoutSessionView(APIView):
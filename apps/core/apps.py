@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.core"
+
+    def ready(self):
+        # Evict cached WebSocket user snapshots when users change; WebSockets need channels
+        if 'channels' in settings.INSTALLED_APPS:
+            from . import signals  # noqa: F401
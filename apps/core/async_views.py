@@ -0,0 +1,54 @@
+"""
+Native async DRF views for ASGI deployments.
+
+DRF 3.14 only dispatches sync handlers, so under ASGI Django runs every
+APIView in its sync thread and a view awaiting an LLM call holds that thread
+for the whole call. AsyncAPIView's handlers are coroutines that run on the
+server's event loop. Authentication, permissions, throttling and body
+parsing (`APIView.initial` plus request.data) still run in a worker thread
+because they touch the database and the request stream, and errors go
+through DRF's exception handling as usual.
+"""
+
+import asyncio
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """APIView whose get/post/... handlers are `async def`"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # csrf_exempt() in Django 4.2 hides that the view is a coroutine function
+        return markcoroutinefunction(super().as_view(**initkwargs))
+
+    def _prepare(self, request, *args, **kwargs):
+        self.initial(request, *args, **kwargs)
+        # Parse the body here so handlers can read request.data without blocking
+        request.data
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self._prepare)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
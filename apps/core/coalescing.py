@@ -0,0 +1,81 @@
+"""
+Batching of work queued on an event loop.
+
+`Coalescer` is the batching GroupBroadcaster (apps.core.fanout) and
+ChatMessageWriter (apps.templates.message_writer) share: what is queued on
+a loop waits up to a window for more, then goes out as one batch, or at
+once when the batch is full. Batches are handed to `send_batch` one at a
+time, in the order they were started. `LoopLocal` keeps one instance per
+running event loop.
+"""
+
+import asyncio
+import logging
+import weakref
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Coalescer:
+    """
+    Subclasses add to `_pending` (a `new_batch()`), call `_queued()` after
+    each addition, and implement `send_batch`
+    """
+
+    def __init__(self):
+        self._pending = self.new_batch()
+        self._flush_handle = None
+        self._sending: Optional[asyncio.Future] = None
+
+    def new_batch(self):
+        return []
+
+    def _queued(self, window_ms: float, full: bool = False):
+        """Start a flush now if the batch is full, otherwise within window_ms"""
+        if full:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(window_ms / 1000, self._start_flush)
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, self.new_batch()
+        if batch:
+            self._sending = asyncio.ensure_future(self._send(batch, self._sending))
+
+    async def _send(self, batch, previous: Optional[asyncio.Future]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.send_batch(batch)
+        except Exception as e:
+            logger.error(f"{type(self).__name__} dropped a batch of {len(batch)}: {e}")
+
+    async def send_batch(self, batch):
+        raise NotImplementedError
+
+    async def flush(self):
+        """Send everything queued now and wait for it"""
+        self._start_flush()
+        if self._sending is not None:
+            await asyncio.wait([self._sending])
+
+
+class LoopLocal:
+    """One object per running event loop and key, made by factory(*key) on first use"""
+
+    def __init__(self, factory: Callable[..., Any]):
+        self.factory = factory
+        self._instances = weakref.WeakKeyDictionary()
+
+    def get(self, *key):
+        instances = self._instances.setdefault(asyncio.get_running_loop(), {})
+        if key not in instances:
+            instances[key] = self.factory(*key)
+        return instances[key]
+
+    def clear(self):
+        self._instances.clear()
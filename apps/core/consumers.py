@@ -8,9 +8,11 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 
+from .fanout import FanoutMixin
+
 logger = logging.getLogger(__name__)
 
-class RootWebSocketConsumer(AsyncWebsocketConsumer):
+class RootWebSocketConsumer(FanoutMixin, AsyncWebsocketConsumer):
     """
     Root WebSocket consumer that handles connections to ws://localhost:8000/
     This provides a general-purpose WebSocket endpoint for testing and basic functionality
@@ -91,28 +93,12 @@ class RootWebSocketConsumer(AsyncWebsocketConsumer):
         }))
     
     async def broadcast_message(self, message):
-        """Broadcast message to all connected clients in the room"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'broadcast_message_handler',
-                'message': message,
-                'sender': self.channel_name
-            }
-        )
-    
-    async def broadcast_message_handler(self, event):
-        """Handle broadcast message from group"""
-        message = event['message']
-        sender = event['sender']
-        
-        # Don't send the message back to the sender
-        if sender != self.channel_name:
-            await self.send(text_data=json.dumps({
-                'type': 'broadcast',
-                'message': message,
-                'timestamp': self.get_timestamp()
-            }))
+        """Broadcast message to the other clients in the room"""
+        self.broadcast(self.room_group_name, {
+            'type': 'broadcast',
+            'message': message,
+            'timestamp': self.get_timestamp()
+        }, exclude_self=True)
     
     async def send_error(self, error_message):
         """Send error message to client"""
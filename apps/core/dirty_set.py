@@ -0,0 +1,87 @@
+"""
+Sets of IDs waiting for a deferred recomputation.
+
+Write paths add the IDs of the objects they touched and a periodic task
+pops them in batches, so a burst of updates to the same object costs one
+recomputation. The set is a Redis set when the default cache is Redis
+(shared by every worker) and a process-local set otherwise.
+"""
+
+import logging
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class DirtySet:
+    """A named set of dirty IDs; members are stored as strings"""
+
+    def __init__(self, key):
+        self.key = key
+        self.local = set()
+        self._lock = threading.Lock()
+
+    def redis_client(self):
+        """Return the raw redis client behind the default cache, if it is Redis"""
+        backend = getattr(cache, '_cache', None)
+        if backend is None or not hasattr(backend, 'get_client'):
+            return None
+        try:
+            return backend.get_client(self.key, write=True)
+        except Exception as e:
+            logger.warning(f"Redis unavailable for dirty set {self.key}: {e}")
+            return None
+
+    def is_shared(self):
+        """Whether the set is in Redis, so a periodic task in another process sees it"""
+        return self.redis_client() is not None
+
+    def add(self, ids):
+        ids = [str(value) for value in ids]
+        if not ids:
+            return
+        client = self.redis_client()
+        if client is not None:
+            try:
+                client.sadd(self.key, *ids)
+                return
+            except Exception as e:
+                logger.warning(f"Failed to add to dirty set {self.key} in Redis: {e}")
+        with self._lock:
+            self.local.update(ids)
+
+    def add_on_commit(self, ids):
+        """Add once the current transaction commits (immediately outside one)"""
+        ids = [str(value) for value in ids if value]
+        if ids:
+            transaction.on_commit(lambda: self.add(ids))
+
+    def pop(self, count):
+        """Atomically remove and return up to `count` IDs"""
+        client = self.redis_client()
+        if client is not None:
+            try:
+                return [
+                    member.decode() if isinstance(member, bytes) else member
+                    for member in client.spop(self.key, count) or []
+                ]
+            except Exception as e:
+                logger.warning(f"Failed to pop from dirty set {self.key} in Redis: {e}")
+        with self._lock:
+            popped = []
+            while self.local and len(popped) < count:
+                popped.append(self.local.pop())
+            return popped
+
+    def count(self):
+        client = self.redis_client()
+        if client is not None:
+            try:
+                return client.scard(self.key)
+            except Exception:
+                pass
+        with self._lock:
+            return len(self.local)
@@ -0,0 +1,88 @@
+"""
+A persistent event loop for running coroutines from sync (WSGI) code.
+
+Views used to call async services with asyncio.new_event_loop() and
+run_until_complete per request, which builds and tears down a loop every
+time and throws away any client or connection pool bound to it. `run_sync`
+submits the coroutine to one loop running in a daemon thread for the life of
+the process instead, so concurrent requests interleave on it while their
+worker threads wait for the result. The loop is restarted in a forked child
+(gunicorn --preload), where the parent's thread does not exist.
+
+Coroutines run here must not use the ORM directly (the loop thread is an
+async context); wrap such calls in sync_to_async as under ASGI.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """An event loop in a daemon thread, started on first use"""
+
+    def __init__(self, name='background-event-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _running(self):
+        return self._loop is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    @property
+    def loop(self):
+        if not self._running():
+            with self._lock:
+                if not self._running():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name=self.name, daemon=True)
+        thread.start()
+        ready.wait()
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+        logger.debug(f"Started {self.name} in process {self._pid}")
+
+    def run(self, coro, timeout=None):
+        """Run coro on the loop and block until it finishes (cancelled on timeout)"""
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError(f"{self.name}.run() called from its own loop; await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self):
+        with self._lock:
+            if self._running():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+            self._loop = self._thread = self._pid = None
+
+
+background_loop = BackgroundEventLoop()
+
+
+def run_sync(coro, timeout=None):
+    """Run coro on the process-wide background loop and return its result"""
+    return background_loop.run(coro, timeout)
@@ -0,0 +1,199 @@
+"""
+Group broadcasts through the channel layer, serialized once and coalesced.
+
+Consumers used to call group_send for every broadcast with the raw event,
+and every member re-encoded it to JSON in its handler. `GroupBroadcaster`
+instead:
+
+- encodes the payload once, when it is published, so members send the text
+  as it is
+- buffers broadcasts for WINDOW_MS (apps.core.coalescing) and sends each group one layer message
+  framing all of them (up to MAX_FRAMES), so a burst of small broadcasts
+  costs one group_send per group, and one dispatch per member, rather than
+  one per broadcast
+- sends the groups of a flush through a transport. With channels_redis the
+  membership reads of every group go out in one pipeline, and the writes in
+  one more, per Redis host; other layers (the in-memory one in tests) get a
+  group_send per group
+
+Consumers receiving broadcasts include `FanoutMixin`, which handles the
+framed messages and provides `broadcast()`.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Union
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, get_channel_layer
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .coalescing import Coalescer, LoopLocal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FANOUT_SETTINGS = {
+    # How long broadcasts wait for others to share their group_send
+    'WINDOW_MS': 5,
+    # Broadcasts framed into one layer message
+    'MAX_FRAMES': 100,
+    # Dotted path of a transport class; None picks one for the layer
+    'TRANSPORT': None,
+}
+
+# Consumer event type of framed broadcasts, handled by FanoutMixin.fanout_frames
+FRAMES_EVENT = 'fanout.frames'
+
+
+def get_fanout_settings():
+    return {**DEFAULT_FANOUT_SETTINGS, **getattr(settings, 'FANOUT', {})}
+
+
+class LayerTransport:
+    """Sends each group its message with the layer's own group_send"""
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    async def send(self, messages: Dict[str, Dict]):
+        await asyncio.gather(*(self.layer.group_send(group, message) for group, message in messages.items()))
+
+
+# The script channels_redis runs for group_send: add to each channel key below capacity
+_GROUP_SEND_LUA = """
+    local over_capacity = 0
+    local current_time = ARGV[#ARGV - 1]
+    local expiry = ARGV[#ARGV]
+    for i=1,#KEYS do
+        if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+            redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+            redis.call('EXPIRE', KEYS[i], expiry)
+        else
+            over_capacity = over_capacity + 1
+        end
+    end
+    return over_capacity
+"""
+
+
+class RedisPipelineTransport(LayerTransport):
+    """
+    group_send for several groups at once on a channels_redis RedisChannelLayer:
+    one pipeline per host reads every group's members, and one more per host
+    expires and writes every channel key they map to
+    """
+
+    async def send(self, messages: Dict[str, Dict]):
+        layer = self.layer
+        now = int(time.time())
+
+        groups_by_host = defaultdict(list)
+        for group in messages:
+            groups_by_host[layer.consistent_hash(group)].append(group)
+
+        members = {}
+        for index, groups in groups_by_host.items():
+            pipe = layer.connection(index).pipeline(transaction=False)
+            for group in groups:
+                key = layer._group_key(group)
+                pipe.zremrangebyscore(key, min=0, max=now - layer.group_expiry)
+                pipe.zrange(key, 0, -1)
+            results = await pipe.execute()
+            for group, names in zip(groups, results[1::2]):
+                members[group] = [name.decode('utf8') for name in names]
+
+        writes = defaultdict(list)
+        for group, message in messages.items():
+            if not members[group]:
+                continue
+            keys_by_host, key_messages, capacities = layer._map_channel_keys_to_connection(members[group], message)
+            for index, keys in keys_by_host.items():
+                writes[index].extend((key, key_messages[key], capacities[key]) for key in keys)
+
+        for index, items in writes.items():
+            pipe = layer.connection(index).pipeline(transaction=False)
+            for key in {key for key, _, _ in items}:
+                pipe.zremrangebyscore(key, min=0, max=now - int(layer.expiry))
+            pipe.eval(
+                _GROUP_SEND_LUA, len(items),
+                *(key for key, _, _ in items),
+                *(payload for _, payload, _ in items),
+                *(capacity for _, _, capacity in items),
+                time.time(), layer.expiry,
+            )
+            over_capacity = (await pipe.execute())[-1]
+            if over_capacity:
+                logger.info(f"{over_capacity} of {len(items)} channel keys over capacity in a fan-out")
+
+
+def transport_for(layer) -> LayerTransport:
+    path = get_fanout_settings()['TRANSPORT']
+    if path:
+        return import_string(path)(layer)
+    try:
+        from channels_redis.core import RedisChannelLayer
+    except ImportError:
+        RedisChannelLayer = None
+    if RedisChannelLayer is not None and isinstance(layer, RedisChannelLayer):
+        return RedisPipelineTransport(layer)
+    return LayerTransport(layer)
+
+
+class GroupBroadcaster(Coalescer):
+    """Coalesces the broadcasts of one event loop into framed group messages"""
+
+    def __init__(self, layer, transport: LayerTransport = None):
+        super().__init__()
+        self.layer = layer
+        self.transport = transport or transport_for(layer)
+
+    def new_batch(self) -> Dict[str, List]:
+        return {}
+
+    def publish(self, groups: Union[str, Iterable[str]], payload: Union[str, Dict], exclude: str = None):
+        """
+        Queue payload (a dict to encode as JSON, or text as it should be sent)
+        for every member of groups, except the channel named by exclude
+        """
+        text = payload if isinstance(payload, str) else json.dumps(payload)
+        config = get_fanout_settings()
+        full = False
+        for group in [groups] if isinstance(groups, str) else groups:
+            frames = self._pending.setdefault(group, [])
+            frames.append([text, exclude])
+            full = full or len(frames) >= config['MAX_FRAMES']
+        # Flushes go out in order, so members see a group's broadcasts in order
+        self._queued(config['WINDOW_MS'], full)
+
+    async def send_batch(self, batch: Dict[str, List]):
+        try:
+            await self.transport.send({
+                group: {'type': FRAMES_EVENT, 'frames': frames} for group, frames in batch.items()
+            })
+        except Exception as e:
+            logger.error(f"Fan-out to {len(batch)} groups failed: {e}")
+
+
+_broadcasters = LoopLocal(lambda alias: GroupBroadcaster(get_channel_layer(alias)))
+
+
+def get_broadcaster(alias: str = DEFAULT_CHANNEL_LAYER) -> GroupBroadcaster:
+    """The running event loop's broadcaster for a channel layer"""
+    return _broadcasters.get(alias)
+
+
+class FanoutMixin:
+    """Receives GroupBroadcaster frames on an AsyncWebsocketConsumer"""
+
+    def broadcast(self, groups, payload, exclude_self: bool = False):
+        get_broadcaster(self.channel_layer_alias).publish(
+            groups, payload, exclude=self.channel_name if exclude_self else None
+        )
+
+    async def fanout_frames(self, event):
+        for text, exclude in event['frames']:
+            if exclude != self.channel_name:
+                await self.send(text_data=text)
@@ -0,0 +1,226 @@
+"""
+Idempotent request replay.
+
+`IdempotencyStore.execute(key, compute)` runs `compute` once per key and
+replays its result to every duplicate: a client retrying a slow AI call gets
+the original response instead of paying for a second generation.
+
+Completed payloads are stored zlib-compressed JSON in the default cache
+with a TTL. While a key is being computed its in-flight marker is a cache
+lock (`cache.add`, so SET NX on Redis) that duplicates on other workers poll
+until the result lands; duplicates in the same process wait on an event
+instead and are handed the result directly, which also works with caches
+that cannot hold a lock. Failed computations are not stored, so the next
+duplicate runs its own. `aexecute` does the same for async views and
+coroutine computations.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDEMPOTENCY_SETTINGS = {
+    'TTL_S': 3600,
+    # Longer than the slowest computation; a crashed owner's lock lapses after this
+    'LOCK_TTL_S': 120,
+    'WAIT_TIMEOUT_S': 90,
+    'POLL_INTERVAL_S': 0.05,
+    'COMPRESS_LEVEL': 6,
+}
+
+
+def get_idempotency_settings():
+    return {**DEFAULT_IDEMPOTENCY_SETTINGS, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+def _off_loop(fn, *args):
+    """Cache calls can be network round trips; keep them off the event loop"""
+    return sync_to_async(fn, thread_sensitive=False)(*args)
+
+
+class IdempotencyTimeout(Exception):
+    """A duplicate waited longer than WAIT_TIMEOUT_S for the original request"""
+
+
+class _Flight:
+    __slots__ = ('done', 'payload')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload = None
+
+
+class IdempotencyStore:
+    """Replay store for one kind of request; keys must include the user"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _result_key(self, key):
+        return f'idempotency:{self.namespace}:result:{key}'
+
+    def _lock_key(self, key):
+        return f'idempotency:{self.namespace}:lock:{key}'
+
+    def get(self, key):
+        """The stored payload for key, or None"""
+        try:
+            blob = cache.get(self._result_key(key))
+        except Exception as e:
+            logger.warning(f"Idempotency store unavailable: {e}")
+            return None
+        if blob is None:
+            return None
+        return json.loads(zlib.decompress(blob))
+
+    def set(self, key, payload):
+        config = get_idempotency_settings()
+        blob = zlib.compress(
+            json.dumps(payload, separators=(',', ':'), default=str).encode(), config['COMPRESS_LEVEL']
+        )
+        try:
+            cache.set(self._result_key(key), blob, timeout=config['TTL_S'])
+        except Exception as e:
+            logger.warning(f"Failed to store idempotent result {key}: {e}")
+
+    def execute(self, key, compute):
+        """
+        Return (payload, replayed): the stored or shared payload for key, or
+        compute() (a JSON-serializable payload) stored for later duplicates.
+        """
+        payload = self.get(key)
+        if payload is not None:
+            return payload, True
+
+        deadline = time.monotonic() + get_idempotency_settings()['WAIT_TIMEOUT_S']
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+
+            if leader:
+                try:
+                    payload, replayed = self._execute_locked(key, compute, deadline)
+                    flight.payload = payload
+                    return payload, replayed
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+
+            if not flight.done.wait(max(0.0, deadline - time.monotonic())):
+                raise IdempotencyTimeout(key)
+            if flight.payload is not None:
+                return flight.payload, True
+            # The leader failed; try again ourselves
+
+    def _acquire(self, key, token):
+        try:
+            return cache.add(self._lock_key(key), token, timeout=get_idempotency_settings()['LOCK_TTL_S'])
+        except Exception as e:
+            logger.warning(f"Idempotency lock unavailable, computing {key} unlocked: {e}")
+            return True
+
+    def _release(self, key, token):
+        lock_key = self._lock_key(key)
+        try:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+        except Exception:
+            pass
+
+    def _execute_locked(self, key, compute, deadline):
+        token = uuid.uuid4().hex
+        interval = get_idempotency_settings()['POLL_INTERVAL_S']
+        while not self._acquire(key, token):
+            # Another worker is computing it
+            time.sleep(interval)
+            interval = min(interval * 2, 1.0)
+            payload = self.get(key)
+            if payload is not None:
+                return payload, True
+            if time.monotonic() >= deadline:
+                raise IdempotencyTimeout(key)
+
+        try:
+            # Stored by a duplicate that finished before the lock was taken
+            payload = self.get(key)
+            if payload is not None:
+                return payload, True
+            payload = compute()
+            self.set(key, payload)
+            return payload, False
+        finally:
+            self._release(key, token)
+
+    async def aexecute(self, key, compute):
+        """
+        execute() for async callers: `compute` is a coroutine function and
+        waiting for a duplicate does not block the event loop.
+        """
+        payload = await _off_loop(self.get, key)
+        if payload is not None:
+            return payload, True
+
+        config = get_idempotency_settings()
+        deadline = time.monotonic() + config['WAIT_TIMEOUT_S']
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+
+            if leader:
+                try:
+                    payload, replayed = await self._aexecute_locked(key, compute, deadline)
+                    flight.payload = payload
+                    return payload, replayed
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+
+            while not flight.done.is_set():
+                if time.monotonic() >= deadline:
+                    raise IdempotencyTimeout(key)
+                await asyncio.sleep(config['POLL_INTERVAL_S'])
+            if flight.payload is not None:
+                return flight.payload, True
+            # The leader failed; try again ourselves
+
+    async def _aexecute_locked(self, key, compute, deadline):
+        token = uuid.uuid4().hex
+        interval = get_idempotency_settings()['POLL_INTERVAL_S']
+        while not await _off_loop(self._acquire, key, token):
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 1.0)
+            payload = await _off_loop(self.get, key)
+            if payload is not None:
+                return payload, True
+            if time.monotonic() >= deadline:
+                raise IdempotencyTimeout(key)
+
+        try:
+            payload = await _off_loop(self.get, key)
+            if payload is not None:
+                return payload, True
+            payload = await compute()
+            await _off_loop(self.set, key, payload)
+            return payload, False
+        finally:
+            await _off_loop(self._release, key, token)
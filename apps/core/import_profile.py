@@ -0,0 +1,138 @@
+"""
+Import-time profile of a worker's start.
+
+`profile_imports` runs a fresh interpreter under `python -X importtime`,
+imports a module there (the ASGI entry point by default) and reads the
+per-module timings it prints to stderr. It also reports the child's wall
+time and peak RSS, so HTTP-only and WebSocket worker starts can be compared:
+
+    python manage.py profile_imports                 # HTTP-only worker
+    python manage.py profile_imports --consumers     # plus every WebSocket consumer
+"""
+
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+DEFAULT_MODULE = 'promptcraft.asgi'
+
+# ru_maxrss survives exec, so it would report the parent's peak; VmHWM is the child's own
+_REPORT_RSS = """
+import sys
+try:
+    with open('/proc/self/status') as _status:
+        _rss_kb = next(int(line.split()[1]) for line in _status if line.startswith('VmHWM:'))
+    print('peak_rss_mb=%f' % (_rss_kb / 1024))
+except (OSError, StopIteration):
+    try:
+        import resource
+        # KiB on Linux, bytes on macOS
+        _rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print('peak_rss_mb=%f' % (_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)))
+    except ImportError:  # Windows
+        pass
+"""
+
+# -X importtime only times imports made through __import__, not importlib.import_module
+_PRELOAD_ROUTES = """
+from apps.core.lazy_routing import LazyConsumer
+for _routing in ('apps.core.routing', 'apps.templates.routing', 'apps.ai_services.routing'):
+    try:
+        _patterns = __import__(_routing, fromlist=['websocket_urlpatterns']).websocket_urlpatterns
+    except ImportError:
+        continue
+    for _route in _patterns:
+        if isinstance(_route.callback, LazyConsumer):
+            try:
+                __import__(_route.callback.consumer_path.rsplit('.', 1)[0])
+                _route.callback.resolve()
+            except ImportError:
+                pass
+"""
+
+
+@dataclass
+class ModuleImport:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    imports: List[ModuleImport]
+    wall_ms: float
+    peak_rss_mb: Optional[float]
+    returncode: int
+    error: str = ''
+
+    def heaviest(self, limit: int = 25, sort: str = 'cumulative') -> List[ModuleImport]:
+        key = (lambda entry: entry.self_us) if sort == 'self' else (lambda entry: entry.cumulative_us)
+        return sorted(self.imports, key=key, reverse=True)[:limit]
+
+    def by_package(self) -> Dict[str, int]:
+        """Self time in microseconds per top-level package"""
+        totals = {}
+        for entry in self.imports:
+            package = entry.name.split('.', 1)[0]
+            totals[package] = totals.get(package, 0) + entry.self_us
+        return totals
+
+
+def parse_importtime(output: str) -> List[ModuleImport]:
+    """The entries of `-X importtime` output, in the order they were printed"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # The header line
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        # Nested imports are indented by two spaces per level
+        imports.append(ModuleImport(stripped, self_us, cumulative_us, (len(name) - len(stripped) - 1) // 2))
+    return imports
+
+
+def profile_imports(module: str = DEFAULT_MODULE, consumers: bool = False, env: Dict[str, str] = None,
+                    timeout: float = 300) -> ImportProfile:
+    """Import `module` in a fresh interpreter and profile it; with consumers, preload all WebSocket consumers too"""
+    code = (
+        "import django\n"
+        "django.setup()\n"
+        f"__import__({module!r})\n"
+    )
+    if consumers:
+        code += _PRELOAD_ROUTES
+    code += _REPORT_RSS
+
+    child_env = {**os.environ, **(env or {})}
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=child_env, timeout=timeout,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    peak_rss_mb = None
+    for line in completed.stdout.splitlines():
+        if line.startswith('peak_rss_mb='):
+            peak_rss_mb = float(line.split('=', 1)[1])
+
+    error = ''
+    if completed.returncode:
+        error = [line for line in completed.stderr.splitlines() if not line.startswith('import time:')][-1:]
+        error = error[0] if error else f'exit code {completed.returncode}'
+    return ImportProfile(module, parse_importtime(completed.stderr), wall_ms, peak_rss_mb, completed.returncode,
+                         error)
@@ -0,0 +1,67 @@
+"""
+Deferred imports of heavy optional dependencies.
+
+LangChain, FAISS, sentence-transformers and SciPy take seconds and hundreds
+of megabytes to import, and the service modules that use them are imported
+by views and consumers that may never call into them. Instead of
+
+    try:
+        from langchain_community.vectorstores import FAISS
+        LANGCHAIN_AVAILABLE = True
+    except ImportError:
+        LANGCHAIN_AVAILABLE = False
+
+those modules now write
+
+    LANGCHAIN_AVAILABLE = modules_available('langchain_community')
+    FAISS = lazy_import('langchain_community.vectorstores', 'FAISS') if LANGCHAIN_AVAILABLE else None
+
+`modules_available` only looks the packages up, and the `lazy_import` proxy
+imports the module on first attribute access or call. A package that is
+installed but broken raises its ImportError at that first use.
+"""
+
+import importlib
+import importlib.util
+
+
+def modules_available(*packages: str) -> bool:
+    """Whether all these top-level packages are installed, without importing them"""
+    try:
+        return all(importlib.util.find_spec(package) is not None for package in packages)
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyImport:
+    """Stands in for a module, or a name in one, until it is first used"""
+
+    __slots__ = ('_module_name', '_attribute', '_target')
+
+    def __init__(self, module_name: str, attribute: str = None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            target = importlib.import_module(self._module_name)
+            if self._attribute:
+                target = getattr(target, self._attribute)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        name = f"{self._module_name}.{self._attribute}" if self._attribute else self._module_name
+        state = 'imported' if self._target is not None else 'not imported'
+        return f"<LazyImport {name} ({state})>"
+
+
+def lazy_import(module_name: str, attribute: str = None) -> LazyImport:
+    return LazyImport(module_name, attribute)
@@ -0,0 +1,78 @@
+"""
+WebSocket routes whose consumers are imported on first connection.
+
+The routing modules used to import their consumer modules, and with them
+LangChain, the embedding and FAISS wrappers and the RAG services, so every
+ASGI worker paid for those imports at start even if it only ever served
+HTTP. Routes now name their consumer by dotted path:
+
+    path('ws/chat/<str:session_id>/', lazy_consumer('apps.templates.chat_consumer.ChatConsumer'))
+
+and the consumer module is imported, in a worker thread so the event loop
+keeps serving, when the first connection reaches that route. A consumer
+whose module fails to import rejects the handshake and logs why, rather
+than taking the other routes down with it.
+
+`preload_consumers` imports every route's consumer up front, for
+WebSocket workers that would rather pay at start than on first connection.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Iterable
+
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LazyConsumer:
+    """ASGI application for a consumer class imported on its first connection"""
+
+    def __init__(self, consumer_path: str, **initkwargs):
+        self.consumer_path = consumer_path
+        self.initkwargs = initkwargs
+        self._application = None
+
+    def __repr__(self):
+        return f"<LazyConsumer {self.consumer_path}>"
+
+    @property
+    def resolved(self) -> bool:
+        return self._application is not None
+
+    def resolve(self):
+        """The consumer's ASGI application, importing it if needed"""
+        if self._application is None:
+            consumer_class = import_string(self.consumer_path)
+            self._application = consumer_class.as_asgi(**self.initkwargs)
+        return self._application
+
+    async def __call__(self, scope, receive, send):
+        application = self._application
+        if application is None:
+            try:
+                application = await asyncio.get_running_loop().run_in_executor(None, self.resolve)
+            except ImportError as e:
+                logger.error(f"WebSocket consumer {self.consumer_path} is unavailable: {e}")
+                # Closing before accept rejects the handshake
+                await send({'type': 'websocket.close', 'code': 1011})
+                return
+        return await application(scope, receive, send)
+
+
+def lazy_consumer(consumer_path: str, **initkwargs) -> LazyConsumer:
+    return LazyConsumer(consumer_path, **initkwargs)
+
+
+def preload_consumers(urlpatterns: Iterable) -> Dict[str, str]:
+    """Import the consumers of all lazy routes; returns the ones that failed, with why"""
+    failed = {}
+    for route in urlpatterns:
+        callback = getattr(route, 'callback', None)
+        if isinstance(callback, LazyConsumer) and not callback.resolved:
+            try:
+                callback.resolve()
+            except ImportError as e:
+                failed[callback.consumer_path] = str(e)
+    return failed
@@ -0,0 +1,328 @@
+"""
+Two-tier cache of LLM responses.
+
+Intent classification and prompt optimization calls used to pay for a full
+round-trip even when a near-identical prompt had been answered minutes
+earlier. Call sites now look the request up first:
+
+    lookup = get_response_cache().lookup('intent', model, query, system=system_prompt)
+    if lookup.hit:
+        return lookup.served()
+    result = ...call the model...
+    get_response_cache().store(lookup, result)
+
+(`alookup`/`astore` from async code.) A lookup tries two tiers:
+
+- exact: the request (task, model, system prompt, parameters and prompt,
+  with case and whitespace normalized) hashed with BLAKE2b, in the Django
+  cache, so every worker shares it
+- semantic: the prompt's MiniLM embedding against the prompts this process
+  has stored for the same task, model, system prompt and parameters; the
+  nearest one counts when its cosine similarity reaches the task's
+  threshold. Optimized prompts and assessments (scores and a rewrite) are
+  written for the prompt they were asked about, so 'optimize' and
+  'assessment' have no threshold and are served from the exact tier only
+
+Entries live for the task's TTL. Each semantic index is a ring of
+MAX_ENTRIES vectors (the oldest is overwritten) and at most MAX_INDEXES
+indexes are kept, least recently used first out.
+
+A fraction (SHADOW_RATE) of semantic hits is not served: the caller gets a
+miss, calls the model, and `store` compares the fresh response with the one
+the cache would have served, counting a false positive when they differ.
+`stats()` reports hits per tier, misses and false positives per task. With
+RECORD_PATH set, every stored response is appended to a JSON-lines request
+log that `manage.py evaluate_llm_cache` replays offline.
+"""
+
+import asyncio
+import difflib
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_CACHE_SETTINGS = {
+    'ENABLED': True,
+    # Django cache holding the exact tier
+    'CACHE_ALIAS': 'default',
+    'TTL_S': 900,
+    'TASK_TTL_S': {'intent': 3600, 'optimize': 1800},
+    # Cosine similarity a neighbour needs to be served; None turns the semantic tier off
+    'THRESHOLD': 0.95,
+    'TASK_THRESHOLDS': {'intent': 0.92, 'optimize': None, 'assessment': None},
+    # Vectors per semantic index, and indexes per process
+    'MAX_ENTRIES': 2000,
+    'MAX_INDEXES': 64,
+    # Function embedding a list of texts as normalized rows
+    'EMBEDDER': 'apps.templates.semantic_search.embed_texts',
+    # Fraction of semantic hits checked against a fresh call
+    'SHADOW_RATE': 0.0,
+    # JSON-lines request log for the offline evaluation, off when empty
+    'RECORD_PATH': '',
+}
+
+
+def get_llm_cache_settings():
+    return {**DEFAULT_LLM_CACHE_SETTINGS, **getattr(settings, 'LLM_CACHE', {})}
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', text or '').casefold().split())
+
+
+def _digest(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _comparable(response):
+    """What two responses must share to count as the same answer"""
+    if hasattr(response, '__dataclass_fields__'):
+        response = {name: getattr(response, name) for name in response.__dataclass_fields__}
+    if isinstance(response, str):
+        try:
+            response = json.loads(response)
+        except ValueError:
+            return normalize_text(response)
+    if isinstance(response, dict):
+        for label in ('category', 'intent'):
+            if label in response:
+                return (label, response[label])
+        for text in ('optimized_content', 'optimized_prompt', 'content'):
+            if text in response:
+                return normalize_text(str(response[text]))
+    return normalize_text(json.dumps(response, sort_keys=True, default=str))
+
+
+def same_response(a, b, text_similarity: float = 0.8) -> bool:
+    """Classifications must agree on their label; generated text must be mostly the same"""
+    a, b = _comparable(a), _comparable(b)
+    if isinstance(a, str) and isinstance(b, str):
+        return a == b or difflib.SequenceMatcher(None, a, b, autojunk=False).ratio() >= text_similarity
+    return a == b
+
+
+@dataclass
+class CacheLookup:
+    task: str
+    model: str
+    prompt: str
+    key: str
+    index_key: str
+    system: str = ''
+    params: Dict = field(default_factory=dict)
+    result: Any = None
+    # 'exact' or 'semantic' when served from the cache
+    tier: Optional[str] = None
+    similarity: Optional[float] = None
+    vector: Optional[np.ndarray] = None
+    # The response a shadowed semantic hit would have served
+    shadowed: Any = None
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def hit(self) -> bool:
+        return self.tier is not None
+
+    def served(self) -> Any:
+        """The cached response as a hit returns it: marked cached, with nothing spent on it"""
+        if isinstance(self.result, dict):
+            return {**self.result, 'processing_time_ms': 0, 'tokens_used': 0, 'cached': self.tier}
+        return self.result
+
+
+class SemanticIndex:
+    """Ring of normalized prompt embeddings with the exact-tier key and expiry of each"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors = None
+        self.keys = [None] * capacity
+        self.expires = np.zeros(capacity)
+        self.size = 0
+        self.cursor = 0
+
+    def add(self, vector: np.ndarray, key: str, expires_at: float):
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+        self.vectors[self.cursor] = vector
+        self.keys[self.cursor] = key
+        self.expires[self.cursor] = expires_at
+        self.cursor = (self.cursor + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def nearest(self, vector: np.ndarray, now: float):
+        if not self.size:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        scores[self.expires[:self.size] <= now] = -1.0
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+
+class LLMResponseCache:
+    def __init__(self, config: Optional[Dict] = None, backend=None, embed: Optional[Callable] = None,
+                 clock: Callable[[], float] = time.time):
+        self.config = config or get_llm_cache_settings()
+        self.backend = backend if backend is not None else caches[self.config['CACHE_ALIAS']]
+        self._embed = embed
+        self.clock = clock
+        self._indexes: 'OrderedDict[str, SemanticIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._embedder_failed = False
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._record_lock = threading.Lock()
+
+    # Configuration
+
+    def ttl(self, task: str) -> float:
+        return self.config['TASK_TTL_S'].get(task, self.config['TTL_S'])
+
+    def threshold(self, task: str) -> Optional[float]:
+        return self.config['TASK_THRESHOLDS'].get(task, self.config['THRESHOLD'])
+
+    def _count(self, task: str, name: str):
+        with self._lock:
+            counters = self._counters.setdefault(task, {
+                'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'stores': 0,
+                'shadow_checks': 0, 'false_positives': 0,
+            })
+            counters[name] += 1
+
+    def _embed_prompt(self, prompt: str) -> Optional[np.ndarray]:
+        if self._embedder_failed:
+            return None
+        try:
+            embed = self._embed or import_string(self.config['EMBEDDER'])
+            vector = np.asarray(embed([normalize_text(prompt)])[0], dtype=np.float32)
+        except Exception as e:
+            # Without an embedding model the exact tier still works
+            logger.warning(f"LLM cache semantic tier disabled: {e}")
+            self._embedder_failed = True
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    # Lookups
+
+    def lookup(self, task: str, model: str, prompt: str, system: str = '', params: Dict = None) -> CacheLookup:
+        params = params or {}
+        normalized_system = normalize_text(system)
+        index_key = _digest(task, model, normalized_system, params)
+        lookup = CacheLookup(task=task, model=model, prompt=prompt, system=system, params=params,
+                             key=f"llmcache:{_digest(index_key, normalize_text(prompt))}", index_key=index_key)
+        if not self.config['ENABLED']:
+            return lookup
+
+        now = self.clock()
+        entry = self.backend.get(lookup.key)
+        if entry is not None and entry['expires_at'] > now:
+            lookup.result, lookup.tier, lookup.similarity = entry['result'], 'exact', 1.0
+            self._count(task, 'exact_hits')
+            return lookup
+
+        threshold = self.threshold(task)
+        if threshold is not None:
+            lookup.vector = self._embed_prompt(prompt)
+            with self._lock:
+                index = self._indexes.get(index_key)
+                if index is not None:
+                    self._indexes.move_to_end(index_key)
+            if lookup.vector is not None and index is not None:
+                with self._lock:
+                    neighbour, similarity = index.nearest(lookup.vector, now)
+                if neighbour is not None and similarity >= threshold:
+                    entry = self.backend.get(neighbour)
+                    if entry is not None and entry['expires_at'] > now:
+                        if self.config['SHADOW_RATE'] and random.random() < self.config['SHADOW_RATE']:
+                            # Served as a miss; store() compares the fresh response
+                            lookup.shadowed, lookup.similarity = entry['result'], similarity
+                            self._count(task, 'shadow_checks')
+                        else:
+                            lookup.result, lookup.tier, lookup.similarity = entry['result'], 'semantic', similarity
+                            self._count(task, 'semantic_hits')
+                            return lookup
+
+        self._count(task, 'misses')
+        return lookup
+
+    def store(self, lookup: CacheLookup, result: Any):
+        """Cache the response to a missed lookup"""
+        if lookup.hit or not self.config['ENABLED']:
+            return
+        latency_ms = (time.perf_counter() - lookup.started) * 1000
+        if lookup.shadowed is not None and not same_response(lookup.shadowed, result):
+            self._count(lookup.task, 'false_positives')
+            logger.info(f"LLM cache false positive for {lookup.task} at similarity {lookup.similarity:.3f}")
+
+        ttl = self.ttl(lookup.task)
+        expires_at = self.clock() + ttl
+        self.backend.set(lookup.key, {'expires_at': expires_at, 'result': result}, timeout=int(ttl) + 1)
+        self._count(lookup.task, 'stores')
+        if lookup.vector is not None:
+            with self._lock:
+                index = self._indexes.get(lookup.index_key)
+                if index is None:
+                    index = self._indexes[lookup.index_key] = SemanticIndex(self.config['MAX_ENTRIES'])
+                    while len(self._indexes) > self.config['MAX_INDEXES']:
+                        self._indexes.popitem(last=False)
+                self._indexes.move_to_end(lookup.index_key)
+                index.add(lookup.vector, lookup.key, expires_at)
+
+        if self.config['RECORD_PATH']:
+            self._record(lookup, result, latency_ms)
+
+    def _record(self, lookup: CacheLookup, result: Any, latency_ms: float):
+        line = json.dumps({
+            'ts': self.clock(), 'task': lookup.task, 'model': lookup.model, 'system': lookup.system,
+            'params': lookup.params, 'prompt': lookup.prompt, 'response': result, 'latency_ms': round(latency_ms, 1),
+        }, default=str)
+        try:
+            with self._record_lock, open(self.config['RECORD_PATH'], 'a', encoding='utf-8') as log:
+                log.write(line + '\n')
+        except OSError as e:
+            logger.warning(f"Could not record LLM request: {e}")
+
+    async def alookup(self, task: str, model: str, prompt: str, system: str = '', params: Dict = None) -> CacheLookup:
+        # Embedding the prompt is CPU work; keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.lookup(task, model, prompt, system=system, params=params)
+        )
+
+    async def astore(self, lookup: CacheLookup, result: Any):
+        await asyncio.get_running_loop().run_in_executor(None, self.store, lookup, result)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats = {task: dict(counters) for task, counters in self._counters.items()}
+        for counters in stats.values():
+            lookups = counters['exact_hits'] + counters['semantic_hits'] + counters['misses']
+            counters['hit_rate'] = (counters['exact_hits'] + counters['semantic_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = LLMResponseCache()
+    return _response_cache
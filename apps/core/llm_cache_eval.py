@@ -0,0 +1,104 @@
+"""
+Offline evaluation of the LLM response cache.
+
+Replays a request log recorded with LLM_CACHE['RECORD_PATH'] (one JSON
+object per line: ts, task, model, system, params, prompt, response and
+latency_ms) through a fresh cache in timestamp order, on a clock that
+follows the log, so TTLs expire as they would have. For each request the
+cache could answer, the recorded response is compared with the one it
+would have served: a semantic hit with a different answer is a false
+positive. Each run reports per task the exact and semantic hit rates, the
+false positives and the model latency the hits would have saved:
+
+    python manage.py evaluate_llm_cache --log llm_requests.jsonl --threshold 0.9 0.93 0.95 0.97
+
+Prompts are embedded once, in batches, and shared by every threshold.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.module_loading import import_string
+
+from .llm_cache import LLMResponseCache, get_llm_cache_settings, normalize_text, same_response
+
+
+@dataclass
+class TaskEvaluation:
+    task: str
+    requests: int = 0
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    false_positives: int = 0
+    latency_ms: float = 0.0
+    latency_saved_ms: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.exact_hits + self.semantic_hits) / self.requests if self.requests else 0.0
+
+    @property
+    def false_positive_rate(self) -> float:
+        """False positives per semantic hit"""
+        return self.false_positives / self.semantic_hits if self.semantic_hits else 0.0
+
+
+def read_request_log(path: str) -> List[Dict]:
+    records = []
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            if line.strip():
+                records.append(json.loads(line))
+    return sorted(records, key=lambda record: record.get('ts', 0))
+
+
+def embed_records(records: Iterable[Dict], embed: Callable, batch_size: int = 256) -> Dict[str, np.ndarray]:
+    """Embeddings of the records' normalized prompts, keyed by normalized prompt"""
+    texts = list(dict.fromkeys(normalize_text(record['prompt']) for record in records))
+    vectors = {}
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        vectors.update(zip(batch, np.asarray(embed(batch), dtype=np.float32)))
+    return vectors
+
+
+def evaluate(records: List[Dict], threshold: Optional[float] = None, embed: Callable = None,
+             vectors: Dict[str, np.ndarray] = None, **overrides) -> Dict[str, TaskEvaluation]:
+    """Replay records through a fresh cache; threshold, when given, applies to every task"""
+    config = {**get_llm_cache_settings(), 'ENABLED': True, 'SHADOW_RATE': 0.0, 'RECORD_PATH': '', **overrides}
+    if threshold is not None:
+        config['THRESHOLD'], config['TASK_THRESHOLDS'] = threshold, {}
+    if vectors is None:
+        vectors = embed_records(records, embed or import_string(config['EMBEDDER']))
+
+    now = [0.0]
+    backend = LocMemCache('llm-cache-eval', {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': len(records) + 1}})
+    backend.clear()
+    cache = LLMResponseCache(config, backend=backend, embed=lambda texts: [vectors[text] for text in texts],
+                             clock=lambda: now[0])
+
+    results = {}
+    for record in records:
+        now[0] = record.get('ts', now[0])
+        task = record['task']
+        evaluation = results.setdefault(task, TaskEvaluation(task))
+        latency_ms = record.get('latency_ms') or 0.0
+        evaluation.requests += 1
+        evaluation.latency_ms += latency_ms
+
+        lookup = cache.lookup(task, record.get('model', ''), record['prompt'], system=record.get('system', ''),
+                              params=record.get('params'))
+        if not lookup.hit:
+            cache.store(lookup, record['response'])
+            continue
+        evaluation.latency_saved_ms += latency_ms
+        if lookup.tier == 'exact':
+            evaluation.exact_hits += 1
+        else:
+            evaluation.semantic_hits += 1
+            if not same_response(lookup.result, record['response']):
+                evaluation.false_positives += 1
+    return results
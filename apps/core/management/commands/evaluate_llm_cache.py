@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from apps.core.llm_cache import get_llm_cache_settings
+from apps.core.llm_cache_eval import embed_records, evaluate, read_request_log
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a recorded LLM request log through a fresh response cache and report, per task and '
+        'similarity threshold, the hit rate, false positives and model latency saved.'
+    )
+    # Works on a log file; this process's URLconf and models are beside the point
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', required=True, help='JSON-lines request log (LLM_CACHE RECORD_PATH)')
+        parser.add_argument(
+            '--threshold', type=float, nargs='*', default=[],
+            help='Similarity thresholds to compare, applied to every task (default: the configured ones)',
+        )
+        parser.add_argument('--embedder', help='Dotted path of the embedding function (default: LLM_CACHE EMBEDDER)')
+
+    def handle(self, *args, **options):
+        try:
+            records = read_request_log(options['log'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["log"]}: {e}')
+        if not records:
+            raise CommandError(f'{options["log"]} has no requests')
+
+        embedder = options['embedder'] or get_llm_cache_settings()['EMBEDDER']
+        try:
+            vectors = embed_records(records, import_string(embedder))
+        except Exception as e:
+            raise CommandError(f'Could not embed prompts with {embedder}: {e}')
+
+        for threshold in options['threshold'] or [None]:
+            label = f'threshold {threshold}' if threshold is not None else 'configured thresholds'
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{len(records)} requests, {label}'))
+            self.stdout.write(
+                f'{"task":<14} {"requests":>8} {"exact":>7} {"semantic":>8} {"hit rate":>8} '
+                f'{"false +":>7} {"saved s":>9} {"saved":>6}'
+            )
+            results = evaluate(records, threshold, vectors=vectors)
+            for task, result in sorted(results.items()):
+                saved = result.latency_saved_ms / result.latency_ms if result.latency_ms else 0.0
+                self.stdout.write(
+                    f'{task:<14} {result.requests:>8} {result.exact_hits:>7} {result.semantic_hits:>8} '
+                    f'{result.hit_rate:>8.1%} {result.false_positives:>7} '
+                    f'{result.latency_saved_ms / 1000:>9.1f} {saved:>6.1%}'
+                )
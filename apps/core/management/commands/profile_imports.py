@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.import_profile import DEFAULT_MODULE, profile_imports
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a module (the ASGI entry point by default) in a fresh interpreter under '
+        '`python -X importtime` and report the heaviest imports, start time and peak RSS.'
+    )
+    # Profiles a fresh interpreter; this one's URLconf and models are beside the point
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default=DEFAULT_MODULE, help='Module to import (default: %(default)s)')
+        parser.add_argument(
+            '--consumers', action='store_true',
+            help='Also import every WebSocket consumer, as a WebSocket worker does after its first connections',
+        )
+        parser.add_argument('--limit', type=int, default=25, help='Modules to list (default: %(default)s)')
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'self'], default='cumulative',
+            help='Order modules by time including or excluding their own imports (default: %(default)s)',
+        )
+        parser.add_argument('--packages', action='store_true', help='Also total self time per top-level package')
+
+    def handle(self, *args, **options):
+        profile = profile_imports(options['module'], consumers=options['consumers'])
+        if not profile.imports:
+            raise CommandError(f'No import timings for {profile.module}: {profile.error or "no output"}')
+        if profile.returncode:
+            self.stderr.write(self.style.WARNING(f'Importing {profile.module} failed: {profile.error}'))
+
+        self.stdout.write(f'{"self ms":>9} {"cumul ms":>9}  module ({options["sort"]})')
+        for entry in profile.heaviest(options['limit'], options['sort']):
+            self.stdout.write(f'{entry.self_us / 1000:9.1f} {entry.cumulative_us / 1000:9.1f}  {entry.name}')
+
+        if options['packages']:
+            self.stdout.write('')
+            self.stdout.write(f'{"self ms":>9}  package')
+            packages = sorted(profile.by_package().items(), key=lambda item: item[1], reverse=True)
+            for package, self_us in packages[:options['limit']]:
+                self.stdout.write(f'{self_us / 1000:9.1f}  {package}')
+
+        rss = f', peak RSS {profile.peak_rss_mb:.0f} MB' if profile.peak_rss_mb is not None else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{profile.module}: {len(profile.imports)} modules imported, '
+            f'{profile.wall_ms:.0f} ms to start{rss}'
+        ))
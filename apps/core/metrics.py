@@ -0,0 +1,276 @@
+"""
+Per-route HTTP latency histograms for PerformanceMiddleware.
+
+Latencies go into HDR-style log-linear buckets: SUB_BUCKETS buckets per
+doubling starting at LOWEST_TRACKABLE seconds, so every recorded value is
+within ~19% of its bucket bound whatever its magnitude. Each series
+(method, route, status class) holds a time-to-first-byte histogram, a
+total duration histogram and a byte counter.
+
+Series live in an mmap'd block of 64-bit words. With METRICS_SHARED_DIR set
+each process maps its own file there and the exporter merges every file in
+the directory, so all workers of a gunicorn/uvicorn server are reported by
+whichever one serves the scrape; otherwise the block is anonymous memory and
+only the current process is reported.
+"""
+
+import glob
+import logging
+import math
+import mmap
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LOWEST_TRACKABLE = 0.0001  # 100us
+SUB_BUCKETS = 4
+BUCKET_COUNT = 80  # 100us .. ~105s; one extra bucket holds everything above
+BUCKET_BOUNDS = tuple(LOWEST_TRACKABLE * 2 ** (i / SUB_BUCKETS) for i in range(BUCKET_COUNT))
+# Prometheus gets one bucket per doubling; the finer buckets serve percentile()
+EXPORT_STRIDE = SUB_BUCKETS
+
+MAX_SERIES = 1024
+KEY_BYTES = 256
+KEY_SEPARATOR = '\x1f'
+OVERFLOW_ROUTE = '__overflow__'
+
+MAGIC = 0x50434d4554524943  # "PCMETRIC"
+HEADER_WORDS = 4  # magic, max series, used series, reserved
+KEY_WORDS = KEY_BYTES // 8
+HISTOGRAM_WORDS = BUCKET_COUNT + 1
+TTFB_OFFSET = KEY_WORDS
+DURATION_OFFSET = TTFB_OFFSET + HISTOGRAM_WORDS
+BYTES_OFFSET = DURATION_OFFSET + HISTOGRAM_WORDS
+TTFB_SUM_OFFSET = BYTES_OFFSET + 1
+DURATION_SUM_OFFSET = BYTES_OFFSET + 2
+SLOT_WORDS = BYTES_OFFSET + 3
+
+FILE_PREFIX = 'http_metrics_'
+
+
+def bucket_index(seconds):
+    """Index of the smallest bucket whose bound is >= seconds"""
+    if seconds <= LOWEST_TRACKABLE:
+        return 0
+    return min(math.ceil(SUB_BUCKETS * math.log2(seconds / LOWEST_TRACKABLE)), BUCKET_COUNT)
+
+
+def percentile(counts, q):
+    """Upper bound of the bucket holding quantile q (0-1), or None when empty"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if seen >= rank and count:
+            return BUCKET_BOUNDS[index] if index < BUCKET_COUNT else math.inf
+    return math.inf
+
+
+class SeriesSnapshot:
+    """Merged values of one (method, route, status) series"""
+
+    def __init__(self, method, route, status):
+        self.method = method
+        self.route = route
+        self.status = status
+        self.ttfb_counts = [0] * HISTOGRAM_WORDS
+        self.duration_counts = [0] * HISTOGRAM_WORDS
+        self.ttfb_sum = 0.0
+        self.duration_sum = 0.0
+        self.bytes_total = 0
+
+    @property
+    def count(self):
+        return sum(self.duration_counts)
+
+    def percentile(self, q, ttfb=False):
+        return percentile(self.ttfb_counts if ttfb else self.duration_counts, q)
+
+
+class MetricsStore:
+    """Fixed-size series table over an mmap'd block; one writer per process"""
+
+    def __init__(self, shared_dir=None, max_series=MAX_SERIES):
+        self.shared_dir = shared_dir or None
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._pid = None
+        self._buffer = None
+        self._slots = {}
+
+    @property
+    def size(self):
+        return (HEADER_WORDS + self.max_series * SLOT_WORDS) * 8
+
+    def _map(self):
+        """Map this process's block, remapping after a fork"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._slots = {}
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+            path = os.path.join(self.shared_dir, f'{FILE_PREFIX}{pid}.db')
+            with open(path, 'w+b') as handle:
+                handle.truncate(self.size)
+                self._buffer = mmap.mmap(handle.fileno(), self.size)
+        else:
+            self._buffer = mmap.mmap(-1, self.size)
+        self._words = memoryview(self._buffer).cast('Q')
+        self._floats = memoryview(self._buffer).cast('d')
+        self._words[0] = MAGIC
+        self._words[1] = self.max_series
+        self._words[2] = 0
+        self._pid = pid
+
+    def _slot(self, key):
+        base = self._slots.get(key)
+        if base is not None:
+            return base
+        used = self._words[2]
+        if used >= self.max_series - 1:
+            # Keep the last slot for everything beyond the table size
+            method, _, status = key.split(KEY_SEPARATOR)
+            key = KEY_SEPARATOR.join((method, OVERFLOW_ROUTE, status))
+            base = self._slots.get(key)
+            if base is not None:
+                return base
+            used = self.max_series - 1
+        base = HEADER_WORDS + used * SLOT_WORDS
+        encoded = key.encode('utf-8')[:KEY_BYTES]
+        start = base * 8
+        self._buffer[start:start + len(encoded)] = encoded
+        self._slots[key] = base
+        self._words[2] = min(used + 1, self.max_series)
+        return base
+
+    def observe(self, method, route, status, ttfb, duration, nbytes):
+        key = KEY_SEPARATOR.join((method, route, status))
+        with self._lock:
+            self._map()
+            base = self._slot(key)
+            words = self._words
+            floats = self._floats
+            words[base + TTFB_OFFSET + bucket_index(ttfb)] += 1
+            words[base + DURATION_OFFSET + bucket_index(duration)] += 1
+            words[base + BYTES_OFFSET] += nbytes
+            floats[base + TTFB_SUM_OFFSET] += ttfb
+            floats[base + DURATION_SUM_OFFSET] += duration
+
+    def _blocks(self):
+        """Yield the buffers to report: every process file, or our own block"""
+        if not self.shared_dir:
+            if self._buffer is not None:
+                yield self._buffer
+            return
+        for path in sorted(glob.glob(os.path.join(self.shared_dir, f'{FILE_PREFIX}*.db'))):
+            try:
+                with open(path, 'rb') as handle:
+                    yield mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+
+    def snapshot(self):
+        """Merge all series, keyed by (method, route, status)"""
+        merged = {}
+        for block in self._blocks():
+            words = memoryview(block).cast('Q')
+            floats = memoryview(block).cast('d')
+            try:
+                if words[0] != MAGIC:
+                    continue
+                for slot in range(min(words[2], words[1])):
+                    base = HEADER_WORDS + slot * SLOT_WORDS
+                    raw = bytes(block[base * 8:base * 8 + KEY_BYTES]).rstrip(b'\0')
+                    key = tuple(raw.decode('utf-8', 'replace').split(KEY_SEPARATOR))
+                    if len(key) != 3:
+                        continue
+                    series = merged.get(key)
+                    if series is None:
+                        series = merged[key] = SeriesSnapshot(*key)
+                    for i in range(HISTOGRAM_WORDS):
+                        series.ttfb_counts[i] += words[base + TTFB_OFFSET + i]
+                        series.duration_counts[i] += words[base + DURATION_OFFSET + i]
+                    series.bytes_total += words[base + BYTES_OFFSET]
+                    series.ttfb_sum += floats[base + TTFB_SUM_OFFSET]
+                    series.duration_sum += floats[base + DURATION_SUM_OFFSET]
+            finally:
+                words.release()
+                floats.release()
+        return merged
+
+    def reset(self):
+        """Drop this process's series (tests)"""
+        with self._lock:
+            if self._buffer is not None:
+                self._words.release()
+                self._floats.release()
+                self._buffer.close()
+            self._buffer = None
+            self._pid = None
+            self._slots = {}
+
+
+http_metrics = MetricsStore(getattr(settings, 'METRICS_SHARED_DIR', None))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    """Prometheus label pairs, escaped, for histogram_lines and sample lines"""
+    return ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+
+
+def _format_float(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def histogram_lines(name, labels, counts, total):
+    """Sample lines of one histogram series kept in this module's buckets"""
+    lines = []
+    cumulative = 0
+    for index in range(BUCKET_COUNT):
+        cumulative += counts[index]
+        if index % EXPORT_STRIDE == 0:
+            lines.append(f'{name}_bucket{{{labels},le="{_format_float(BUCKET_BOUNDS[index])}"}} {cumulative}')
+    cumulative += counts[BUCKET_COUNT]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {_format_float(total)}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return lines
+
+
+def render_prometheus(store=None):
+    """Render all series in the Prometheus text exposition format (0.0.4)"""
+    store = store or http_metrics
+    series = sorted(store.snapshot().values(), key=lambda s: (s.route, s.method, s.status))
+    families = (
+        ('http_request_ttfb_seconds', 'Time from request start to the first response byte.',
+         lambda s: (s.ttfb_counts, s.ttfb_sum)),
+        ('http_request_duration_seconds', 'Time from request start to the last response byte.',
+         lambda s: (s.duration_counts, s.duration_sum)),
+    )
+    lines = []
+    for name, help_text, values in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for s in series:
+            labels = format_labels(method=s.method, route=s.route, status=s.status)
+            counts, total = values(s)
+            lines.extend(histogram_lines(name, labels, counts, total))
+    lines.append('# HELP http_response_size_bytes_total Response body bytes sent.')
+    lines.append('# TYPE http_response_size_bytes_total counter')
+    for s in series:
+        labels = format_labels(method=s.method, route=s.route, status=s.status)
+        lines.append(f'http_response_size_bytes_total{{{labels}}} {s.bytes_total}')
+    return '\n'.join(lines) + '\n'
@@ -10,11 +10,14 @@ import logging
 import json
 import time
 import uuid
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 from django.core.cache import cache
 
+from .metrics import http_metrics
+
 logger = logging.getLogger('core.auth_debug')
 security_logger = logging.getLogger('promptcraft.security')
 performance_logger = logging.getLogger('promptcraft.performance')
@@ -202,41 +205,120 @@ class RequestLoggingMiddleware(MiddlewareMixin):
         return False
 
 
-class PerformanceMiddleware(MiddlewareMixin):
-    """Monitor and optimize performance"""
-    
-    def process_request(self, request):
-        request.performance_start = time.time()
-        return None
-    
-    def process_response(self, request, response):
-        if hasattr(request, 'performance_start'):
-            duration = time.time() - request.performance_start
-            
-            # Add performance headers
-            response['X-Processing-Time'] = f"{duration:.3f}"
-            
-            # Log performance metrics
+def _route_label(request):
+    """URL pattern of the matched view, so metrics don't explode per object ID"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.route or match.view_name or '<unnamed>'
+
+
+class _ResponseTimer:
+    """Timing and size of one response, recorded once the body is fully sent"""
+
+    def __init__(self, request, response, start):
+        self.method = request.method
+        self.path = request.path
+        self.route = _route_label(request)
+        self.status_code = response.status_code
+        self.start = start
+        self.ttfb = None
+        self.nbytes = 0
+
+    def first_byte(self):
+        if self.ttfb is None:
+            self.ttfb = time.perf_counter() - self.start
+
+    def finish(self, streaming):
+        duration = time.perf_counter() - self.start
+        ttfb = duration if self.ttfb is None else self.ttfb
+        http_metrics.observe(
+            self.method, self.route, f'{self.status_code // 100}xx',
+            ttfb, duration, self.nbytes
+        )
+        performance_logger.info(
+            f"PERF: {self.method} {self.path} "
+            f"{self.status_code} {duration:.3f}s {self.nbytes}b"
+            + (f" ttfb={ttfb:.3f}s" if streaming else "")
+        )
+
+        # Alert on very slow requests; streams are judged by their first byte
+        if ttfb > getattr(settings, 'SLOW_REQUEST_THRESHOLD', 2.0):
             perf_info = {
-                'path': request.path,
-                'method': request.method,
+                'path': self.path,
+                'method': self.method,
                 'duration': duration,
-                'status_code': response.status_code,
-                'content_length': len(response.content),
+                'ttfb': ttfb,
+                'status_code': self.status_code,
+                'content_length': self.nbytes,
             }
-            
-            # Log as JSON for easier parsing
-            performance_logger.info(
-                f"PERF: {request.method} {request.path} "
-                f"{response.status_code} {duration:.3f}s {len(response.content)}b"
-            )
-            
-            # Alert on very slow requests
-            if duration > getattr(settings, 'SLOW_REQUEST_THRESHOLD', 2.0):
-                logger.warning(f"Very slow request: {perf_info}")
-        
+            logger.warning(f"Very slow request: {perf_info}")
+
+
+class PerformanceMiddleware:
+    """
+    Record per-route latency and response size into apps.core.metrics
+
+    Works under WSGI and ASGI. Streaming responses (SSE) are not read here:
+    their iterator is wrapped so time to first byte, total bytes and stream
+    duration are measured as the server sends them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.process_response(request, response, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.process_response(request, response, start)
+
+    def process_response(self, request, response, start):
+        timer = _ResponseTimer(request, response, start)
+        response['X-Processing-Time'] = f"{time.perf_counter() - start:.3f}"
+
+        if not response.streaming:
+            length = response.get('Content-Length')
+            timer.nbytes = int(length) if length is not None else len(response.content)
+            timer.finish(streaming=False)
+        elif response.is_async:
+            response.streaming_content = self._timed_async_stream(response.streaming_content, timer)
+        else:
+            response.streaming_content = self._timed_stream(response.streaming_content, timer)
         return response
 
+    @staticmethod
+    def _timed_stream(chunks, timer):
+        try:
+            for chunk in chunks:
+                timer.first_byte()
+                timer.nbytes += len(chunk)
+                yield chunk
+        finally:
+            timer.finish(streaming=True)
+
+    @staticmethod
+    async def _timed_async_stream(chunks, timer):
+        try:
+            async for chunk in chunks:
+                timer.first_byte()
+                timer.nbytes += len(chunk)
+                yield chunk
+        finally:
+            timer.finish(streaming=True)
+
 
 class RateLimitMiddleware(MiddlewareMixin):
     """Advanced rate limiting middleware"""
@@ -0,0 +1,56 @@
+"""
+Query budgets for list views.
+
+`query_budget(n)` counts the SQL statements a view runs on the default
+database. Over budget it logs a warning, or raises QueryBudgetExceeded when
+settings.QUERY_BUDGET_STRICT is on (the testing settings enable it), so an
+N+1 regression in a list serializer fails the test suite instead of
+shipping.
+"""
+
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than its budget"""
+
+
+class QueryCounter:
+    """Database execute wrapper that counts statements"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries):
+    """Decorate a view or viewset method with a maximum number of queries"""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = view_func(*args, **kwargs)
+            if counter.count > max_queries:
+                message = (
+                    f"{view_func.__qualname__} ran {counter.count} queries, "
+                    f"over its budget of {max_queries}"
+                )
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+
+    return decorator
@@ -3,14 +3,18 @@ Core WebSocket routing
 """
 
 from django.urls import path, re_path
-from . import consumers
+
+from apps.core.lazy_routing import lazy_consumer
+
+RootWebSocketConsumer = lazy_consumer('apps.core.consumers.RootWebSocketConsumer')
+HealthCheckConsumer = lazy_consumer('apps.core.consumers.HealthCheckConsumer')
 
 websocket_urlpatterns = [
     # Root WebSocket endpoint
-    path('', consumers.RootWebSocketConsumer.as_asgi()),
-    re_path(r'^$', consumers.RootWebSocketConsumer.as_asgi()),
+    path('', RootWebSocketConsumer),
+    re_path(r'^$', RootWebSocketConsumer),
     
     # Health check endpoint
-    path('health/', consumers.HealthCheckConsumer.as_asgi()),
-    path('ws/health/', consumers.HealthCheckConsumer.as_asgi()),
-]
\ No newline at end of file
+    path('health/', HealthCheckConsumer),
+    path('ws/health/', HealthCheckConsumer),
+]
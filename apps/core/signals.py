@@ -0,0 +1,20 @@
+"""
+Signal handlers that evict cached WebSocket user snapshots (apps.core.ws_auth).
+
+Eviction happens once the transaction commits, so a concurrent handshake
+cannot cache the old row after it.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .ws_auth import evict_user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='ws_auth_user_saved')
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid='ws_auth_user_deleted')
+def user_changed(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: evict_user(user_id))
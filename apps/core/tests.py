@@ -1,3 +1,1654 @@
-from django.test import TestCase
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, path
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from apps.chat.views import ChatCompletionsProxyView
+from apps.core import fanout, metrics, timer_wheel, ws_auth
+from apps.core.async_views import AsyncAPIView
+from apps.core.consumers import RootWebSocketConsumer
+from apps.core.event_loop import BackgroundEventLoop
+from apps.core.fanout import FRAMES_EVENT, GroupBroadcaster, LayerTransport, RedisPipelineTransport
+from apps.core.idempotency import IdempotencyStore
+from apps.core.import_profile import parse_importtime, profile_imports
+from apps.core.lazy_imports import lazy_import, modules_available
+from apps.core.lazy_routing import lazy_consumer, preload_consumers
+from apps.core.llm_cache import DEFAULT_LLM_CACHE_SETTINGS, LLMResponseCache, same_response
+from apps.core.llm_cache_eval import evaluate
+from apps.core.metrics import MetricsStore, bucket_index, render_prometheus
+from apps.core.middleware import PerformanceMiddleware
+from apps.core.timer_wheel import ConnectionTimer, HeartbeatMixin, TimerWheel
+from apps.core.vector_index import replacing_directory
+from apps.core.views import prometheus_metrics
+from apps.core.ws_auth import JWTAuthMiddleware, token_from_scope
+from apps.core.ws_protocol import (
+    CLOSE_TOO_BIG, MSGPACK_PROTOCOL, MSGPACK_ZLIB_PROTOCOL, TYPE_CODES, FrameProtocolMixin, FrameTooLarge,
+    MsgpackCodec, negotiate,
+)
+
+
+def sse_view(request):
+    def events():
+        for i in range(3):
+            time.sleep(0.02)
+            yield f"event: token\ndata: {i}\n\n"
+    return StreamingHttpResponse(events(), content_type="text/event-stream")
+
+
+def async_sse_view(request):
+    async def events():
+        for i in range(3):
+            await asyncio.sleep(0.02)
+            yield f"data: {i}\n\n"
+    return StreamingHttpResponse(events(), content_type="text/event-stream")
+
+
+def routed(request, route):
+    request.resolver_match = ResolverMatch(lambda r: None, (), {}, route=route)
+    return request
+
+
+class MetricsTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        self.store = MetricsStore()
+        patcher = mock.patch("apps.core.middleware.http_metrics", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.store.reset)
+        self.factory = RequestFactory()
+
+    def series(self, route, method="GET", status="2xx"):
+        return self.store.snapshot()[(method, route, status)]
+
+
+# ===========================================================================
+# 1. PerformanceMiddleware — buffered and streaming (SSE) responses
+# ===========================================================================
+
+class PerformanceMiddlewareTests(MetricsTestMixin, TestCase):
+
+    def test_buffered_response_is_recorded(self):
+        middleware = PerformanceMiddleware(lambda request: HttpResponse(b"x" * 512))
+        response = middleware(routed(self.factory.get("/api/v2/core/config/"), "api/v2/core/config/"))
+
+        self.assertIn("X-Processing-Time", response)
+        series = self.series("api/v2/core/config/")
+        self.assertEqual(series.count, 1)
+        self.assertEqual(series.bytes_total, 512)
+        self.assertEqual(series.ttfb_sum, series.duration_sum)
+
+    def test_sse_stream_is_measured_while_sent(self):
+        middleware = PerformanceMiddleware(sse_view)
+        response = middleware(routed(self.factory.get("/stream/"), "stream/"))
+
+        # Nothing is recorded until the server has sent the stream
+        self.assertEqual(self.store.snapshot(), {})
+        body = b"".join(response.streaming_content)
+
+        series = self.series("stream/")
+        self.assertEqual(series.count, 1)
+        self.assertEqual(series.bytes_total, len(body))
+        self.assertGreaterEqual(series.ttfb_sum, 0.02)
+        self.assertGreaterEqual(series.duration_sum, 0.06)
+        self.assertLess(series.ttfb_sum, series.duration_sum)
+
+    def test_disconnected_stream_records_bytes_sent(self):
+        middleware = PerformanceMiddleware(sse_view)
+        response = middleware(routed(self.factory.get("/stream/"), "stream/"))
+        first = next(iter(response.streaming_content))
+        response.close()
+
+        series = self.series("stream/")
+        self.assertEqual(series.count, 1)
+        self.assertEqual(series.bytes_total, len(first))
+
+    def test_async_stream_under_asgi(self):
+        async def get_response(request):
+            return async_sse_view(request)
+
+        middleware = PerformanceMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        async def consume():
+            response = await middleware(routed(self.factory.get("/stream/"), "stream/"))
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        body = asyncio.run(consume())
+        series = self.series("stream/")
+        self.assertEqual(series.bytes_total, len(body))
+        self.assertGreaterEqual(series.duration_sum, 0.06)
+
+    def test_unmatched_requests_share_one_series(self):
+        middleware = PerformanceMiddleware(lambda request: HttpResponse(status=404))
+        for url in ("/wp-admin/", "/.env", "/phpMyAdmin/"):
+            middleware(self.factory.get(url))
+        self.assertEqual(self.series("<unmatched>", status="4xx").count, 3)
+
+
+class SSEViewMetricsTests(MetricsTestMixin, TestCase):
+
+    @override_settings(DEEPSEEK_CONFIG={"API_KEY": "test-key", "BASE_URL": "http://127.0.0.1:9"})
+    def test_chat_completions_proxy_stream(self):
+        user = get_user_model().objects.create_user(
+            username="streamer", email="streamer@example.com", password="pass1234"
+        )
+        request = self.factory.post(
+            "/api/v2/chat/completions/",
+            data={"messages": [{"role": "user", "content": "hi"}]},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}",
+        )
+        middleware = PerformanceMiddleware(ChatCompletionsProxyView.as_view())
+        response = middleware(routed(request, "api/v2/chat/completions/"))
+
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content)
+        self.assertIn(b"event: stream_end", body)
+
+        series = self.series("api/v2/chat/completions/", method="POST")
+        self.assertEqual(series.bytes_total, len(body))
+        self.assertLessEqual(series.ttfb_sum, series.duration_sum)
+
+
+# ===========================================================================
+# 2. Histograms, shared memory and the Prometheus endpoint
+# ===========================================================================
+
+def _observe_in_child(shared_dir):
+    MetricsStore(shared_dir).observe("GET", "child/", "2xx", 0.01, 0.02, 100)
+
+
+class MetricsStoreTests(SimpleTestCase):
+
+    def test_bucket_relative_error(self):
+        for value in (0.00015, 0.0031, 0.047, 0.5, 1.9, 42.0):
+            bound = metrics.BUCKET_BOUNDS[bucket_index(value)]
+            self.assertGreaterEqual(bound, value)
+            self.assertLessEqual(bound / value, 2 ** (1 / metrics.SUB_BUCKETS) + 1e-9)
+        self.assertEqual(bucket_index(10_000), metrics.BUCKET_COUNT)
+
+    def test_percentiles(self):
+        store = MetricsStore()
+        self.addCleanup(store.reset)
+        for ms in range(1, 101):
+            store.observe("GET", "p/", "2xx", ms / 1000, ms / 1000, 0)
+        series = store.snapshot()[("GET", "p/", "2xx")]
+        self.assertAlmostEqual(series.percentile(0.5), 0.05, delta=0.05 * 0.19)
+        self.assertAlmostEqual(series.percentile(0.99), 0.099, delta=0.099 * 0.19)
+
+    def test_overflow_series(self):
+        store = MetricsStore(max_series=4)
+        self.addCleanup(store.reset)
+        for i in range(10):
+            store.observe("GET", f"route-{i}/", "2xx", 0.001, 0.001, 1)
+        snapshot = store.snapshot()
+        self.assertEqual(len(snapshot), 4)
+        self.assertEqual(snapshot[("GET", metrics.OVERFLOW_ROUTE, "2xx")].count, 7)
+
+    def test_shared_dir_merges_processes(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            store = MetricsStore(shared_dir)
+            self.addCleanup(store.reset)
+            store.observe("GET", "child/", "2xx", 0.01, 0.03, 50)
+
+            child = multiprocessing.get_context("fork").Process(target=_observe_in_child, args=(shared_dir,))
+            child.start()
+            child.join(10)
+            self.assertEqual(child.exitcode, 0)
+
+            series = MetricsStore(shared_dir).snapshot()[("GET", "child/", "2xx")]
+            self.assertEqual(series.count, 2)
+            self.assertEqual(series.bytes_total, 150)
+
+    def test_prometheus_text(self):
+        store = MetricsStore()
+        self.addCleanup(store.reset)
+        store.observe("GET", 'say/"hi"/', "2xx", 0.001, 0.3, 10)
+        store.observe("GET", 'say/"hi"/', "2xx", 0.002, 0.4, 10)
+        text = render_prometheus(store)
+
+        labels = 'method="GET",route="say/\\"hi\\"/",status="2xx"'
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="0.2048"}} 0', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="0.4096"}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'http_request_ttfb_seconds_count{{{labels}}} 2', text)
+        self.assertIn(f'http_response_size_bytes_total{{{labels}}} 20', text)
+
+
+class PrometheusEndpointTests(SimpleTestCase):
+
+    @override_settings(METRICS_AUTH_TOKEN="scrape-token")
+    def test_bearer_token_required(self):
+        factory = RequestFactory()
+        self.assertEqual(prometheus_metrics(factory.get("/metrics/")).status_code, 401)
+
+        response = prometheus_metrics(factory.get("/metrics/", HTTP_AUTHORIZATION="Bearer scrape-token"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn(b"# TYPE http_request_ttfb_seconds histogram", response.content)
+
+
+# ===========================================================================
+# 3. Idempotent replay
+# ===========================================================================
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "idempotency"}}
+
+
+class SlowComputation:
+    """Stands in for an LLM call; counts how often it actually runs"""
+
+    def __init__(self, seconds=0.05, fail=False):
+        self.seconds = seconds
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.seconds)
+        if self.fail:
+            raise RuntimeError("provider timeout")
+        return {"optimized": "better prompt " * 50, "usage": {"tokens_in": 10, "tokens_out": 20}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class IdempotencyStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.store = IdempotencyStore("tests")
+
+    def test_replays_completed_result(self):
+        compute = SlowComputation(0)
+        first, replayed = self.store.execute("user:key", compute)
+        self.assertFalse(replayed)
+        self.assertEqual(self.store.execute("user:key", compute), (first, True))
+        self.assertEqual(compute.calls, 1)
+
+        from django.core.cache import cache
+        blob = cache.get("idempotency:tests:result:user:key")
+        self.assertIsInstance(blob, bytes)
+        self.assertLess(len(blob), len(first["optimized"]) / 4)
+
+    def test_concurrent_duplicates_share_one_computation(self):
+        compute = SlowComputation(0.1)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: self.store.execute("user:key", compute), range(8)))
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(sorted(replayed for _, replayed in results), [False] + [True] * 7)
+
+    def test_waits_for_another_worker(self):
+        from django.core.cache import cache
+
+        # Another process holds the in-flight lock and stores the result later
+        cache.add("idempotency:tests:lock:user:key", "other-worker")
+        other = IdempotencyStore("tests")
+        threading.Timer(0.1, lambda: other.set("user:key", {"optimized": "theirs"})).start()
+
+        compute = SlowComputation(0)
+        self.assertEqual(self.store.execute("user:key", compute), ({"optimized": "theirs"}, True))
+        self.assertEqual(compute.calls, 0)
+
+    def test_failures_are_not_stored(self):
+        with self.assertRaises(RuntimeError):
+            self.store.execute("user:key", SlowComputation(0, fail=True))
+        compute = SlowComputation(0)
+        self.assertFalse(self.store.execute("user:key", compute)[1])
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+    def test_in_process_duplicates_without_a_shared_cache(self):
+        compute = SlowComputation(0.1)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: self.store.execute("user:key", compute), range(4)))
+        self.assertEqual(compute.calls, 1)
+
+
+@pytest.mark.slow
+def test_benchmark_retry_storm():
+    """50 users, each client retrying its request 10 times while the first is in flight"""
+    users, retries, llm_seconds = 50, 10, 0.2
+    compute = SlowComputation(llm_seconds)
+    store = IdempotencyStore("bench")
+    latencies = {False: [], True: []}
+    lock = threading.Lock()
+
+    def request(i):
+        user = i % users
+        # Retries trickle in while the original is still being generated
+        time.sleep((i // users) * llm_seconds / (2 * retries))
+        start = time.perf_counter()
+        _, replayed = store.execute(f"{user}:key", compute)
+        with lock:
+            latencies[replayed].append(time.perf_counter() - start)
+
+    with override_settings(CACHES=LOCMEM_CACHE), ThreadPoolExecutor(max_workers=200) as pool:
+        list(pool.map(request, range(users * retries)))
+
+    # Later retries, after the originals completed
+    with override_settings(CACHES=LOCMEM_CACHE):
+        start = time.perf_counter()
+        for user in range(users):
+            assert store.execute(f"{user}:key", compute)[1]
+        completed_replay_us = (time.perf_counter() - start) / users * 1e6
+
+    waited_ms = 1000 * sum(latencies[True]) / len(latencies[True])
+    print(
+        f"{users * (retries + 1)} requests, {compute.calls} LLM calls "
+        f"({users * (retries + 1) - compute.calls} saved); in-flight duplicates waited {waited_ms:.0f}ms "
+        f"on average (original {llm_seconds * 1000:.0f}ms); completed replays {completed_replay_us:.0f}us"
+    )
+    assert compute.calls == users
+    assert waited_ms < llm_seconds * 1000
+
+
+@pytest.mark.slow
+def test_benchmark_middleware_overhead():
+    store = MetricsStore()
+    factory = RequestFactory()
+    request = routed(factory.get("/bench/"), "bench/")
+    response = HttpResponse(b"x" * 2048)
+    view = lambda request: response
+    runs = 20000
+
+    def timed(handler):
+        start = time.perf_counter()
+        for _ in range(runs):
+            handler(request)
+        return (time.perf_counter() - start) * 1e6 / runs
+
+    def stream_view(request):
+        return StreamingHttpResponse(iter([b"data: x\n\n"] * 10))
+
+    def timed_stream(handler):
+        start = time.perf_counter()
+        for _ in range(runs // 10):
+            for _ in handler(request).streaming_content:
+                pass
+        return (time.perf_counter() - start) * 1e6 / (runs // 10)
+
+    with mock.patch("apps.core.middleware.http_metrics", store), \
+            mock.patch("apps.core.middleware.performance_logger.disabled", True):
+        bare_us = timed(view)
+        instrumented_us = timed(PerformanceMiddleware(view))
+        bare_stream_us = timed_stream(stream_view)
+        instrumented_stream_us = timed_stream(PerformanceMiddleware(stream_view))
+    store.reset()
+
+    print(
+        f"buffered: +{instrumented_us - bare_us:.1f}us per request, "
+        f"10-chunk stream: +{instrumented_stream_us - bare_stream_us:.1f}us per request"
+    )
+    assert instrumented_us - bare_us < 100
+
+
+# ===========================================================================
+# 4. Background event loop and async views
+# ===========================================================================
+
+class BackgroundEventLoopTests(SimpleTestCase):
+
+    def setUp(self):
+        self.background = BackgroundEventLoop("test-loop")
+        self.addCleanup(self.background.stop)
+
+    def test_reuses_one_loop(self):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            loops = set(pool.map(lambda _: self.background.run(current_loop()), range(16)))
+        self.assertEqual(loops, {self.background.loop})
+
+    def test_timeout_cancels(self):
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            self.background.run(slow(), timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+
+    def test_errors_propagate(self):
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            self.background.run(fail())
+
+    def test_rejects_calls_from_its_own_loop(self):
+        async def nested():
+            async def inner():
+                return 1
+            self.background.run(inner())
+
+        with self.assertRaises(RuntimeError):
+            self.background.run(nested())
+
+
+class EchoView(AsyncAPIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        await asyncio.sleep(0)
+        return Response({"user": request.user.username, "data": request.data})
+
+
+class AsyncAPIViewTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="async", password="pass1234")
+        self.factory = APIRequestFactory()
+        self.view = EchoView.as_view()
+
+    def call(self, request):
+        response = asyncio.run(self.view(request))
+        return response.render()
+
+    def test_is_a_coroutine_view(self):
+        from asgiref.sync import iscoroutinefunction
+
+        self.assertTrue(iscoroutinefunction(self.view))
+
+    def test_runs_async_handler(self):
+        request = self.factory.post("/echo/", {"q": "prompt"}, format="json")
+        force_authenticate(request, user=self.user)
+        response = self.call(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"user": "async", "data": {"q": "prompt"}})
+
+    def test_permissions_and_methods(self):
+        self.assertEqual(self.call(self.factory.post("/echo/", {}, format="json")).status_code, 401)
+        request = self.factory.get("/echo/")
+        force_authenticate(request, user=self.user)
+        self.assertEqual(self.call(request).status_code, 405)
+
+
+class FakeRAGAgent:
+    """An LLM-backed agent whose HTTP client is bound to the loop it was opened on"""
+
+    def __init__(self, llm_seconds=0.05, connect_seconds=0.02):
+        self.llm_seconds = llm_seconds
+        self.connect_seconds = connect_seconds
+        self.clients = {}
+
+    async def answer(self, query):
+        loop = asyncio.get_running_loop()
+        if loop not in self.clients:
+            # TLS handshake and connection pool setup
+            self.clients[loop] = asyncio.ensure_future(asyncio.sleep(self.connect_seconds))
+        await self.clients[loop]
+        await asyncio.sleep(self.llm_seconds)
+        return {"answer": query.upper()}
+
+
+@pytest.mark.slow
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_concurrent_rag_answers():
+    """200 concurrent answer requests: loop per request, background loop (WSGI), async view (ASGI)"""
+    requests, llm_seconds = 200, 0.05
+    user = get_user_model().objects.create_user(username="bench", password="pass1234")
+    factory = APIRequestFactory()
+
+    def timed(fn):
+        start = time.perf_counter()
+        latency = fn()
+        return latency, time.perf_counter() - start
+
+    def threaded(handle):
+        def run():
+            def one(i):
+                start = time.perf_counter()
+                handle(i)
+                return time.perf_counter() - start
+            with ThreadPoolExecutor(max_workers=requests) as pool:
+                return list(pool.map(one, range(requests)))
+        return timed(run)
+
+    legacy_agent = FakeRAGAgent(llm_seconds)
+
+    def new_loop(i):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(legacy_agent.answer(f"q{i}"))
+        finally:
+            loop.close()
+
+    background, wsgi_agent = BackgroundEventLoop("bench-loop"), FakeRAGAgent(llm_seconds)
+    try:
+        legacy = threaded(new_loop)
+        wsgi = threaded(lambda i: background.run(wsgi_agent.answer(f"q{i}")))
+    finally:
+        background.stop()
+
+    asgi_agent = FakeRAGAgent(llm_seconds)
+
+    class AnswerView(AsyncAPIView):
+        permission_classes = [IsAuthenticated]
+
+        async def post(self, request):
+            return Response(await asgi_agent.answer(request.data["query"]))
+
+    view = AnswerView.as_view()
+
+    async def serve():
+        async def one(i):
+            request = factory.post("/rag/answer/", {"query": f"q{i}"}, format="json")
+            force_authenticate(request, user=user)
+            start = time.perf_counter()
+            response = await view(request)
+            assert response.status_code == 200
+            return time.perf_counter() - start
+        return await asyncio.gather(*(one(i) for i in range(requests)))
+
+    asgi = timed(lambda: asyncio.run(serve()))
+
+    def summary(name, result, agent):
+        latencies, elapsed = result
+        p95 = sorted(latencies)[int(len(latencies) * 0.95)]
+        return (
+            f"{name}: p50 {statistics.median(latencies) * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, "
+            f"{requests / elapsed:.0f} req/s, {len(agent.clients)} client(s)"
+        )
+
+    print(
+        f"{requests} concurrent requests, {llm_seconds * 1000:.0f}ms LLM call; "
+        + "; ".join([
+            summary("new loop per request", legacy, legacy_agent),
+            summary("background loop (WSGI)", wsgi, wsgi_agent),
+            summary("async view (ASGI)", asgi, asgi_agent),
+        ])
+    )
+    assert len(legacy_agent.clients) == requests
+    assert len(wsgi_agent.clients) == len(asgi_agent.clients) == 1
+    assert statistics.median(wsgi[0]) < statistics.median(legacy[0])
+
+
+# ===========================================================================
+# 5. WebSocket JWT authentication
+# ===========================================================================
+
+async def scope_user(scope):
+    """The scope['user'] JWTAuthMiddleware hands to the application"""
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["user"] = scope.get("user")
+
+    await JWTAuthMiddleware(app)(scope, None, None)
+    return seen["user"]
+
+
+def handshake_scope(token=None, header=None):
+    return {
+        "type": "websocket",
+        "query_string": f"token={token}".encode() if token else b"",
+        "headers": [(b"authorization", f"Bearer {header}".encode())] if header else [],
+    }
+
+
+class WebSocketJWTAuthTests(TestCase):
+
+    def setUp(self):
+        ws_auth._caches.clear()
+        self.addCleanup(ws_auth._caches.clear)
+        self.user = get_user_model().objects.create_user(username="socket", password="pass1234")
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self, scope):
+        # async_to_sync runs the snapshot query on this thread, inside the test transaction
+        return async_to_sync(scope_user)(scope)
+
+    def test_token_from_query_string_or_header(self):
+        self.assertEqual(token_from_scope(handshake_scope(token="abc")), "abc")
+        self.assertEqual(token_from_scope(handshake_scope(header="abc")), "abc")
+        self.assertEqual(token_from_scope(handshake_scope(token="undefined", header="abc")), "abc")
+        self.assertIsNone(token_from_scope(handshake_scope(token="null")))
+
+    def test_valid_token_sets_a_slim_user(self):
+        user = self.authenticate(handshake_scope(token=self.token))
+
+        self.assertTrue(user.is_authenticated)
+        self.assertEqual((user.pk, user.username), (self.user.pk, "socket"))
+        self.assertEqual(user.get_deferred_fields(), {
+            field.attname for field in get_user_model()._meta.concrete_fields
+        } - set(ws_auth.SNAPSHOT_FIELDS))
+
+    def test_invalid_expired_and_inactive_are_anonymous(self):
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+
+        self.assertFalse(self.authenticate(handshake_scope(token="not-a-jwt")).is_authenticated)
+        self.assertFalse(self.authenticate(handshake_scope(token=str(expired))).is_authenticated)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertFalse(self.authenticate(handshake_scope(token=self.token)).is_authenticated)
+
+    def test_reconnects_are_served_from_cache_until_the_user_is_saved(self):
+        with CaptureQueriesContext(connection) as first:
+            self.authenticate(handshake_scope(token=self.token))
+        with CaptureQueriesContext(connection) as again:
+            self.authenticate(handshake_scope(header=self.token))
+        self.assertEqual((len(first), len(again)), (1, 0))
+
+        self.user.username = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.authenticate(handshake_scope(token=self.token)).username, "renamed")
+
+    def test_concurrent_misses_share_one_query(self):
+        others = [get_user_model().objects.create_user(username=f"u{i}") for i in range(20)]
+        tokens = [str(AccessToken.for_user(user)) for user in others] * 3
+
+        async def storm():
+            return await asyncio.gather(*(scope_user(handshake_scope(token=token)) for token in tokens))
+
+        with CaptureQueriesContext(connection) as queries:
+            users = async_to_sync(storm)()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([user.username for user in users[:20]], [f"u{i}" for i in range(20)])
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_websocket_reconnect_storm():
+    """5k handshakes from 1k users: per-connect decode and get vs the cached middleware"""
+    import jwt
+    from channels.db import database_sync_to_async
+    from django.conf import settings
+
+    User = get_user_model()
+    users = User.objects.bulk_create([User(username=f"storm{i}") for i in range(1000)])
+    tokens = [str(AccessToken.for_user(user)) for user in users] * 5
+
+    @database_sync_to_async
+    def legacy_validate(token):
+        # EnhancedChatConsumer._validate_jwt_token before the middleware
+        decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+        return User.objects.get(id=decoded["user_id"])
+
+    async def legacy_handshake(token):
+        await legacy_validate(token_from_scope(handshake_scope(token=token)))
+
+    async def middleware_handshake(token):
+        await scope_user(handshake_scope(token=token))
+
+    def storm(handshake):
+        async def run():
+            async def one(token):
+                start = time.perf_counter()
+                await handshake(token)
+                return time.perf_counter() - start
+            return await asyncio.gather(*(one(token) for token in tokens))
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            latencies = sorted(async_to_sync(run)())
+            elapsed = time.perf_counter() - start
+        return len(queries), elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+    ws_auth._caches.clear()
+    try:
+        results = {
+            "per-connect get": storm(legacy_handshake),
+            "middleware, cold cache": storm(middleware_handshake),
+            "middleware, warm cache": storm(middleware_handshake),
+        }
+    finally:
+        ws_auth._caches.clear()
+
+    print(f"{len(tokens)} handshakes: " + "; ".join(
+        f"{name}: {queries} queries, {elapsed * 1000:.0f}ms total, p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms"
+        for name, (queries, elapsed, p50, p95) in results.items()
+    ))
+    assert results["per-connect get"][0] == len(tokens)
+    assert results["middleware, cold cache"][0] <= len(users) / 100
+    assert results["middleware, warm cache"][0] == 0
+    assert results["middleware, cold cache"][3] < results["per-connect get"][3]
+
+
+# ===========================================================================
+# 6. Heartbeats and idle timeouts on the timer wheel
+# ===========================================================================
+
+class ManualClock:
+    """Stands in for the event loop of a wheel advanced by hand"""
+
+    def time(self):
+        return 0.0
+
+    def create_task(self, coro):
+        coro.close()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.heartbeats = 0
+        self.closed = False
+
+    async def send_heartbeat(self):
+        self.heartbeats += 1
+
+    async def close_idle(self):
+        self.closed = True
+
+
+class HeartbeatEchoConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
+    heartbeat_interval = 0.05
+    idle_timeout = 0.3
+
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.send(text_data=text_data)
+
+
+class TimerWheelTests(SimpleTestCase):
+    def setUp(self):
+        timer_wheel._wheels.clear()
+
+    def manual_wheel(self):
+        wheel = TimerWheel(ManualClock(), tick_s=1.0)
+        wheel.start = 0.0
+        return wheel
+
+    def test_timers_fire_at_their_tick_on_every_level(self):
+        wheel = self.manual_wheel()
+        rng = random.Random(7)
+        due = {}
+        for limit in (60, 4000, 250000, 20000000):
+            for _ in range(50):
+                timer = ConnectionTimer(None, None, None, 0.0)
+                due[timer] = rng.randint(1, limit)
+                wheel.schedule(timer, due[timer])
+        # Ticks without timers due can be skipped past the lowest level
+        fired = {}
+        while wheel.timers:
+            for timer in wheel.advance():
+                fired[timer] = wheel.current_tick
+
+        self.assertEqual(fired, due)
+
+    def test_cancelled_and_rescheduled_timers(self):
+        wheel = self.manual_wheel()
+        kept, cancelled, moved = (ConnectionTimer(None, None, None, 0.0) for _ in range(3))
+        for timer in (kept, cancelled, moved):
+            wheel.schedule(timer, 100)
+        wheel.cancel(cancelled)
+        wheel.schedule(moved, 5000)
+        self.assertEqual(len(wheel), 2)
+
+        fired = {}
+        while wheel.timers:
+            for timer in wheel.advance():
+                fired[timer] = wheel.current_tick
+        self.assertEqual(fired, {kept: 100, moved: 5000})
+
+    @override_settings(HEARTBEATS={'TICK_S': 0.01, 'JITTER': 0.1, 'BATCH_SIZE': 2})
+    def test_idle_connections_close_and_active_ones_get_heartbeats(self):
+        async def run():
+            wheel = timer_wheel.get_timer_wheel()
+            active, idle, silent = FakeConnection(), FakeConnection(), FakeConnection()
+            active_timer = wheel.register(active, 0.05, 0.15)
+            wheel.register(idle, 0.05, 0.15)
+            wheel.register(silent, 0.05, None)
+            for _ in range(30):
+                await asyncio.sleep(0.01)
+                active_timer.touch(asyncio.get_running_loop().time())
+            wheel.unregister(active_timer)
+            return wheel, active, idle, silent
+
+        wheel, active, idle, silent = async_to_sync(run)()
+        self.assertFalse(active.closed)
+        self.assertTrue(idle.closed)
+        self.assertFalse(silent.closed)
+        self.assertGreaterEqual(active.heartbeats, 3)
+        self.assertGreaterEqual(silent.heartbeats, 3)
+        # The idle connection's timer is gone once it has been closed
+        self.assertEqual(len(wheel), 1)
+
+    @override_settings(
+        HEARTBEATS={'TICK_S': 0.01, 'JITTER': 0.1, 'BATCH_SIZE': 500},
+        CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    )
+    def test_consumer_heartbeats_until_idle(self):
+        async def run():
+            communicator = WebsocketCommunicator(HeartbeatEchoConsumer.as_asgi(), "/ws/echo/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(len(timer_wheel.get_timer_wheel()), 1)
+
+            heartbeat = await communicator.receive_json_from(timeout=1)
+            self.assertEqual(heartbeat['type'], 'heartbeat')
+
+            # Messages keep the connection open past the idle timeout
+            for _ in range(4):
+                await communicator.send_to(text_data='"hello"')
+                while (await communicator.receive_json_from(timeout=1)) != 'hello':
+                    pass
+                await asyncio.sleep(0.1)
+
+            # Then silence closes it
+            while True:
+                output = await communicator.receive_output(timeout=1)
+                if output['type'] == 'websocket.close':
+                    break
+            await communicator.disconnect()
+            self.assertEqual(len(timer_wheel.get_timer_wheel()), 0)
+
+        async_to_sync(run)()
+
+
+@pytest.mark.slow
+def test_benchmark_idle_connection_timers():
+    """10k and 50k idle connections: a heartbeat task per connection vs the timer wheel"""
+    interval, tick, duration = 1.0, 0.05, 3.2
+
+    def legacy_register(connection, idle_timeout=300):
+        # The consumers' _heartbeat_loop before the wheel
+        async def heartbeat_loop():
+            last_activity = time.time()
+            while True:
+                await asyncio.sleep(interval)
+                if time.time() - last_activity > idle_timeout:
+                    await connection.close_idle()
+                    break
+                await connection.send_heartbeat()
+        return asyncio.ensure_future(heartbeat_loop())
+
+    async def measure(n, use_wheel):
+        connections = [FakeConnection() for _ in range(n)]
+        wheel = TimerWheel(asyncio.get_running_loop(), tick_s=tick)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        if use_wheel:
+            handles = [wheel.register(connection, interval, 300) for connection in connections]
+        else:
+            handles = [legacy_register(connection) for connection in connections]
+        await asyncio.sleep(0)
+        per_connection = (tracemalloc.get_traced_memory()[0] - before) / n
+        tracemalloc.stop()
+
+        # Loop lag: how late a 10ms sleep wakes up while the heartbeats run
+        lags = []
+        loop = asyncio.get_running_loop()
+        end = loop.time() + duration
+        while loop.time() < end:
+            start = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - start - 0.01)
+
+        for handle in handles:
+            if use_wheel:
+                wheel.unregister(handle)
+            else:
+                handle.cancel()
+        await asyncio.sleep(tick * 2)
+        lags.sort()
+        return {
+            "bytes": per_connection,
+            "p99": lags[int(len(lags) * 0.99)],
+            "max": lags[-1],
+            "heartbeats": sum(connection.heartbeats for connection in connections),
+        }
+
+    with override_settings(HEARTBEATS={'TICK_S': tick, 'JITTER': 0.1, 'BATCH_SIZE': 500}):
+        results = {
+            (n, name): async_to_sync(measure)(n, name == "wheel")
+            for n in (10000, 50000)
+            for name in ("per-connection task", "wheel")
+        }
+
+    print("; ".join(
+        f"{n} {name}: {r['bytes']:.0f} B/conn, lag p99 {r['p99'] * 1000:.1f}ms max {r['max'] * 1000:.1f}ms, "
+        f"{r['heartbeats']} heartbeats"
+        for (n, name), r in results.items()
+    ))
+    for n in (10000, 50000):
+        legacy, wheel = results[(n, "per-connection task")], results[(n, "wheel")]
+        assert wheel["bytes"] < legacy["bytes"] / 2
+        assert wheel["heartbeats"] >= n * 2
+    # At 10k both keep up; at 50k the per-connection wakeups stall the loop
+    assert results[(50000, "wheel")]["p99"] < results[(50000, "per-connection task")]["p99"] / 4
+
+
+# ===========================================================================
+# 7. Coalesced group broadcasts
+# ===========================================================================
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def redis_available():
+    try:
+        import redis
+
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.2).ping()
+    except Exception:
+        return False
+
+
+def redis_channel_layer():
+    from channels_redis.core import RedisChannelLayer
+
+    return RedisChannelLayer(hosts=[REDIS_URL + '/14'], capacity=100000)
+
+
+class CountingTransport(LayerTransport):
+    def __init__(self, layer):
+        super().__init__(layer)
+        self.sends = []
+
+    async def send(self, messages):
+        self.sends.append(messages)
+        await super().send(messages)
+
+
+async def join(layer, group, count):
+    channels = [await layer.new_channel() for _ in range(count)]
+    for channel in channels:
+        await layer.group_add(group, channel)
+    return channels
+
+
+class GroupBroadcasterTests(SimpleTestCase):
+    def setUp(self):
+        fanout._broadcasters.clear()
+
+    @override_settings(FANOUT={'WINDOW_MS': 5, 'MAX_FRAMES': 100})
+    def test_broadcasts_in_a_window_share_one_layer_message(self):
+        async def run():
+            layer = InMemoryChannelLayer()
+            transport = CountingTransport(layer)
+            broadcaster = GroupBroadcaster(layer, transport)
+            (room,), (lobby,) = await join(layer, "room", 1), await join(layer, "lobby", 1)
+
+            for i in range(10):
+                broadcaster.publish("room", {"n": i}, exclude="sender")
+            broadcaster.publish(["room", "lobby"], "42[\"hi\"]")
+            await broadcaster.flush()
+            return transport.sends, await layer.receive(room), await layer.receive(lobby)
+
+        sends, room_message, lobby_message = async_to_sync(run)()
+        self.assertEqual(len(sends), 1)
+        self.assertEqual(room_message["type"], FRAMES_EVENT)
+        self.assertEqual(
+            room_message["frames"],
+            [[json.dumps({"n": i}), "sender"] for i in range(10)] + [["42[\"hi\"]", None]],
+        )
+        self.assertEqual(lobby_message["frames"], [["42[\"hi\"]", None]])
+
+    @override_settings(FANOUT={'WINDOW_MS': 10000, 'MAX_FRAMES': 4})
+    def test_full_groups_flush_without_waiting_for_the_window(self):
+        async def run():
+            layer = InMemoryChannelLayer()
+            transport = CountingTransport(layer)
+            broadcaster = GroupBroadcaster(layer, transport)
+            await join(layer, "room", 1)
+            for i in range(10):
+                broadcaster.publish("room", {"n": i})
+            await asyncio.sleep(0.01)
+            sent = [len(messages["room"]["frames"]) for messages in transport.sends]
+            await broadcaster.flush()
+            return sent, [len(messages["room"]["frames"]) for messages in transport.sends]
+
+        before_flush, after_flush = async_to_sync(run)()
+        self.assertEqual(before_flush, [4, 4])
+        self.assertEqual(after_flush, [4, 4, 2])
+
+    @override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER, FANOUT={'WINDOW_MS': 1, 'MAX_FRAMES': 100})
+    def test_room_broadcasts_reach_everyone_but_the_sender(self):
+        async def run():
+            clients = [WebsocketCommunicator(RootWebSocketConsumer.as_asgi(), "/ws/") for _ in range(3)]
+            for client in clients:
+                await client.connect()
+                await client.receive_json_from()
+
+            await clients[0].send_json_to({"type": "broadcast", "message": "hello"})
+            received = [await client.receive_json_from(timeout=1) for client in clients[1:]]
+            self.assertTrue(await clients[0].receive_nothing(timeout=0.05))
+            for client in clients:
+                await client.disconnect()
+            return received
+
+        for message in async_to_sync(run)():
+            self.assertEqual(message["type"], "broadcast")
+            self.assertEqual(message["message"], "hello")
+
+
+@unittest.skipUnless(redis_available(), "Redis is not reachable")
+class RedisPipelineTransportTests(SimpleTestCase):
+    def test_groups_are_sent_in_two_pipelines(self):
+        async def run():
+            layer = redis_channel_layer()
+            await layer.flush()
+            a = await join(layer, "a", 3)
+            b = await join(layer, "b", 2)
+            await join(layer, "empty", 0)
+
+            transport = RedisPipelineTransport(layer)
+            with mock.patch.object(type(layer.connection(0)), "pipeline", autospec=True,
+                              side_effect=type(layer.connection(0)).pipeline) as pipelines:
+                await transport.send({
+                    "a": {"type": FRAMES_EVENT, "frames": [["one", None]]},
+                    "b": {"type": FRAMES_EVENT, "frames": [["two", None]]},
+                    "empty": {"type": FRAMES_EVENT, "frames": [["three", None]]},
+                })
+            received = {channel: await layer.receive(channel) for channel in a + b}
+            await layer.flush()
+            return pipelines.call_count, received, a
+
+        pipelines, received, a = async_to_sync(run)()
+        self.assertEqual(pipelines, 2)
+        for channel, message in received.items():
+            self.assertEqual(message["frames"], [["one", None]] if channel in a else [["two", None]])
+
+
+@pytest.mark.slow
+def test_benchmark_group_fanout():
+    """200 small broadcasts to a 10k member group: group_send per broadcast vs the broadcaster"""
+    members, broadcasts = 10000, 200
+    payloads = [{"type": "broadcast", "message": f"update {i}", "timestamp": "2026-01-01T00:00:00"}
+                for i in range(broadcasts)]
+
+    async def deliver(layer, channels):
+        # What each member's consumer does with what it receives
+        delivered = 0
+        for channel in channels:
+            while True:
+                try:
+                    message = layer.channels[channel].get_nowait()[1]
+                except asyncio.QueueEmpty:
+                    break
+                if message["type"] == FRAMES_EVENT:
+                    for text, exclude in message["frames"]:
+                        delivered += 1
+                else:
+                    json.dumps({"type": "broadcast", "message": message["message"],
+                                "timestamp": message["timestamp"]})
+                    delivered += 1
+        return delivered
+
+    async def run(use_broadcaster):
+        layer = InMemoryChannelLayer(capacity=broadcasts + 1)
+        channels = await join(layer, "room", members)
+        transport = CountingTransport(layer)
+        start = time.perf_counter()
+        if use_broadcaster:
+            broadcaster = GroupBroadcaster(layer, transport)
+            for payload in payloads:
+                broadcaster.publish("room", payload)
+            await broadcaster.flush()
+            layer_messages = sum(len(messages) for messages in transport.sends)
+        else:
+            for payload in payloads:
+                await layer.group_send("room", {"type": "broadcast_message_handler", **payload})
+            layer_messages = broadcasts
+        delivered = await deliver(layer, channels)
+        return delivered / (time.perf_counter() - start), layer_messages, delivered
+
+    async def redis_round_trips(use_broadcaster):
+        from redis.asyncio.connection import AbstractConnection
+
+        layer = redis_channel_layer()
+        await layer.flush()
+        pipe = layer.connection(0).pipeline(transaction=False)
+        for i in range(members):
+            pipe.zadd(layer._group_key("room"), {f"specific.bench!{i}": time.time()})
+        await pipe.execute()
+
+        with mock.patch.object(AbstractConnection, "send_packed_command", autospec=True,
+                          side_effect=AbstractConnection.send_packed_command) as round_trips:
+            if use_broadcaster:
+                broadcaster = GroupBroadcaster(layer)
+                for payload in payloads:
+                    broadcaster.publish("room", payload)
+                await broadcaster.flush()
+            else:
+                for payload in payloads:
+                    await layer.group_send("room", {"type": "broadcast_message_handler", **payload})
+        await layer.flush()
+        return round_trips.call_count / broadcasts
+
+    with override_settings(FANOUT={'WINDOW_MS': 5, 'MAX_FRAMES': 100}):
+        results = {name: async_to_sync(run)(name == "broadcaster") for name in ("group_send", "broadcaster")}
+        redis = (
+            {name: async_to_sync(redis_round_trips)(name == "broadcaster") for name in ("group_send", "broadcaster")}
+            if redis_available() else None
+        )
+
+    print(f"{broadcasts} broadcasts to {members} members: " + "; ".join(
+        f"{name}: {rate:,.0f} messages/s delivered, {layer_messages} layer messages"
+        for name, (rate, layer_messages, _) in results.items()
+    ) + ("; Redis round trips per broadcast: " + ", ".join(
+        f"{name} {trips:.2f}" for name, trips in redis.items()
+    ) if redis else "; Redis not reachable"))
+    assert results["group_send"][2] == results["broadcaster"][2] == members * broadcasts
+    assert results["broadcaster"][1] == broadcasts // 100
+    assert results["broadcaster"][0] > results["group_send"][0] * 3
+    if redis:
+        assert redis["broadcaster"] < redis["group_send"] / 10
+
+
+# ===========================================================================
+# 8. Binary WebSocket frames
+# ===========================================================================
+
+class FrameEchoConsumer(FrameProtocolMixin, AsyncWebsocketConsumer):
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.send_message({**json.loads(text_data), 'echo': True})
+
+
+def streamed_response(chunks=300):
+    """The frames of a streamed optimization, as PromptChatConsumer sends them"""
+    words = "Rewrite the prompt so that the model knows the audience, the format and the goal".split()
+    yield {'type': 'rag_stream_started', 'prompt': "Write a blog post about vector search",
+           'timestamp': "2026-10-18T12:00:00.000000+00:00"}
+    for i in range(1, chunks + 1):
+        yield {
+            'type': 'rag_stream_chunk',
+            'chunk_index': i,
+            'chunk_type': 'token',
+            'content': words[i % len(words)] + " ",
+            'metadata': {},
+            'run_id': "0b7c6a52-5a0e-4d1e-9d55-51c3d1f0e0aa",
+            'is_final': i == chunks,
+            'timestamp': f"2026-10-18T12:00:{i % 60:02d}.{i * 997 % 1000000:06d}+00:00",
+        }
+    yield {'type': 'rag_stream_completed', 'total_chunks': chunks, 'processing_time_ms': 5120,
+           'timestamp': "2026-10-18T12:00:05.120000+00:00"}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class FrameProtocolTests(SimpleTestCase):
+    def test_msgpack_frames_carry_type_codes_and_epoch_milliseconds(self):
+        frame = MsgpackCodec().encode({'type': 'pong', 'timestamp': "2026-01-01T00:00:00.250000+00:00"})
+        self.assertEqual(frame[0], 0)
+        self.assertEqual(msgpack.unpackb(frame[1:]), {'type': TYPE_CODES['pong'], 'timestamp': 1767225600250})
+
+        custom = MsgpackCodec().encode({'type': 'custom_event', 'timestamp': 'soon'})
+        self.assertEqual(msgpack.unpackb(custom[1:]), {'type': 'custom_event', 'timestamp': 'soon'})
+
+    @override_settings(WS_PROTOCOL={'COMPRESS_MIN_BYTES': 100, 'COMPRESS_LEVEL': 6})
+    def test_only_large_frames_are_compressed(self):
+        codec = MsgpackCodec(compress=True)
+        small, large = {'type': 'message', 'content': 'hi'}, {'type': 'message', 'content': 'long ' * 100}
+        self.assertEqual(codec.encode(small)[0], 0)
+        self.assertEqual(codec.encode(large)[0], 1)
+        self.assertEqual(codec.decode(codec.encode(large)), large)
+        self.assertEqual(codec.decode(codec.encode(small)), small)
+
+    @override_settings(WS_PROTOCOL={'MAX_FRAME_BYTES': 4096})
+    def test_compressed_frames_are_bounded(self):
+        import zlib
+
+        bomb = bytes([1]) + zlib.compress(msgpack.packb({'type': 'message', 'content': 'a' * 1_000_000}))
+        self.assertLess(len(bomb), 2048)
+        with self.assertRaises(FrameTooLarge):
+            MsgpackCodec(compress=True).decode(bomb)
+        # Only a socket that negotiated promptcraft.msgpack.zlib may send compressed frames
+        small = MsgpackCodec(compress=True).encode({'type': 'message', 'content': 'long ' * 200})
+        self.assertEqual(small[0], 1)
+        with self.assertRaisesMessage(ValueError, "Compressed frame"):
+            MsgpackCodec().decode(small)
+
+    @override_settings(WS_PROTOCOL={'MAX_FRAME_BYTES': 4096})
+    def test_oversized_frame_closes_the_socket(self):
+        import zlib
+
+        async def run():
+            client = WebsocketCommunicator(FrameEchoConsumer.as_asgi(), "/ws/", subprotocols=[MSGPACK_ZLIB_PROTOCOL])
+            await client.connect()
+            await client.send_to(bytes_data=bytes([1]) + zlib.compress(b'\0' * 100_000))
+            closed = await client.receive_output()
+            await client.wait()
+            return closed
+
+        self.assertEqual(async_to_sync(run)(), {'type': 'websocket.close', 'code': CLOSE_TOO_BIG})
+
+    def test_negotiation(self):
+        self.assertIsNone(negotiate([]).subprotocol)
+        self.assertIsNone(negotiate(['graphql-ws']).subprotocol)
+        self.assertEqual(negotiate(['graphql-ws', MSGPACK_ZLIB_PROTOCOL, MSGPACK_PROTOCOL]).subprotocol,
+                         MSGPACK_ZLIB_PROTOCOL)
+
+    def test_consumer_speaks_the_negotiated_encoding(self):
+        async def run():
+            text_client = WebsocketCommunicator(FrameEchoConsumer.as_asgi(), "/ws/")
+            connected, subprotocol = await text_client.connect()
+            self.assertTrue(connected)
+            self.assertIsNone(subprotocol)
+            await text_client.send_json_to({'type': 'ping'})
+            self.assertEqual(await text_client.receive_json_from(), {'type': 'ping', 'echo': True})
+            await text_client.disconnect()
+
+            binary_client = WebsocketCommunicator(FrameEchoConsumer.as_asgi(), "/ws/",
+                                                  subprotocols=[MSGPACK_PROTOCOL])
+            connected, subprotocol = await binary_client.connect()
+            self.assertEqual(subprotocol, MSGPACK_PROTOCOL)
+            codec = MsgpackCodec()
+            await binary_client.send_to(bytes_data=codec.encode({'type': 'ping', 'n': 1}))
+            reply = await binary_client.receive_from()
+            await binary_client.disconnect()
+            return reply
+
+        reply = async_to_sync(run)()
+        self.assertIsInstance(reply, bytes)
+        self.assertEqual(msgpack.unpackb(reply[1:]), {'type': TYPE_CODES['ping'], 'n': 1, 'echo': True})
+
+
+@pytest.mark.slow
+def test_benchmark_streamed_response_encodings():
+    """Bytes per streamed response and CPU per 1k frames: JSON text vs msgpack vs msgpack.zlib"""
+    import zlib
+
+    frames = list(streamed_response())
+    encoders = {
+        "json": lambda payload: json.dumps(payload).encode(),
+        "msgpack": MsgpackCodec().encode,
+        "msgpack.zlib": MsgpackCodec(compress=True).encode,
+    }
+
+    def with_deflate(encode):
+        # permessage-deflate as the ASGI server applies it: one stream per socket, flushed per frame
+        def encode_deflated(payload, stream):
+            return stream.compress(encode(payload)) + stream.flush(zlib.Z_SYNC_FLUSH)
+        return encode_deflated
+
+    results = {}
+    for name, encode in encoders.items():
+        for deflate in (False, True):
+            label = name + (" + permessage-deflate" if deflate else "")
+            run = with_deflate(encode) if deflate else (lambda payload, stream, encode=encode: encode(payload))
+            stream = zlib.compressobj(wbits=-15)
+            size = sum(len(run(frame, stream)) for frame in frames)
+            start = time.process_time()
+            for _ in range(20):
+                stream = zlib.compressobj(wbits=-15)
+                for frame in frames:
+                    run(frame, stream)
+            cpu_per_1k = (time.process_time() - start) / (20 * len(frames)) * 1000
+            results[label] = (size, cpu_per_1k)
+
+    print(f"{len(frames)} frame response: " + "; ".join(
+        f"{name}: {size} bytes, {cpu * 1000:.2f}ms CPU per 1k frames" for name, (size, cpu) in results.items()
+    ))
+    assert results["msgpack"][0] < results["json"][0] * 0.8
+    assert results["msgpack"][1] < results["json"][1]
+
+
+# ===========================================================================
+# 9. Lazy WebSocket routes and import profiles
+# ===========================================================================
+
+# Modules no HTTP-only worker should import
+CONSUMER_MODULES = {
+    'apps.core.consumers', 'apps.templates.consumers', 'apps.templates.chat_consumer',
+    'apps.templates.enhanced_consumer', 'apps.ai_services.consumers', 'apps.templates.langchain_services',
+    'apps.ai_services.rag_service', 'apps.ai_services.rag_service_enhanced',
+}
+
+
+class LazyRoutingTests(SimpleTestCase):
+    def test_consumer_is_imported_on_the_first_connection(self):
+        health = lazy_consumer('apps.core.consumers.HealthCheckConsumer')
+        application = URLRouter([path('ws/health/', health)])
+        self.assertFalse(health.resolved)
+
+        async def run():
+            communicator = WebsocketCommunicator(application, '/ws/health/')
+            connected, _ = await communicator.connect()
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, message
+
+        connected, message = async_to_sync(run)()
+        self.assertTrue(connected)
+        self.assertEqual(message['status'], 'healthy')
+        self.assertTrue(health.resolved)
+
+    def test_unimportable_consumer_rejects_the_handshake(self):
+        missing = lazy_consumer('apps.core.no_such_module.Consumer')
+        application = URLRouter([path('ws/missing/', missing)])
+
+        async def run():
+            communicator = WebsocketCommunicator(application, '/ws/missing/')
+            return await communicator.connect()
+
+        with self.assertLogs('apps.core.lazy_routing', 'ERROR'):
+            connected, _ = async_to_sync(run)()
+        self.assertFalse(connected)
+        self.assertEqual(preload_consumers([path('ws/missing/', missing)]).keys(), {'apps.core.no_such_module.Consumer'})
+
+    def test_lazy_import_waits_for_first_use(self):
+        self.assertTrue(modules_available('json', 'asyncio'))
+        self.assertFalse(modules_available('json', 'no_such_package_for_tests'))
+
+        sys.modules.pop('colorsys', None)
+        rgb_to_hsv = lazy_import('colorsys', 'rgb_to_hsv')
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertEqual(rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertIn('colorsys', sys.modules)
+        self.assertIn('(imported)', repr(rgb_to_hsv))
+
+    def test_parse_importtime_output(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     encodings.aliases\n"
+            "import time:      2048 |       9000 |   apps.templates.langchain_services\n"
+            "Traceback (most recent call last):\n"
+        )
+        imports = parse_importtime(output)
+        self.assertEqual([(entry.name, entry.self_us, entry.cumulative_us, entry.depth) for entry in imports],
+                         [('encodings.aliases', 120, 120, 2), ('apps.templates.langchain_services', 2048, 9000, 1)])
+
+    def test_http_worker_does_not_import_consumers(self):
+        profile = profile_imports()
+        self.assertEqual(profile.returncode, 0, profile.error)
+        self.assertTrue({'promptcraft.asgi', 'apps.core.lazy_routing', 'apps.templates.routing'}
+                        <= {entry.name for entry in profile.imports})
+        self.assertFalse(CONSUMER_MODULES & {entry.name for entry in profile.imports})
+
+
+@pytest.mark.slow
+def test_benchmark_worker_cold_start():
+    """Start time, modules imported and peak RSS of HTTP-only and WebSocket workers, best of three"""
+    results = {}
+    for name, consumers in (("HTTP-only", False), ("WebSocket", True)):
+        profiles = [profile_imports(consumers=consumers) for _ in range(3)]
+        assert all(profile.returncode == 0 for profile in profiles), profiles[0].error
+        results[name] = (
+            min(profile.wall_ms for profile in profiles),
+            len(profiles[0].imports),
+            min(profile.peak_rss_mb or 0 for profile in profiles),
+            {entry.name for entry in profiles[0].imports},
+        )
+
+    print("Worker start: " + "; ".join(
+        f"{name}: {wall:.0f}ms, {modules} modules, peak RSS {rss:.0f} MB"
+        for name, (wall, modules, rss, _) in results.items()
+    ))
+    http_modules, websocket_modules = results["HTTP-only"][3], results["WebSocket"][3]
+    assert not CONSUMER_MODULES & http_modules
+    assert 'apps.core.consumers' in websocket_modules
+    assert results["HTTP-only"][1] < results["WebSocket"][1]
+
+
+# ===========================================================================
+# 10. LLM response cache
+# ===========================================================================
+
+def bag_of_words(texts, dim=512):
+    """Deterministic stand-in for MiniLM: hashed word counts, so shared words mean similar prompts"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.split():
+            vectors[row, int(hashlib.blake2b(word.encode(), digest_size=4).hexdigest(), 16) % dim] += 1
+    return vectors
+
+
+def response_cache(clock=None, **overrides):
+    backend = LocMemCache('llm-cache-tests', {'TIMEOUT': None})
+    backend.clear()
+    return LLMResponseCache({**DEFAULT_LLM_CACHE_SETTINGS, **overrides}, backend=backend, embed=bag_of_words,
+                            clock=clock or time.time)
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+    PROMPT = "Write a blog post about vector search"
+    CODING_PROMPT = "Debug this Python function that parses dates"
+
+    def test_exact_tier_normalizes_the_prompt(self):
+        cache = response_cache()
+        missed = cache.lookup('intent', 'deepseek-chat', self.PROMPT, system="Classify")
+        self.assertFalse(missed.hit)
+        cache.store(missed, {'category': 'content_creation'})
+
+        hit = cache.lookup('intent', 'deepseek-chat', "  write a BLOG post\nabout vector search ", system="Classify")
+        self.assertEqual((hit.tier, hit.result), ('exact', {'category': 'content_creation'}))
+        # Another model, system prompt or parameters is another question
+        self.assertFalse(cache.lookup('intent', 'gpt-4', self.PROMPT, system="Classify").hit)
+        self.assertFalse(cache.lookup('intent', 'deepseek-chat', self.PROMPT, system="Summarize").hit)
+        self.assertFalse(cache.lookup('intent', 'deepseek-chat', self.PROMPT, system="Classify",
+                                      params={'temperature': 0.9}).hit)
+        self.assertEqual(cache.stats()['intent']['exact_hits'], 1)
+
+    def test_semantic_tier_serves_close_prompts_above_the_task_threshold(self):
+        cache = response_cache()
+        for task in ('intent', 'optimize'):
+            cache.store(cache.lookup(task, 'deepseek-chat', self.PROMPT), {'category': 'content_creation'})
+
+        # 7 of 8 words shared: cosine 0.935, over intent's 0.92; optimize only serves exact repeats
+        paraphrase = self.PROMPT + " please"
+        hit = cache.lookup('intent', 'deepseek-chat', paraphrase)
+        self.assertEqual(hit.tier, 'semantic')
+        self.assertAlmostEqual(hit.similarity, 7 / np.sqrt(56), places=4)
+        self.assertFalse(cache.lookup('optimize', 'deepseek-chat', paraphrase).hit)
+        self.assertEqual(cache.lookup('optimize', 'deepseek-chat', self.PROMPT).tier, 'exact')
+        self.assertFalse(cache.lookup('intent', 'deepseek-chat', self.CODING_PROMPT).hit)
+
+        exact_only = response_cache(TASK_THRESHOLDS={'intent': None})
+        exact_only.store(exact_only.lookup('intent', 'deepseek-chat', self.PROMPT), {'category': 'content_creation'})
+        self.assertFalse(exact_only.lookup('intent', 'deepseek-chat', paraphrase).hit)
+
+    def test_assessments_are_not_served_to_near_duplicate_prompts(self):
+        cache = response_cache()
+        prompt = ("You are a senior editor. Review the attached quarterly marketing report for tone, "
+                  "structure, accuracy and clarity, then list concrete fixes")
+        paraphrase = prompt + " please"
+        for task in ('assessment', 'summary'):
+            cache.store(cache.lookup(task, 'deepseek-chat', prompt),
+                        '{"overall_score": 7, "improved_prompt": "You are a senior editor..."}')
+
+        # Close enough for the default threshold, but scores and rewrites belong to one prompt
+        self.assertEqual(cache.lookup('summary', 'deepseek-chat', paraphrase).tier, 'semantic')
+        self.assertFalse(cache.lookup('assessment', 'deepseek-chat', paraphrase).hit)
+        self.assertEqual(cache.lookup('assessment', 'deepseek-chat', prompt).tier, 'exact')
+
+    def test_hits_are_served_as_cached(self):
+        cache = response_cache()
+        cache.store(cache.lookup('intent', 'm', self.PROMPT),
+                    {'category': 'content_creation', 'tokens_used': 120, 'processing_time_ms': 850})
+
+        served = cache.lookup('intent', 'm', self.PROMPT).served()
+        self.assertEqual(served, {'category': 'content_creation', 'tokens_used': 0, 'processing_time_ms': 0,
+                                  'cached': 'exact'})
+        cache.store(cache.lookup('intent', 'm', self.CODING_PROMPT), 'plain text')
+        self.assertEqual(cache.lookup('intent', 'm', self.CODING_PROMPT).served(), 'plain text')
+
+    def test_entries_expire_and_indexes_are_capped(self):
+        now = [1000.0]
+        cache = response_cache(clock=lambda: now[0], TASK_TTL_S={'intent': 60}, MAX_ENTRIES=2, MAX_INDEXES=1)
+        cache.store(cache.lookup('intent', 'm', self.PROMPT), 'first')
+        now[0] += 59
+        self.assertTrue(cache.lookup('intent', 'm', self.PROMPT + " please").hit)
+        now[0] += 2
+        self.assertFalse(cache.lookup('intent', 'm', self.PROMPT).hit)
+
+        # The ring keeps the two latest prompts; the exact tier still has the oldest
+        for prompt in (self.PROMPT, "Summarize this quarterly sales report", "Draft an email to a customer"):
+            cache.store(cache.lookup('intent', 'm', prompt), prompt)
+        self.assertFalse(cache.lookup('intent', 'm', self.PROMPT + " please").hit)
+        self.assertEqual(cache.lookup('intent', 'm', self.PROMPT).tier, 'exact')
+        # A second index pushes the first out
+        cache.store(cache.lookup('intent', 'other-model', self.PROMPT), 'other')
+        self.assertFalse(cache.lookup('intent', 'm', "Draft an email to a customer please").hit)
+
+    def test_shadowed_hits_count_false_positives(self):
+        cache = response_cache(SHADOW_RATE=1.0)
+        cache.store(cache.lookup('intent', 'm', self.PROMPT), {'category': 'content_creation'})
+
+        agreeing = cache.lookup('intent', 'm', self.PROMPT + " please")
+        self.assertFalse(agreeing.hit)
+        cache.store(agreeing, {'category': 'content_creation', 'confidence': 0.7})
+        with self.assertLogs('apps.core.llm_cache', 'INFO'):
+            disagreeing = cache.lookup('intent', 'm', self.PROMPT + " today")
+            cache.store(disagreeing, {'category': 'technical_writing'})
+
+        stats = cache.stats()['intent']
+        self.assertEqual((stats['shadow_checks'], stats['false_positives'], stats['semantic_hits']), (2, 1, 0))
+
+    def test_failing_embedder_leaves_the_exact_tier(self):
+        def broken(texts):
+            raise ImportError("No module named 'sentence_transformers'")
+
+        cache = response_cache()
+        cache._embed = broken
+        with self.assertLogs('apps.core.llm_cache', 'WARNING'):
+            cache.store(cache.lookup('intent', 'm', self.PROMPT), 'answer')
+        self.assertEqual(cache.lookup('intent', 'm', self.PROMPT).tier, 'exact')
+        self.assertFalse(cache.lookup('intent', 'm', self.PROMPT + " please").hit)
+
+    def test_same_response(self):
+        self.assertTrue(same_response({'category': 'coding', 'confidence': 0.9}, {'category': 'coding'}))
+        self.assertFalse(same_response('{"intent": "coding"}', '{"intent": "creative"}'))
+        self.assertTrue(same_response({'optimized_content': "You are an editor. Tighten this draft."},
+                                      {'optimized_content': "You are an editor. Tighten this draft!"}))
+        self.assertFalse(same_response("Write a haiku", "Summarize the attached report in five bullets"))
+
+    def test_records_requests_and_replays_them(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as log:
+            cache = response_cache(RECORD_PATH=log.name)
+            for prompt, category in ((self.PROMPT, 'content_creation'), (self.CODING_PROMPT, 'coding')):
+                cache.store(cache.lookup('intent', 'm', prompt), {'category': category})
+            records = [json.loads(line) for line in log]
+        self.assertEqual([record['prompt'] for record in records], [self.PROMPT, self.CODING_PROMPT])
+
+        records += [
+            {**records[0], 'ts': records[0]['ts'] + 1, 'latency_ms': 900},
+            {**records[0], 'ts': records[0]['ts'] + 2, 'prompt': self.PROMPT + " please", 'latency_ms': 1100},
+            {**records[1], 'ts': records[1]['ts'] + 3, 'prompt': self.CODING_PROMPT + " please",
+             'response': {'category': 'education'}, 'latency_ms': 1000},
+        ]
+        result = evaluate(records, embed=bag_of_words)['intent']
+        self.assertEqual((result.requests, result.exact_hits, result.semantic_hits, result.false_positives),
+                         (5, 1, 2, 1))
+        self.assertEqual(result.latency_saved_ms, 3000)
+        self.assertEqual(evaluate(records, threshold=0.99, embed=bag_of_words)['intent'].semantic_hits, 0)
+
+
+@override_settings(DEEPSEEK_CONFIG={'API_KEY': 'test-key'})
+class DeepSeekCallCacheTests(SimpleTestCase):
+    def test_orchestrator_calls_are_cached_when_well_formed(self):
+        from apps.orchestrator.views import _call_deepseek_sync
+
+        def completion(content):
+            return mock.Mock(**{'json.return_value': {'choices': [{'message': {'content': content}}]}})
+
+        cache = response_cache()
+        with mock.patch('apps.orchestrator.views.get_response_cache', return_value=cache), \
+                mock.patch('apps.orchestrator.views.requests.post',
+                           side_effect=[completion('not json'), completion('{"intent": "coding"}')]) as post:
+            for _ in range(3):
+                _call_deepseek_sync("Classify", "Debug this Python function", task='intent')
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(cache.stats()['intent']['exact_hits'], 1)
+
+
+@pytest.mark.slow
+def test_benchmark_llm_cache_replay():
+    """Hit rate and model latency saved over a synthetic day of intent and optimization requests"""
+    rng = random.Random(7)
+    subjects = [f"{topic} for {audience}" for topic in (
+        "a blog post about vector search", "a product launch email", "unit tests for a payment service",
+        "a lesson plan on photosynthesis", "a quarterly sales summary", "a poem about the sea",
+        "a REST API design review", "a hiring plan for a startup",
+    ) for audience in ("beginners", "executives", "engineers", "students", "customers")]
+    openers = ["Write", "Please write", "Can you write", "Help me write", "write"]
+    closers = ["", "", " please", " today", " in detail"]
+    records, ts = [], 0.0
+    for _ in range(5000):
+        ts += rng.expovariate(1 / 15)
+        task = 'intent' if rng.random() < 0.7 else 'optimize'
+        subject = rng.randrange(len(subjects))
+        records.append({
+            'ts': ts, 'task': task, 'model': 'deepseek-chat', 'system': task, 'params': {},
+            'prompt': f"{rng.choice(openers)} {subjects[subject]}{rng.choice(closers)}",
+            'response': {'category': f"c{subject // 5}"} if task == 'intent'
+            else {'optimized_content': f"You are an expert. Write {subjects[subject]}."},
+            'latency_ms': rng.uniform(600, 3000) if task == 'intent' else rng.uniform(3000, 12000),
+        })
+
+    lines = []
+    for threshold in (None, 0.8, 0.9, 0.99):
+        start = time.perf_counter()
+        results = evaluate(records, threshold, embed=bag_of_words)
+        per_lookup_us = (time.perf_counter() - start) / len(records) * 1e6
+        for task, result in sorted(results.items()):
+            lines.append(
+                f"{threshold or 'configured'} {task}: {result.hit_rate:.1%} hits "
+                f"({result.exact_hits} exact, {result.semantic_hits} semantic, {result.false_positives} false +), "
+                f"{result.latency_saved_ms / result.latency_ms:.1%} latency saved"
+            )
+        lines.append(f"{threshold or 'configured'}: {per_lookup_us:.0f}us per request")
+        if threshold is None:
+            configured = results
+    print("LLM cache replay: " + "; ".join(lines))
+    assert configured['intent'].exact_hits and configured['intent'].semantic_hits
+    assert configured['intent'].latency_saved_ms / configured['intent'].latency_ms > 0.5
+
+
+# ===========================================================================
+# 11. Index directory swaps
+# ===========================================================================
+
+class ReplacingDirectoryTests(SimpleTestCase):
+    def test_a_written_index_replaces_the_old_one_and_a_failed_one_does_not(self):
+        with tempfile.TemporaryDirectory() as root:
+            index_path = Path(root) / 'index'
+            for version in ('1', '2'):
+                with replacing_directory(index_path) as tmp_path:
+                    (tmp_path / 'version').write_text(version)
+            with self.assertRaises(RuntimeError), replacing_directory(index_path) as tmp_path:
+                (tmp_path / 'version').write_text('3')
+                raise RuntimeError('embedding failed')
+
+            self.assertEqual((index_path / 'version').read_text(), '2')
+            self.assertEqual(sorted(os.listdir(root)), ['index'])
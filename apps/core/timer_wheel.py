@@ -0,0 +1,263 @@
+"""
+Heartbeats and idle timeouts for WebSocket consumers on one timer wheel.
+
+Consumers used to start a task per connection that slept for the heartbeat
+interval, checked idleness and sent a heartbeat, so every socket kept a
+sleeping task and sockets opened together woke together. With
+`HeartbeatMixin`, accepting a connection registers a small timer on the
+event loop's `TimerWheel` instead, and one driver task per loop advances
+the wheel once per TICK_S:
+
+- the wheel is hierarchical (64 slots per level, four levels), so
+  scheduling and cancelling are O(1) and far timers cost nothing until
+  they cascade down to the first level
+- a message from the client only stamps the timer's last activity; the
+  timer is rescheduled when it fires, not on every message
+- heartbeats due in a tick are sent together, BATCH_SIZE at a time, and
+  each next heartbeat is spread by +/- JITTER of the interval so sockets
+  opened together drift apart
+- connections idle for longer than their idle_timeout are closed
+"""
+
+import asyncio
+import json
+import logging
+import math
+import random
+import weakref
+from datetime import datetime
+from typing import List, Optional, Set
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEARTBEAT_SETTINGS = {
+    'TICK_S': 1.0,
+    # Each next heartbeat lands within +/- this fraction of the interval
+    'JITTER': 0.1,
+    # Heartbeats and closes awaited together
+    'BATCH_SIZE': 500,
+}
+
+
+def get_heartbeat_settings():
+    return {**DEFAULT_HEARTBEAT_SETTINGS, **getattr(settings, 'HEARTBEATS', {})}
+
+
+class ConnectionTimer:
+    """Heartbeat and idle state of one connection"""
+
+    __slots__ = ('consumer', 'interval', 'idle_timeout', 'last_activity', 'next_heartbeat', 'due_tick', 'slot',
+                 '__weakref__')
+
+    def __init__(self, consumer, interval: Optional[float], idle_timeout: Optional[float], now: float):
+        self.consumer = consumer
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.last_activity = now
+        self.next_heartbeat = None
+        self.due_tick = None
+        self.slot: Optional[Set] = None
+
+    def touch(self, now: float):
+        self.last_activity = now
+
+    def next_due(self) -> Optional[float]:
+        due = [t for t in (self.next_heartbeat,
+                           self.idle_timeout and self.last_activity + self.idle_timeout) if t]
+        return min(due) if due else None
+
+
+class TimerWheel:
+    """Hierarchical timer wheel for the connection timers of one event loop"""
+
+    SLOTS = 64
+    LEVELS = 4
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, tick_s: float = None):
+        self.loop = loop
+        self.tick_s = tick_s or get_heartbeat_settings()['TICK_S']
+        self.start = loop.time()
+        self.current_tick = 0
+        self.wheels = [[set() for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        self.timers = 0
+        self._driver: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return self.timers
+
+    # Scheduling
+
+    def _place(self, timer: ConnectionTimer, earliest: int):
+        tick = max(timer.due_tick, earliest)
+        for level in range(self.LEVELS):
+            span = self.SLOTS ** level
+            if tick // span - self.current_tick // span < self.SLOTS:
+                break
+        else:
+            # Past the last level: wait in its farthest slot and be placed again on cascade
+            tick = min(tick // span, self.current_tick // span + self.SLOTS - 1) * span
+        slot = self.wheels[level][(tick // span) % self.SLOTS]
+        slot.add(timer)
+        timer.slot = slot
+
+    def schedule(self, timer: ConnectionTimer, at: float):
+        """Fire timer at loop time `at` (rounded up to the next tick)"""
+        self.cancel(timer)
+        timer.due_tick = math.ceil((at - self.start) / self.tick_s)
+        self._place(timer, self.current_tick + 1)
+        self.timers += 1
+        if self._driver is None or self._driver.done():
+            self._driver = self.loop.create_task(self._run())
+
+    def cancel(self, timer: ConnectionTimer):
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+            self.timers -= 1
+
+    def advance(self) -> List[ConnectionTimer]:
+        """Move to the next tick and return the timers due at it"""
+        self.current_tick += 1
+        tick = self.current_tick
+        levels = [level for level in range(1, self.LEVELS) if tick % self.SLOTS ** level == 0]
+        # Highest level first, so timers cascading through several levels reach this tick's slot
+        for level in reversed(levels):
+            slot = self.wheels[level][(tick // self.SLOTS ** level) % self.SLOTS]
+            cascading = list(slot)
+            slot.clear()
+            for timer in cascading:
+                self._place(timer, tick)
+
+        slot = self.wheels[0][tick % self.SLOTS]
+        due = [timer for timer in slot if timer.due_tick <= tick]
+        for timer in due:
+            slot.discard(timer)
+            timer.slot = None
+        self.timers -= len(due)
+        return due
+
+    # Connections
+
+    def register(self, consumer, interval: Optional[float], idle_timeout: Optional[float]) -> ConnectionTimer:
+        now = self.loop.time()
+        timer = ConnectionTimer(consumer, interval, idle_timeout, now)
+        if interval:
+            # Sockets opened together start out spread over one interval
+            timer.next_heartbeat = now + interval * random.uniform(0.5, 1.0)
+        due = timer.next_due()
+        if due is not None:
+            self.schedule(timer, due)
+        return timer
+
+    def unregister(self, timer: ConnectionTimer):
+        self.cancel(timer)
+        timer.consumer = None
+
+    async def _run(self):
+        config = get_heartbeat_settings()
+        while self.timers:
+            next_tick_at = self.start + (self.current_tick + 1) * self.tick_s
+            await asyncio.sleep(max(0.0, next_tick_at - self.loop.time()))
+            due = []
+            # Catch up on ticks missed while the loop was busy
+            while self.start + (self.current_tick + 1) * self.tick_s <= self.loop.time() + 1e-9:
+                due.extend(self.advance())
+            if due:
+                await self._fire(due, config)
+
+    async def _fire(self, due: List[ConnectionTimer], config):
+        now = self.loop.time()
+        heartbeats, idle = [], []
+        for timer in due:
+            if timer.consumer is None:
+                continue
+            if timer.idle_timeout and now - timer.last_activity >= timer.idle_timeout:
+                idle.append(timer.consumer)
+                timer.consumer = None
+                continue
+            if timer.next_heartbeat and now >= timer.next_heartbeat - self.tick_s / 2:
+                heartbeats.append(timer.consumer)
+                timer.next_heartbeat = now + timer.interval * (1 + random.uniform(-1, 1) * config['JITTER'])
+            self.schedule(timer, timer.next_due())
+
+        # A heartbeat is a write to the server's send buffer, so they are awaited
+        # in turn rather than as tasks, whose allocations set off full
+        # collections at tens of thousands of connections
+        for i, consumer in enumerate(heartbeats, 1):
+            try:
+                await consumer.send_heartbeat()
+            except Exception as e:
+                logger.debug(f"Heartbeat failed: {e}")
+            if i % config['BATCH_SIZE'] == 0:
+                await asyncio.sleep(0)
+        for i in range(0, len(idle), config['BATCH_SIZE']):
+            await asyncio.gather(
+                *(consumer.close_idle() for consumer in idle[i:i + config['BATCH_SIZE']]),
+                return_exceptions=True,
+            )
+
+
+_wheels = weakref.WeakKeyDictionary()
+
+
+def get_timer_wheel() -> TimerWheel:
+    """The running event loop's timer wheel"""
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = TimerWheel(loop)
+    return wheel
+
+
+class HeartbeatMixin:
+    """
+    Heartbeats and idle timeout for an AsyncWebsocketConsumer, registered on
+    accept and dropped on disconnect. Any message from the client counts as
+    activity. Set heartbeat_interval or idle_timeout to None to turn either off.
+    """
+
+    heartbeat_interval: Optional[float] = 30
+    idle_timeout: Optional[float] = 300
+    idle_close_code: Optional[int] = None
+
+    _connection_timer = None
+
+    def heartbeat_message(self):
+        message = {'type': 'heartbeat', 'timestamp': datetime.now().isoformat()}
+        if getattr(self, 'session_id', None):
+            message['session_id'] = self.session_id
+        return message
+
+    async def send_heartbeat(self):
+        message = self.heartbeat_message()
+        if isinstance(message, str):
+            await self.send(text_data=message)
+        elif hasattr(self, 'send_message'):
+            # In the frame encoding negotiated by FrameProtocolMixin
+            await self.send_message(message)
+        else:
+            await self.send(text_data=json.dumps(message))
+
+    async def close_idle(self):
+        logger.info(f"Closing idle connection: {getattr(self, 'session_id', None) or self.channel_name}")
+        await self.close(code=self.idle_close_code)
+
+    async def accept(self, *args, **kwargs):
+        await super().accept(*args, **kwargs)
+        if self._connection_timer is None and (self.heartbeat_interval or self.idle_timeout):
+            self._connection_timer = get_timer_wheel().register(
+                self, self.heartbeat_interval, self.idle_timeout
+            )
+
+    async def websocket_receive(self, message):
+        if self._connection_timer is not None:
+            self._connection_timer.touch(asyncio.get_running_loop().time())
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        if self._connection_timer is not None:
+            get_timer_wheel().unregister(self._connection_timer)
+            self._connection_timer = None
+        await super().websocket_disconnect(message)
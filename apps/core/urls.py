@@ -27,6 +27,8 @@ urlpatterns = [
     path('health/', views.health_simple, name='health-simple'),
     # Comprehensive health endpoint  
     path('health/detailed/', views.HealthCheckView.as_view(), name='health-detailed'),
+    # Prometheus scrape endpoint for PerformanceMiddleware histograms
+    path('metrics/', views.prometheus_metrics, name='metrics'),
     # App configuration endpoints
     path('config/', views.app_config, name='app-config-simple'),
     path('configuration/', views.AppConfigurationView.as_view(), name='app-configuration'),
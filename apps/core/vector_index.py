@@ -0,0 +1,52 @@
+"""
+Pieces shared by the NumPy vector indexes (apps.templates.semantic_search,
+apps.ai_services.rag_service_enhanced): row normalization, top-k selection
+and swapping a freshly written index directory into place.
+"""
+
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length; zero rows stay zero"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best scores, best first"""
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+@contextmanager
+def replacing_directory(path: Path):
+    """
+    Yield an empty directory to write an index into; on success it replaces
+    path, otherwise it is removed and path is left as it was
+    """
+    tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    try:
+        yield tmp_path
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # Processes that still map the old files keep reading them until they reload
+    old_path = path.with_name(f"{path.name}.old-{os.getpid()}")
+    if path.exists():
+        path.rename(old_path)
+    tmp_path.rename(path)
+    shutil.rmtree(old_path, ignore_errors=True)
@@ -2,7 +2,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.conf import settings
 from django.utils import timezone
 from django.shortcuts import render
@@ -84,6 +84,28 @@ def health_simple(request):
     return JsonResponse({"status": "ok"}, status=200)
 
 
+def prometheus_metrics(request):
+    """
+    Per-route latency histograms and LLM queue stats in Prometheus text format
+
+    Requires `Authorization: Bearer <METRICS_AUTH_TOKEN>` when the token is
+    configured, otherwise a staff session (or DEBUG).
+    """
+    from django.utils.crypto import constant_time_compare
+    from apps.templates import llm_scheduler
+    from .metrics import render_prometheus
+
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if token:
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    elif not settings.DEBUG and not getattr(getattr(request, 'user', None), 'is_staff', False):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+
+    body = render_prometheus() + llm_scheduler.render_prometheus()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class HealthCheckView(APIView):
 
     """
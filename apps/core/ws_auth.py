@@ -0,0 +1,272 @@
+"""
+JWT authentication for WebSocket handshakes.
+
+`JWTAuthMiddleware` reads the access token once per handshake (the `token`
+query parameter or an `Authorization: Bearer` header), verifies it with
+SimpleJWT's AccessToken, and puts the user in scope['user'] for every
+consumer, which used to decode the token and fetch the user themselves.
+
+Users come from a process-local cache of slim snapshots (id, username,
+is_active, is_staff and the premium flags), bounded in size and kept for
+USER_CACHE_TTL_S. A snapshot is handed to consumers as a User instance
+with the other fields deferred, so it can be assigned to foreign keys like
+the full object. Cache misses arriving together are fetched with one
+`id__in` query per BATCH_WINDOW_MS, so a reconnect storm against cold
+caches after a deploy costs a handful of queries rather than one per
+socket. Saving or deleting a user evicts its snapshot in the process that
+saved it (apps.core.signals); other processes pick the change up when
+their copy expires.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WS_AUTH_SETTINGS = {
+    'USER_CACHE_TTL_S': 30,
+    'USER_CACHE_SIZE': 10000,
+    # Verified tokens remembered until they expire
+    'TOKEN_CACHE_SIZE': 10000,
+    # How long a cache miss waits for others to share its query
+    'BATCH_WINDOW_MS': 2,
+    'BATCH_SIZE': 500,
+}
+
+SNAPSHOT_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_premium', 'premium_expires_at')
+
+IGNORED_TOKENS = {'', 'undefined', 'null'}
+
+
+def get_ws_auth_settings():
+    return {**DEFAULT_WS_AUTH_SETTINGS, **getattr(settings, 'WS_AUTH', {})}
+
+
+class BoundedTTLCache:
+    """A thread-safe LRU mapping whose entries also expire"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _cache(name: str) -> BoundedTTLCache:
+    if name not in _caches:
+        with _caches_lock:
+            if name not in _caches:
+                config = get_ws_auth_settings()
+                _caches[name] = BoundedTTLCache(
+                    config['USER_CACHE_SIZE' if name == 'users' else 'TOKEN_CACHE_SIZE'],
+                    config['USER_CACHE_TTL_S'],
+                )
+    return _caches[name]
+
+
+# Cached for users that do not exist, so bad tokens are not looked up on every retry
+_MISSING = object()
+
+
+def evict_user(user_id):
+    """Drop a user's snapshot so the next handshake reads the database"""
+    _cache('users').pop(str(user_id))
+
+
+def token_from_scope(scope) -> Optional[str]:
+    """The access token from the query string or an Authorization: Bearer header"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    token = (query.get('token') or [''])[0]
+    if token not in IGNORED_TOKENS:
+        return token
+
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            value = value.decode('latin-1')
+            if value.startswith('Bearer ') and value[7:] not in IGNORED_TOKENS:
+                return value[7:]
+    return None
+
+
+def verify_token(token: str) -> Optional[str]:
+    """The user ID of a valid access token, or None"""
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    tokens = _cache('tokens')
+    cached = tokens.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if expires_at > time.time():
+            return user_id
+
+    try:
+        access = AccessToken(token)
+    except TokenError as e:
+        logger.debug(f"Rejected WebSocket token: {e}")
+        return None
+    user_id = access.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    user_id = str(user_id)
+    ttl = access['exp'] - time.time()
+    if ttl > 0:
+        tokens.set(token, (user_id, access['exp']), ttl=ttl)
+    return user_id
+
+
+def _snapshot_fields():
+    # from_db() expects values in model field order
+    return tuple(
+        field.attname for field in get_user_model()._meta.concrete_fields if field.attname in SNAPSHOT_FIELDS
+    )
+
+
+def _snapshot_user(values):
+    # A User with only the snapshot fields loaded; reading another field queries for it
+    return get_user_model().from_db('default', _snapshot_fields(), values)
+
+
+def _fetch_snapshots(user_ids):
+    fields = _snapshot_fields()
+    rows = get_user_model().objects.filter(id__in=user_ids).values_list(*fields)
+    return {str(row[fields.index('id')]): tuple(row) for row in rows}
+
+
+class _SnapshotLoader:
+    """Coalesces the snapshot misses of one event loop into id__in queries"""
+
+    def __init__(self):
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush = None
+
+    def load(self, user_id: str) -> asyncio.Future:
+        future = self._pending.get(user_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[user_id] = loop.create_future()
+            config = get_ws_auth_settings()
+            if len(self._pending) >= config['BATCH_SIZE']:
+                self._start_batch()
+            elif self._flush is None:
+                self._flush = loop.call_later(config['BATCH_WINDOW_MS'] / 1000, self._start_batch)
+        return future
+
+    def _start_batch(self):
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: Dict[str, asyncio.Future]):
+        try:
+            rows = await database_sync_to_async(_fetch_snapshots)(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        users = _cache('users')
+        for user_id, future in batch.items():
+            values = rows.get(user_id)
+            users.set(user_id, values or _MISSING)
+            if not future.done():
+                future.set_result(values)
+
+
+_loaders = weakref.WeakKeyDictionary()
+
+
+async def get_user_for_token(token: str):
+    """The active user a token belongs to, or None"""
+    user_id = verify_token(token)
+    if user_id is None:
+        return None
+
+    values = _cache('users').get(user_id)
+    if values is None:
+        loop = asyncio.get_running_loop()
+        if loop not in _loaders:
+            _loaders[loop] = _SnapshotLoader()
+        # shield: one handshake giving up must not cancel the batch others wait on
+        values = await asyncio.shield(_loaders[loop].load(user_id))
+    if values is None or values is _MISSING:
+        return None
+
+    user = _snapshot_user(values)
+    return user if user.is_active else None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Sets scope['user'] from a JWT access token, when the handshake carries one"""
+
+    async def __call__(self, scope, receive, send):
+        token = token_from_scope(scope)
+        if token is not None:
+            scope = dict(scope)
+            try:
+                user = await get_user_for_token(token)
+            except Exception as e:
+                logger.error(f"WebSocket authentication failed: {e}")
+                user = None
+            if user is not None:
+                scope['user'] = user
+            elif not getattr(scope.get('user'), 'is_authenticated', False):
+                scope['user'] = AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """Session authentication, overridden by a JWT when one is sent"""
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
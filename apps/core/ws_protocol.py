@@ -0,0 +1,214 @@
+"""
+Binary WebSocket frames for chat and streaming consumers.
+
+Consumers that include `FrameProtocolMixin` send their messages with
+`send_message(payload)`. By default that is the JSON text frame they always
+sent. A client that lists one of the binary subprotocols in its
+Sec-WebSocket-Protocol header gets binary frames instead:
+
+    promptcraft.msgpack       msgpack, uncompressed
+    promptcraft.msgpack.zlib  msgpack, zlib-compressed from COMPRESS_MIN_BYTES
+
+A binary frame is one flag byte (0 plain, 1 zlib) followed by the msgpack
+encoded message, in which:
+
+- `type` is an integer from TYPE_CODES when the type has one, otherwise the
+  type name
+- `timestamp` is milliseconds since the epoch instead of an ISO string
+
+Clients on a binary subprotocol may send binary frames encoded the same way;
+they reach the consumer's receive() as the equivalent JSON text. Compressed
+frames are only accepted on promptcraft.msgpack.zlib, and a frame that
+decompresses past MAX_FRAME_BYTES closes the socket (1009) instead of
+being inflated. Compression
+of the socket as a whole (permessage-deflate) is negotiated by the ASGI
+server and applies to either encoding.
+"""
+
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:  # pragma: no cover - msgpack ships with channels_redis
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+JSON_PROTOCOL = 'promptcraft.json'
+MSGPACK_PROTOCOL = 'promptcraft.msgpack'
+MSGPACK_ZLIB_PROTOCOL = 'promptcraft.msgpack.zlib'
+
+DEFAULT_WS_PROTOCOL_SETTINGS = {
+    # Smaller frames are sent uncompressed even on promptcraft.msgpack.zlib
+    'COMPRESS_MIN_BYTES': 512,
+    'COMPRESS_LEVEL': 6,
+    # Largest decoded client frame; a zlib frame inflating past it closes the socket
+    'MAX_FRAME_BYTES': 1024 * 1024,
+}
+
+# Append only: codes are part of the protocol
+TYPE_CODES = {
+    'heartbeat': 1,
+    'ping': 2,
+    'pong': 3,
+    'error': 4,
+    'connection_ack': 5,
+    'connection_established': 6,
+    'message': 7,
+    'typing_start': 8,
+    'typing_stop': 9,
+    'stream_chunk': 10,
+    'streaming_connected': 11,
+    'rag_stream_started': 12,
+    'rag_stream_chunk': 13,
+    'rag_stream_completed': 14,
+    'optimization_started': 15,
+    'optimization_result': 16,
+    'chat_message': 17,
+    'chat_response': 18,
+    'deepseek_response': 19,
+    'intent_result': 20,
+    'template_suggestions': 21,
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+FLAG_PLAIN = 0
+FLAG_ZLIB = 1
+
+# WebSocket close code for a message too big to process
+CLOSE_TOO_BIG = 1009
+
+
+class FrameTooLarge(ValueError):
+    """A client frame larger than MAX_FRAME_BYTES once decoded"""
+
+
+def get_ws_protocol_settings():
+    return {**DEFAULT_WS_PROTOCOL_SETTINGS, **getattr(settings, 'WS_PROTOCOL', {})}
+
+
+def _epoch_ms(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return value
+
+
+class JSONCodec:
+    """The JSON text frames consumers have always sent"""
+
+    subprotocol = None
+    binary = False
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        return json.dumps(payload)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """Flag byte plus msgpack, with type codes and epoch-ms timestamps"""
+
+    binary = True
+
+    def __init__(self, compress: bool = False):
+        self.compress = compress
+        self.subprotocol = MSGPACK_ZLIB_PROTOCOL if compress else MSGPACK_PROTOCOL
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        message = dict(payload)
+        if message.get('type') in TYPE_CODES:
+            message['type'] = TYPE_CODES[message['type']]
+        if 'timestamp' in message:
+            message['timestamp'] = _epoch_ms(message['timestamp'])
+        body = msgpack.packb(message, use_bin_type=True, default=str)
+
+        if self.compress:
+            config = get_ws_protocol_settings()
+            if len(body) >= config['COMPRESS_MIN_BYTES']:
+                return bytes([FLAG_ZLIB]) + zlib.compress(body, config['COMPRESS_LEVEL'])
+        return bytes([FLAG_PLAIN]) + body
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        max_bytes = get_ws_protocol_settings()['MAX_FRAME_BYTES']
+        body = data[1:]
+        if data[0] == FLAG_ZLIB:
+            if not self.compress:
+                raise ValueError(f"Compressed frame on {self.subprotocol}")
+            # Inflate at most max_bytes; anything left over means the frame is bigger
+            inflater = zlib.decompressobj()
+            body = inflater.decompress(body, max_bytes)
+            if inflater.unconsumed_tail:
+                raise FrameTooLarge(f"Frame inflates past {max_bytes} bytes")
+        elif data[0] != FLAG_PLAIN:
+            raise ValueError(f"Unknown frame flag {data[0]}")
+        if len(body) > max_bytes:
+            raise FrameTooLarge(f"Frame of {len(body)} bytes")
+        message = msgpack.unpackb(body, raw=False)
+        if isinstance(message, dict) and message.get('type') in TYPE_NAMES:
+            message['type'] = TYPE_NAMES[message['type']]
+        return message
+
+
+JSON_CODEC = JSONCodec()
+
+
+def negotiate(subprotocols) -> JSONCodec:
+    """The codec for the first subprotocol the client offers that we speak"""
+    for subprotocol in subprotocols or ():
+        if subprotocol == JSON_PROTOCOL:
+            codec = JSONCodec()
+            codec.subprotocol = JSON_PROTOCOL
+            return codec
+        if subprotocol in (MSGPACK_PROTOCOL, MSGPACK_ZLIB_PROTOCOL) and MSGPACK_AVAILABLE:
+            return MsgpackCodec(compress=subprotocol == MSGPACK_ZLIB_PROTOCOL)
+    return JSON_CODEC
+
+
+class FrameProtocolMixin:
+    """
+    Picks the frame encoding on accept() from the handshake's subprotocols.
+    Send with send_message(payload) rather than send(text_data=json.dumps(...)).
+    """
+
+    frame_codec = JSON_CODEC
+
+    async def accept(self, subprotocol: Optional[str] = None, headers=None):
+        if subprotocol is None:
+            self.frame_codec = negotiate(self.scope.get('subprotocols'))
+            subprotocol = self.frame_codec.subprotocol
+        await super().accept(subprotocol=subprotocol, headers=headers)
+
+    async def send_message(self, payload: Dict[str, Any]):
+        if self.frame_codec.binary:
+            await self.send(bytes_data=self.frame_codec.encode(payload))
+        else:
+            await self.send(text_data=self.frame_codec.encode(payload))
+
+    async def websocket_receive(self, message):
+        if message.get('bytes') is not None and self.frame_codec.binary:
+            try:
+                decoded = self.frame_codec.decode(message['bytes'])
+            except FrameTooLarge as e:
+                logger.warning(f"Closing socket: {e}")
+                await self.close(code=CLOSE_TOO_BIG)
+                return
+            except Exception as e:
+                logger.warning(f"Undecodable binary frame: {e}")
+                return
+            # receive() handlers take JSON text
+            message = {'type': message['type'], 'text': json.dumps(decoded, default=str)}
+        await super().websocket_receive(message)
@@ -1,6 +1,9 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import F, Sum
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
 from .models import (
     Achievement, UserAchievement, DailyChallenge, 
     UserDailyChallenge, CreditTransaction, UserLevel
@@ -9,6 +12,59 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+BULK_AWARD_BATCH_SIZE = 500
+
+
+def _supports_update_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    # SQLite added RETURNING in 3.35, together with INSERT ... RETURNING
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def _change_balance(user_id, delta, required=None):
+    """
+    Add delta to a user's credits with one conditional UPDATE.
+
+    With `required`, the row only changes while credits >= required, so two
+    concurrent spends can never both pass the check. Returns the new balance,
+    or None when the condition failed or the user does not exist. On
+    backends without UPDATE ... RETURNING the balance is read back in the
+    caller's transaction, where the updated row is still locked.
+    """
+    User = get_user_model()
+    if not _supports_update_returning():
+        users = User.objects.filter(pk=user_id)
+        if required is not None:
+            users = users.filter(credits__gte=required)
+        if not users.update(credits=F('credits') + delta):
+            return None
+        return User.objects.filter(pk=user_id).values_list('credits', flat=True).get()
+
+    qn = connection.ops.quote_name
+    credits = qn(User._meta.get_field('credits').column)
+    sql = (
+        f'UPDATE {qn(User._meta.db_table)} SET {credits} = {credits} + %s '
+        f'WHERE {qn(User._meta.pk.column)} = %s'
+    )
+    params = [delta, User._meta.pk.get_db_prep_value(user_id, connection)]
+    if required is not None:
+        sql += f' AND {credits} >= %s'
+        params.append(required)
+    with connection.cursor() as cursor:
+        cursor.execute(sql + f' RETURNING {credits}', params)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _related_fields(related_object):
+    if not related_object:
+        return {}
+    return {
+        'related_object_type': related_object.__class__.__name__.lower(),
+        'related_object_id': str(related_object.id),
+    }
+
 class GamificationService:
     """
     Service for handling all gamification features
@@ -37,44 +93,109 @@ class GamificationService:
         Returns:
             New credit balance
         """
-        user.credits += amount
-        user.save(update_fields=['credits'])
-        print(f"🎮 Gamification: Awarded {amount} credits to {user.username} - {reason}")
         if amount <= 0:
             raise ValueError("Credit amount must be positive")
         
         with transaction.atomic():
-            # Update user credits
-            user.credits = F('credits') + amount
-            user.save(update_fields=['credits'])
-            
-            # Refresh to get actual value
-            user.refresh_from_db(fields=['credits'])
-            
-            # Create transaction record
-            transaction_data = {
-                'user': user,
-                'amount': amount,
-                'balance_after': user.credits,
-                'transaction_type': transaction_type,
-                'description': reason,
-                'metadata': metadata or {}
-            }
-            
-            if related_object:
-                transaction_data['related_object_type'] = related_object.__class__.__name__.lower()
-                transaction_data['related_object_id'] = str(related_object.id)
+            balance = _change_balance(user.pk, amount)
+            if balance is None:
+                raise ValueError(f"User {user.pk} does not exist")
             
-            CreditTransaction.objects.create(**transaction_data)
+            CreditTransaction.objects.create(
+                user=user,
+                amount=amount,
+                balance_after=balance,
+                transaction_type=transaction_type,
+                description=reason,
+                metadata=metadata or {},
+                **_related_fields(related_object)
+            )
+        
+        user.credits = balance
+        logger.info(f"Awarded {amount} credits to user {user.username}: {reason}")
+        return balance
+    
+    @staticmethod
+    def award_credits_bulk(awards, reason, transaction_type='bonus', metadata=None,
+                           batch_size=BULK_AWARD_BATCH_SIZE):
+        """
+        Award credits to many users at once (challenge payouts, leaderboard rewards)
+        
+        Each batch costs one UPDATE, one SELECT of the new balances and one
+        multi-row INSERT of CreditTransaction rows, whatever its size.
+        
+        Args:
+            awards: Iterable of (user or user ID, amount) pairs; a user may
+                appear more than once and gets one transaction per entry
+            reason: Human-readable reason, shared by every transaction
+            transaction_type: Type of transaction for tracking
+            metadata: Optional additional data, shared by every transaction
+            batch_size: Users per UPDATE
+        
+        Returns:
+            Dict of user ID to new credit balance; unknown users are skipped
+        """
+        entries = []
+        for user, amount in awards:
+            if amount <= 0:
+                raise ValueError("Credit amount must be positive")
+            entries.append((getattr(user, 'pk', user), amount))
+        
+        User = get_user_model()
+        pk_field = User._meta.pk
+        totals = defaultdict(int)
+        for user_id, amount in entries:
+            totals[pk_field.to_python(user_id)] += amount
+        user_ids = list(totals)
+        
+        balances = {}
+        with transaction.atomic():
+            for start in range(0, len(user_ids), batch_size):
+                batch = user_ids[start:start + batch_size]
+                amounts = {totals[user_id] for user_id in batch}
+                if len(amounts) == 1:
+                    increment = Value(amounts.pop())
+                else:
+                    increment = Case(
+                        *[When(pk=user_id, then=Value(totals[user_id])) for user_id in batch],
+                        output_field=IntegerField(),
+                    )
+                User.objects.filter(pk__in=batch).update(credits=F('credits') + increment)
+                balances.update(User.objects.filter(pk__in=batch).values_list('pk', 'credits'))
             
-            logger.info(f"Awarded {amount} credits to user {user.username}: {reason}")
-            return user.credits
+            # Replay the entries from each user's starting balance for balance_after
+            running = {user_id: balances[user_id] - totals[user_id] for user_id in balances}
+            rows = []
+            for user_id, amount in entries:
+                user_id = pk_field.to_python(user_id)
+                if user_id not in running:
+                    continue
+                running[user_id] += amount
+                rows.append(CreditTransaction(
+                    user_id=user_id,
+                    amount=amount,
+                    balance_after=running[user_id],
+                    transaction_type=transaction_type,
+                    description=reason,
+                    metadata=metadata or {},
+                ))
+            CreditTransaction.objects.bulk_create(rows, batch_size=batch_size)
+        
+        skipped = len(user_ids) - len(balances)
+        logger.info(
+            f"Awarded credits to {len(balances)} users ({len(rows)} transactions): {reason}"
+            + (f"; skipped {skipped} unknown users" if skipped else "")
+        )
+        return balances
     
     @staticmethod
     def spend_credits(user, amount, reason, transaction_type='spent_ai', related_object=None):
         """
         Spend user credits with validation
         
+        The balance check and the deduction are one conditional UPDATE, so
+        concurrent spends cannot overdraw the account.
+        
         Args:
             user: User object
             amount: Number of credits to spend (positive integer)
@@ -91,34 +212,24 @@ class GamificationService:
         if amount <= 0:
             raise ValueError("Credit amount must be positive")
         
-        if user.credits < amount:
-            raise ValueError(f"Insufficient credits. Required: {amount}, Available: {user.credits}")
-        
         with transaction.atomic():
-            # Update user credits
-            user.credits = F('credits') - amount
-            user.save(update_fields=['credits'])
-            
-            # Refresh to get actual value
-            user.refresh_from_db(fields=['credits'])
-            
-            # Create transaction record
-            transaction_data = {
-                'user': user,
-                'amount': -amount,  # Negative for spending
-                'balance_after': user.credits,
-                'transaction_type': transaction_type,
-                'description': reason,
-            }
+            balance = _change_balance(user.pk, -amount, required=amount)
+            if balance is None:
+                user.refresh_from_db(fields=['credits'])
+                raise ValueError(f"Insufficient credits. Required: {amount}, Available: {user.credits}")
             
-            if related_object:
-                transaction_data['related_object_type'] = related_object.__class__.__name__.lower()
-                transaction_data['related_object_id'] = str(related_object.id)
-            
-            CreditTransaction.objects.create(**transaction_data)
-            
-            logger.info(f"User {user.username} spent {amount} credits: {reason}")
-            return user.credits
+            CreditTransaction.objects.create(
+                user=user,
+                amount=-amount,  # Negative for spending
+                balance_after=balance,
+                transaction_type=transaction_type,
+                description=reason,
+                **_related_fields(related_object)
+            )
+        
+        user.credits = balance
+        logger.info(f"User {user.username} spent {amount} credits: {reason}")
+        return balance
     
     @staticmethod
     def check_achievements(user):
@@ -1,3 +1,175 @@
-from django.test import TestCase
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.gamification.models import CreditTransaction
+from apps.gamification.services import GamificationService
+
+
+def statements(ctx):
+    return [q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+
+
+def make_user(username, credits=100):
+    return get_user_model().objects.create_user(
+        username=username, email=f"{username}@example.com", password="pass1234", credits=credits
+    )
+
+
+# ===========================================================================
+# 1. Credit ledger — conditional balance updates
+# ===========================================================================
+
+class CreditLedgerTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("ledger", credits=100)
+
+    def test_award_is_one_update_and_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            balance = GamificationService.award_credits(self.user, 25, "Welcome bonus")
+
+        sql = statements(ctx)
+        self.assertEqual(len(sql), 2)
+        self.assertTrue(sql[0].startswith("UPDATE"))
+        self.assertTrue(sql[1].startswith("INSERT"))
+        self.assertEqual(balance, 125)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credits, 125)
+        self.assertEqual(CreditTransaction.objects.get().balance_after, 125)
+
+    def test_award_rejects_non_positive_amount_before_writing(self):
+        with self.assertRaises(ValueError):
+            GamificationService.award_credits(self.user, 0, "Nothing")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credits, 100)
+
+    def test_spend(self):
+        stale = get_user_model().objects.get(pk=self.user.pk)
+        GamificationService.spend_credits(self.user, 80, "AI call")
+
+        # A stale in-memory balance no longer decides whether the spend passes
+        with self.assertRaisesMessage(ValueError, "Available: 20"):
+            GamificationService.spend_credits(stale, 30, "AI call")
+        self.assertEqual(stale.credits, 20)
+        self.assertEqual(CreditTransaction.objects.count(), 1)
+        self.assertEqual(GamificationService.spend_credits(stale, 20, "AI call"), 0)
+
+
+class BulkAwardTests(TestCase):
+
+    def test_bulk_award(self):
+        alice, bob, carol = make_user("alice", 10), make_user("bob", 0), make_user("carol", 5)
+        missing = get_user_model()(username="ghost").pk
+
+        with CaptureQueriesContext(connection) as ctx:
+            balances = GamificationService.award_credits_bulk(
+                [(alice, 50), (bob.pk, 20), (alice, 5), (str(carol.pk), 20), (missing, 10)],
+                reason="Weekly leaderboard", transaction_type="earned_challenge",
+            )
+
+        self.assertEqual([sql.split()[0] for sql in statements(ctx)], ["UPDATE", "SELECT", "INSERT"])
+        self.assertEqual(balances, {alice.pk: 65, bob.pk: 20, carol.pk: 25})
+        alice_rows = CreditTransaction.objects.filter(user=alice).order_by("balance_after")
+        self.assertEqual([(t.amount, t.balance_after) for t in alice_rows], [(50, 60), (5, 65)])
+        self.assertEqual(CreditTransaction.objects.count(), 4)
+
+    def test_same_amount_batches(self):
+        users = [make_user(f"winner{i}", 0) for i in range(5)]
+        with CaptureQueriesContext(connection) as ctx:
+            GamificationService.award_credits_bulk([(u, 10) for u in users], "Daily challenge", batch_size=2)
+        self.assertEqual(sum(1 for sql in statements(ctx) if sql.startswith("UPDATE")), 3)
+        self.assertEqual(
+            set(get_user_model().objects.filter(pk__in=[u.pk for u in users]).values_list("credits", flat=True)),
+            {10},
+        )
+
+
+# ===========================================================================
+# 2. Concurrency — parallel spends cannot overdraw
+# ===========================================================================
+
+class ConcurrentSpendTests(TransactionTestCase):
+
+    def test_500_parallel_spends(self):
+        user = make_user("contended", credits=300)
+        results = {"spent": 0, "refused": 0}
+        lock = threading.Lock()
+        start = threading.Barrier(25)
+
+        def spend(_):
+            if _ < 25:
+                start.wait()
+            try:
+                while True:
+                    try:
+                        GamificationService.spend_credits(
+                            get_user_model()(pk=user.pk, username=user.username, credits=300), 1, "parallel"
+                        )
+                        outcome = "spent"
+                        break
+                    except ValueError:
+                        outcome = "refused"
+                        break
+                    except OperationalError as e:
+                        # SQLite locks the whole table; retry as a busy timeout would
+                        if "locked" not in str(e):
+                            raise
+                        time.sleep(0.001)
+                with lock:
+                    results[outcome] += 1
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=25) as pool:
+            list(pool.map(spend, range(500)))
+
+        user.refresh_from_db()
+        self.assertEqual(results, {"spent": 300, "refused": 200})
+        self.assertEqual(user.credits, 0)
+        self.assertEqual(CreditTransaction.objects.filter(user=user).count(), 300)
+        self.assertEqual(
+            sorted(CreditTransaction.objects.filter(user=user).values_list("balance_after", flat=True)),
+            list(range(300)),
+        )
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_credit_ledger_throughput():
+    users = [make_user(f"bench{i}", credits=10_000) for i in range(500)]
+    GamificationService.award_credits_bulk([(users[0], 1)], "warm up")
+
+    def run(fn, operations):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+        return operations / elapsed, len(statements(ctx)) / operations
+
+    spend_rate, spend_sql = run(
+        lambda: [GamificationService.spend_credits(user, 1, "bench") for user in users], len(users)
+    )
+    single_rate, single_sql = run(
+        lambda: [GamificationService.award_credits(user, 10, "bench") for user in users], len(users)
+    )
+    bulk_rate, bulk_sql = run(
+        lambda: GamificationService.award_credits_bulk([(user, 10) for user in users], "bench"), len(users)
+    )
+
+    # In-memory SQLite has no round trips, so the statement counts are what
+    # carries over to a networked database
+    print(
+        f"spend_credits: {spend_rate:.0f}/s, {spend_sql:.2f} statements each; "
+        f"award_credits: {single_rate:.0f}/s, {single_sql:.2f} statements each; "
+        f"award_credits_bulk: {bulk_rate:.0f} awards/s, {bulk_sql:.3f} statements each"
+    )
+    assert spend_sql == single_sql == 2
+    # bulk_create still splits at the SQLite bind parameter limit
+    assert bulk_sql < 0.05
@@ -10,6 +10,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.core.llm_cache import get_response_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,12 +29,24 @@ def _get_deepseek_config():
 
 
 def _call_deepseek_sync(system_prompt: str, user_content: str,
-                        max_tokens: int = 512, temperature: float = 0.3) -> str:
-    """Synchronous DeepSeek chat completion. Returns content string."""
+                        max_tokens: int = 512, temperature: float = 0.3, task: str = None) -> str:
+    """Synchronous DeepSeek chat completion. Returns content string.
+
+    With a task, answers are looked up in and stored to the LLM response cache.
+    """
     api_key, base_url, model = _get_deepseek_config()
     if not api_key:
         raise ValueError("DeepSeek API key not configured")
 
+    cached = None
+    if task:
+        cached = get_response_cache().lookup(
+            task, model, user_content, system=system_prompt,
+            params={'max_tokens': max_tokens, 'temperature': temperature},
+        )
+        if cached.hit:
+            return cached.result
+
     resp = requests.post(
         f"{base_url}/v1/chat/completions",
         headers={
@@ -51,7 +65,15 @@ def _call_deepseek_sync(system_prompt: str, user_content: str,
         timeout=30,
     )
     resp.raise_for_status()
-    return resp.json()["choices"][0]["message"]["content"]
+    content = resp.json()["choices"][0]["message"]["content"]
+    if cached is not None:
+        # Callers parse the answer as JSON; don't keep serving one that doesn't parse
+        try:
+            _parse_json_response(content)
+        except ValueError:
+            return content
+        get_response_cache().store(cached, content)
+    return content
 
 
 def _parse_json_response(raw: str) -> dict:
@@ -141,7 +163,7 @@ class IntentDetectionView(APIView):
             "- keywords: array of 3-6 key terms from the input"
         )
         try:
-            raw = _call_deepseek_sync(system, prompt, max_tokens=300, temperature=0.2)
+            raw = _call_deepseek_sync(system, prompt, max_tokens=300, temperature=0.2, task='intent')
             data = _parse_json_response(raw)
             return Response({
                 'intent': data.get('intent', 'general'),
@@ -182,7 +204,7 @@ class PromptAssessmentView(APIView):
             "- improved_prompt: a rewritten, improved version of the original prompt"
         )
         try:
-            raw = _call_deepseek_sync(system, content_for_ai, max_tokens=700, temperature=0.3)
+            raw = _call_deepseek_sync(system, content_for_ai, max_tokens=700, temperature=0.3, task='assessment')
             data = _parse_json_response(raw)
             return Response({
                 'score': float(data.get('score', 7.0)),
@@ -0,0 +1,264 @@
+"""
+Query cost limiting and resolver timing for the prompt history GraphQL endpoint.
+
+Cost is computed before execution: every object-typed field costs its weight
+(default 1) times the product of the list sizes above it, where a list size
+comes from the field's `first`/`limit` argument (a literal, or the request's
+value for a variable, else the variable's default), its schema default, or
+DEFAULT_LIST_SIZE. Queries over the caller's budget or max depth are rejected
+as validation errors, so nothing is resolved.
+
+Resolvers clamp their page size with `clamp_list_size`, so no list is longer
+than MAX_LIST_SIZE whatever the costing saw; sizes are costed the same way.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from graphql import GraphQLError, get_named_type, get_nullable_type, is_leaf_type
+from graphql.language import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    IntValueNode,
+    OperationDefinitionNode,
+    VariableNode,
+)
+from graphql.type import GraphQLList
+from graphql.validation import ValidationRule, specified_rules
+from graphene_django.views import GraphQLView
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIST_SIZE = 50
+# Longest page a resolver returns
+MAX_LIST_SIZE = 100
+LIST_SIZE_ARGUMENTS = ('first', 'limit')
+
+# Extra weight for fields that are more expensive than a single row lookup
+FIELD_WEIGHTS = {
+    'Query.searchIterations': 5,
+    'Query.searchSavedPrompts': 5,
+}
+
+DEFAULT_COST_LIMITS = {
+    'anonymous': 100,
+    'authenticated': 5000,
+    'staff': 50000,
+    'max_depth': 10,
+}
+
+
+def get_cost_limits():
+    limits = dict(DEFAULT_COST_LIMITS)
+    limits.update(getattr(settings, 'GRAPHQL_QUERY_COST_LIMITS', {}))
+    return limits
+
+
+def get_cost_budget(user):
+    """Return the maximum query cost allowed for a user"""
+    limits = get_cost_limits()
+    if user is None or not user.is_authenticated:
+        return limits['anonymous']
+    if user.is_staff:
+        return limits['staff']
+    return limits['authenticated']
+
+
+def clamp_list_size(size, default):
+    """The number of rows a resolver returns for a `first`/`limit` argument (None when null)"""
+    if size is None:
+        size = default
+    return min(max(size, 0), MAX_LIST_SIZE)
+
+
+def _list_size(node, field_def, variables):
+    default = DEFAULT_LIST_SIZE
+    for name in LIST_SIZE_ARGUMENTS:
+        arg_def = field_def.args.get(name)
+        if arg_def is not None and isinstance(arg_def.default_value, int):
+            default = arg_def.default_value
+            break
+    for argument in node.arguments:
+        if argument.name.value not in LIST_SIZE_ARGUMENTS:
+            continue
+        if isinstance(argument.value, IntValueNode):
+            return clamp_list_size(int(argument.value.value), default)
+        if isinstance(argument.value, VariableNode):
+            value = variables.get(argument.value.name.value)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return clamp_list_size(value, default)
+            if value is not None:
+                # Not an integer; execution rejects it, but don't undercount if it doesn't
+                return MAX_LIST_SIZE
+    return clamp_list_size(default, default)
+
+
+def calculate_query_cost(schema, operation, fragments, field_weights=None, variables=None):
+    """
+    Return (cost, depth) for an operation.
+
+    `variables` are the request's variable values; variables the request
+    leaves out are costed at their defaults. Fragment spreads are expanded in
+    place so their fields pay the list multipliers of the spread site; cyclic
+    spreads are skipped (graphql-core reports them separately).
+    """
+    field_weights = FIELD_WEIGHTS if field_weights is None else field_weights
+    variable_values = {
+        definition.variable.name.value: int(definition.default_value.value)
+        for definition in operation.variable_definitions or ()
+        if isinstance(definition.default_value, IntValueNode)
+    }
+    if isinstance(variables, dict):
+        variable_values.update(variables)
+    root_type = schema.get_root_type(operation.operation)
+    max_depth = 0
+
+    def visit(selection_set, parent_type, multiplier, depth, visited_fragments):
+        nonlocal max_depth
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                name = selection.name.value
+                if name.startswith('__') or not hasattr(parent_type, 'fields'):
+                    continue
+                field_def = parent_type.fields.get(name)
+                if field_def is None:
+                    continue
+                max_depth = max(max_depth, depth)
+                named_type = get_named_type(field_def.type)
+                if is_leaf_type(named_type):
+                    continue
+                cost += field_weights.get(f'{parent_type.name}.{name}', 1) * multiplier
+                child_multiplier = multiplier
+                if isinstance(get_nullable_type(field_def.type), GraphQLList):
+                    child_multiplier *= _list_size(selection, field_def, variable_values)
+                if selection.selection_set:
+                    cost += visit(
+                        selection.selection_set, named_type, child_multiplier,
+                        depth + 1, visited_fragments
+                    )
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = schema.get_type(selection.type_condition.name.value) or parent_type
+                cost += visit(selection.selection_set, fragment_type, multiplier, depth, visited_fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = fragments.get(name)
+                if fragment is None or name in visited_fragments:
+                    continue
+                fragment_type = schema.get_type(fragment.type_condition.name.value) or parent_type
+                cost += visit(
+                    fragment.selection_set, fragment_type, multiplier, depth,
+                    visited_fragments | {name}
+                )
+        return cost
+
+    cost = visit(operation.selection_set, root_type, 1, 1, frozenset())
+    return cost, max_depth
+
+
+def query_cost_validator(max_cost, max_depth=None, field_weights=None, callback=None, variables=None):
+    """Build a validation rule rejecting operations above max_cost or max_depth, given the request's variables"""
+
+    class QueryCostValidator(ValidationRule):
+        def __init__(self, validation_context):
+            super().__init__(validation_context)
+            document = validation_context.document
+            fragments = {
+                definition.name.value: definition
+                for definition in document.definitions
+                if isinstance(definition, FragmentDefinitionNode)
+            }
+            for definition in document.definitions:
+                if not isinstance(definition, OperationDefinitionNode):
+                    continue
+                cost, depth = calculate_query_cost(
+                    validation_context.schema, definition, fragments, field_weights, variables
+                )
+                name = definition.name.value if definition.name else 'anonymous'
+                if callable(callback):
+                    callback(name, cost, depth)
+                if max_depth is not None and depth > max_depth:
+                    validation_context.report_error(GraphQLError(
+                        f"'{name}' exceeds maximum operation depth of {max_depth}.",
+                        [definition],
+                    ))
+                if cost > max_cost:
+                    validation_context.report_error(GraphQLError(
+                        f"'{name}' has a cost of {cost}, which exceeds the budget of {max_cost}.",
+                        [definition],
+                    ))
+
+    return QueryCostValidator
+
+
+class FieldTimingStats:
+    """Process-wide resolver timings keyed by 'Type.field', used to tune FIELD_WEIGHTS"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, key, elapsed_ms):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: dict(stats, avg_ms=stats['total_ms'] / stats['count'])
+                for key, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+field_timings = FieldTimingStats()
+
+
+class FieldTimingMiddleware:
+    """Graphene middleware recording resolver time for object-typed fields"""
+
+    def resolve(self, next, root, info, **args):
+        if is_leaf_type(get_named_type(info.return_type)):
+            return next(root, info, **args)
+        start = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            field_timings.record(
+                f'{info.parent_type.name}.{info.field_name}',
+                (time.perf_counter() - start) * 1000
+            )
+
+
+class CostLimitedGraphQLView(GraphQLView):
+    """GraphQLView that validates query cost against the requesting user's budget"""
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        # Built per operation (batched requests carry their own variables)
+        limits = get_cost_limits()
+        self.validation_rules = tuple(specified_rules) + (
+            query_cost_validator(
+                get_cost_budget(getattr(request, 'user', None)),
+                max_depth=limits['max_depth'],
+                callback=lambda name, cost, depth: logger.debug(
+                    "GraphQL operation %s cost=%s depth=%s", name, cost, depth
+                ),
+                variables=variables,
+            ),
+        )
+        return super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
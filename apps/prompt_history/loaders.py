@@ -0,0 +1,118 @@
+"""
+Per-request batch loaders for the prompt history GraphQL schema.
+
+GraphQLView executes resolvers synchronously, so instead of promise-based
+deferral these loaders batch by sibling priming: whenever a list of nodes
+is resolved, the keys their nested fields will ask for are registered as
+pending, and the first nested lookup fetches every pending key in one query.
+A nested list of N parents therefore costs one query per field instead of N.
+"""
+from collections import defaultdict
+
+from .models import PromptHistory, PromptIteration, ConversationThread, ThreadMessage
+
+
+class BatchLoader:
+    """Caches values by key and fetches all pending keys in a single batch."""
+
+    def __init__(self, batch_load_fn, many=False, on_batch=None):
+        self._batch_load_fn = batch_load_fn
+        self._many = many
+        self._on_batch = on_batch
+        self._cache = {}
+        self._pending = set()
+
+    def prime(self, key):
+        """Register a key to be fetched with the next batch"""
+        if key is not None and key not in self._cache:
+            self._pending.add(key)
+
+    def load(self, key):
+        if key is None:
+            return [] if self._many else None
+        if key not in self._cache:
+            keys = self._pending | {key}
+            self._pending = set()
+            results = self._batch_load_fn(list(keys))
+            loaded = []
+            for k in keys:
+                value = results.get(k, [] if self._many else None)
+                self._cache[k] = value
+                if self._many:
+                    loaded.extend(value)
+                elif value is not None:
+                    loaded.append(value)
+            if self._on_batch:
+                self._on_batch(loaded)
+        return self._cache[key]
+
+
+def _by_id(queryset):
+    def batch_load(keys):
+        return {obj.pk: obj for obj in queryset.filter(pk__in=keys)}
+    return batch_load
+
+
+def _grouped_by(queryset, field):
+    def batch_load(keys):
+        grouped = defaultdict(list)
+        for obj in queryset.filter(**{f'{field}__in': keys}):
+            grouped[getattr(obj, field)].append(obj)
+        return grouped
+    return batch_load
+
+
+class PromptHistoryLoaders:
+    """Loader set shared by every resolver of a single GraphQL request"""
+
+    def __init__(self):
+        self.histories = BatchLoader(
+            _by_id(PromptHistory.objects.all()),
+            on_batch=self.prime
+        )
+        self.iterations = BatchLoader(
+            _by_id(PromptIteration.objects.with_chain_stats()),
+            on_batch=self.prime
+        )
+        self.iterations_by_prompt = BatchLoader(
+            _grouped_by(
+                PromptIteration.objects.with_chain_stats().order_by('-created_at'),
+                'parent_prompt_id'
+            ),
+            many=True,
+            on_batch=self.prime
+        )
+        self.threads = BatchLoader(
+            _by_id(ConversationThread.objects.all()),
+            on_batch=self.prime
+        )
+        self.messages_by_thread = BatchLoader(
+            _grouped_by(ThreadMessage.objects.order_by('message_order'), 'thread_id'),
+            many=True,
+            on_batch=self.prime
+        )
+
+    def prime(self, nodes):
+        """Register the related keys of resolved nodes and return them unchanged"""
+        for node in nodes:
+            if isinstance(node, PromptIteration):
+                self.histories.prime(node.parent_prompt_id)
+                self.iterations.prime(node.previous_iteration_id)
+            elif isinstance(node, PromptHistory):
+                self.iterations_by_prompt.prime(node.id)
+            elif isinstance(node, ConversationThread):
+                self.messages_by_thread.prime(node.id)
+            elif isinstance(node, ThreadMessage):
+                self.threads.prime(node.thread_id)
+                self.iterations.prime(node.iteration_id)
+        return nodes
+
+
+def get_loaders(info):
+    """Return the loader set for the current request, creating it on first use"""
+    context = info.context
+    loaders = getattr(context, '_prompt_history_loaders', None)
+    if loaders is None:
+        loaders = PromptHistoryLoaders()
+        setattr(context, '_prompt_history_loaders', loaders)
+    return loaders
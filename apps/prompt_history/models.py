@@ -1,5 +1,7 @@
 import uuid
 from django.db import models
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 
 
@@ -36,6 +38,33 @@ class PromptHistory(models.Model):
         return f"PromptHistory<{self.id}> by {self.user}"
 
 
+class PromptIterationQuerySet(models.QuerySet):
+    def with_chain_stats(self):
+        """
+        Annotate chain length and next-iteration existence so the
+        iteration_chain_length / has_next_iteration properties don't
+        issue a COUNT and an EXISTS query per row.
+        """
+        chain_length = (
+            PromptIteration.objects
+            .filter(parent_prompt=OuterRef('parent_prompt'), is_deleted=False)
+            .order_by()
+            .values('parent_prompt')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        next_iterations = PromptIteration.objects.filter(
+            previous_iteration=OuterRef('pk'),
+            is_deleted=False
+        )
+        return self.annotate(
+            annotated_chain_length=Coalesce(
+                Subquery(chain_length, output_field=IntegerField()), Value(0)
+            ),
+            annotated_has_next=Exists(next_iterations),
+        )
+
+
 class PromptIteration(models.Model):
     """
     Tracks iterations and versions of prompts, enabling version control
@@ -172,6 +201,8 @@ class PromptIteration(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PromptIterationQuerySet.as_manager()
+
     class Meta:
         db_table = "prompt_iterations"
         ordering = ['-created_at']
@@ -210,6 +241,8 @@ class PromptIteration(models.Model):
     @property
     def iteration_chain_length(self):
         """Get the total number of iterations in this chain"""
+        if hasattr(self, 'annotated_chain_length'):
+            return self.annotated_chain_length
         return PromptIteration.objects.filter(
             parent_prompt=self.parent_prompt,
             is_deleted=False
@@ -218,6 +251,8 @@ class PromptIteration(models.Model):
     @property
     def has_next_iteration(self):
         """Check if there's a next iteration after this one"""
+        if hasattr(self, 'annotated_has_next'):
+            return self.annotated_has_next
         return self.next_iterations.filter(is_deleted=False).exists()
 
     def __str__(self):
@@ -5,6 +5,19 @@ import graphene
 from graphene_django import DjangoObjectType
 from django.db.models import Q
 from .models import PromptHistory, PromptIteration, ConversationThread, ThreadMessage, SavedPrompt
+from .complexity import clamp_list_size
+from .loaders import get_loaders
+
+
+def _primed(info, nodes):
+    """Evaluate a list result and register its nested keys with the request loaders"""
+    return get_loaders(info).prime(list(nodes))
+
+
+def _primed_one(info, node):
+    if node is not None:
+        get_loaders(info).prime([node])
+    return node
 
 
 # ==================== Object Types ====================
@@ -20,6 +33,9 @@ class PromptHistoryType(DjangoObjectType):
             'created_at', 'updated_at', 'iterations'
         )
 
+    def resolve_iterations(self, info):
+        return get_loaders(info).iterations_by_prompt.load(self.id)
+
 
 class PromptIterationType(DjangoObjectType):
     """GraphQL type for PromptIteration model"""
@@ -44,6 +60,12 @@ class PromptIterationType(DjangoObjectType):
     def resolve_has_next_iteration(self, info):
         return self.has_next_iteration
 
+    def resolve_parent_prompt(self, info):
+        return get_loaders(info).histories.load(self.parent_prompt_id)
+
+    def resolve_previous_iteration(self, info):
+        return get_loaders(info).iterations.load(self.previous_iteration_id)
+
 
 class ConversationThreadType(DjangoObjectType):
     """GraphQL type for ConversationThread model"""
@@ -56,6 +78,9 @@ class ConversationThreadType(DjangoObjectType):
             'messages'
         )
 
+    def resolve_messages(self, info):
+        return get_loaders(info).messages_by_thread.load(self.id)
+
 
 class ThreadMessageType(DjangoObjectType):
     """GraphQL type for ThreadMessage model"""
@@ -63,6 +88,12 @@ class ThreadMessageType(DjangoObjectType):
         model = ThreadMessage
         fields = ('id', 'thread', 'iteration', 'message_order', 'created_at')
 
+    def resolve_thread(self, info):
+        return get_loaders(info).threads.load(self.thread_id)
+
+    def resolve_iteration(self, info):
+        return get_loaders(info).iterations.load(self.iteration_id)
+
 
 class SavedPromptType(DjangoObjectType):
     """GraphQL type for SavedPrompt model - User's saved plain prompts"""
@@ -246,81 +277,87 @@ class Query(graphene.ObjectType):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
-        return PromptHistory.objects.filter(id=id, user=user, is_deleted=False).first()
+        return _primed_one(info, PromptHistory.objects.filter(id=id, user=user, is_deleted=False).first())
 
     def resolve_all_prompt_histories(self, info, limit=50, offset=0):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
-        return PromptHistory.objects.filter(
+        limit, offset = clamp_list_size(limit, 50), max(offset or 0, 0)
+        return _primed(info, PromptHistory.objects.filter(
             user=user, is_deleted=False
-        ).order_by('-created_at')[offset:offset+limit]
+        ).order_by('-created_at')[offset:offset+limit])
 
     def resolve_prompt_iteration(self, info, id):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
-        return PromptIteration.objects.filter(id=id, user=user, is_deleted=False).first()
+        return _primed_one(info, PromptIteration.objects.with_chain_stats().filter(
+            id=id, user=user, is_deleted=False
+        ).first())
 
     def resolve_all_iterations_for_prompt(self, info, parent_prompt_id, include_deleted=False):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
         
-        queryset = PromptIteration.objects.filter(
+        queryset = PromptIteration.objects.with_chain_stats().filter(
             parent_prompt_id=parent_prompt_id,
             user=user
         )
         if not include_deleted:
             queryset = queryset.filter(is_deleted=False)
         
-        return queryset.order_by('iteration_number')
+        return _primed(info, queryset.order_by('iteration_number'))
 
     def resolve_latest_iteration(self, info, parent_prompt_id):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
         
-        return PromptIteration.objects.filter(
+        return _primed_one(info, PromptIteration.objects.with_chain_stats().filter(
             parent_prompt_id=parent_prompt_id,
             user=user,
             is_deleted=False
-        ).order_by('-iteration_number').first()
+        ).order_by('-iteration_number').first())
 
     def resolve_bookmarked_iterations(self, info, limit=20):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit = clamp_list_size(limit, 20)
         
-        return PromptIteration.objects.filter(
+        return _primed(info, PromptIteration.objects.with_chain_stats().filter(
             user=user,
             is_bookmarked=True,
             is_deleted=False
-        ).order_by('-created_at')[:limit]
+        ).order_by('-created_at')[:limit])
 
     def resolve_conversation_thread(self, info, id):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
-        return ConversationThread.objects.filter(id=id, user=user, is_deleted=False).first()
+        return _primed_one(info, ConversationThread.objects.filter(id=id, user=user, is_deleted=False).first())
 
     def resolve_all_conversation_threads(self, info, status=None, limit=50):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit = clamp_list_size(limit, 50)
         
         queryset = ConversationThread.objects.filter(user=user, is_deleted=False)
         if status:
             queryset = queryset.filter(status=status)
         
-        return queryset.order_by('-last_activity_at')[:limit]
+        return _primed(info, queryset.order_by('-last_activity_at')[:limit])
 
     def resolve_search_iterations(self, info, query, interaction_type=None, tags=None, limit=20):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit = clamp_list_size(limit, 20)
         
-        queryset = PromptIteration.objects.filter(user=user, is_deleted=False)
+        queryset = PromptIteration.objects.with_chain_stats().filter(user=user, is_deleted=False)
         
         # Text search
         if query:
@@ -340,7 +377,7 @@ class Query(graphene.ObjectType):
             for tag in tags:
                 queryset = queryset.filter(tags__contains=[tag])
         
-        return queryset.order_by('-created_at')[:limit]
+        return _primed(info, queryset.order_by('-created_at')[:limit])
 
     # SavedPrompt Resolvers
     def resolve_saved_prompt(self, info, id):
@@ -353,6 +390,7 @@ class Query(graphene.ObjectType):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit, offset = clamp_list_size(limit, 50), max(offset or 0, 0)
         
         queryset = SavedPrompt.objects.filter(user=user, is_deleted=False)
         
@@ -367,6 +405,7 @@ class Query(graphene.ObjectType):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit = clamp_list_size(limit, 20)
         
         return SavedPrompt.objects.filter(
             user=user,
@@ -378,6 +417,7 @@ class Query(graphene.ObjectType):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit = clamp_list_size(limit, 20)
         
         queryset = SavedPrompt.objects.filter(user=user, is_deleted=False)
         
@@ -403,6 +443,7 @@ class Query(graphene.ObjectType):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception("Authentication required")
+        limit = clamp_list_size(limit, 50)
         
         queryset = SavedPrompt.objects.filter(is_public=True, is_deleted=False)
         
@@ -3,15 +3,15 @@ import time
 import logging
 from typing import Dict, Any
 
+from apps.core.lazy_imports import lazy_import, modules_available
+
 logger = logging.getLogger(__name__)
 
-# Try to import LangChain and LangSmith; graceful fallback
-try:
-    from langchain_core.prompts import PromptTemplate
-    from langchain_openai import OpenAI
-    LANGCHAIN_AVAILABLE = True
-except Exception:
-    LANGCHAIN_AVAILABLE = False
+# LangChain is imported on first use; graceful fallback
+LANGCHAIN_AVAILABLE = modules_available('langchain_core', 'langchain_openai')
+if LANGCHAIN_AVAILABLE:
+    PromptTemplate = lazy_import('langchain_core.prompts', 'PromptTemplate')
+    OpenAI = lazy_import('langchain_openai', 'OpenAI')
 
 
 def _hash_user_id(user_id: int) -> str:
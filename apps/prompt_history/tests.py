@@ -26,3 +26,286 @@ def test_prompt_history_crud_and_enhance(client_db):
     # Enhance (best-effort)
     resp = client.post(f'/api/v2/history/{hid}/enhance/', data={'style': 'concise'})
     assert resp.status_code in (200, 201, 202, 400, 500)
+
+
+# ==================== GraphQL query-count harness ====================
+
+import time
+
+from apps.prompt_history.models import PromptHistory, PromptIteration, ConversationThread
+from apps.prompt_history.schema import schema
+
+NESTED_THREADS_QUERY = """
+{
+  allConversationThreads(limit: 100) {
+    id
+    messages {
+      messageOrder
+      thread { id }
+      iteration {
+        id
+        iterationChainLength
+        hasNextIteration
+        previousIteration { id }
+        parentPrompt { id iterations { id } }
+      }
+    }
+  }
+}
+"""
+
+
+class _GraphQLContext:
+    def __init__(self, user):
+        self.user = user
+
+
+def execute_graphql(user, query):
+    result = schema.execute(query, context_value=_GraphQLContext(user))
+    assert not result.errors, result.errors
+    return result.data
+
+
+def seed_threads(user, threads, iterations_per_thread):
+    for t in range(threads):
+        thread = ConversationThread.objects.create(user=user, title=f'Thread {t}')
+        prompt = PromptHistory.objects.create(user=user, original_prompt=f'Prompt {t}')
+        previous = None
+        for i in range(iterations_per_thread):
+            previous = PromptIteration.objects.create(
+                user=user,
+                parent_prompt=prompt,
+                previous_iteration=previous,
+                iteration_number=i + 1,
+                prompt_text=f'Iteration {i}',
+            )
+            thread.add_iteration(previous)
+
+
+@pytest.mark.django_db
+def test_nested_thread_query_count_is_independent_of_node_count(django_assert_num_queries):
+    user = User.objects.create_user(username='gql', email='gql@example.com', password='pass1234')
+    seed_threads(user, threads=2, iterations_per_thread=2)
+    # threads, messages, threads-by-id, iterations, histories, iterations-by-prompt
+    with django_assert_num_queries(6):
+        execute_graphql(user, NESTED_THREADS_QUERY)
+
+    seed_threads(user, threads=5, iterations_per_thread=4)
+    with django_assert_num_queries(6):
+        data = execute_graphql(user, NESTED_THREADS_QUERY)
+    assert len(data['allConversationThreads']) == 7
+
+
+@pytest.mark.django_db
+def test_annotated_chain_stats_match_model_properties():
+    user = User.objects.create_user(username='chain', email='chain@example.com', password='pass1234')
+    seed_threads(user, threads=1, iterations_per_thread=3)
+    PromptIteration.objects.filter(iteration_number=3).update(is_deleted=True)
+
+    annotated = {it.id: it for it in PromptIteration.objects.with_chain_stats()}
+    for iteration in PromptIteration.objects.all():
+        assert annotated[iteration.id].iteration_chain_length == iteration.iteration_chain_length == 2
+        assert annotated[iteration.id].has_next_iteration == iteration.has_next_iteration
+    assert annotated[PromptIteration.objects.get(iteration_number=1).id].has_next_iteration is True
+    assert annotated[PromptIteration.objects.get(iteration_number=2).id].has_next_iteration is False
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_100_node_nested_query(django_assert_max_num_queries):
+    user = User.objects.create_user(username='bench', email='bench@example.com', password='pass1234')
+    seed_threads(user, threads=10, iterations_per_thread=10)
+
+    with django_assert_max_num_queries(6):
+        start = time.perf_counter()
+        execute_graphql(user, NESTED_THREADS_QUERY)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"100-node nested GraphQL query: {elapsed_ms:.1f}ms")
+
+
+# ==================== GraphQL query cost limits ====================
+
+import json
+from unittest import mock
+
+from graphql import parse, validate, specified_rules
+from django.test import RequestFactory
+
+from apps.prompt_history.complexity import (
+    calculate_query_cost, query_cost_validator, field_timings,
+    FieldTimingMiddleware, CostLimitedGraphQLView,
+)
+
+
+def query_cost(query, variables=None):
+    document = parse(query)
+    operation = document.definitions[0]
+    fragments = {d.name.value: d for d in document.definitions[1:]}
+    return calculate_query_cost(schema.graphql_schema, operation, fragments, variables=variables)
+
+
+def cost_errors(query, max_cost, max_depth=None):
+    rules = tuple(specified_rules) + (query_cost_validator(max_cost, max_depth=max_depth),)
+    return [error.message for error in validate(schema.graphql_schema, parse(query), rules)]
+
+
+def test_query_cost_uses_list_arguments_and_defaults():
+    # the thread list once, then messages resolved once per thread
+    assert query_cost('{ allConversationThreads(limit: 10) { id messages { id } } }') == (11, 3)
+    # iterations resolved once per message: 10 threads * 50 (default list size)
+    assert query_cost(
+        '{ allConversationThreads(limit: 10) { messages { iteration { id } } } }'
+    ) == (511, 4)
+    # schema default limit (50) when the argument is omitted
+    assert query_cost('{ allConversationThreads { id } }') == (1, 2)
+    assert query_cost('{ allConversationThreads { messages { id } } }') == (51, 3)
+
+
+def test_query_cost_uses_variable_defaults_and_fragments():
+    query = """
+    query Threads($n: Int = 4) {
+      allConversationThreads(limit: $n) { ...ThreadFields }
+    }
+    fragment ThreadFields on ConversationThreadType { messages { iteration { id } } }
+    """
+    # 1 + 4 messages + 4 * 50 iterations
+    assert query_cost(query)[0] == 205
+
+
+def test_query_cost_uses_request_variables_and_clamps_list_sizes():
+    query = """
+    query Threads($n: Int = 1) {
+      allConversationThreads(limit: $n) { messages { iteration { id } } }
+    }
+    """
+    literal = '{ allConversationThreads(limit: 100000) { messages { iteration { id } } } }'
+    # the request's value, not the default, clamped to the 100 rows a resolver returns
+    assert query_cost(query)[0] == 51 + 1
+    assert query_cost(query, {'n': 100000})[0] == query_cost(literal)[0] == 1 + 100 + 100 * 50
+    assert query_cost(query, {'n': 4})[0] == 1 + 4 + 4 * 50
+    # null falls back to the schema default, as in the resolver
+    assert query_cost(query, {'n': None})[0] == 1 + 50 + 50 * 50
+    assert query_cost(query.replace(' = 1', ''))[0] == 1 + 50 + 50 * 50
+
+
+@pytest.mark.django_db
+def test_resolvers_clamp_page_size():
+    user = User.objects.create_user(username='pages', email='pages@example.com', password='pass1234')
+    seed_threads(user, threads=3, iterations_per_thread=0)
+    with mock.patch('apps.prompt_history.complexity.MAX_LIST_SIZE', 2):
+        for limit in (100000, None):
+            result = schema.execute(
+                'query Threads($n: Int) { allConversationThreads(limit: $n) { id } }',
+                variable_values={'n': limit}, context_value=_GraphQLContext(user),
+            )
+            assert not result.errors
+            assert len(result.data['allConversationThreads']) == 2
+    result = schema.execute('{ allPromptHistories(limit: -5, offset: -1) { id } }',
+                            context_value=_GraphQLContext(user))
+    assert result.data == {'allPromptHistories': []}
+
+
+def test_pathological_nested_query_is_rejected():
+    query = """
+    {
+      allConversationThreads(limit: 100) {
+        messages {
+          iteration {
+            parentPrompt { iterations { previousIteration { parentPrompt { iterations { id } } } } }
+          }
+        }
+      }
+    }
+    """
+    errors = cost_errors(query, max_cost=5000)
+    assert len(errors) == 1
+    assert 'exceeds the budget of 5000' in errors[0]
+
+
+def test_depth_limit_is_enforced():
+    query = '{ allConversationThreads(limit: 1) { messages { iteration { parentPrompt { id } } } } }'
+    assert cost_errors(query, max_cost=10 ** 6, max_depth=5) == []
+    errors = cost_errors(query, max_cost=10 ** 6, max_depth=4)
+    assert errors == ["'anonymous' exceeds maximum operation depth of 4."]
+
+
+def test_cyclic_fragments_do_not_recurse_forever():
+    query = """
+    { allConversationThreads(limit: 1) { ...A } }
+    fragment A on ConversationThreadType { messages { thread { ...A } } }
+    """
+    errors = cost_errors(query, max_cost=10 ** 6)
+    assert any('Cannot spread fragment' in error for error in errors)
+
+
+@pytest.mark.django_db
+def test_graphql_view_applies_per_user_budget(settings):
+    settings.GRAPHQL_QUERY_COST_LIMITS = {'authenticated': 100, 'staff': 10000}
+    user = User.objects.create_user(username='budget', email='budget@example.com', password='pass1234')
+    view = CostLimitedGraphQLView.as_view(schema=schema, middleware=[])
+    query = '{ allConversationThreads(limit: 10) { messages { iteration { id } } } }'
+
+    def post():
+        request = RequestFactory().post(
+            '/api/graphql/', data=json.dumps({'query': query}), content_type='application/json'
+        )
+        request.user = user
+        response = view(request)
+        return response.status_code, json.loads(response.content)
+
+    status, body = post()
+    assert status == 400
+    assert 'data' not in body
+    assert 'has a cost of 511, which exceeds the budget of 100' in body['errors'][0]['message']
+
+    # moving the page size into a variable doesn't escape the budget
+    query = 'query T($n: Int = 1) { allConversationThreads(limit: $n) { messages { iteration { id } } } }'
+    request = RequestFactory().post(
+        '/api/graphql/', data=json.dumps({'query': query, 'variables': {'n': 100000}}),
+        content_type='application/json'
+    )
+    request.user = user
+    response = view(request)
+    assert response.status_code == 400
+    assert 'has a cost of 5101' in json.loads(response.content)['errors'][0]['message']
+
+    user.is_staff = True
+    status, body = post()
+    assert status == 200
+    assert body['data'] == {'allConversationThreads': []}
+
+
+@pytest.mark.django_db
+def test_field_timing_middleware_records_object_fields():
+    user = User.objects.create_user(username='timing', email='timing@example.com', password='pass1234')
+    seed_threads(user, threads=1, iterations_per_thread=2)
+    field_timings.reset()
+    result = schema.execute(
+        NESTED_THREADS_QUERY,
+        context_value=_GraphQLContext(user),
+        middleware=[FieldTimingMiddleware()],
+    )
+    assert not result.errors
+    stats = field_timings.snapshot()
+    assert stats['Query.allConversationThreads']['count'] == 1
+    assert stats['ThreadMessageType.iteration']['count'] == 2
+    assert 'PromptIterationType.id' not in stats
+
+
+@pytest.mark.slow
+def test_benchmark_cost_validation_overhead():
+    document = parse(NESTED_THREADS_QUERY)
+    rules = tuple(specified_rules)
+    cost_rules = rules + (query_cost_validator(10 ** 9, max_depth=20),)
+    runs = 200
+
+    def timed(rule_set):
+        start = time.perf_counter()
+        for _ in range(runs):
+            validate(schema.graphql_schema, document, rule_set)
+        return (time.perf_counter() - start) * 1000 / runs
+
+    baseline_ms = timed(rules)
+    with_cost_ms = timed(cost_rules)
+    print(f"validation: {baseline_ms:.3f}ms, with cost rule: {with_cost_ms:.3f}ms per request")
+    assert with_cost_ms - baseline_ms < 5
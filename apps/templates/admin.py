@@ -19,6 +19,7 @@ from .models import (
     TemplateUsage, TemplateRating, TemplateBookmark
 )
 from .services.md_ingestion_service import MarkdownIngestionManager
+from .popularity import recalculate_popularity
 
 
 class MarkdownBulkUploadForm(forms.Form):
@@ -436,10 +437,7 @@ class TemplateAdmin(admin.ModelAdmin):
     
     def bulk_update_popularity(self, request, queryset):
         """Bulk update popularity scores"""
-        count = 0
-        for template in queryset:
-            template.update_popularity_score()
-            count += 1
+        count = recalculate_popularity(queryset.values_list('id', flat=True))
         messages.success(request, f'Updated popularity scores for {count} templates')
     bulk_update_popularity.short_description = 'Update popularity scores'
     
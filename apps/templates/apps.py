@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TemplatesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.templates"
+
+    def ready(self):
+        # Queue saved library prompts for the semantic index
+        from . import signals  # noqa: F401
@@ -5,7 +5,6 @@ Handles real-time chat with DeepSeek AI integration matching frontend protocol
 
 import json
 import time
-import asyncio
 import logging
 import uuid
 from typing import Dict, Any, Optional
@@ -18,6 +17,9 @@ from django.core.cache import cache
 from django.utils import timezone as django_timezone
 from django.contrib.auth.models import AnonymousUser
 
+from apps.core.timer_wheel import HeartbeatMixin
+from apps.core.ws_protocol import FrameProtocolMixin
+
 from .deepseek_service import DeepSeekService
 from .langchain_services import get_langchain_service
 from .models import ChatMessage, UserIntent
@@ -25,11 +27,14 @@ from .models import ChatMessage, UserIntent
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(FrameProtocolMixin, HeartbeatMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for Next.js chat frontend
     Matches the WsInbound/WsOutbound protocol from your frontend
     """
+
+    heartbeat_interval = 20
+    idle_timeout = 300
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -38,8 +43,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.user_id = None
         self.deepseek_service = DeepSeekService()
         self.langchain_service = get_langchain_service()
-        self.heartbeat_task = None
-        self.last_activity = time.time()
     
     async def connect(self):
         """Handle WebSocket connection with JWT auth support"""
@@ -53,17 +56,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Accept connection
             await self.accept()
             
-            # Start heartbeat
-            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
-            
             # Send welcome message
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'connection_ack',
                 'session_id': self.session_id,
                 'timestamp': datetime.now().isoformat(),
                 'user_id': str(self.user_id) if self.user_id else None,
                 'authenticated': self.user is not None and not isinstance(self.user, AnonymousUser)
-            }))
+            })
             
             logger.info(f"Chat WebSocket connected: session={self.session_id}, user={self.user_id}")
             
@@ -74,8 +74,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Clean up on disconnect"""
         try:
-            if self.heartbeat_task:
-                self.heartbeat_task.cancel()
             logger.info(f"Chat WebSocket disconnected: session={self.session_id}, code={close_code}")
         except Exception as e:
             logger.error(f"Disconnect cleanup error: {e}")
@@ -83,7 +81,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         """Handle incoming messages matching frontend protocol"""
         start_time = time.time()
-        self.last_activity = start_time
         
         try:
             data = json.loads(text_data)
@@ -130,14 +127,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
             
             # Echo user message back
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'message',
                 'message_id': message_id,
                 'content': content,
                 'role': 'user',
                 'timestamp': user_message.get('timestamp'),
                 'session_id': self.session_id
-            }))
+            })
             
             # Process with AI
             await self._process_ai_response(content, start_time)
@@ -158,10 +155,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 return
             
             # Send typing indicator
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'typing_start',
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Process optimization
             if self.deepseek_service and self.deepseek_service.enabled:
@@ -179,14 +176,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 result = {'error': 'No optimization service available'}
             
             # Stop typing indicator
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'typing_stop',
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Send optimization result
             response_id = str(uuid.uuid4())
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'optimization_result',
                 'message_id': response_id,
                 'original_prompt': prompt,
@@ -197,7 +194,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'processing_time_ms': result.get('processing_time_ms', 0),
                 'timestamp': datetime.now().isoformat(),
                 'session_id': self.session_id
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Optimization error: {e}")
@@ -226,7 +223,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             
             # Send intent analysis
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'intent_result',
                 'query': query,
                 'category': result.get('category', 'general'),
@@ -237,7 +234,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'processing_time_ms': result.get('processing_time_ms', 0),
                 'timestamp': datetime.now().isoformat(),
                 'session_id': self.session_id
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Intent analysis error: {e}")
@@ -269,11 +266,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     async def handle_ping(self, data: Dict[str, Any], start_time: float):
         """Handle ping messages for latency measurement"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'pong',
             'timestamp': datetime.now().isoformat(),
             'latency_ms': int((time.time() - start_time) * 1000)
-        }))
+        })
     
     async def handle_pong(self, data: Dict[str, Any], start_time: float):
         """Handle pong responses"""
@@ -283,38 +280,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     # Helper methods
     async def _authenticate_user(self):
-        """Authenticate user from JWT token"""
-        try:
-            # Check for JWT in query params or headers
-            token = None
-            
-            # Try query params first
-            query_string = self.scope.get('query_string', b'').decode()
-            if 'token=' in query_string:
-                token = query_string.split('token=')[1].split('&')[0]
-            
-            # Try headers
-            if not token:
-                headers = dict(self.scope.get('headers', []))
-                auth_header = headers.get(b'authorization', b'').decode()
-                if auth_header.startswith('Bearer '):
-                    token = auth_header[7:]
-            
-            if token:
-                # Decode and validate JWT (implement your JWT validation)
-                # For now, use the user from scope if available
-                self.user = self.scope.get('user')
-                if self.user and not isinstance(self.user, AnonymousUser):
-                    self.user_id = self.user.id
-                else:
-                    self.user = None
-                    self.user_id = None
-            else:
-                self.user = None
-                self.user_id = None
-                
-        except Exception as e:
-            logger.error(f"Authentication error: {e}")
+        """Take the user authenticated by the handshake (apps.core.ws_auth.JWTAuthMiddleware)"""
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.user = user
+            self.user_id = user.id
+        else:
             self.user = None
             self.user_id = None
     
@@ -322,10 +293,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """Process content with AI and stream response"""
         try:
             # Send typing indicator
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'typing_start',
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Generate AI response
             if self.deepseek_service and self.deepseek_service.enabled:
@@ -335,10 +306,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 ai_content = f"I understand you said: '{content}'. I'm currently using fallback responses as the AI service is not available."
             
             # Stop typing indicator
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'typing_stop',
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Save and send AI message
             response_id = str(uuid.uuid4())
@@ -349,7 +320,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 session_id=self.session_id
             )
             
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'message',
                 'message_id': response_id,
                 'content': ai_content,
@@ -357,7 +328,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'timestamp': ai_message.get('timestamp'),
                 'session_id': self.session_id,
                 'processing_time_ms': int((time.time() - start_time) * 1000)
-            }))
+            })
             
         except Exception as e:
             logger.error(f"AI response error: {e}")
@@ -385,35 +356,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     async def _send_error(self, message: str):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'error',
             'message': message,
             'timestamp': datetime.now().isoformat()
-        }))
-    
-    async def _heartbeat_loop(self):
-        """Send periodic heartbeat messages"""
-        try:
-            while True:
-                await asyncio.sleep(20)  # 20 second intervals
-                
-                # Check if connection is still active
-                if time.time() - self.last_activity > 300:  # 5 minutes timeout
-                    logger.info(f"Connection timeout: {self.session_id}")
-                    await self.close()
-                    break
-                
-                # Send heartbeat
-                await self.send(text_data=json.dumps({
-                    'type': 'heartbeat',
-                    'timestamp': datetime.now().isoformat(),
-                    'session_id': self.session_id
-                }))
-                
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.error(f"Heartbeat error: {e}")
+        })
     
     # Slash command handlers
     async def _handle_intent_command(self, content: str, start_time: float):
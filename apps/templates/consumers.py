@@ -7,6 +7,7 @@ import json
 import time
 import asyncio
 import logging
+import uuid
 from typing import Dict, Any, Optional
 from datetime import datetime
 
@@ -15,6 +16,8 @@ from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.utils import timezone
+from apps.core.timer_wheel import HeartbeatMixin
+from apps.core.ws_protocol import FrameProtocolMixin
 
 from .models import (
     UserIntent, ChatMessage, PromptLibrary, 
@@ -25,7 +28,8 @@ from .langchain_services import langchain_service
 
 # Import RAG streaming service
 try:
-    from apps.ai_services.rag_service_enhanced import StreamingRAGAgent
+    from apps.ai_services.rag_service_enhanced import get_rag_agent as get_streaming_rag_agent
+    from apps.ai_services.rag_service_enhanced import OptimizationRequest as StreamingOptimizationRequest
     RAG_AVAILABLE = True
 except ImportError as e:
     RAG_AVAILABLE = False
@@ -41,11 +45,14 @@ except ImportError as e:
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class PromptChatConsumer(AsyncWebsocketConsumer):
+class PromptChatConsumer(FrameProtocolMixin, HeartbeatMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time prompt optimization chat
     Handles intent processing, search, and AI-powered optimization
     """
+
+    heartbeat_interval = 30
+    idle_timeout = 300
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -60,8 +67,8 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
         self.rag_agent = None
         if RAG_AVAILABLE:
             try:
-                self.rag_agent = StreamingRAGAgent()
-                logger.info("RAG streaming agent initialized successfully")
+                # Shared by every connection in the process; the index loads once
+                self.rag_agent = get_streaming_rag_agent()
             except Exception as e:
                 logger.warning(f"Failed to initialize RAG agent: {e}")
                 self.rag_agent = None
@@ -131,14 +138,14 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 ])
             
             # Send connection confirmation
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'connection_established',
                 'session_id': self.session_id,
                 'timestamp': timezone.now().isoformat(),
                 'capabilities': capabilities,
                 'rag_enabled': self.rag_agent is not None,
                 'deepseek_enabled': self.deepseek_service is not None and self.deepseek_service.enabled
-            }))
+            })
             
             # Log performance
             elapsed_ms = int((time.time() - start_time) * 1000)
@@ -228,7 +235,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 suggestions = await self._get_prompt_suggestions(intent)
                 
                 # Send response
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'intent_processed',
                     'intent_id': str(intent.id),
                     'intent_category': intent.intent_category,
@@ -236,7 +243,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                     'suggestions': suggestions,
                     'processing_time_ms': intent.processing_time_ms,
                     'timestamp': timezone.now().isoformat()
-                }))
+                })
                 
             except Exception as e:
                 logger.error(f"Intent processing error: {e}")
@@ -284,7 +291,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 })
             
             # Send results
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'search_results',
                 'query': query,
                 'results': formatted_results,
@@ -292,7 +299,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 'search_time_ms': metrics.get('total_time_ms', 0),
                 'from_cache': metrics.get('from_cache', False),
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Search error: {e}")
@@ -381,7 +388,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             )
             
             # Send optimized result
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'prompt_optimized',
                 'optimization_id': str(optimization.id),
                 'original_content': original_prompt.content,
@@ -392,7 +399,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 'processing_time_ms': optimization.processing_time_ms,
                 'method': 'langchain',
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Optimization error: {e}")
@@ -412,13 +419,13 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             cached_suggestions = cache.get(cache_key)
             
             if cached_suggestions:
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'suggestions',
                     'input': partial_input,
                     'suggestions': cached_suggestions,
                     'from_cache': True,
                     'timestamp': timezone.now().isoformat()
-                }))
+                })
                 return
             
             # Generate new suggestions
@@ -428,13 +435,13 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             # Cache suggestions
             cache.set(cache_key, suggestions, 60)  # Cache for 1 minute
             
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'suggestions',
                 'input': partial_input,
                 'suggestions': suggestions,
                 'from_cache': False,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Suggestions error: {e}")
@@ -465,7 +472,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             )
             
             # Send response
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'chat_response',
                 'user_message_id': str(message.id),
                 'ai_message_id': str(ai_message.id),
@@ -473,7 +480,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 'confidence': ai_response.get('confidence', 0.0),
                 'suggestions': ai_response.get('suggestions', []),
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Chat message error: {e}")
@@ -492,11 +499,11 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 return
             
             # Send processing status
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'rag_processing_started',
                 'prompt': prompt[:100] + '...' if len(prompt) > 100 else prompt,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
             start_time = time.time()
             
@@ -506,7 +513,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             processing_time = int((time.time() - start_time) * 1000)
             
             # Send optimized result
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'rag_optimized',
                 'original_prompt': prompt,
                 'optimized_prompt': result['optimized_prompt'],
@@ -515,7 +522,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 'processing_time_ms': processing_time,
                 'sources_used': result.get('sources_used', []),
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"RAG optimization error: {e}")
@@ -534,41 +541,49 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 return
             
             # Send streaming start notification
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'rag_stream_started',
                 'prompt': prompt[:100] + '...' if len(prompt) > 100 else prompt,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
             start_time = time.time()
             chunk_count = 0
+            request = StreamingOptimizationRequest(
+                session_id=str(self.session_id or uuid.uuid4()),
+                original=prompt,
+                mode=data.get('mode', 'fast'),
+                context=data.get('context') or {}
+            )
             
-            # Stream optimization updates
-            async for chunk in self.rag_agent.optimize_prompt_stream(prompt):
+            # Stream optimization updates. Optimization chunks carry only
+            # the new text; tokens that arrive while a send is in progress
+            # are merged into the next chunk, so a slow client gets fewer,
+            # larger frames rather than a growing backlog.
+            async for chunk in self.rag_agent.optimize_prompt_stream(request):
                 chunk_count += 1
+                metadata = {k: v for k, v in chunk.items() if k not in ('type', 'delta', 'message', 'run_id')}
                 
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'rag_stream_chunk',
                     'chunk_index': chunk_count,
                     'chunk_type': chunk['type'],
-                    'content': chunk['content'],
-                    'metadata': chunk.get('metadata', {}),
-                    'is_final': chunk.get('is_final', False),
+                    'content': chunk.get('delta', chunk.get('message', '')),
+                    'metadata': metadata,
+                    'run_id': chunk.get('run_id'),
+                    'is_final': chunk['type'] == 'complete',
                     'timestamp': timezone.now().isoformat()
-                }))
-                
-                # Small delay to prevent overwhelming the WebSocket
-                await asyncio.sleep(0.05)
+                })
             
             processing_time = int((time.time() - start_time) * 1000)
             
             # Send completion notification
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'rag_stream_completed',
                 'total_chunks': chunk_count,
                 'processing_time_ms': processing_time,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"RAG streaming error: {e}")
@@ -576,10 +591,10 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
     
     async def handle_ping(self, data: Dict[str, Any]):
         """Handle ping/pong for connection health"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'pong',
             'timestamp': timezone.now().isoformat()
-        }))
+        })
     
     async def handle_rate_response(self, data: Dict[str, Any]):
         """Handle user feedback on AI responses"""
@@ -590,12 +605,12 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             if message_id and rating:
                 await self._update_message_rating(message_id, rating)
                 
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'rating_recorded',
                     'message_id': message_id,
                     'rating': rating,
                     'timestamp': timezone.now().isoformat()
-                }))
+                })
         except Exception as e:
             logger.error(f"Rating error: {e}")
     
@@ -616,11 +631,11 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 return
             
             # Send processing status
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'deepseek_processing',
                 'model': model,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
             start_time = time.time()
             
@@ -650,7 +665,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 )
                 
                 # Send response
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'deepseek_response',
                     'message': {
                         'role': 'assistant',
@@ -663,7 +678,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                     'cost_estimate': response.tokens_used * 0.0014 / 1000,
                     'provider': 'deepseek',
                     'timestamp': timezone.now().isoformat()
-                }))
+                })
             else:
                 await self._send_error(f"DeepSeek chat failed: {response.error}")
                 
@@ -687,12 +702,12 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 return
             
             # Send processing status
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'deepseek_optimization_started',
                 'prompt_preview': prompt[:100] + '...' if len(prompt) > 100 else prompt,
                 'optimization_type': optimization_type,
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
             start_time = time.time()
             
@@ -706,7 +721,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
             processing_time = int((time.time() - start_time) * 1000)
             
             # Send optimized result
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'deepseek_optimization_complete',
                 'original_prompt': prompt,
                 'optimized_prompt': result['optimized_content'],
@@ -717,7 +732,7 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
                 'cost_estimate': result.get('tokens_used', 0) * 0.0014 / 1000,
                 'provider': 'deepseek',
                 'timestamp': timezone.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"DeepSeek optimization error: {e}")
@@ -896,11 +911,11 @@ class PromptChatConsumer(AsyncWebsocketConsumer):
     
     async def _send_error(self, error_message: str):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'error',
             'message': error_message,
             'timestamp': timezone.now().isoformat()
-        }))
+        })
 
 
 # Import Socket.IO compatibility consumer
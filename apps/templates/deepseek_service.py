@@ -30,6 +30,8 @@ except ImportError:
                 return cast(value)
         return value
 
+from apps.core.llm_cache import get_response_cache
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -251,6 +253,14 @@ class DeepSeekService:
             }
         ]
         
+        cache = get_response_cache()
+        cached = await cache.alookup(
+            'intent', self.config.model_chat, query, system=messages[0]["content"],
+            params={"temperature": 0.1, "max_tokens": 300}
+        )
+        if cached.hit:
+            return cached.served()
+        
         response = await self._make_request(
             messages, 
             model=self.config.model_chat,
@@ -261,7 +271,7 @@ class DeepSeekService:
         if response.success:
             try:
                 parsed_data = json.loads(response.content)
-                return {
+                result = {
                     "processed_data": parsed_data,
                     "category": parsed_data.get("category", "general"),
                     "confidence": parsed_data.get("confidence", 0.5),
@@ -272,8 +282,10 @@ class DeepSeekService:
                     "model": response.model
                 }
             except json.JSONDecodeError:
-                # Fallback parsing
+                # Fallback parsing; a guess from unparsed output isn't worth serving again
                 return self._parse_fallback_intent(response.content, query)
+            await cache.astore(cached, result)
+            return result
         else:
             logger.error(f"Intent processing failed: {response.error}")
             return {
@@ -405,6 +417,14 @@ class DeepSeekService:
             {"role": "user", "content": f"Original Prompt: {original_prompt}"}
         ]
         
+        cache = get_response_cache()
+        cached = await cache.alookup(
+            'optimize', self.config.model_coder, original_prompt, system=system_message,
+            params={"temperature": 0.3, "max_tokens": 1500}
+        )
+        if cached.hit:
+            return cached.served()
+        
         # Use the coder model for better structured output
         response = await self._make_request(
             messages,
@@ -416,7 +436,7 @@ class DeepSeekService:
         if response.success:
             try:
                 parsed_data = json.loads(response.content)
-                return {
+                result = {
                     "optimized_content": parsed_data.get("optimized_content", original_prompt),
                     "improvements": parsed_data.get("improvements", []),
                     "rationale": parsed_data.get("rationale", ""),
@@ -428,6 +448,7 @@ class DeepSeekService:
                     "model": response.model
                 }
             except json.JSONDecodeError:
+                # Unparsed output needs review; don't serve it again
                 return {
                     "optimized_content": response.content,
                     "improvements": ["Response parsing issue - manual review recommended"],
@@ -436,6 +457,8 @@ class DeepSeekService:
                     "processing_time_ms": response.response_time_ms,
                     "tokens_used": response.tokens_used
                 }
+            await cache.astore(cached, result)
+            return result
         else:
             return {
                 "optimized_content": original_prompt,
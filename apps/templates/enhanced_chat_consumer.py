@@ -5,7 +5,6 @@ Automatically converts successful chat interactions into reusable templates
 
 import json
 import time
-import asyncio
 import logging
 import uuid
 from typing import Dict, Any, Optional, List, Union
@@ -18,19 +17,29 @@ from django.core.cache import cache
 from django.utils import timezone as django_timezone
 from django.contrib.auth.models import AnonymousUser
 
+from apps.core.timer_wheel import HeartbeatMixin
+from apps.core.ws_protocol import FrameProtocolMixin
+
 from .deepseek_service import DeepSeekService
 from .langchain_services import get_langchain_service
+from .message_writer import (
+    MESSAGE_TYPES, get_chat_persistence_settings, get_message_writer, load_history, message_uuid,
+)
 from .models import ChatMessage, UserIntent
 from ..templates.models import Template, TemplateField, TemplateCategory
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class EnhancedChatConsumer(AsyncWebsocketConsumer):
+class EnhancedChatConsumer(FrameProtocolMixin, HeartbeatMixin, AsyncWebsocketConsumer):
     """
     Enhanced WebSocket consumer with template creation capabilities
     Automatically suggests and creates templates from successful interactions
     """
+
+    heartbeat_interval = 30
+    idle_timeout = 300
+    idle_close_code = 4001
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -39,8 +48,6 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
         self.user_id = None
         self.deepseek_service = DeepSeekService()
         self.langchain_service = get_langchain_service()
-        self.heartbeat_task = None
-        self.last_activity = time.time()
         self.conversation_history = []  # Track conversation for template creation
         self.template_suggestions = []  # Track potential templates
     
@@ -56,22 +63,24 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             # Accept connection
             await self.accept()
             
-            # Start heartbeat
-            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+            # Pick the conversation up where the last connection left it
+            if self.user_id:
+                self.conversation_history = await load_history(self.session_id, self.user_id)
             
             # Send welcome message with template integration info
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'connection_ack',
                 'session_id': self.session_id,
                 'timestamp': datetime.now().isoformat(),
                 'user_id': str(self.user_id) if self.user_id else None,
                 'authenticated': self.user is not None and not isinstance(self.user, AnonymousUser),
+                'restored_messages': len(self.conversation_history),
                 'features': {
                     'template_creation': True,
                     'ai_optimization': self.deepseek_service.enabled if self.deepseek_service else False,
                     'langchain_fallback': self.langchain_service is not None
                 }
-            }))
+            })
             
             logger.info(f"Enhanced Chat WebSocket connected: session={self.session_id}, user={self.user_id}")
             
@@ -86,8 +95,6 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             if len(self.conversation_history) >= 3 and self.user_id:
                 await self._suggest_template_creation()
             
-            if self.heartbeat_task:
-                self.heartbeat_task.cancel()
             logger.info(f"Enhanced Chat WebSocket disconnected: session={self.session_id}, code={close_code}")
         except Exception as e:
             logger.error(f"Disconnect cleanup error: {e}")
@@ -95,7 +102,6 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         """Handle incoming messages with template awareness"""
         start_time = time.time()
-        self.last_activity = start_time
         
         try:
             data = json.loads(text_data)
@@ -144,27 +150,27 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                 'timestamp': datetime.now().isoformat(),
                 'session_id': self.session_id
             }
-            self.conversation_history.append(user_message)
+            self._remember(user_message)
             
             # Save user message
             await self._save_message(**user_message)
             
             # Echo user message back
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'message',
                 'message_id': message_id,
                 'content': content,
                 'role': 'user',
                 'timestamp': user_message['timestamp'],
                 'session_id': self.session_id
-            }))
+            })
             
             # Process with AI and get enhanced response
             ai_response = await self._process_ai_response_enhanced(content, start_time)
             
             # Add AI response to conversation history
             if ai_response:
-                self.conversation_history.append(ai_response)
+                self._remember(ai_response)
             
             # Check if we should suggest template creation
             await self._check_template_opportunity()
@@ -200,7 +206,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             })
             
             if template:
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'template_created',
                     'template': {
                         'id': str(template['id']),
@@ -211,7 +217,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                     },
                     'message': 'Template created successfully!',
                     'timestamp': datetime.now().isoformat()
-                }))
+                })
             else:
                 await self._send_error("Failed to create template")
                 
@@ -245,7 +251,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                 template = await self._create_template_from_data(template_data)
                 
                 if template:
-                    await self.send(text_data=json.dumps({
+                    await self.send_message({
                         'type': 'conversation_template_created',
                         'template': {
                             'id': str(template['id']),
@@ -257,7 +263,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                         },
                         'message': 'Conversation saved as template!',
                         'timestamp': datetime.now().isoformat()
-                    }))
+                    })
                 else:
                     await self._send_error("Failed to save conversation as template")
             else:
@@ -272,12 +278,12 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
         try:
             suggestions = await self._get_intelligent_template_suggestions()
             
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'template_suggestions',
                 'suggestions': suggestions,
                 'conversation_length': len(self.conversation_history),
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
         except Exception as e:
             logger.error(f"Template suggestions error: {e}")
@@ -287,10 +293,10 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
         """Enhanced AI response processing with template awareness"""
         try:
             # Send typing indicator
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'typing_start',
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Get conversation context for better AI responses
             context = self._build_conversation_context()
@@ -314,10 +320,10 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                 ai_content = await self._generate_fallback_response(content, context)
             
             # Stop typing indicator
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'typing_stop',
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Create AI message object
             response_id = str(uuid.uuid4())
@@ -347,7 +353,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             if len(self.template_suggestions) > 0:
                 response_data['template_suggestions'] = self.template_suggestions[-3:]  # Last 3 suggestions
             
-            await self.send(text_data=json.dumps(response_data))
+            await self.send_message(response_data)
             
             return ai_message
             
@@ -366,7 +372,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             analysis = await self._analyze_conversation_for_templates()
             
             if analysis['should_suggest_template']:
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'template_opportunity',
                     'suggestion': {
                         'title': analysis['suggested_title'],
@@ -376,7 +382,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                         'reasoning': analysis['reasoning']
                     },
                     'timestamp': datetime.now().isoformat()
-                }))
+                })
                 
         except Exception as e:
             logger.error(f"Template opportunity check error: {e}")
@@ -589,128 +595,53 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             return "I'm here to help! Could you please rephrase your request?"
     
     async def _handle_authentication(self):
-        """Handle user authentication from JWT token or headers"""
-        try:
-            # Check for token in query parameters (URL)
-            query_string = self.scope.get('query_string', b'').decode('utf-8')
-            token = None
-            
-            # Handle token=undefined case
-            if 'token=undefined' in query_string or 'token=' in query_string:
-                # Extract token from query parameters
-                for param in query_string.split('&'):
-                    if param.startswith('token='):
-                        token_value = param.split('=', 1)[1]
-                        # Skip undefined or empty tokens
-                        if token_value and token_value != 'undefined' and token_value != 'null':
-                            token = token_value
-                        break
-            
-            # Check for token in headers
-            if not token:
-                headers = dict(self.scope.get('headers', []))
-                auth_header = headers.get(b'authorization', b'').decode('utf-8')
-                if auth_header.startswith('Bearer '):
-                    token = auth_header[7:]  # Remove 'Bearer ' prefix
-            
-            if token and token != 'undefined':
-                # Validate JWT token
-                user = await self._validate_jwt_token(token)
-                if user:
-                    self.user = user
-                    self.user_id = user.id
-                    logger.info(f"User authenticated: {user.id}")
-                    return
-            
+        """Take the user authenticated by the handshake (apps.core.ws_auth.JWTAuthMiddleware)"""
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.user = user
+            self.user_id = user.id
+            logger.info(f"User authenticated: {user.id}")
+        else:
             # If no valid token, set as anonymous user
             self.user = AnonymousUser()
             self.user_id = None
             logger.info("Anonymous user connection (no valid token)")
-            
-        except Exception as e:
-            logger.error(f"Authentication error: {e}")
-            self.user = AnonymousUser()
-            self.user_id = None
     
-    @database_sync_to_async
-    def _validate_jwt_token(self, token: str):
-        """Validate JWT token and return user"""
-        try:
-            from rest_framework_simplejwt.tokens import UntypedToken
-            from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-            from django.contrib.auth import get_user_model
-            import jwt
-            from django.conf import settings
-            
-            # Validate the token
-            try:
-                # Decode the token
-                decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                user_id = decoded_token.get('user_id')
-                
-                if user_id:
-                    User = get_user_model()
-                    user = User.objects.get(id=user_id)
-                    return user
-                    
-            except (jwt.InvalidTokenError, jwt.ExpiredSignatureError, User.DoesNotExist):
-                logger.warning("Invalid or expired JWT token")
-                return None
-                
-        except Exception as e:
-            logger.error(f"JWT validation error: {e}")
-            return None
+    def _remember(self, message: Dict[str, Any]):
+        """Add to the conversation, keeping the last HISTORY_WINDOW messages"""
+        self.conversation_history.append(message)
+        del self.conversation_history[:-get_chat_persistence_settings()['HISTORY_WINDOW']]
     
     async def _save_message(self, **message_data):
-        """Save message to database"""
+        """Queue message for the batched writer (apps.templates.message_writer)"""
         try:
             # Only save if we have a user
             if self.user_id:
-                await self._save_message_to_db(message_data)
+                get_message_writer().write(ChatMessage(
+                    id=message_uuid(message_data['id']),
+                    session_id=message_data['session_id'],
+                    user_id=self.user_id,
+                    message_type=MESSAGE_TYPES.get(message_data['role'], message_data['role']),
+                    content=message_data['content'],
+                    delivered_at=django_timezone.now(),
+                ))
         except Exception as e:
             logger.error(f"Message save error: {e}")
     
-    @database_sync_to_async
-    def _save_message_to_db(self, message_data: Dict[str, Any]):
-        """Save message to database (sync operation)"""
-        try:
-            # This is a placeholder - implement based on your ChatMessage model
-            logger.info(f"Would save message: {message_data['content'][:50]}...")
-        except Exception as e:
-            logger.error(f"Database save error: {e}")
-    
     async def _send_error(self, message: str, error_code: str = "GENERAL_ERROR"):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'error',
             'error': error_code,
             'message': message,
             'timestamp': datetime.now().isoformat()
-        }))
-    
-    async def _heartbeat_loop(self):
-        """Maintain connection with periodic heartbeat"""
-        try:
-            while True:
-                await asyncio.sleep(30)  # Send heartbeat every 30 seconds
-                if time.time() - self.last_activity > 300:  # 5 minutes idle
-                    await self.close(code=4001)  # Close idle connection
-                    break
-                    
-                await self.send(text_data=json.dumps({
-                    'type': 'heartbeat',
-                    'timestamp': datetime.now().isoformat()
-                }))
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.error(f"Heartbeat error: {e}")
+        })
     
     async def _suggest_template_creation(self):
         """Suggest template creation when conversation ends"""
         try:
             if len(self.conversation_history) >= 3:
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'template_opportunity',
                     'suggestion': {
                         'title': 'Save This Conversation',
@@ -720,7 +651,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                         'reasoning': 'Long conversation with valuable content'
                     },
                     'timestamp': datetime.now().isoformat()
-                }))
+                })
         except Exception as e:
             logger.error(f"Template suggestion error: {e}")
     
@@ -752,10 +683,10 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
     
     async def handle_ping(self, data: Dict[str, Any], start_time: float):
         """Handle ping messages"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'pong',
             'timestamp': datetime.now().isoformat(),
             'latency_ms': int((time.time() - start_time) * 1000)
-        }))
+        })
     
     # ... (include other necessary methods from original consumer)
\ No newline at end of file
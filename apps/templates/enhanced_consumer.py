@@ -18,9 +18,13 @@ from django.core.cache import cache
 from django.utils import timezone
 from django.contrib.auth.models import AnonymousUser
 
+from apps.core.timer_wheel import HeartbeatMixin
+from apps.core.ws_protocol import FrameProtocolMixin
+
 # Import existing services
 from .deepseek_service import DeepSeekService
 from .langchain_services import get_langchain_service
+from .message_writer import MESSAGE_TYPES, get_message_writer, message_uuid
 from .models import ChatMessage, UserIntent
 
 # Import RAG services
@@ -31,11 +35,14 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
-class EnhancedChatConsumer(AsyncWebsocketConsumer):
+class EnhancedChatConsumer(FrameProtocolMixin, HeartbeatMixin, AsyncWebsocketConsumer):
     """
     Enhanced WebSocket consumer that adds RAG agent capabilities
     while maintaining compatibility with existing chat protocol
     """
+
+    heartbeat_interval = 20
+    idle_timeout = 300
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -45,8 +52,6 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
         self.deepseek_service = DeepSeekService()
         self.langchain_service = get_langchain_service()
         self.rag_agent = get_rag_agent()
-        self.heartbeat_task = None
-        self.last_activity = time.time()
         self.active_agent_runs = {}  # Track running agent sessions
     
     async def connect(self):
@@ -61,11 +66,8 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             # Accept connection
             await self.accept()
             
-            # Start heartbeat
-            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
-            
             # Send welcome message with RAG capabilities
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'connection_ack',
                 'session_id': self.session_id,
                 'timestamp': datetime.now().isoformat(),
@@ -77,7 +79,7 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                     'citations': True,
                     'streaming_optimization': True
                 }
-            }))
+            })
             
             logger.info(f"Enhanced Chat WebSocket connected: session={self.session_id}, user={self.user_id}")
             
@@ -93,9 +95,6 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                 if not task.done():
                     task.cancel()
                     
-            if self.heartbeat_task:
-                self.heartbeat_task.cancel()
-                
             logger.info(f"Enhanced Chat WebSocket disconnected: session={self.session_id}, code={close_code}")
         except Exception as e:
             logger.error(f"Disconnect cleanup error: {e}")
@@ -103,7 +102,6 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         """Handle incoming messages with RAG agent support"""
         start_time = time.time()
-        self.last_activity = start_time
         
         try:
             data = json.loads(text_data)
@@ -153,26 +151,26 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             # Check user credits
             credits_needed = 1 if mode == 'fast' else 3
             if not await self._check_user_credits(credits_needed):
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'agent.error',
                     'run_id': None,
                     'code': 'insufficient_credits',
                     'message': f'Insufficient credits. Need {credits_needed} credits for {mode} mode.'
-                }))
+                })
                 return
             
             # Generate run ID
             run_id = str(uuid.uuid4())
             
             # Send agent.start event
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.start',
                 'run_id': run_id,
                 'session_id': self.session_id,
                 'mode': mode,
                 'budget': budget,
                 'timestamp': datetime.now().isoformat()
-            }))
+            })
             
             # Start optimization task
             task = asyncio.create_task(
@@ -188,12 +186,12 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
         """Run the actual RAG optimization with streaming events"""
         try:
             # Send step event
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.step',
                 'run_id': run_id,
                 'tool': 'retriever',
                 'note': 'Searching knowledge base for relevant context...'
-            }))
+            })
             
             # Simulate some processing time for retrieval
             await asyncio.sleep(0.3)
@@ -208,12 +206,12 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             )
             
             # Send another step event
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.step',
                 'run_id': run_id,
                 'tool': 'optimizer',
                 'note': 'Analyzing prompt and generating optimization...'
-            }))
+            })
             
             # Run the optimization
             result = await self.rag_agent.optimize_prompt(opt_request)
@@ -226,15 +224,15 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             for i, word in enumerate(words):
                 if i % 3 == 0:  # Send every 3 words to simulate streaming
                     content_so_far = ' '.join(words[:i+3])
-                    await self.send(text_data=json.dumps({
+                    await self.send_message({
                         'type': 'agent.token',
                         'run_id': run_id,
                         'content': content_so_far
-                    }))
+                    })
                     await asyncio.sleep(0.05)  # Small delay for streaming effect
             
             # Send citations
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.citations',
                 'run_id': run_id,
                 'citations': [
@@ -247,38 +245,38 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
                     }
                     for c in result.citations
                 ]
-            }))
+            })
             
             # Consume credits
             credits_used = 1 if mode == 'fast' else 3
             await self._consume_user_credits(credits_used, result.usage["tokens_in"], result.usage["tokens_out"])
             
             # Send completion event
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.done',
                 'run_id': run_id,
                 'optimized': result.optimized,
                 'diff_summary': result.diff_summary,
                 'usage': result.usage,
                 'processing_time_ms': int((time.time() - time.time()) * 1000)
-            }))
+            })
             
         except asyncio.CancelledError:
             # Send cancellation event
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.error',
                 'run_id': run_id,
                 'code': 'cancelled',
                 'message': 'Optimization was cancelled'
-            }))
+            })
         except Exception as e:
             logger.error(f"Agent optimization error: {e}")
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'agent.error',
                 'run_id': run_id,
                 'code': 'optimization_failed',
                 'message': 'Optimization failed due to an internal error'
-            }))
+            })
         finally:
             # Clean up
             if run_id in self.active_agent_runs:
@@ -291,10 +289,10 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             task = self.active_agent_runs[run_id]
             if not task.done():
                 task.cancel()
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'agent.cancelled',
                     'run_id': run_id
-                }))
+                })
     
     async def handle_agent_status(self, data: Dict[str, Any], start_time: float):
         """Get status of agent optimizations"""
@@ -306,11 +304,11 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
             for run_id, task in self.active_agent_runs.items()
         ]
         
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'agent.status',
             'active_runs': active_runs,
             'timestamp': datetime.now().isoformat()
-        }))
+        })
     
     @database_sync_to_async
     def _check_user_credits(self, credits_needed: int) -> bool:
@@ -371,8 +369,21 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
     # Include all existing methods from the original ChatConsumer
     async def handle_chat_message(self, data: Dict[str, Any], start_time: float):
         """Handle regular chat messages (existing functionality)"""
+        content = data.get('content', '').strip()
+        if not content:
+            await self._send_error("Message content required")
+            return
+        # Queued for the batched writer (apps.templates.message_writer)
+        if self.user_id:
+            get_message_writer().write(ChatMessage(
+                id=message_uuid(data.get('message_id')),
+                session_id=self.session_id,
+                user_id=self.user_id,
+                message_type=MESSAGE_TYPES['user'],
+                content=content,
+                delivered_at=timezone.now(),
+            ))
         # This would include the existing chat message handling logic
-        pass
     
     async def handle_optimize_prompt(self, data: Dict[str, Any], start_time: float):
         """Handle prompt optimization (existing functionality)"""
@@ -386,10 +397,10 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
     
     async def handle_ping(self, data: Dict[str, Any], start_time: float):
         """Handle ping messages"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'pong',
             'timestamp': datetime.now().isoformat()
-        }))
+        })
     
     async def handle_pong(self, data: Dict[str, Any], start_time: float):
         """Handle pong responses"""
@@ -402,32 +413,8 @@ class EnhancedChatConsumer(AsyncWebsocketConsumer):
     
     async def _send_error(self, message: str):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'error',
             'message': message,
             'timestamp': datetime.now().isoformat()
-        }))
-    
-    async def _heartbeat_loop(self):
-        """Send periodic heartbeat messages"""
-        try:
-            while True:
-                await asyncio.sleep(20)  # 20 second intervals
-                
-                # Check if connection is still active
-                if time.time() - self.last_activity > 300:  # 5 minutes timeout
-                    logger.info(f"Connection timeout: {self.session_id}")
-                    await self.close()
-                    break
-                
-                # Send heartbeat
-                await self.send(text_data=json.dumps({
-                    'type': 'heartbeat',
-                    'timestamp': datetime.now().isoformat(),
-                    'session_id': self.session_id
-                }))
-                
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.error(f"Heartbeat error: {e}")
\ No newline at end of file
+        })
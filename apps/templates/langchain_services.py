@@ -6,15 +6,16 @@ Optimized for high performance with caching and efficient model usage
 import os
 import time
 import json
+import hashlib
 import logging
-import asyncio
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
 
 from django.core.cache import cache
 from django.conf import settings
 
+from apps.core.lazy_imports import lazy_import, modules_available
+
 logger = logging.getLogger(__name__)
 
 # LangChain imports - with comprehensive fallbacks and error handling
@@ -42,18 +43,22 @@ except ImportError as e:
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 
-# Enable LangChain with modern split package architecture (LangChain 0.3.x compatible)
-try:
+# Enable LangChain with modern split package architecture (LangChain 0.3.x compatible),
+# imported on first use
+LANGCHAIN_AVAILABLE = modules_available('langchain_openai', 'langchain_core')
+if LANGCHAIN_AVAILABLE:
     # Use the canonical import paths for LangChain 0.3.x
-    from langchain_openai import ChatOpenAI
-    from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
-    from langchain_core.messages import HumanMessage, SystemMessage
-    LANGCHAIN_AVAILABLE = True
-    logger.info("LangChain 0.3.x loaded (langchain-openai + langchain-core)")
-except ImportError as e:
-    LANGCHAIN_AVAILABLE = False
-    logger.warning(f"LangChain not available: {e} - using fallback implementations")
+    ChatOpenAI = lazy_import('langchain_openai', 'ChatOpenAI')
+    PromptTemplate = lazy_import('langchain_core.prompts', 'PromptTemplate')
+    ChatPromptTemplate = lazy_import('langchain_core.prompts', 'ChatPromptTemplate')
+    HumanMessage = lazy_import('langchain_core.messages', 'HumanMessage')
+    SystemMessage = lazy_import('langchain_core.messages', 'SystemMessage')
+else:
+    logger.warning("LangChain not available - using fallback implementations")
 
+from apps.core.llm_cache import get_response_cache
+
+from .llm_scheduler import BACKGROUND, INTERACTIVE, QueueOverloaded, get_llm_scheduler
 from .models import UserIntent, PromptLibrary
 
 # Import DeepSeek service and mock service as fallbacks
@@ -70,6 +75,12 @@ try:
 except ImportError:
     MockLangChainOptimizationService = None
 
+def intent_cache_key(query: str) -> str:
+    """Same key in every worker, unlike hash(), which is salted per process"""
+    digest = hashlib.blake2b(query.lower().encode('utf-8'), digest_size=16).hexdigest()
+    return f"intent:{digest}"
+
+
 @dataclass
 class OptimizationResult:
     """Result structure for prompt optimization"""
@@ -85,7 +96,9 @@ class LangChainOptimizationService:
     """High-performance LangChain service for intent processing and optimization"""
     
     def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Blocking chain calls run on the process's interactive and background queues
+        self.scheduler = get_llm_scheduler()
+        self.response_cache = get_response_cache()
         self.deepseek_service = None
         self._initialize_services()
         # Initialize memory only if ConversationBufferWindowMemory is available
@@ -147,7 +160,7 @@ class LangChainOptimizationService:
         start_time = time.time()
         
         # Check cache first
-        cache_key = f"intent:{hash(query.lower())}"
+        cache_key = intent_cache_key(query)
         cached_result = cache.get(cache_key)
         if cached_result:
             return cached_result
@@ -197,9 +210,8 @@ class LangChainOptimizationService:
                     }
                 
                 # Run intent classification
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    self.executor,
+                response = await self.scheduler.run(
+                    INTERACTIVE,
                     self._run_intent_classification,
                     intent_prompt,
                     query
@@ -224,6 +236,10 @@ class LangChainOptimizationService:
                 # Ultimate fallback - simple keyword matching
                 return self._simple_intent_classification(query, start_time)
                 
+        except QueueOverloaded as e:
+            # Keyword matching now beats a model answer after the user has moved on
+            logger.warning(f"Intent classification shed: {e}")
+            return self._simple_intent_classification(query, start_time, str(e))
         except Exception as e:
             logger.error(f"Intent processing error: {e}")
             return self._simple_intent_classification(query, start_time, str(e))
@@ -313,14 +329,27 @@ class LangChainOptimizationService:
                     optimization_context, optimization_type
                 )
                 
-                # Run optimization
-                loop = asyncio.get_event_loop()
-                optimized_result = await loop.run_in_executor(
-                    self.executor,
-                    self._run_optimization,
-                    optimization_prompt,
-                    original_prompt.content
+                # Run optimization, unless a close enough prompt was optimized the same way recently
+                cached = await self.response_cache.alookup(
+                    'optimize', getattr(self.optimization_model, 'model_name', 'gpt-4'), original_prompt.content,
+                    system=json.dumps({
+                        "optimization_type": optimization_type,
+                        "intent_category": optimization_context["user_intent"]["category"],
+                        "additional_context": optimization_context["additional_context"],
+                    }, sort_keys=True, default=str)
                 )
+                if cached.hit:
+                    optimized_result = cached.result
+                else:
+                    optimized_result = await self.scheduler.run(
+                        BACKGROUND,
+                        self._run_optimization,
+                        optimization_prompt,
+                        original_prompt.content
+                    )
+                    # Failed runs come back with zero confidence
+                    if optimized_result.get("confidence", 0.8) > 0:
+                        await self.response_cache.astore(cached, optimized_result)
                 
                 processing_time_ms = int((time.time() - start_time) * 1000)
                 
@@ -481,9 +510,8 @@ class LangChainOptimizationService:
             ])
             
             # Generate response
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                self.executor,
+            response = await self.scheduler.run(
+                INTERACTIVE,
                 self._run_response_generation,
                 response_prompt,
                 context
@@ -0,0 +1,233 @@
+"""
+Priority classes for blocking LLM chain invocations.
+
+LangChainOptimizationService used to run every blocking chain call in one
+ThreadPoolExecutor(4), so a burst of deep optimizations left quick intent
+classifications waiting behind them. Calls now go through the process's
+`LLMScheduler`, which keeps a queue per priority class:
+
+    interactive  intent classification and chat responses, someone is waiting
+    background   deep optimizations
+
+Each queue has its own threads (CONCURRENCY), so work in one class never
+occupies the other's, and a deadline (MAX_WAIT_MS) on the time a call may
+spend queued. Load is shed at both ends: a call is refused up front when
+the queue's backlog would keep it waiting past the deadline, and a call
+whose wait ran past the deadline anyway is dropped instead of being run
+for a caller who has likely given up. Either way the caller gets
+`QueueOverloaded` and can fall back.
+
+Queue wait is recorded per class in the log-linear buckets of
+apps.core.metrics; `stats()` reports counts and wait percentiles, and
+`render_prometheus()` adds them to the /metrics endpoint.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from apps.core.metrics import BUCKET_COUNT, bucket_index, format_labels, histogram_lines, percentile
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+DEFAULT_LLM_SCHEDULER_SETTINGS = {
+    'QUEUES': {
+        INTERACTIVE: {'CONCURRENCY': 4, 'MAX_WAIT_MS': 2000},
+        BACKGROUND: {'CONCURRENCY': 2, 'MAX_WAIT_MS': 30000},
+    },
+    # Weight of the latest call in each queue's moving average of run time
+    'EWMA_ALPHA': 0.2,
+}
+
+
+def get_llm_scheduler_settings():
+    configured = getattr(settings, 'LLM_SCHEDULER', {})
+    queues = {name: dict(options) for name, options in DEFAULT_LLM_SCHEDULER_SETTINGS['QUEUES'].items()}
+    for name, options in configured.get('QUEUES', {}).items():
+        queues[name] = {**queues.get(name, {'CONCURRENCY': 1, 'MAX_WAIT_MS': 0}), **options}
+    return {**DEFAULT_LLM_SCHEDULER_SETTINGS, **configured, 'QUEUES': queues}
+
+
+class QueueOverloaded(Exception):
+    """A call was shed because it would wait, or had waited, past its queue's deadline"""
+
+    def __init__(self, queue: str, wait_ms: float, max_wait_ms: float):
+        super().__init__(f"{queue} queue overloaded: {wait_ms:.0f}ms wait exceeds {max_wait_ms:.0f}ms")
+        self.queue = queue
+        self.wait_ms = wait_ms
+        self.max_wait_ms = max_wait_ms
+
+
+class PriorityQueue:
+    """One priority class: its threads, deadline and counters"""
+
+    def __init__(self, name: str, concurrency: int, max_wait_ms: float, ewma_alpha: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_wait = max_wait_ms / 1000 if max_wait_ms else None
+        self.ewma_alpha = ewma_alpha
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'llm-{name}')
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.shed = 0
+        self.run_time = 0.0
+        self.wait_counts = [0] * (BUCKET_COUNT + 1)
+        self.wait_total = 0.0
+
+    def expected_wait(self) -> float:
+        """Seconds a call submitted now would queue, from the backlog and the average run time"""
+        with self._lock:
+            backlog = self.waiting + self.running - self.concurrency + 1
+            return max(0, backlog) / self.concurrency * self.run_time
+
+    def submit(self, fn: Callable, args, kwargs):
+        if self.max_wait is not None:
+            expected = self.expected_wait()
+            if expected > self.max_wait:
+                with self._lock:
+                    self.shed += 1
+                raise QueueOverloaded(self.name, expected * 1000, self.max_wait * 1000)
+        with self._lock:
+            self.waiting += 1
+            self.submitted += 1
+        try:
+            future = self.executor.submit(self._run, time.perf_counter(), fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self.waiting -= 1
+            raise
+        # Cancelled while queued: _run never starts
+        future.add_done_callback(self._forget_if_cancelled)
+        return future
+
+    def _forget_if_cancelled(self, future):
+        if future.cancelled():
+            with self._lock:
+                self.waiting -= 1
+
+    def _run(self, submitted_at: float, fn: Callable, args, kwargs):
+        started_at = time.perf_counter()
+        waited = started_at - submitted_at
+        with self._lock:
+            self.waiting -= 1
+            self.wait_counts[bucket_index(waited)] += 1
+            self.wait_total += waited
+            if self.max_wait is not None and waited > self.max_wait:
+                self.shed += 1
+                raise QueueOverloaded(self.name, waited * 1000, self.max_wait * 1000)
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_time = elapsed if self.completed == 1 else (
+                    self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * self.run_time
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self.wait_counts)
+            stats = {
+                'concurrency': self.concurrency,
+                'waiting': self.waiting,
+                'running': self.running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'shed': self.shed,
+                'avg_run_ms': self.run_time * 1000,
+            }
+        for label, q in (('wait_p50_ms', 0.5), ('wait_p95_ms', 0.95), ('wait_p99_ms', 0.99)):
+            value = percentile(counts, q)
+            stats[label] = value * 1000 if value is not None else None
+        return stats
+
+
+class LLMScheduler:
+    """Per-class queues for blocking LLM calls, shared by the whole process"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or get_llm_scheduler_settings()
+        self.queues = {
+            name: PriorityQueue(name, options['CONCURRENCY'], options['MAX_WAIT_MS'], config['EWMA_ALPHA'])
+            for name, options in config['QUEUES'].items()
+        }
+
+    def submit(self, queue: str, fn: Callable, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on a priority class; returns a concurrent.futures.Future"""
+        return self.queues[queue].submit(fn, args, kwargs)
+
+    async def run(self, queue: str, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a priority class and await its result; raises QueueOverloaded when shed"""
+        return await asyncio.wrap_future(self.submit(queue, fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: queue.stats() for name, queue in self.queues.items()}
+
+    def shutdown(self, wait: bool = True):
+        for queue in self.queues.values():
+            queue.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
+
+
+# (name, type, help, PriorityQueue attribute)
+PROMETHEUS_SAMPLES = (
+    ('llm_queue_concurrency', 'gauge', 'Threads serving the queue.', 'concurrency'),
+    ('llm_queue_waiting', 'gauge', 'Calls queued and not yet started.', 'waiting'),
+    ('llm_queue_running', 'gauge', 'Calls running.', 'running'),
+    ('llm_queue_submitted_total', 'counter', 'Calls accepted into the queue.', 'submitted'),
+    ('llm_queue_completed_total', 'counter', 'Calls that ran to completion or error.', 'completed'),
+    ('llm_queue_shed_total', 'counter', 'Calls refused or dropped past the queue deadline.', 'shed'),
+    ('llm_queue_run_seconds', 'gauge', 'Moving average of call run time.', 'run_time'),
+)
+
+
+def render_prometheus(scheduler: Optional[LLMScheduler] = None) -> str:
+    """The scheduler's queues in Prometheus text format; empty before the first LLM call"""
+    scheduler = scheduler or _scheduler
+    if scheduler is None:
+        return ''
+    queues = sorted(scheduler.queues.items())
+    snapshots = {}
+    for name, queue in queues:
+        with queue._lock:
+            snapshots[name] = (
+                {attribute: getattr(queue, attribute) for _, _, _, attribute in PROMETHEUS_SAMPLES},
+                list(queue.wait_counts),
+                queue.wait_total,
+            )
+
+    lines = []
+    for metric, kind, help_text, attribute in PROMETHEUS_SAMPLES:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, _ in queues:
+            lines.append(f'{metric}{{{format_labels(queue=name)}}} {snapshots[name][0][attribute]}')
+    lines.append('# HELP llm_queue_wait_seconds Time calls spent queued before running.')
+    lines.append('# TYPE llm_queue_wait_seconds histogram')
+    for name, _ in queues:
+        _, counts, total = snapshots[name]
+        lines.extend(histogram_lines('llm_queue_wait_seconds', format_labels(queue=name), counts, total))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.templates.semantic_search import get_semantic_search_settings, index_path, rebuild_prompt_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Embed every active PromptLibrary prompt and write the semantic search index. '
+        'Run after bulk imports; single saves are added by the index_new_prompts task.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=get_semantic_search_settings()['BATCH_SIZE'],
+            help='Prompts embedded per batch (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_prompt_index(batch_size=options['batch_size'])
+        if not count:
+            self.stdout.write('No active prompts to index.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} prompts in {time.perf_counter() - start:.1f}s at {index_path()}'
+        ))
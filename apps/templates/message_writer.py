@@ -0,0 +1,134 @@
+"""
+Batched persistence of WebSocket chat messages.
+
+Chat consumers hand `ChatMessage` rows to the event loop's
+`ChatMessageWriter` and carry on without waiting for the database. The
+writer gathers rows from every connection on the loop and inserts them with
+one bulk_create per FLUSH_MS or BATCH_SIZE rows, whichever comes first
+(apps.core.coalescing), so
+a busy process issues a few INSERTs a second instead of one per message.
+Rows are inserted with ignore_conflicts, so a message ID a client sends
+twice is stored once. A failed batch is retried RETRIES times with
+exponential backoff from RETRY_BACKOFF_MS, then inserted row by row so a
+row the database rejects does not take the rest of the batch with it.
+
+`load_history` restores the last HISTORY_WINDOW messages of a session with
+one query, after flushing what this process still holds for it.
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Dict, List
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from apps.core.coalescing import Coalescer, LoopLocal
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAT_PERSISTENCE_SETTINGS = {
+    'BATCH_SIZE': 200,
+    'FLUSH_MS': 50,
+    # Bulk insert attempts after the first, and the delay before the first retry
+    'RETRIES': 2,
+    'RETRY_BACKOFF_MS': 100,
+    # Messages kept per connection, and restored on reconnect
+    'HISTORY_WINDOW': 50,
+}
+
+# Conversation roles to ChatMessage.message_type
+MESSAGE_TYPES = {'user': 'user', 'assistant': 'ai', 'system': 'system'}
+ROLES = {message_type: role for role, message_type in MESSAGE_TYPES.items()}
+
+
+def get_chat_persistence_settings():
+    return {**DEFAULT_CHAT_PERSISTENCE_SETTINGS, **getattr(settings, 'CHAT_PERSISTENCE', {})}
+
+
+def message_uuid(message_id) -> uuid.UUID:
+    """The message's ID as a UUID, or a new one if the client sent something else"""
+    try:
+        return uuid.UUID(str(message_id))
+    except (TypeError, ValueError):
+        return uuid.uuid4()
+
+
+def _insert(rows: List[ChatMessage]):
+    ChatMessage.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def _insert_each(rows: List[ChatMessage]) -> int:
+    """Insert rows one at a time; returns how many failed"""
+    failed = 0
+    for row in rows:
+        try:
+            _insert([row])
+        except Exception as e:
+            failed += 1
+            logger.error(f"Failed to save chat message {row.id}: {e}")
+    return failed
+
+
+class ChatMessageWriter(Coalescer):
+    """Accumulates ChatMessage rows and writes them in bulk"""
+
+    def write(self, message: ChatMessage):
+        """Queue a row; it is inserted within FLUSH_MS"""
+        self._pending.append(message)
+        config = get_chat_persistence_settings()
+        # One batch at a time, so a session's rows are inserted in order
+        self._queued(config['FLUSH_MS'], len(self._pending) >= config['BATCH_SIZE'])
+
+    async def send_batch(self, rows: List[ChatMessage]):
+        config = get_chat_persistence_settings()
+        for attempt in range(config['RETRIES'] + 1):
+            try:
+                await database_sync_to_async(_insert)(rows)
+                return
+            except Exception as e:
+                logger.warning(f"Failed to save {len(rows)} chat messages (attempt {attempt + 1}): {e}")
+            if attempt < config['RETRIES']:
+                await asyncio.sleep(config['RETRY_BACKOFF_MS'] / 1000 * 2 ** attempt)
+
+        failed = await database_sync_to_async(_insert_each)(rows)
+        if failed:
+            logger.error(f"Dropped {failed} of {len(rows)} chat messages")
+
+
+_writers = LoopLocal(ChatMessageWriter)
+
+
+def get_message_writer() -> ChatMessageWriter:
+    """The running event loop's writer"""
+    return _writers.get()
+
+
+def _recent_messages(session_id: str, user_id, limit: int) -> List[Dict]:
+    rows = (
+        ChatMessage.objects
+        .filter(session_id=session_id, user_id=user_id)
+        .order_by('-created_at')
+        .values('id', 'content', 'message_type', 'created_at')[:limit]
+    )
+    return [
+        {
+            'id': str(row['id']),
+            'content': row['content'],
+            'role': ROLES.get(row['message_type'], row['message_type']),
+            'timestamp': row['created_at'].isoformat(),
+            'session_id': session_id,
+        }
+        for row in list(rows)[::-1]
+    ]
+
+
+async def load_history(session_id: str, user_id) -> List[Dict]:
+    """The session's last HISTORY_WINDOW messages, oldest first, as conversation entries"""
+    await get_message_writer().flush()
+    return await database_sync_to_async(_recent_messages)(
+        session_id, user_id, get_chat_persistence_settings()['HISTORY_WINDOW']
+    )
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, Exists, IntegerField, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.postgres.search import SearchVectorField
@@ -17,6 +19,15 @@ class FieldType(models.TextChoices):
     RADIO = 'radio', 'Radio Buttons'
     NUMBER = 'number', 'Number Input'
 
+class TemplateCategoryQuerySet(models.QuerySet):
+    def with_template_count(self):
+        """Annotate the number of public, active templates in each category"""
+        return self.annotate(annotated_template_count=Count(
+            'templates',
+            filter=Q(templates__is_active=True, templates__is_public=True)
+        ))
+
+
 class TemplateCategory(models.Model):
     """Categories for organizing templates"""
     
@@ -41,6 +52,8 @@ class TemplateCategory(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TemplateCategoryQuerySet.as_manager()
+
     class Meta:
         db_table = 'template_categories'
         ordering = ['order', 'name']
@@ -126,6 +139,58 @@ class PromptField(models.Model):
                 )
 
 
+class TemplateQuerySet(models.QuerySet):
+    def with_field_count(self):
+        """Annotate the number of fields as a subquery, so it composes with other joins"""
+        field_counts = (
+            TemplateField.objects.filter(template=OuterRef('pk'))
+            .order_by().values('template')
+            .annotate(count=Count('id')).values('count')
+        )
+        return self.annotate(annotated_field_count=Coalesce(
+            Subquery(field_counts, output_field=IntegerField()), Value(0)
+        ))
+
+    def with_user_state(self, user):
+        """Annotate whether `user` bookmarked each template and the rating they gave it"""
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                annotated_is_bookmarked=Value(False),
+                annotated_user_rating=Value(None, output_field=IntegerField()),
+            )
+        return self.annotate(
+            annotated_is_bookmarked=Exists(
+                TemplateBookmark.objects.filter(template=OuterRef('pk'), user=user)
+            ),
+            annotated_user_rating=Subquery(
+                TemplateRating.objects.filter(template=OuterRef('pk'), user=user).values('rating')[:1],
+                output_field=IntegerField()
+            ),
+        )
+
+    def with_fields(self):
+        """Prefetch fields in display order"""
+        return self.prefetch_related(
+            Prefetch('fields', queryset=PromptField.objects.order_by('order', 'created_at'))
+        )
+
+    def for_list(self, user=None):
+        """
+        Everything TemplateListSerializer reads, in a fixed number of queries.
+
+        The category is prefetched rather than joined so that each distinct
+        category on the page is loaded once with its template count.
+        """
+        return (
+            self.select_related('author')
+            .prefetch_related(
+                Prefetch('category', queryset=TemplateCategory.objects.with_template_count())
+            )
+            .with_field_count()
+            .with_user_state(user)
+        )
+
+
 class Template(models.Model):
     """Main template model with all features"""
     
@@ -317,6 +382,8 @@ class Template(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TemplateQuerySet.as_manager()
+
     class Meta:
         db_table = 'templates'
         ordering = ['-created_at']
@@ -334,37 +401,23 @@ class Template(models.Model):
     @property
     def field_count(self):
         """Get number of fields in this template"""
+        annotated = getattr(self, 'annotated_field_count', None)
+        if annotated is not None:
+            return annotated
         return self.fields.count()
 
     def update_popularity_score(self):
-        """Calculate and update popularity score based on various metrics"""
-        # Weighted calculation of popularity
-        usage_weight = 0.4
-        rating_weight = 0.3
-        completion_weight = 0.2
-        recency_weight = 0.1
-        
-        # Normalize usage count (assuming max of 1000 uses)
-        usage_score = min(self.usage_count / 1000.0, 1.0)
-        
-        # Rating score (0-5 to 0-1)
-        rating_score = self.average_rating / 5.0
-        
-        # Completion rate is already 0-1
-        completion_score = self.completion_rate
-        
-        # Recency score based on creation date
-        from django.utils import timezone
-        days_old = (timezone.now() - self.created_at).days
-        recency_score = max(0, 1 - (days_old / 365.0))  # Decay over a year
-        
-        self.popularity_score = (
-            usage_score * usage_weight +
-            rating_score * rating_weight +
-            completion_score * completion_weight +
-            recency_score * recency_weight
-        ) * 100  # Scale to 0-100
-        
+        """
+        Synchronously calculate and save the popularity score.
+
+        Only for admin actions and seeding; request paths should call
+        popularity.mark_popularity_dirty() and let the periodic task batch it
+        (or recompute on commit where no task runs).
+        """
+        from .popularity import compute_popularity_score
+        self.popularity_score = compute_popularity_score(
+            self.usage_count, self.average_rating, self.completion_rate, self.created_at
+        )
         self.save(update_fields=['popularity_score'])
 
 
@@ -588,18 +641,11 @@ class TemplateRating(models.Model):
         return round((self.helpful_votes / self.total_votes) * 100, 1)
 
     def save(self, *args, **kwargs):
-        """Override save to update template average rating"""
+        """Override save to queue the template's rating and popularity recalculation"""
         super().save(*args, **kwargs)
         
-        # Update template's average rating
-        from django.db.models import Avg
-        avg_rating = self.template.ratings.aggregate(avg=Avg('rating'))['avg']
-        if avg_rating:
-            self.template.average_rating = round(avg_rating, 2)
-            self.template.save(update_fields=['average_rating'])
-            
-            # Update popularity score
-            self.template.update_popularity_score()
+        from .popularity import mark_popularity_dirty
+        mark_popularity_dirty(self.template_id)
 
 
 class TemplateBookmark(models.Model):
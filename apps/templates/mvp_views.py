@@ -11,7 +11,7 @@ from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db.models import Q, Count, Avg
+from django.db.models import Q, Avg
 from django.utils import timezone
 import logging
 
@@ -45,9 +45,7 @@ class MVPTemplateCategoryViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         """Optimize queryset with annotations"""
-        return self.queryset.annotate(
-            template_count=Count('templates', filter=Q(templates__is_active=True, templates__is_public=True))
-        )
+        return self.queryset.with_template_count()
 
     @action(detail=True, methods=['get'])
     def templates(self, request, pk=None):
@@ -58,7 +56,7 @@ class MVPTemplateCategoryViewSet(viewsets.ReadOnlyModelViewSet):
                 category=category,
                 is_active=True,
                 is_public=True
-            ).select_related('author', 'category').order_by('-created_at')
+            ).for_list(request.user).order_by('-created_at')
             
             # Paginate results
             page = self.paginate_queryset(templates)
@@ -97,10 +95,10 @@ class MVPTemplateViewSet(viewsets.ModelViewSet):
         """Optimize queryset based on user and action"""
         queryset = Template.objects.filter(is_active=True)
         
-        # Optimize database queries
-        queryset = queryset.select_related('author', 'category').prefetch_related('fields')
-        
+        # Optimize database queries: list rows read annotations instead of
+        # per-template counts, other actions serialize the ordered fields
         if self.action == 'list':
+            queryset = queryset.for_list(self.request.user)
             # Show public templates unless user requests their own
             if self.request.query_params.get('my_templates') == 'true':
                 if self.request.user.is_authenticated:
@@ -109,6 +107,8 @@ class MVPTemplateViewSet(viewsets.ModelViewSet):
                     queryset = queryset.none()
             else:
                 queryset = queryset.filter(is_public=True)
+        else:
+            queryset = queryset.select_related('author', 'category').with_fields()
         
         return queryset
 
@@ -228,7 +228,7 @@ def mvp_search_templates(request):
             templates = templates.filter(category_id=category_id)
         
         # Order by relevance (usage count for now)
-        templates = templates.select_related('author', 'category').order_by('-usage_count', '-created_at')
+        templates = templates.for_list(request.user).order_by('-usage_count', '-created_at')
         
         # Apply pagination
         paginator = MVPPagination()
@@ -264,7 +264,7 @@ def mvp_featured_templates(request):
             is_active=True,
             is_public=True,
             is_featured=True
-        ).select_related('author', 'category').order_by('-created_at')[:10]
+        ).for_list(request.user).order_by('-created_at')[:10]
         
         serializer = TemplateListSerializer(templates, many=True, context={'request': request})
         
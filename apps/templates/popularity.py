@@ -0,0 +1,197 @@
+"""
+Deferred popularity recalculation for templates.
+
+Usage and rating events only record the template ID in a dirty set (see
+apps.core.dirty_set). The periodic `recalculate_dirty_popularity` task
+drains the set and recomputes average rating, completion rate and
+popularity score for each batch with one aggregate query and one multi-row
+UPDATE, instead of several aggregates and UPDATEs per event.
+
+That needs a beat and worker running the task (PERIODIC_TASKS_ENABLED) and
+a set they share (Redis). Without either, events recompute their template
+once the transaction commits.
+"""
+
+import logging
+import sqlite3
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, FloatField, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.core.dirty_set import DirtySet
+
+logger = logging.getLogger(__name__)
+
+DIRTY_SET_KEY = 'templates:popularity:dirty'
+DEFAULT_BATCH_SIZE = 1000
+
+USAGE_WEIGHT = 0.4
+RATING_WEIGHT = 0.3
+COMPLETION_WEIGHT = 0.2
+RECENCY_WEIGHT = 0.1
+
+_dirty = DirtySet(DIRTY_SET_KEY)
+_local_dirty = _dirty.local
+
+
+def compute_popularity_score(usage_count, average_rating, completion_rate, created_at, now=None):
+    """Weighted 0-100 score from usage, rating, completion rate and recency"""
+    now = now or timezone.now()
+    # Normalize usage count (assuming max of 1000 uses)
+    usage_score = min(usage_count / 1000.0, 1.0)
+    # Rating score (0-5 to 0-1)
+    rating_score = average_rating / 5.0
+    # Recency score decays over a year
+    days_old = (now - created_at).days
+    recency_score = max(0, 1 - (days_old / 365.0))
+
+    return (
+        usage_score * USAGE_WEIGHT +
+        rating_score * RATING_WEIGHT +
+        completion_rate * COMPLETION_WEIGHT +
+        recency_score * RECENCY_WEIGHT
+    ) * 100
+
+
+def _add_dirty(template_ids):
+    _dirty.add(template_ids)
+
+
+def deferred_recalculation():
+    """Whether the periodic task will pick up dirty templates"""
+    return getattr(settings, 'PERIODIC_TASKS_ENABLED', False) and _dirty.is_shared()
+
+
+def mark_popularity_dirty(*template_ids):
+    """Queue templates for the next popularity recalculation once the transaction commits"""
+    if deferred_recalculation():
+        _dirty.add_on_commit(template_ids)
+        return
+    template_ids = [value for value in template_ids if value]
+    if template_ids:
+        transaction.on_commit(lambda: recalculate_popularity(template_ids))
+
+
+def pop_dirty_templates(count):
+    """Atomically remove and return up to `count` dirty template IDs"""
+    return _dirty.pop(count)
+
+
+def dirty_template_count():
+    return _dirty.count()
+
+
+def recalculate_popularity(template_ids):
+    """
+    Recompute rating, completion rate and popularity for the given templates.
+
+    Uses one SELECT with per-template aggregate subqueries and one multi-row
+    UPDATE. Returns the number of templates updated.
+    """
+    from .models import Template, TemplateRating, TemplateUsage
+
+    template_ids = list(template_ids)
+    if not template_ids:
+        return 0
+
+    rating_avg = (
+        TemplateRating.objects.filter(template=OuterRef('pk'))
+        .order_by().values('template')
+        .annotate(avg=Avg('rating')).values('avg')
+    )
+    usage_counts = (
+        TemplateUsage.objects.filter(template=OuterRef('pk'))
+        .order_by().values('template')
+    )
+    total_usages = usage_counts.annotate(total=Count('id')).values('total')
+    completed_usages = usage_counts.annotate(
+        completed=Count('id', filter=Q(was_completed=True))
+    ).values('completed')
+
+    templates = list(
+        Template.objects.filter(pk__in=template_ids)
+        .only('id', 'usage_count', 'average_rating', 'completion_rate', 'created_at')
+        .annotate(
+            rating_avg=Subquery(rating_avg, output_field=FloatField()),
+            total_usages=Coalesce(Subquery(total_usages, output_field=IntegerField()), Value(0)),
+            completed_usages=Coalesce(Subquery(completed_usages, output_field=IntegerField()), Value(0)),
+        )
+    )
+
+    now = timezone.now()
+    for template in templates:
+        if template.rating_avg is not None:
+            template.average_rating = round(template.rating_avg, 2)
+        if template.total_usages:
+            template.completion_rate = template.completed_usages / template.total_usages
+        template.popularity_score = compute_popularity_score(
+            template.usage_count, template.average_rating,
+            template.completion_rate, template.created_at, now
+        )
+
+    _write_scores(Template, templates)
+    return len(templates)
+
+
+def _write_scores(model, templates):
+    """
+    Persist recalculated scores in one statement.
+
+    bulk_update builds a CASE/WHEN expression per row in Python, which
+    dominates at thousands of rows per batch; PostgreSQL and SQLite >= 3.33
+    join a VALUES list instead. Other backends fall back to bulk_update.
+    """
+    fields = ['average_rating', 'completion_rate', 'popularity_score']
+    if not templates:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk_field = model._meta.pk
+    params = []
+    for template in templates:
+        params.extend([
+            pk_field.get_db_prep_value(template.pk, connection),
+            template.average_rating, template.completion_rate, template.popularity_score,
+        ])
+
+    if connection.vendor == 'postgresql':
+        rows = ', '.join(['(%s::uuid, %s::double precision, %s::double precision, %s::double precision)'] * len(templates))
+        sql = (
+            f"UPDATE {table} AS t SET average_rating = v.average_rating, "
+            f"completion_rate = v.completion_rate, popularity_score = v.popularity_score "
+            f"FROM (VALUES {rows}) AS v(id, average_rating, completion_rate, popularity_score) "
+            f"WHERE t.id = v.id"
+        )
+    elif connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 33):
+        rows = ', '.join(['(%s, %s, %s, %s)'] * len(templates))
+        sql = (
+            f"UPDATE {table} SET average_rating = v.column2, "
+            f"completion_rate = v.column3, popularity_score = v.column4 "
+            f"FROM (VALUES {rows}) AS v WHERE {table}.id = v.column1"
+        )
+    else:
+        model.objects.bulk_update(templates, fields)
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def recalculate_dirty_templates(batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """Drain the dirty set in batches; returns the number of templates updated"""
+    updated = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        template_ids = pop_dirty_templates(batch_size)
+        if not template_ids:
+            break
+        try:
+            updated += recalculate_popularity(template_ids)
+        except Exception:
+            # Put the batch back so the next run retries it
+            _add_dirty(template_ids)
+            raise
+        batches += 1
+    return updated
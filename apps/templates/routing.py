@@ -1,26 +1,32 @@
 """
 WebSocket URL routing for real-time prompt optimization chat
+
+Consumers are imported on their route's first connection (apps.core.lazy_routing).
 """
 
 from django.urls import re_path, path
-from . import consumers
-from .chat_consumer import ChatConsumer
-from .enhanced_consumer import EnhancedChatConsumer
+
+from apps.core.lazy_routing import lazy_consumer
+
+EnhancedChatConsumer = lazy_consumer('apps.templates.enhanced_consumer.EnhancedChatConsumer')
+ChatConsumer = lazy_consumer('apps.templates.chat_consumer.ChatConsumer')
+PromptChatConsumer = lazy_consumer('apps.templates.consumers.PromptChatConsumer')
+SocketIOCompatibilityConsumer = lazy_consumer('apps.templates.socketio_consumer.SocketIOCompatibilityConsumer')
 
 websocket_urlpatterns = [
     # Enhanced Chat WebSocket with RAG agent support (primary)
-    path('ws/chat/<str:session_id>/', EnhancedChatConsumer.as_asgi()),
-    re_path(r'ws/chat/(?P<session_id>[a-zA-Z0-9_-]+)/$', EnhancedChatConsumer.as_asgi()),
+    path('ws/chat/<str:session_id>/', EnhancedChatConsumer),
+    re_path(r'ws/chat/(?P<session_id>[a-zA-Z0-9_-]+)/$', EnhancedChatConsumer),
     
     # Standard Chat WebSocket (fallback)
-    path('ws/chat-basic/<str:session_id>/', ChatConsumer.as_asgi()),
-    re_path(r'ws/chat-basic/(?P<session_id>[a-zA-Z0-9_-]+)/$', ChatConsumer.as_asgi()),
+    path('ws/chat-basic/<str:session_id>/', ChatConsumer),
+    re_path(r'ws/chat-basic/(?P<session_id>[a-zA-Z0-9_-]+)/$', ChatConsumer),
     
     # Legacy prompt optimization chat
-    path('ws/prompt-chat/<str:session_id>/', consumers.PromptChatConsumer.as_asgi()),
-    re_path(r'ws/prompt-chat/(?P<session_id>[a-zA-Z0-9_-]+)/$', consumers.PromptChatConsumer.as_asgi()),
+    path('ws/prompt-chat/<str:session_id>/', PromptChatConsumer),
+    re_path(r'ws/prompt-chat/(?P<session_id>[a-zA-Z0-9_-]+)/$', PromptChatConsumer),
     
     # Socket.IO compatibility endpoints
-    path('socket.io/', consumers.SocketIOCompatibilityConsumer.as_asgi()),
-    re_path(r'socket\.io/.*', consumers.SocketIOCompatibilityConsumer.as_asgi()),
-]
\ No newline at end of file
+    path('socket.io/', SocketIOCompatibilityConsumer),
+    re_path(r'socket\.io/.*', SocketIOCompatibilityConsumer),
+]
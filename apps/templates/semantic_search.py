@@ -0,0 +1,544 @@
+"""
+Embedding search over the prompt library.
+
+Each active PromptLibrary row is embedded with the research agent's MiniLM
+model (research_agent.embeddings.get_embedder) and stored as one row of a
+float32 matrix on disk, next to an approximate nearest-neighbour index:
+
+- hnswlib's HNSW graph, or FAISS's when only FAISS is installed
+- otherwise an inverted file (IVF) in NumPy: spherical k-means lists, of
+  which the IVF_NPROBE nearest to the query are scanned
+
+The ANN index only proposes candidates; they are re-scored exactly against
+the matrix. Below EXACT_BELOW prompts the whole matrix is scanned instead.
+
+`build_prompt_index` command (or rebuild_prompt_index) writes the index.
+Saving a prompt marks it dirty (see signals.py) and the periodic
+`index_new_prompts` task embeds the dirty prompts and adds them in place;
+web processes pick the new files up on their next search. The worker
+writes and the web processes read the same INDEX_DIR, so where they run in
+separate containers it has to be a volume both mount.
+
+Hybrid search fuses the vector ranking with the full-text ranking of
+search_services by reciprocal rank fusion.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.dirty_set import DirtySet
+from apps.core.lazy_imports import lazy_import, modules_available
+from apps.core.vector_index import normalize_rows, replacing_directory, top_k_indices
+
+# Imported when an index is first built or loaded
+HNSWLIB_AVAILABLE = modules_available('hnswlib')
+hnswlib = lazy_import('hnswlib') if HNSWLIB_AVAILABLE else None
+
+FAISS_AVAILABLE = modules_available('faiss')
+faiss = lazy_import('faiss') if FAISS_AVAILABLE else None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEMANTIC_SEARCH_SETTINGS = {
+    # Defaults to BASE_DIR/semantic_index
+    'INDEX_DIR': '',
+    # 'auto' (hnswlib, then faiss, then ivf), 'hnswlib', 'faiss', 'ivf' or 'exact'
+    'BACKEND': 'auto',
+    # Scan the whole matrix below this many prompts
+    'EXACT_BELOW': 20000,
+    'HNSW_M': 16,
+    'HNSW_EF_CONSTRUCTION': 200,
+    'HNSW_EF_SEARCH': 64,
+    # 0 for 4 * sqrt(number of prompts)
+    'IVF_LISTS': 0,
+    'IVF_NPROBE': 32,
+    # Results taken from each ranking before fusion
+    'CANDIDATES': 50,
+    'RRF_K': 60,
+    'BATCH_SIZE': 256,
+    'MAX_TEXT_CHARS': 2000,
+    # How often web processes look for a newer index on disk
+    'RELOAD_CHECK_S': 10,
+}
+
+EMBEDDED_FIELDS = {'title', 'content', 'category', 'tags'}
+
+DIRTY_SET_KEY = 'templates:semantic_index:dirty'
+SUGGESTIONS_CACHE_TIMEOUT = 300
+
+_dirty = DirtySet(DIRTY_SET_KEY)
+
+
+def get_semantic_search_settings():
+    return {**DEFAULT_SEMANTIC_SEARCH_SETTINGS, **getattr(settings, 'SEMANTIC_SEARCH', {})}
+
+
+def index_path() -> Path:
+    config = get_semantic_search_settings()
+    return Path(config['INDEX_DIR'] or Path(settings.BASE_DIR) / 'semantic_index')
+
+
+def mark_prompt_dirty(*prompt_ids):
+    """Queue prompts for embedding once the transaction commits"""
+    _dirty.add_on_commit(prompt_ids)
+
+
+def prompt_text(title, content, category='', tags=()) -> str:
+    """The text embedded for a prompt"""
+    text = f"{title}\n{category} {' '.join(tags or [])}\n{content}"
+    return text[:get_semantic_search_settings()['MAX_TEXT_CHARS']]
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Normalized float32 embeddings, one row per text"""
+    from research_agent.embeddings import get_embedder
+
+    vectors = get_embedder().encode(
+        texts,
+        batch_size=get_semantic_search_settings()['BATCH_SIZE'],
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+class IVFLists:
+    """Inverted file in NumPy: spherical k-means centroids and each row's list"""
+
+    name = 'ivf'
+    ITERATIONS = 10
+    SAMPLE_PER_LIST = 32
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, config: Dict):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.nprobe = config['IVF_NPROBE']
+        self._lists = None
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, config: Dict) -> 'IVFLists':
+        rng = np.random.default_rng(0)
+        nlist = min(config['IVF_LISTS'] or max(1, int(4 * np.sqrt(len(vectors)))), len(vectors))
+        sample = np.asarray(vectors[np.sort(rng.choice(
+            len(vectors), min(len(vectors), nlist * cls.SAMPLE_PER_LIST), replace=False
+        ))])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(cls.ITERATIONS):
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, np.argmax(sample @ centroids.T, axis=1), sample)
+            # Keep the old centroid of a list that lost all its members
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+
+        lists = cls(centroids, np.zeros(0, dtype=np.int32), config)
+        lists.add(np.arange(len(vectors)), vectors)
+        return lists
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        needed = int(rows.max()) + 1
+        if needed > len(self.assignments):
+            grown = np.full(max(needed, 2 * len(self.assignments)), -1, dtype=np.int32)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        for start in range(0, len(rows), 8192):
+            batch = np.asarray(vectors[start:start + 8192])
+            self.assignments[rows[start:start + 8192]] = np.argmax(batch @ self.centroids.T, axis=1)
+        self._lists = None
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        lists = self._lists
+        if lists is None:
+            # Rows grouped by list; rebuilt on the first search after an add
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            lists = self._lists = (order, bounds)
+        order, bounds = lists
+        probes = top_k_indices(self.centroids @ query, self.nprobe)
+        return np.concatenate([order[bounds[probe]:bounds[probe + 1]] for probe in probes])
+
+    def save(self, path: Path):
+        np.save(path / 'ivf_centroids.npy', self.centroids)
+        np.save(path / 'ivf_assignments.npy', self.assignments)
+
+    @classmethod
+    def load(cls, path: Path, dim: int, config: Dict) -> 'IVFLists':
+        return cls(np.load(path / 'ivf_centroids.npy'), np.load(path / 'ivf_assignments.npy'), config)
+
+
+class HNSWGraph:
+    """hnswlib HNSW graph over inner product; labels are matrix rows"""
+
+    name = 'hnswlib'
+
+    def __init__(self, index, config: Dict):
+        self.index = index
+        self.ef_search = config['HNSW_EF_SEARCH']
+        self.index.set_ef(self.ef_search)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, config: Dict) -> 'HNSWGraph':
+        index = hnswlib.Index(space='ip', dim=vectors.shape[1])
+        index.init_index(
+            max_elements=max(1024, len(vectors)), M=config['HNSW_M'], ef_construction=config['HNSW_EF_CONSTRUCTION']
+        )
+        graph = cls(index, config)
+        graph.add(np.arange(len(vectors)), vectors)
+        return graph
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        needed = int(rows.max()) + 1
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+        # Existing labels are updated in place
+        self.index.add_items(np.asarray(vectors), rows)
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, self.index.get_current_count())
+        if k > self.ef_search:
+            self.index.set_ef(k)
+        labels, _ = self.index.knn_query(query, k=k)
+        return labels[0].astype(np.int64)
+
+    def save(self, path: Path):
+        self.index.save_index(str(path / 'hnsw.bin'))
+
+    @classmethod
+    def load(cls, path: Path, dim: int, config: Dict) -> 'HNSWGraph':
+        index = hnswlib.Index(space='ip', dim=dim)
+        index.load_index(str(path / 'hnsw.bin'))
+        return cls(index, config)
+
+
+class FaissHNSW:
+    """
+    FAISS HNSW graph over inner product. FAISS cannot move a vector already
+    in the graph, so an edited prompt keeps its old position until the next
+    rebuild (its score is still computed from the new vector).
+    """
+
+    name = 'faiss'
+
+    def __init__(self, index, config: Dict):
+        self.index = index
+        self.ef_search = config['HNSW_EF_SEARCH']
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, config: Dict) -> 'FaissHNSW':
+        index = faiss.IndexHNSWFlat(vectors.shape[1], config['HNSW_M'], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config['HNSW_EF_CONSTRUCTION']
+        graph = cls(index, config)
+        graph.add(np.arange(len(vectors)), vectors)
+        return graph
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        # New rows are numbered in order, as FAISS numbers what it is given
+        new = rows >= self.index.ntotal
+        if new.any():
+            self.index.add(np.ascontiguousarray(np.asarray(vectors)[new]))
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        self.index.hnsw.efSearch = max(k, self.ef_search)
+        _, labels = self.index.search(query.reshape(1, -1), k)
+        return labels[0][labels[0] >= 0]
+
+    def save(self, path: Path):
+        faiss.write_index(self.index, str(path / 'faiss.index'))
+
+    @classmethod
+    def load(cls, path: Path, dim: int, config: Dict) -> 'FaissHNSW':
+        return cls(faiss.read_index(str(path / 'faiss.index')), config)
+
+
+ANN_BACKENDS = {
+    'hnswlib': (HNSWGraph, HNSWLIB_AVAILABLE),
+    'faiss': (FaissHNSW, FAISS_AVAILABLE),
+    'ivf': (IVFLists, True),
+}
+
+
+def _backend_name(config: Dict) -> Optional[str]:
+    """The ANN backend to build, or None for exact search only"""
+    backend = config['BACKEND']
+    if backend == 'exact':
+        return None
+    if backend == 'auto':
+        return next(name for name, (_, available) in ANN_BACKENDS.items() if available)
+    if not ANN_BACKENDS[backend][1]:
+        logger.warning(f"Semantic search backend {backend} is not installed; using ivf")
+        return 'ivf'
+    return backend
+
+
+class PromptVectorIndex:
+    """
+    Prompt embeddings and their ANN index, stored as a directory:
+
+    - ids.npy: prompt IDs, one per matrix row
+    - vectors.npy: the normalized float32 embedding matrix
+    - meta.json: dimension and ANN backend
+    - the backend's own files
+    """
+
+    def __init__(self, dim: int, ids: Sequence[str] = (), vectors: np.ndarray = None, ann=None):
+        self.dim = dim
+        self.ids = list(ids)
+        self._rows = {prompt_id: row for row, prompt_id in enumerate(self.ids)}
+        self._vectors = vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        self.ann = ann
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.ids)]
+
+    @classmethod
+    def build(cls, ids: Sequence, vectors: np.ndarray) -> 'PromptVectorIndex':
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = cls(vectors.shape[1])
+        index.add(ids, vectors)
+        return index
+
+    def _reserve(self, count: int):
+        # A loaded matrix is a read-only memory map until the first add
+        if count > len(self._vectors) or not self._vectors.flags.writeable:
+            grown = np.zeros((max(count, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:len(self._vectors)] = self._vectors
+            self._vectors = grown
+
+    def add(self, ids: Sequence, vectors: np.ndarray):
+        """Add prompts, or replace the vectors of ones already indexed"""
+        latest = dict(zip((str(prompt_id) for prompt_id in ids), range(len(ids))))
+        if not latest:
+            return
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32)[list(latest.values())])
+
+        rows = np.empty(len(latest), dtype=np.int64)
+        for i, prompt_id in enumerate(latest):
+            row = self._rows.get(prompt_id)
+            if row is None:
+                row = self._rows[prompt_id] = len(self.ids)
+                self.ids.append(prompt_id)
+            rows[i] = row
+        self._reserve(len(self.ids))
+        self._vectors[rows] = vectors
+
+        config = get_semantic_search_settings()
+        if self.ann is not None:
+            self.ann.add(rows, vectors)
+        elif len(self) >= config['EXACT_BELOW'] and (backend := _backend_name(config)):
+            self.ann = ANN_BACKENDS[backend][0].train(self.vectors, config)
+
+    def search(self, query_vector: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """(prompt ID, cosine similarity) of the k nearest prompts, best first"""
+        if not self.ids:
+            return []
+        config = get_semantic_search_settings()
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+
+        if self.ann is None or len(self) < config['EXACT_BELOW']:
+            rows = np.arange(len(self.ids))
+            scores = self.vectors @ query
+        else:
+            rows = self.ann.candidates(query, max(k, config['CANDIDATES']))
+            scores = self._vectors[rows] @ query
+        return [(self.ids[rows[i]], float(scores[i])) for i in top_k_indices(scores, k)]
+
+    def save(self, path: Path):
+        """Write the index to path, replacing any previous one"""
+        with replacing_directory(path) as tmp_path:
+            np.save(tmp_path / 'ids.npy', np.array(self.ids, dtype=str))
+            np.save(tmp_path / 'vectors.npy', self.vectors)
+            if self.ann is not None:
+                self.ann.save(tmp_path)
+            with open(tmp_path / 'meta.json', 'w') as f:
+                json.dump({'dim': self.dim, 'backend': self.ann.name if self.ann else None}, f)
+
+    @classmethod
+    def load(cls, path: Path) -> 'PromptVectorIndex':
+        with open(path / 'meta.json') as f:
+            meta = json.load(f)
+        ann = None
+        if meta['backend']:
+            ann_class, available = ANN_BACKENDS[meta['backend']]
+            if available:
+                ann = ann_class.load(path, meta['dim'], get_semantic_search_settings())
+            else:
+                logger.warning(f"Semantic index was built with {meta['backend']}, which is not installed; "
+                               f"searching exactly")
+        return cls(
+            meta['dim'],
+            np.load(path / 'ids.npy').tolist(),
+            np.load(path / 'vectors.npy', mmap_mode='r'),
+            ann,
+        )
+
+
+def _index_stamp(path: Path):
+    try:
+        stat = (path / 'meta.json').stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+_loaded = {'index': None, 'stamp': None, 'checked': 0.0}
+_loaded_lock = threading.Lock()
+
+
+def get_prompt_index() -> Optional[PromptVectorIndex]:
+    """This process's copy of the index on disk, reloaded when it changes"""
+    config = get_semantic_search_settings()
+    if time.monotonic() - _loaded['checked'] < config['RELOAD_CHECK_S']:
+        return _loaded['index']
+
+    with _loaded_lock:
+        if time.monotonic() - _loaded['checked'] >= config['RELOAD_CHECK_S']:
+            path = index_path()
+            stamp = _index_stamp(path)
+            if stamp != _loaded['stamp']:
+                _loaded['index'] = PromptVectorIndex.load(path) if stamp else None
+                _loaded['stamp'] = stamp
+                if stamp:
+                    logger.info(f"Loaded semantic index with {len(_loaded['index'])} prompts")
+            _loaded['checked'] = time.monotonic()
+    return _loaded['index']
+
+
+def _embed_rows(rows: Iterable[Tuple]) -> Tuple[List[str], np.ndarray]:
+    rows = list(rows)
+    texts = [prompt_text(title, content, category, tags) for _, title, content, category, tags in rows]
+    return [str(row[0]) for row in rows], embed_texts(texts)
+
+
+def _prompt_rows(queryset):
+    return queryset.values_list('id', 'title', 'content', 'category', 'tags')
+
+
+def rebuild_prompt_index(batch_size: int = None) -> int:
+    """Embed every active prompt and write a new index; returns its size"""
+    from .models import PromptLibrary
+
+    batch_size = batch_size or get_semantic_search_settings()['BATCH_SIZE']
+    ids, vectors, batch = [], [], []
+    rows = _prompt_rows(PromptLibrary.objects.filter(is_active=True).order_by('created_at'))
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            batch_ids, batch_vectors = _embed_rows(batch)
+            ids.extend(batch_ids)
+            vectors.append(batch_vectors)
+            batch = []
+    if batch:
+        batch_ids, batch_vectors = _embed_rows(batch)
+        ids.extend(batch_ids)
+        vectors.append(batch_vectors)
+    if not ids:
+        return 0
+
+    index = PromptVectorIndex.build(ids, np.concatenate(vectors))
+    index.save(index_path())
+    return len(index)
+
+
+def index_dirty_prompts(batch_size: int = None) -> int:
+    """Embed the prompts saved since the last run into the index on disk"""
+    from .models import PromptLibrary
+
+    path = index_path()
+    if _index_stamp(path) is None:
+        if _dirty.count():
+            logger.warning("No semantic index yet; run manage.py build_prompt_index")
+        return 0
+
+    batch_size = batch_size or get_semantic_search_settings()['BATCH_SIZE']
+    index = None
+    added = 0
+    while True:
+        prompt_ids = _dirty.pop(batch_size)
+        if not prompt_ids:
+            break
+        # Inactive and deleted prompts are left in place and filtered out on fetch
+        rows = list(_prompt_rows(PromptLibrary.objects.filter(id__in=prompt_ids, is_active=True)))
+        if not rows:
+            continue
+        if index is None:
+            index = PromptVectorIndex.load(path)
+        index.add(*_embed_rows(rows))
+        added += len(rows)
+
+    if index is not None:
+        index.save(path)
+    return added
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: each ID scores the sum of 1 / (k + rank) over the lists"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def keyword_ranking(query: str, limit: int) -> List[str]:
+    """Prompt IDs from the full-text search service, best first"""
+    from .search_services import search_service
+
+    results, _ = search_service.search_prompts(query, None, None, limit)
+    return [str(result.prompt.id) for result in results]
+
+
+def semantic_search(query: str, limit: int = 10, mode: str = 'hybrid') -> List[Tuple[str, float]]:
+    """
+    (prompt ID, score) for query, best first. mode 'semantic' ranks by
+    cosine similarity; 'hybrid' fuses that with the full-text ranking (RRF
+    scores). Without an index, hybrid search is full-text only.
+    """
+    config = get_semantic_search_settings()
+    index = get_prompt_index()
+    vector_hits = []
+    if index is not None and len(index):
+        vector_hits = index.search(embed_texts([query])[0], limit if mode == 'semantic' else config['CANDIDATES'])
+    if mode == 'semantic':
+        return vector_hits
+
+    rankings = [[prompt_id for prompt_id, _ in vector_hits], keyword_ranking(query, config['CANDIDATES'])]
+    return reciprocal_rank_fusion(rankings, config['RRF_K'])[:limit]
+
+
+def search_suggestions(partial_query: str, limit: int = 5) -> List[str]:
+    """Titles of popular active prompts containing the query, prefix matches first"""
+    from .models import PromptLibrary
+
+    partial_query = partial_query.lower()
+    cache_key = f"prompt_suggestions:{hashlib.md5(partial_query.encode()).hexdigest()}:{limit}"
+    suggestions = cache.get(cache_key)
+    if suggestions is not None:
+        return suggestions
+
+    titles = (
+        PromptLibrary.objects.filter(is_active=True, title__icontains=partial_query)
+        .order_by('-usage_count', '-quality_score')
+        .values_list('title', flat=True)[:limit * 4]
+    )
+    seen = set()
+    suggestions = []
+    for title in sorted(titles, key=lambda title: not title.lower().startswith(partial_query)):
+        if title.lower() not in seen:
+            seen.add(title.lower())
+            suggestions.append(title)
+    suggestions = suggestions[:limit]
+    cache.set(cache_key, suggestions, SUGGESTIONS_CACHE_TIMEOUT)
+    return suggestions
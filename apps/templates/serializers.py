@@ -70,6 +70,9 @@ class TemplateCategorySerializer(serializers.ModelSerializer):
     
     def get_template_count(self, obj):
         """Get count of public, active templates in this category"""
+        annotated = getattr(obj, 'annotated_template_count', None)
+        if annotated is not None:
+            return annotated
         return obj.templates.filter(is_active=True, is_public=True).count()
 
 
@@ -77,12 +80,16 @@ class TemplateListSerializer(serializers.ModelSerializer):
     """
     Lightweight serializer for template lists
     
-    Optimized for performance with minimal data
+    Optimized for performance with minimal data. Expects a queryset from
+    Template.objects.for_list(); without its annotations every row falls
+    back to per-template queries.
     """
     
     author = serializers.StringRelatedField()
     category = TemplateCategorySerializer(read_only=True)
     field_count = serializers.ReadOnlyField()
+    is_bookmarked = serializers.SerializerMethodField()
+    user_rating = serializers.SerializerMethodField()
     
     class Meta:
         model = Template
@@ -90,9 +97,33 @@ class TemplateListSerializer(serializers.ModelSerializer):
             'id', 'title', 'description', 'category', 'author', 
             'version', 'tags', 'usage_count', 'completion_rate', 
             'average_rating', 'popularity_score', 'is_featured',
-            'field_count', 'created_at', 'updated_at'
+            'field_count', 'is_bookmarked', 'user_rating',
+            'created_at', 'updated_at'
         ]
 
+    def _request_user(self):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
+
+    def get_is_bookmarked(self, obj):
+        """Whether the current user bookmarked this template"""
+        if hasattr(obj, 'annotated_is_bookmarked'):
+            return bool(obj.annotated_is_bookmarked)
+        user = self._request_user()
+        if user is None:
+            return False
+        return obj.bookmarks.filter(user=user).exists()
+
+    def get_user_rating(self, obj):
+        """The current user's rating of this template, if any"""
+        if hasattr(obj, 'annotated_user_rating'):
+            return obj.annotated_user_rating
+        user = self._request_user()
+        if user is None:
+            return None
+        return obj.ratings.filter(user=user).values_list('rating', flat=True).first()
+
 
 class TemplateDetailSerializer(serializers.ModelSerializer):
     """
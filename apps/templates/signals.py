@@ -0,0 +1,19 @@
+"""
+Signal handlers that keep the prompt semantic index fresh.
+
+Handlers only queue the saved prompt (see apps.templates.semantic_search);
+the embedding happens in the periodic task.
+"""
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .semantic_search import EMBEDDED_FIELDS, mark_prompt_dirty
+
+
+@receiver(post_save, sender='templates.PromptLibrary', dispatch_uid='semantic_index_prompt_saved')
+def prompt_saved(sender, instance, update_fields=None, **kwargs):
+    """Saves limited to fields that are not embedded (counters, search_vector) are skipped"""
+    if update_fields and not EMBEDDED_FIELDS.intersection(update_fields):
+        return
+    mark_prompt_dirty(instance.pk)
@@ -7,14 +7,21 @@ import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
+from apps.core.fanout import FanoutMixin
+from apps.core.timer_wheel import HeartbeatMixin
 import logging
 
 logger = logging.getLogger(__name__)
 
-class SocketIOCompatibilityConsumer(AsyncWebsocketConsumer):
+class SocketIOCompatibilityConsumer(FanoutMixin, HeartbeatMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer that mimics Socket.IO protocol for frontend compatibility
     """
+
+    # Engine.IO clients ping every pingInterval and expect the server to drop
+    # them after pingInterval + pingTimeout without one
+    heartbeat_interval = None
+    idle_timeout = 45
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -174,16 +181,12 @@ class SocketIOCompatibilityConsumer(AsyncWebsocketConsumer):
         try:
             message_text = data.get("message", "") if isinstance(data, dict) else str(data)
             
-            # Broadcast to room group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": message_text,
-                    "user": str(self.user) if self.user else "Anonymous",
-                    "session_id": self.session_id
-                }
-            )
+            # Broadcast to room group, encoded once for every member
+            self.broadcast(self.room_group_name, "42" + json.dumps(["chat_message", {
+                "message": message_text,
+                "user": str(self.user) if self.user else "Anonymous",
+                "session_id": self.session_id
+            }]))
             
         except Exception as e:
             logger.error(f"Error handling chat message: {e}")
@@ -254,12 +257,3 @@ class SocketIOCompatibilityConsumer(AsyncWebsocketConsumer):
             "message": error_msg,
             "session_id": self.session_id
         }])
-
-    # Group message handlers
-    async def chat_message(self, event):
-        """Send chat message to WebSocket"""
-        await self.send_socketio_message("42", ["chat_message", {
-            "message": event["message"],
-            "user": event["user"],
-            "session_id": event["session_id"]
-        }])
\ No newline at end of file
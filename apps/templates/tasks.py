@@ -0,0 +1,41 @@
+"""
+Celery tasks for the templates app.
+"""
+import logging
+from celery import shared_task
+
+from .popularity import recalculate_dirty_templates, DEFAULT_BATCH_SIZE
+from .semantic_search import index_dirty_prompts
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def recalculate_dirty_popularity(batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Recompute popularity for every template touched since the last run.
+
+    Args:
+        batch_size: Number of templates per aggregate query / bulk_update
+
+    Returns:
+        Number of templates updated
+    """
+    updated = recalculate_dirty_templates(batch_size=batch_size)
+    if updated:
+        logger.info(f"Recalculated popularity for {updated} templates")
+    return updated
+
+
+@shared_task
+def index_new_prompts():
+    """
+    Embed library prompts saved since the last run into the semantic index.
+
+    Returns:
+        Number of prompts embedded
+    """
+    added = index_dirty_prompts()
+    if added:
+        logger.info(f"Added {added} prompts to the semantic index")
+    return added
@@ -7,17 +7,54 @@ Run locally:
     python manage.py test apps.templates --verbosity=2
 """
 
+import asyncio
+import hashlib
+import json
 import re
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import StringIO
-
+from unittest import mock
+
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.management import call_command
-from django.test import TestCase
-
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.core.query_budget import QueryBudgetExceeded, query_budget
+from apps.templates import message_writer, popularity, semantic_search
+from apps.templates.enhanced_consumer import EnhancedChatConsumer
+from apps.templates.langchain_services import LangChainOptimizationService, intent_cache_key
+from apps.templates.llm_scheduler import BACKGROUND, INTERACTIVE, LLMScheduler, QueueOverloaded
 from apps.templates.management.commands.inflate_templates import (
     CATEGORIES_DATASET,
     TEMPLATES_DATASET,
 )
-from apps.templates.models import Template, TemplateCategory, PromptField, TemplateField
+from apps.templates.message_writer import get_message_writer, load_history
+from apps.templates.models import (
+    ChatMessage, PromptField, PromptLibrary, Template, TemplateBookmark, TemplateCategory, TemplateField,
+    TemplateRating, TemplateUsage,
+)
+from apps.templates.popularity import deferred_recalculation
+from apps.templates.semantic_search import (
+    IVFLists, PromptVectorIndex, reciprocal_rank_fusion, search_suggestions,
+)
+from apps.templates.serializers import TemplateListSerializer
+from apps.templates.tasks import index_new_prompts, recalculate_dirty_popularity
+from apps.templates.views import TemplateCategoryViewSet, TemplateViewSet
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -366,3 +403,759 @@ class InflateTemplatesCommandTests(TestCase):
         self.assertIn("Created:", output)
         self.assertIn("Skipped", output)
         self.assertIn("Errors: 0", output)
+
+
+# ===========================================================================
+# 6. Popularity Recalculation — dirty set drained by a batched task
+# ===========================================================================
+
+class PopularityRecalculationTests(TestCase):
+    """Rating/usage events mark templates dirty; the task recomputes in batches."""
+
+    def setUp(self):
+        popularity._local_dirty.clear()
+        # As where a beat drains a shared (Redis) set
+        deferred = mock.patch.object(popularity, "deferred_recalculation", return_value=True)
+        deferred.start()
+        self.addCleanup(deferred.stop)
+        self.user = get_user_model().objects.create_user(
+            username="rater", email="rater@example.com", password="pass1234"
+        )
+        self.category = TemplateCategory.objects.create(name="Popularity", slug="popularity")
+
+    def make_template(self, **kwargs):
+        return Template.objects.create(
+            title="Popular", description="d", category=self.category,
+            template_content="{{topic}}", author=self.user, **kwargs
+        )
+
+    def test_rating_only_marks_template_dirty(self):
+        template = self.make_template()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                TemplateRating.objects.create(template=template, user=self.user, rating=4)
+
+        template.refresh_from_db()
+        self.assertEqual(template.average_rating, 0.0)
+        self.assertEqual(popularity.pop_dirty_templates(10), [str(template.id)])
+
+    def test_rating_recalculates_on_commit_without_a_scheduler(self):
+        template = self.make_template()
+        with mock.patch.object(popularity, "deferred_recalculation", return_value=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                TemplateRating.objects.create(template=template, user=self.user, rating=4)
+
+        template.refresh_from_db()
+        self.assertEqual(template.average_rating, 4.0)
+        self.assertGreater(template.popularity_score, 0)
+        self.assertEqual(popularity.dirty_template_count(), 0)
+
+    def test_deferral_needs_a_scheduler_and_a_shared_set(self):
+        with mock.patch.object(popularity._dirty, "is_shared", return_value=True):
+            with self.settings(PERIODIC_TASKS_ENABLED=True):
+                self.assertTrue(deferred_recalculation())
+            with self.settings(PERIODIC_TASKS_ENABLED=False):
+                self.assertFalse(deferred_recalculation())
+        with self.settings(PERIODIC_TASKS_ENABLED=True):
+            # Testing uses DummyCache: the set would live in this process only
+            self.assertFalse(deferred_recalculation())
+
+    def test_task_recalculates_dirty_templates(self):
+        rated = self.make_template(usage_count=500)
+        untouched = self.make_template(usage_count=500)
+        other = get_user_model().objects.create_user(
+            username="rater2", email="rater2@example.com", password="pass1234"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            TemplateRating.objects.create(template=rated, user=self.user, rating=5)
+            TemplateRating.objects.create(template=rated, user=other, rating=2)
+            TemplateUsage.objects.create(template=rated, user=self.user, was_completed=True)
+            TemplateUsage.objects.create(template=rated, user=other, was_completed=False)
+
+        self.assertEqual(recalculate_dirty_popularity(batch_size=1), 1)
+        self.assertEqual(popularity.dirty_template_count(), 0)
+
+        rated.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual(rated.average_rating, 3.5)
+        self.assertEqual(rated.completion_rate, 0.5)
+        expected = popularity.compute_popularity_score(500, 3.5, 0.5, rated.created_at)
+        self.assertAlmostEqual(rated.popularity_score, expected, places=3)
+        self.assertEqual(untouched.popularity_score, 0.0)
+
+    def test_batch_uses_constant_statement_count(self):
+        templates = [self.make_template(usage_count=i * 100) for i in range(5)]
+        with self.assertNumQueries(2):
+            updated = popularity.recalculate_popularity([t.id for t in templates])
+        self.assertEqual(updated, 5)
+
+        for template in templates:
+            synced = Template.objects.get(pk=template.pk)
+            recalculated = synced.popularity_score
+            synced.update_popularity_score()
+            self.assertAlmostEqual(recalculated, synced.popularity_score, places=3)
+
+    def test_failed_batch_is_requeued(self):
+        template = self.make_template()
+        popularity._add_dirty([str(template.id)])
+        with self.assertRaises(RuntimeError):
+            with mock.patch.object(
+                popularity, "recalculate_popularity", side_effect=RuntimeError("db down")
+            ):
+                popularity.recalculate_dirty_templates()
+        self.assertEqual(popularity.pop_dirty_templates(10), [str(template.id)])
+
+
+# ===========================================================================
+# 7. List Query Plans — annotated counts, user state, query budgets
+# ===========================================================================
+
+class TemplateListQueryTests(TestCase):
+    viewset = TemplateViewSet
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="lister", email="lister@example.com", password="pass1234"
+        )
+        self.factory = APIRequestFactory()
+
+    def make_templates(self, count, fields=3):
+        templates = []
+        for i in range(count):
+            category, _ = TemplateCategory.objects.get_or_create(
+                slug=f"list-cat-{i % 4}", defaults={"name": f"List Cat {i % 4}"}
+            )
+            template = Template.objects.create(
+                title=f"List {i}", description="d", category=category,
+                template_content="{{topic}}", author=self.user,
+            )
+            for order in range(fields):
+                field = PromptField.objects.create(label=f"Field {order}", order=fields - order)
+                TemplateField.objects.create(template=template, field=field, order=order)
+            templates.append(template)
+        return templates
+
+    def get(self, action, **kwargs):
+        request = self.factory.get("/")
+        force_authenticate(request, user=self.user)
+        view = self.viewset.as_view({"get": action})
+        response = view(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_template_list_query_count_is_constant(self):
+        self.make_templates(2)
+        with self.assertNumQueries(3):
+            self.get("list")
+        self.make_templates(8)
+        with self.assertNumQueries(3):
+            data = self.get("list")
+        self.assertEqual(data["count"], 10)
+
+    def test_template_list_reads_annotations(self):
+        bookmarked, rated, plain = self.make_templates(3, fields=2)
+        TemplateBookmark.objects.create(user=self.user, template=bookmarked)
+        TemplateRating.objects.create(template=rated, user=self.user, rating=4)
+
+        rows = {row["title"]: row for row in self.get("list")["results"]}
+        self.assertTrue(rows[bookmarked.title]["is_bookmarked"])
+        self.assertFalse(rows[rated.title]["is_bookmarked"])
+        self.assertEqual(rows[rated.title]["user_rating"], 4)
+        self.assertIsNone(rows[plain.title]["user_rating"])
+        self.assertEqual(rows[plain.title]["field_count"], 2)
+        self.assertEqual(rows[plain.title]["category"]["template_count"], 1)
+
+    def test_serializer_falls_back_without_annotations(self):
+        template = self.make_templates(1, fields=2)[0]
+        TemplateBookmark.objects.create(user=self.user, template=template)
+        request = self.factory.get("/")
+        request.user = self.user
+        data = TemplateListSerializer(
+            Template.objects.get(pk=template.pk), context={"request": request}
+        ).data
+        self.assertEqual(data["field_count"], 2)
+        self.assertTrue(data["is_bookmarked"])
+        self.assertEqual(data["category"]["template_count"], 1)
+
+    def test_detail_prefetches_fields_in_order(self):
+        template = self.make_templates(1, fields=3)[0]
+        data = self.get("retrieve", pk=str(template.pk))
+        self.assertEqual([field["order"] for field in data["fields"]], [1, 2, 3])
+
+    def test_category_list_query_count_is_constant(self):
+        self.viewset = TemplateCategoryViewSet
+        self.make_templates(8)
+        with self.assertNumQueries(2):
+            data = self.get("list")
+        self.assertEqual([row["template_count"] for row in data["results"]], [2, 2, 2, 2])
+
+    def test_query_budget_is_strict_in_tests(self):
+        @query_budget(1)
+        def over_budget():
+            return list(Template.objects.all()), list(TemplateCategory.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            over_budget()
+        with override_settings(QUERY_BUDGET_STRICT=False):
+            with self.assertLogs("apps.core.query_budget", level="WARNING"):
+                over_budget()
+        # Unset (development included, whatever DEBUG is) only warns
+        with override_settings(DEBUG=True):
+            del settings.QUERY_BUDGET_STRICT
+            with self.assertLogs("apps.core.query_budget", level="WARNING"):
+                over_budget()
+
+
+# ---------------------------------------------------------------------------
+# Semantic search over the prompt library
+# ---------------------------------------------------------------------------
+
+def clustered_vectors(count, dim=64, clusters=50, seed=0):
+    """Normalized vectors around random centres, like embeddings of related prompts"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fake_embed(texts, dim=64):
+    """Hashed bag of words: texts sharing words are close"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1
+    vectors[vectors.sum(axis=1) == 0, 0] = 1
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_neighbours(vectors, queries, k):
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def use_temporary_semantic_index(test):
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    settings_override = override_settings(SEMANTIC_SEARCH={
+        "INDEX_DIR": tmp.name + "/index", "EXACT_BELOW": 100, "RELOAD_CHECK_S": 0, "IVF_NPROBE": 16,
+    })
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+class SemanticIndexTests(TestCase):
+    def setUp(self):
+        use_temporary_semantic_index(self)
+
+    def test_small_index_searches_exactly(self):
+        vectors = clustered_vectors(50)
+        index = PromptVectorIndex.build([f"p{i}" for i in range(50)], vectors)
+
+        self.assertIsNone(index.ann)
+        hits = index.search(vectors[7], 5)
+        self.assertEqual([hit[0] for hit in hits], [f"p{i}" for i in exact_neighbours(vectors, vectors[7:8], 5)[0]])
+        self.assertAlmostEqual(hits[0][1], 1.0, places=5)
+
+    def test_ivf_recall_against_exact_search(self):
+        vectors = clustered_vectors(3000)
+        index = PromptVectorIndex.build(range(3000), vectors)
+        self.assertIsInstance(index.ann, IVFLists)
+
+        queries = clustered_vectors(50, seed=1)
+        expected = exact_neighbours(vectors, queries, 10)
+        found = 0
+        for query, truth in zip(queries, expected):
+            found += len({int(prompt_id) for prompt_id, _ in index.search(query, 10)} & set(truth))
+        self.assertGreaterEqual(found / expected.size, 0.9)
+
+    def test_add_replaces_and_appends(self):
+        vectors = clustered_vectors(200)
+        index = PromptVectorIndex.build(range(200), vectors)
+        target = clustered_vectors(1, seed=2)[0]
+
+        index.add(["5", "new"], np.stack([target, -target]))
+
+        self.assertEqual(len(index), 201)
+        self.assertEqual(index.search(target, 1)[0][0], "5")
+        self.assertEqual(index.search(-target, 1)[0][0], "new")
+
+    def test_saved_index_is_memory_mapped_and_extendable(self):
+        path = semantic_search.index_path()
+        vectors = clustered_vectors(300)
+        PromptVectorIndex.build(range(300), vectors).save(path)
+
+        index = PromptVectorIndex.load(path)
+        self.assertIsInstance(index.vectors, np.memmap)
+        self.assertIsInstance(index.ann, IVFLists)
+        self.assertEqual(index.search(vectors[3], 1)[0][0], "3")
+
+        index.add(["extra"], clustered_vectors(1, seed=3))
+        index.save(path)
+        self.assertEqual(len(PromptVectorIndex.load(path)), 301)
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+        self.assertEqual([item for item, _ in fused], ["a", "c", "b", "d"])
+        self.assertAlmostEqual(fused[0][1], 1 / 61 + 1 / 62)
+
+
+@mock.patch("apps.templates.semantic_search.embed_texts", fake_embed)
+class PromptLibrarySemanticSearchTests(TestCase):
+    def setUp(self):
+        use_temporary_semantic_index(self)
+
+    def make_prompt(self, title, content, **fields):
+        return PromptLibrary.objects.create(title=title, content=content, category="writing", **fields)
+
+    def test_saved_prompts_are_added_by_the_periodic_task(self):
+        self.make_prompt("Cold outreach email", "Write a cold email to a prospective client")
+        self.make_prompt("Blog outline", "Outline a blog post about gardening")
+        self.assertEqual(semantic_search.rebuild_prompt_index(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            poem = self.make_prompt("Haiku generator", "Compose a haiku about autumn leaves")
+        self.assertEqual(index_new_prompts(), 1)
+
+        hits = semantic_search.semantic_search("haiku about autumn", 2, mode="semantic")
+        self.assertEqual(hits[0][0], str(poem.pk))
+
+    def test_counter_updates_are_not_reembedded(self):
+        prompt = self.make_prompt("Cold outreach email", "Write a cold email")
+        semantic_search.rebuild_prompt_index()
+
+        prompt.usage_count = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            prompt.save(update_fields=["usage_count"])
+        self.assertEqual(semantic_search._dirty.count(), 0)
+
+    def test_hybrid_search_fuses_keyword_ranking(self):
+        email = self.make_prompt("Cold outreach email", "Write a cold email to a prospective client")
+        blog = self.make_prompt("Blog outline", "Outline a blog post about gardening")
+        semantic_search.rebuild_prompt_index()
+
+        with mock.patch("apps.templates.semantic_search.keyword_ranking", return_value=[str(blog.pk)]):
+            hits = semantic_search.semantic_search("cold email", 2)
+
+        # The blog prompt is second by vector and first by keyword, which outranks first by vector only
+        self.assertEqual([prompt_id for prompt_id, _ in hits], [str(blog.pk), str(email.pk)])
+        self.assertAlmostEqual(hits[0][1], 1 / 62 + 1 / 61)
+
+    def test_suggestions_are_library_titles(self):
+        self.make_prompt("Email follow-up", "Follow up", usage_count=5)
+        self.make_prompt("Cold email opener", "Open", usage_count=50)
+        self.make_prompt("Cold email opener", "Duplicate title", usage_count=1)
+        self.make_prompt("Retired email", "Old", is_active=False)
+
+        self.assertEqual(search_suggestions("email"), ["Email follow-up", "Cold email opener"])
+
+
+@pytest.mark.slow
+def test_benchmark_semantic_index_100k_prompts(tmp_path):
+    """Recall@10 and query latency of each ANN backend against exact search"""
+    count, dim = 100_000, 384
+    vectors = clustered_vectors(count, dim=dim, clusters=1000)
+    queries = clustered_vectors(200, dim=dim, clusters=1000, seed=1)
+    expected = exact_neighbours(vectors, queries, 10)
+
+    def measure(index):
+        latencies, found = [], 0
+        for query, truth in zip(queries, expected):
+            start = time.perf_counter()
+            hits = index.search(query, 10)
+            latencies.append(time.perf_counter() - start)
+            found += len({int(prompt_id) for prompt_id, _ in hits} & set(truth))
+        latencies.sort()
+        return found / expected.size, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+    backends = ["exact"] + [name for name, (_, available) in semantic_search.ANN_BACKENDS.items() if available]
+    results = {}
+    for backend in backends:
+        with override_settings(SEMANTIC_SEARCH={"BACKEND": backend, "INDEX_DIR": str(tmp_path / backend)}):
+            start = time.perf_counter()
+            index = PromptVectorIndex.build(range(count), vectors)
+            build_s = time.perf_counter() - start
+            quality = measure(index)
+            start = time.perf_counter()
+            index.add([f"new{i}" for i in range(1000)], clustered_vectors(1000, dim=dim, seed=2))
+            add_ms = (time.perf_counter() - start) * 1000
+            results[backend] = quality + (build_s, add_ms)
+
+    print("; ".join(
+        f"{backend}: recall@10 {recall:.3f}, p50 {p50 * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms, "
+        f"build {build_s:.1f}s, add 1k {add_ms:.0f}ms"
+        for backend, (recall, p50, p95, build_s, add_ms) in results.items()
+    ))
+    for backend in backends[1:]:
+        recall, p50 = results[backend][:2]
+        assert recall >= 0.9
+        assert p50 < results["exact"][1]
+
+
+# ---------------------------------------------------------------------------
+# Batched chat message writes
+# ---------------------------------------------------------------------------
+
+def chat_message(user, session_id, content, message_type='user', message_id=None):
+    return ChatMessage(id=message_id or uuid.uuid4(), session_id=session_id, user=user,
+                       message_type=message_type, content=content)
+
+
+@contextmanager
+def count_statements():
+    """Statements run on the default connection, by first keyword"""
+    counts = {}
+
+    def count(execute, sql, params, many, context):
+        keyword = sql.split(None, 1)[0].upper()
+        counts[keyword] = counts.get(keyword, 0) + 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        yield counts
+
+
+class ChatMessageWriterTests(TestCase):
+    def setUp(self):
+        message_writer._writers.clear()
+        self.user = get_user_model().objects.create_user(username="chatter", password="pass1234")
+
+    # Under SQLite's 66-row bulk_create limit for ChatMessage, so a batch is one INSERT
+    @override_settings(CHAT_PERSISTENCE={'BATCH_SIZE': 50, 'FLUSH_MS': 20, 'HISTORY_WINDOW': 50})
+    def test_messages_from_all_sessions_are_inserted_in_batches(self):
+        async def run():
+            writer = get_message_writer()
+            for i in range(120):
+                writer.write(chat_message(self.user, f"session-{i % 7}", f"message {i}"))
+            # The last 20 wait for the flush window
+            await asyncio.sleep(0.1)
+
+        with count_statements() as statements:
+            async_to_sync(run)()
+
+        self.assertEqual(statements['INSERT'], 3)
+        self.assertEqual(ChatMessage.objects.count(), 120)
+
+    def test_a_message_sent_twice_is_stored_once(self):
+        message_id = uuid.uuid4()
+
+        async def run():
+            writer = get_message_writer()
+            writer.write(chat_message(self.user, "s", "hello", message_id=message_id))
+            await writer.flush()
+            writer.write(chat_message(self.user, "s", "hello", message_id=message_id))
+            writer.write(chat_message(self.user, "s", "world"))
+            await writer.flush()
+
+        async_to_sync(run)()
+        self.assertEqual(sorted(ChatMessage.objects.values_list('content', flat=True)), ["hello", "world"])
+
+    @override_settings(CHAT_PERSISTENCE={'BATCH_SIZE': 100, 'FLUSH_MS': 10000, 'HISTORY_WINDOW': 4})
+    def test_history_restores_the_last_window_with_one_query(self):
+        other = get_user_model().objects.create_user(username="other", password="pass1234")
+
+        async def run():
+            writer = get_message_writer()
+            for i in range(6):
+                writer.write(chat_message(self.user, "s", f"q{i}", 'user'))
+                writer.write(chat_message(self.user, "s", f"a{i}", 'ai'))
+            writer.write(chat_message(other, "s", "not yours"))
+            # Still queued: restoring flushes first
+            return await load_history("s", self.user.pk)
+
+        with count_statements() as statements:
+            history = async_to_sync(run)()
+        self.assertEqual([(entry['role'], entry['content']) for entry in history],
+                         [('user', 'q4'), ('assistant', 'a4'), ('user', 'q5'), ('assistant', 'a5')])
+        self.assertEqual(statements, {'INSERT': 1, 'SELECT': 1})
+
+    def test_routed_chat_consumer_queues_user_messages(self):
+        # ws/chat/ is served by enhanced_consumer; skip __init__, which builds the RAG agent
+        consumer = EnhancedChatConsumer.__new__(EnhancedChatConsumer)
+        consumer.session_id, consumer.user_id = "s", self.user.pk
+
+        async def run():
+            await consumer.handle_chat_message({'type': 'chat_message', 'content': " hello "}, 0)
+            await get_message_writer().flush()
+
+        async_to_sync(run)()
+        self.assertEqual(list(ChatMessage.objects.values_list('session_id', 'message_type', 'content')),
+                         [("s", 'user', "hello")])
+
+    @override_settings(CHAT_PERSISTENCE={'BATCH_SIZE': 100, 'FLUSH_MS': 20, 'RETRIES': 1, 'RETRY_BACKOFF_MS': 1})
+    def test_failed_batch_is_retried_then_saved_row_by_row(self):
+        insert = message_writer._insert
+        calls = []
+
+        def flaky_insert(rows):
+            calls.append(len(rows))
+            if len(rows) > 1 or rows[0].content == "bad":
+                raise RuntimeError("database rejected the batch")
+            insert(rows)
+
+        async def run():
+            writer = get_message_writer()
+            for content in ("one", "bad", "two"):
+                writer.write(chat_message(self.user, "s", content))
+            await writer.flush()
+
+        with mock.patch.object(message_writer, '_insert', flaky_insert), \
+                self.assertLogs('apps.templates.message_writer', level='WARNING') as logs:
+            async_to_sync(run)()
+        # Two bulk attempts, then one insert per row
+        self.assertEqual(calls, [3, 3, 1, 1, 1])
+        self.assertEqual(sorted(ChatMessage.objects.values_list('content', flat=True)), ["one", "two"])
+        self.assertIn("Dropped 1 of 3 chat messages", logs.output[-1])
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_chat_message_writes():
+    """10k messages from 100 connections: an INSERT per message vs the batched writer"""
+    user = get_user_model().objects.create_user(username="bench-chat", password="pass1234")
+    connections_, per_connection = 100, 100
+
+    @database_sync_to_async
+    def insert_one(message):
+        message.save(force_insert=True)
+
+    async def conversation(index, save, latencies):
+        for i in range(per_connection):
+            message = chat_message(user, f"session-{index}", f"message {i} " * 20)
+            start = time.perf_counter()
+            await save(message)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    async def direct(message):
+        await insert_one(message)
+
+    async def batched(message):
+        get_message_writer().write(message)
+
+    def run(save):
+        async def all_connections():
+            latencies = []
+            await asyncio.gather(*(conversation(i, save, latencies) for i in range(connections_)))
+            await get_message_writer().flush()
+            return latencies
+
+        ChatMessage.objects.all().delete()
+        message_writer._writers.clear()
+        with count_statements() as statements:
+            start = time.perf_counter()
+            latencies = sorted(async_to_sync(all_connections)())
+            elapsed = time.perf_counter() - start
+        assert ChatMessage.objects.count() == connections_ * per_connection
+        return statements.get('INSERT', 0), elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+    results = {"INSERT per message": run(direct), "batched writer": run(batched)}
+    print(f"{connections_ * per_connection} messages: " + "; ".join(
+        f"{name}: {count} INSERTs, {elapsed * 1000:.0f}ms total, "
+        f"save p50 {p50 * 1e6:.0f}us, p99 {p99 * 1e6:.0f}us"
+        for name, (count, elapsed, p50, p99) in results.items()
+    ))
+    assert results["INSERT per message"][0] == connections_ * per_connection
+    # bulk_create splits each batch into a few statements on SQLite
+    assert results["batched writer"][0] <= connections_ * per_connection / 40
+    assert results["batched writer"][3] < results["INSERT per message"][2]
+
+
+# ---------------------------------------------------------------------------
+# Priority queues for blocking LLM calls
+# ---------------------------------------------------------------------------
+
+def scheduler_config(interactive=(2, 1000), background=(1, 10000)):
+    return {
+        'QUEUES': {
+            INTERACTIVE: {'CONCURRENCY': interactive[0], 'MAX_WAIT_MS': interactive[1]},
+            BACKGROUND: {'CONCURRENCY': background[0], 'MAX_WAIT_MS': background[1]},
+        },
+        'EWMA_ALPHA': 0.2,
+    }
+
+
+class SleepingIntentModel:
+    """Stands in for a chat model: blocks like a network call and answers JSON"""
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        time.sleep(self.seconds)
+        return json.dumps({"category": "communication", "confidence": 0.9, "keywords": ["email"]})
+
+
+class LLMSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = LLMScheduler(scheduler_config())
+
+    def tearDown(self):
+        self.scheduler.shutdown(wait=False)
+
+    def test_background_burst_does_not_hold_up_interactive_calls(self):
+        release = threading.Event()
+        for _ in range(5):
+            self.scheduler.submit(BACKGROUND, release.wait, 5)
+
+        async def run():
+            start = time.perf_counter()
+            result = await self.scheduler.run(INTERACTIVE, lambda: "intent")
+            return result, time.perf_counter() - start
+
+        result, elapsed = async_to_sync(run)()
+        release.set()
+        self.assertEqual(result, "intent")
+        self.assertLess(elapsed, 0.5)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats[INTERACTIVE]['completed'], 1)
+        self.assertEqual(stats[BACKGROUND]['submitted'], 5)
+
+    def test_call_that_waited_past_the_deadline_is_dropped(self):
+        scheduler = LLMScheduler(scheduler_config(interactive=(1, 50)))
+        self.addCleanup(scheduler.shutdown, False)
+        ran = []
+        blocker = scheduler.submit(INTERACTIVE, time.sleep, 0.2)
+        late = scheduler.submit(INTERACTIVE, ran.append, "late")
+
+        blocker.result(timeout=5)
+        with self.assertRaises(QueueOverloaded) as raised:
+            late.result(timeout=5)
+        self.assertEqual(raised.exception.queue, INTERACTIVE)
+        self.assertEqual(ran, [])
+        stats = scheduler.stats()[INTERACTIVE]
+        self.assertEqual((stats['shed'], stats['completed']), (1, 1))
+        self.assertGreaterEqual(stats['wait_p95_ms'], 50)
+
+    def test_call_is_refused_when_the_backlog_exceeds_the_deadline(self):
+        scheduler = LLMScheduler(scheduler_config(interactive=(1, 100)))
+        self.addCleanup(scheduler.shutdown, False)
+        # Teach the queue that a call takes ~150ms
+        scheduler.submit(INTERACTIVE, time.sleep, 0.15).result(timeout=5)
+        release = threading.Event()
+        # Holds the only thread: the next call would wait ~150ms
+        scheduler.submit(INTERACTIVE, release.wait, 5)
+
+        with self.assertRaises(QueueOverloaded):
+            scheduler.submit(INTERACTIVE, lambda: None)
+        release.set()
+        self.assertEqual(scheduler.stats()[INTERACTIVE]['shed'], 1)
+
+    def test_queues_are_exported_to_prometheus(self):
+        from apps.core.views import prometheus_metrics
+        from apps.templates import llm_scheduler
+
+        self.scheduler.submit(INTERACTIVE, lambda: None).result(timeout=5)
+        text = llm_scheduler.render_prometheus(self.scheduler)
+        self.assertIn('llm_queue_completed_total{queue="interactive"} 1', text)
+        self.assertIn('llm_queue_concurrency{queue="background"} 1', text)
+        self.assertIn('llm_queue_wait_seconds_count{queue="interactive"} 1', text)
+        self.assertIn('llm_queue_wait_seconds_bucket{queue="interactive",le="+Inf"} 1', text)
+
+        with mock.patch.object(llm_scheduler, '_scheduler', self.scheduler), \
+                self.settings(METRICS_AUTH_TOKEN='scrape-token'):
+            request = APIRequestFactory().get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+            response = prometheus_metrics(request)
+        self.assertIn('llm_queue_waiting{queue="interactive"} 0', response.content.decode())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class IntentQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_intent_cache_key_is_stable_across_processes(self):
+        expected = hashlib.blake2b(b"write an email to my team", digest_size=16).hexdigest()
+        self.assertEqual(intent_cache_key("Write an EMAIL to my team"), f"intent:{expected}")
+
+    def test_intent_runs_on_the_interactive_queue_and_is_cached(self):
+        service = LangChainOptimizationService()
+        service.scheduler = LLMScheduler(scheduler_config())
+        self.addCleanup(service.scheduler.shutdown, False)
+        # The LangChain path, not the DeepSeek client this process may also have
+        service.deepseek_service = None
+        service.intent_model = model = SleepingIntentModel()
+
+        first = async_to_sync(service.process_intent)("Write an email to my team")
+        second = async_to_sync(service.process_intent)("write an EMAIL to my team")
+        self.assertEqual(first['category'], "communication")
+        self.assertEqual(second, first)
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(service.scheduler.stats()[INTERACTIVE]['completed'], 1)
+
+    def test_shed_intent_falls_back_to_keyword_matching(self):
+        service = LangChainOptimizationService()
+        service.scheduler = LLMScheduler(scheduler_config())
+        self.addCleanup(service.scheduler.shutdown, False)
+        service.deepseek_service = None
+        service.intent_model = SleepingIntentModel()
+
+        with mock.patch.object(service.scheduler, 'submit', side_effect=QueueOverloaded(INTERACTIVE, 5000, 2000)):
+            result = async_to_sync(service.process_intent)("Write an email to my team")
+        self.assertEqual(result['category'], "content_creation")
+        self.assertIn("interactive queue overloaded", result['context'])
+        self.assertIsNone(cache.get(intent_cache_key("Write an email to my team")))
+
+
+@pytest.mark.slow
+def test_benchmark_interactive_latency_under_mixed_load():
+    """Interactive p95 with deep optimizations streaming in: one shared pool of 4 vs 2 interactive + 2 background"""
+    deep_s, quick_s, duration_s = 0.4, 0.05, 3.0
+
+    async def mixed_load(run_deep, run_quick):
+        latencies, deep_done = [], []
+
+        async def deep():
+            await run_deep(time.sleep, deep_s)
+            deep_done.append(1)
+
+        async def quick():
+            start = time.perf_counter()
+            try:
+                await run_quick(time.sleep, quick_s)
+            except QueueOverloaded:
+                return
+            latencies.append(time.perf_counter() - start)
+
+        tasks = []
+        end = time.perf_counter() + duration_s
+        while time.perf_counter() < end:
+            # A burst of deep optimizations every 200ms, an intent every 25ms
+            if len(tasks) % 8 == 0:
+                tasks.extend(asyncio.ensure_future(deep()) for _ in range(3))
+            tasks.append(asyncio.ensure_future(quick()))
+            await asyncio.sleep(0.025)
+        await asyncio.gather(*tasks)
+        return sorted(latencies), len(deep_done)
+
+    def shared_pool():
+        executor = ThreadPoolExecutor(max_workers=4)
+
+        async def run(fn, *args):
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+        try:
+            return async_to_sync(mixed_load)(run, run)
+        finally:
+            executor.shutdown(wait=True)
+
+    def priority_queues():
+        scheduler = LLMScheduler(scheduler_config(interactive=(2, 1000), background=(2, 60000)))
+        try:
+            return async_to_sync(mixed_load)(
+                lambda fn, *args: scheduler.run(BACKGROUND, fn, *args),
+                lambda fn, *args: scheduler.run(INTERACTIVE, fn, *args),
+            )
+        finally:
+            scheduler.shutdown(wait=True)
+
+    results = {"shared pool of 4": shared_pool(), "priority queues 2+2": priority_queues()}
+    summary = {
+        name: (latencies[int(len(latencies) * 0.95)], statistics.median(latencies), len(latencies), deep)
+        for name, (latencies, deep) in results.items()
+    }
+    print("Interactive calls under mixed load: " + "; ".join(
+        f"{name}: p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms over {count} calls, {deep} deep done"
+        for name, (p95, p50, count, deep) in summary.items()
+    ))
+    assert summary["priority queues 2+2"][0] < summary["shared pool of 4"][0] / 3
@@ -2,7 +2,7 @@ from rest_framework import viewsets, filters, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg, Count, F
+from django.db.models import Q, Count, F
 from django.utils import timezone
 from django.db import transaction
 from django.views.decorators.cache import cache_page
@@ -24,6 +24,8 @@ from .serializers import (
     TemplateUsageSerializer, TemplateRatingSerializer,
     TemplateAnalyticsSerializer
 )
+from .popularity import mark_popularity_dirty
+from apps.core.query_budget import query_budget
 from apps.analytics.services import AnalyticsService
 from apps.ai_services import AIService
 from apps.gamification.services import GamificationService
@@ -55,11 +57,16 @@ class TemplateCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     - Category statistics
     """
     
-    queryset = TemplateCategory.objects.filter(is_active=True)
+    queryset = TemplateCategory.objects.filter(is_active=True).with_template_count().order_by('order', 'name')
     serializer_class = TemplateCategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    @query_budget(4)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
+    @query_budget(7)
     def templates(self, request, pk=None):
         """Get templates in this category"""
         category = self.get_object()
@@ -67,15 +74,15 @@ class TemplateCategoryViewSet(viewsets.ReadOnlyModelViewSet):
             category=category,
             is_active=True,
             is_public=True
-        ).select_related('author', 'category').order_by('-popularity_score')
+        ).for_list(request.user).order_by('-popularity_score')
         
         # Apply pagination
         page = self.paginate_queryset(templates)
         if page is not None:
-            serializer = TemplateListSerializer(page, many=True)
+            serializer = TemplateListSerializer(page, many=True, context=self.get_serializer_context())
             return self.get_paginated_response(serializer.data)
         
-        serializer = TemplateListSerializer(templates, many=True)
+        serializer = TemplateListSerializer(templates, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
@@ -108,10 +115,10 @@ class TemplateViewSet(viewsets.ModelViewSet):
         """
         queryset = Template.objects.filter(is_active=True)
         
-        # Optimize database queries
-        queryset = queryset.select_related('author', 'category').prefetch_related('fields')
-        
+        # Optimize database queries: list rows read annotations instead of
+        # per-template counts, other actions serialize the ordered fields
         if self.action == 'list':
+            queryset = queryset.for_list(self.request.user)
             # For list view, show public templates unless filtering by user
             if self.request.query_params.get('my_templates'):
                 if self.request.user.is_authenticated:
@@ -120,6 +127,8 @@ class TemplateViewSet(viewsets.ModelViewSet):
                     queryset = queryset.none()
             else:
                 queryset = queryset.filter(is_public=True)
+        else:
+            queryset = queryset.select_related('author', 'category').with_fields()
         
         return queryset
     
@@ -132,6 +141,10 @@ class TemplateViewSet(viewsets.ModelViewSet):
         elif self.action in ['create', 'update', 'partial_update']:
             return TemplateCreateUpdateSerializer
         return TemplateDetailSerializer
+
+    @query_budget(6)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def perform_create(self, serializer):
         """
@@ -238,6 +251,7 @@ class TemplateViewSet(viewsets.ModelViewSet):
         # Update template usage count
         template.usage_count = F('usage_count') + 1
         template.save(update_fields=['usage_count'])
+        mark_popularity_dirty(template.id)
         
         # Spend credits if required
         if template.category.name in ['Premium', 'AI-Powered']:
@@ -328,11 +342,8 @@ class TemplateViewSet(viewsets.ModelViewSet):
             user.experience_points += experience_points
             user.save(update_fields=['experience_points'])
             
-            # Update template completion rate
-            total_usages = template.usage_logs.count()
-            completed_usages = template.usage_logs.filter(was_completed=True).count()
-            template.completion_rate = completed_usages / total_usages if total_usages > 0 else 0
-            template.save(update_fields=['completion_rate'])
+            # Completion rate is recalculated with the popularity batch
+            mark_popularity_dirty(template.id)
             
             # Check for achievements
             GamificationService.check_achievements(user)
@@ -401,7 +412,8 @@ class TemplateViewSet(viewsets.ModelViewSet):
         
         serializer = TemplateRatingSerializer(data=request.data)
         if serializer.is_valid():
-            # Update or create rating
+            # Update or create rating; TemplateRating.save queues the
+            # template's average rating and popularity recalculation
             rating, created = TemplateRating.objects.update_or_create(
                 template=template,
                 user=request.user,
@@ -411,13 +423,6 @@ class TemplateViewSet(viewsets.ModelViewSet):
                 }
             )
             
-            # Update template average rating
-            avg_rating = template.ratings.aggregate(avg=Avg('rating'))['avg'] or 0
-            template.average_rating = round(avg_rating, 2)
-            
-            # Update popularity score
-            template.update_popularity_score()
-            
             # Track analytics
             AnalyticsService.track_event(
                 user=request.user,
@@ -447,14 +452,16 @@ class TemplateViewSet(viewsets.ModelViewSet):
         trending_templates = Template.objects.filter(
             is_active=True,
             is_public=True
-        ).annotate(
+        ).for_list(request.user).annotate(
             recent_usage=Count(
                 'usage_logs',
                 filter=Q(usage_logs__started_at__gte=week_ago)
             )
         ).order_by('-recent_usage', '-popularity_score')[:10]
         
-        serializer = TemplateListSerializer(trending_templates, many=True)
+        serializer = TemplateListSerializer(
+            trending_templates, many=True, context=self.get_serializer_context()
+        )
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -466,9 +473,11 @@ class TemplateViewSet(viewsets.ModelViewSet):
             is_active=True,
             is_public=True,
             is_featured=True
-        ).order_by('-created_at')[:5]
+        ).for_list(request.user).order_by('-created_at')[:5]
         
-        serializer = TemplateListSerializer(featured_templates, many=True)
+        serializer = TemplateListSerializer(
+            featured_templates, many=True, context=self.get_serializer_context()
+        )
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -485,15 +494,15 @@ class TemplateViewSet(viewsets.ModelViewSet):
         user_templates = Template.objects.filter(
             author=request.user,
             is_active=True
-        ).order_by('-created_at')
+        ).for_list(request.user).order_by('-created_at')
         
         # Apply pagination
         page = self.paginate_queryset(user_templates)
         if page is not None:
-            serializer = TemplateListSerializer(page, many=True)
+            serializer = TemplateListSerializer(page, many=True, context=self.get_serializer_context())
             return self.get_paginated_response(serializer.data)
         
-        serializer = TemplateListSerializer(user_templates, many=True)
+        serializer = TemplateListSerializer(user_templates, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
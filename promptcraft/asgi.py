@@ -15,6 +15,8 @@ from django.core.asgi import get_asgi_application
 environment = os.environ.get("DJANGO_ENVIRONMENT", "development")
 settings_module = f"promptcraft.settings.{environment}"
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+# Lets settings enable the native async views (ASYNC_AI_VIEWS)
+os.environ.setdefault("PROMPTCRAFT_SERVER", "asgi")
 
 # Initialize Django ASGI application early to ensure settings are loaded
 django_asgi_app = get_asgi_application()
@@ -22,9 +24,10 @@ django_asgi_app = get_asgi_application()
 try:
     # Import channels components after Django is set up
     from channels.routing import ProtocolTypeRouter, URLRouter
-    from channels.auth import AuthMiddlewareStack
     from channels.security.websocket import AllowedHostsOriginValidator
     from channels.middleware import BaseMiddleware
+    from apps.core.ws_auth import JWTAuthMiddlewareStack
+    from apps.core.lazy_routing import preload_consumers
 
     # Set up logging
     logger = logging.getLogger(__name__)
@@ -37,7 +40,9 @@ try:
                 logger.info(f"WebSocket connection from {scope.get('client', 'unknown')}")
             return await super().__call__(scope, receive, send)
 
-    # Import routing configurations with error handling
+    # Import routing configurations with error handling. Routes import their
+    # consumers (and the AI services behind them) on first connection, so
+    # HTTP-only workers never load them
     websocket_urlpatterns = []
 
     try:
@@ -61,6 +66,11 @@ try:
     except (ImportError, AttributeError) as e:
         logger.info(f"AI services routing not available: {e}")
 
+    # WebSocket workers can pay for the consumer imports at start instead
+    if os.environ.get("PROMPTCRAFT_PRELOAD_CONSUMERS"):
+        for consumer_path, error in preload_consumers(websocket_urlpatterns).items():
+            logger.warning(f"WebSocket consumer {consumer_path} unavailable: {error}")
+
     # Create ASGI application with WebSocket support
     application = ProtocolTypeRouter({
         # HTTP requests are handled by Django
@@ -69,7 +79,7 @@ try:
         # WebSocket connections are handled by Channels
         "websocket": AllowedHostsOriginValidator(
             LoggingMiddleware(
-                AuthMiddlewareStack(
+                JWTAuthMiddlewareStack(
                     URLRouter(websocket_urlpatterns)
                 )
             )
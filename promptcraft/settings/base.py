@@ -124,6 +124,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 # Base middleware
 MIDDLEWARE = [
+    "apps.core.middleware.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
 ]
 
@@ -198,6 +199,10 @@ AUTH_USER_MODEL = 'users.User'
 
 # Feature Flags
 FEATURE_RAG = config('FEATURE_RAG', default=False, cast=bool)
+# Serve the RAG retrieve/answer endpoints as native async views; only useful
+# under ASGI (promptcraft/asgi.py sets PROMPTCRAFT_SERVER=asgi), WSGI workers
+# run the function views on the background event loop instead
+ASYNC_AI_VIEWS = config('ASYNC_AI_VIEWS', default=os.environ.get('PROMPTCRAFT_SERVER') == 'asgi', cast=bool)
 
 # Internationalization
 LANGUAGE_CODE = "en-us"
@@ -404,6 +409,33 @@ WEBSOCKET_SETTINGS = {
     'WEBSOCKET_CONNECT_TIMEOUT': config('WEBSOCKET_CONNECT_TIMEOUT', default=10, cast=int),
 }
 
+# JWT handshake authentication (see apps/core/ws_auth.py)
+WS_AUTH = {
+    'USER_CACHE_TTL_S': config('WS_AUTH_USER_CACHE_TTL_S', default=30, cast=int),
+    'USER_CACHE_SIZE': 10000,
+    'TOKEN_CACHE_SIZE': 10000,
+}
+
+# Consumer heartbeats and idle timeouts (see apps/core/timer_wheel.py)
+HEARTBEATS = {
+    'TICK_S': config('HEARTBEAT_TICK_S', default=1.0, cast=float),
+    'JITTER': 0.1,
+    'BATCH_SIZE': 500,
+}
+
+# Coalesced group broadcasts (see apps/core/fanout.py)
+FANOUT = {
+    'WINDOW_MS': config('FANOUT_WINDOW_MS', default=5, cast=int),
+    'MAX_FRAMES': 100,
+}
+
+# Binary WebSocket frames, chosen by the client's subprotocol (see apps/core/ws_protocol.py)
+WS_PROTOCOL = {
+    'COMPRESS_MIN_BYTES': 512,
+    'COMPRESS_LEVEL': 6,
+    'MAX_FRAME_BYTES': config('WS_MAX_FRAME_BYTES', default=1024 * 1024, cast=int),
+}
+
 # ==================================================
 # CHAT STREAMING & SSE CONFIGURATION
 # ==================================================
@@ -411,6 +443,44 @@ WEBSOCKET_SETTINGS = {
 # Chat Transport Mode (ws or sse)
 CHAT_TRANSPORT = config('CHAT_TRANSPORT', default='sse')  # values: "sse" | "ws"
 
+# Batched chat message writes from WebSocket consumers (see apps/templates/message_writer.py)
+CHAT_PERSISTENCE = {
+    'BATCH_SIZE': config('CHAT_PERSISTENCE_BATCH_SIZE', default=200, cast=int),
+    'FLUSH_MS': config('CHAT_PERSISTENCE_FLUSH_MS', default=50, cast=int),
+    'HISTORY_WINDOW': 50,
+}
+
+# Priority queues for blocking LangChain calls (see apps/templates/llm_scheduler.py)
+LLM_SCHEDULER = {
+    'QUEUES': {
+        'interactive': {
+            'CONCURRENCY': config('LLM_INTERACTIVE_CONCURRENCY', default=4, cast=int),
+            'MAX_WAIT_MS': config('LLM_INTERACTIVE_MAX_WAIT_MS', default=2000, cast=int),
+        },
+        'background': {
+            'CONCURRENCY': config('LLM_BACKGROUND_CONCURRENCY', default=2, cast=int),
+            'MAX_WAIT_MS': config('LLM_BACKGROUND_MAX_WAIT_MS', default=30000, cast=int),
+        },
+    },
+}
+
+# Exact and semantic cache of LLM responses (see apps/core/llm_cache.py)
+LLM_CACHE = {
+    'ENABLED': config('LLM_CACHE_ENABLED', default=True, cast=bool),
+    'THRESHOLD': config('LLM_CACHE_THRESHOLD', default=0.95, cast=float),
+    'TASK_THRESHOLDS': {
+        'intent': config('LLM_CACHE_INTENT_THRESHOLD', default=0.92, cast=float),
+        # Prompt-specific answers: exact repeats only, unless a threshold is given
+        'optimize': config('LLM_CACHE_OPTIMIZE_THRESHOLD', default='',
+                           cast=lambda value: float(value) if value else None),
+        'assessment': config('LLM_CACHE_ASSESSMENT_THRESHOLD', default='',
+                             cast=lambda value: float(value) if value else None),
+    },
+    'MAX_ENTRIES': config('LLM_CACHE_MAX_ENTRIES', default=2000, cast=int),
+    'SHADOW_RATE': config('LLM_CACHE_SHADOW_RATE', default=0.0, cast=float),
+    'RECORD_PATH': config('LLM_CACHE_RECORD_PATH', default=''),
+}
+
 # External AI Provider Configuration (for SSE proxy)
 # ZAI_API_TOKEN = config('ZAI_API_TOKEN', default='')
 # ZAI_API_BASE = config('ZAI_API_BASE', default='https://api.z.ai/api/paas/v4')
@@ -488,6 +558,143 @@ RESEARCH = {
 # Tavily API Configuration
 TAVILY_API_KEY = config('TAVILY_API_KEY', default='')
 
+# ==================================================
+# REQUEST METRICS (apps/core/metrics.py)
+# ==================================================
+
+# Directory (ideally tmpfs, e.g. /dev/shm/promptcraft-metrics) where each
+# worker maps its histograms so /metrics/ reports all workers; empty keeps
+# them per-process. Clear it on deploy, like prometheus multiprocess mode.
+METRICS_SHARED_DIR = config('METRICS_SHARED_DIR', default='')
+# Bearer token for the /metrics/ scrape endpoint; empty allows staff only
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+
+# ==================================================
+# ANALYTICS INGESTION (apps/analytics/ingest.py)
+# ==================================================
+
+ANALYTICS_INGEST = {
+    'FLUSH_SIZE': config('ANALYTICS_FLUSH_SIZE', default=500, cast=int),
+    'FLUSH_INTERVAL_S': config('ANALYTICS_FLUSH_INTERVAL_S', default=2.0, cast=float),
+    'MAX_QUEUE': config('ANALYTICS_MAX_QUEUE', default=20000, cast=int),
+    'BATCH_SIZE': config('ANALYTICS_BATCH_SIZE', default=500, cast=int),
+    'MAX_EVENTS_PER_REQUEST': 500,
+    'MAX_BODY_BYTES': 1024 * 1024,
+}
+
+# ==================================================
+# ANALYTICS ROLLUPS AND PARTITIONS
+# ==================================================
+
+# Incremental event rollups (see apps/analytics/rollups.py)
+ANALYTICS_ROLLUPS = {
+    'LAG_S': config('ANALYTICS_ROLLUP_LAG_S', default=300, cast=int),
+    'WINDOW_HOURS': 24,
+    'MAX_WINDOWS': 48,
+    'HOURLY_RETENTION_DAYS': config('ANALYTICS_HOURLY_RETENTION_DAYS', default=90, cast=int),
+}
+
+# Monthly partitions of analytics_events, PostgreSQL only (see apps/analytics/partitions.py)
+ANALYTICS_PARTITIONS = {
+    'MONTHS_AHEAD': 3,
+    'RETAIN_MONTHS': config('ANALYTICS_RETAIN_MONTHS', default=13, cast=int),
+    'ARCHIVE_SCHEMA': config('ANALYTICS_ARCHIVE_SCHEMA', default='analytics_archive'),
+}
+
+# Oldest dashboard snapshot served before recomputing it inline (see apps/analytics/dashboard.py)
+DASHBOARD_SNAPSHOT_MAX_AGE_S = config('DASHBOARD_SNAPSHOT_MAX_AGE_S', default=300, cast=int)
+
+# ==================================================
+# IDEMPOTENT REPLAY (apps/core/idempotency.py)
+# ==================================================
+
+# Results of AI optimize/answer requests replayed to duplicates of the same request
+IDEMPOTENCY = {
+    'TTL_S': config('IDEMPOTENCY_TTL_S', default=3600, cast=int),
+    'LOCK_TTL_S': 120,
+    'WAIT_TIMEOUT_S': 90,
+}
+
+# ==================================================
+# RAG OPTIMIZATION STREAMING (apps/ai_services/llm_stream.py)
+# ==================================================
+
+# Token streaming for StreamingRAGAgent.optimize_prompt_stream; uses the first
+# provider above with an API key unless PROVIDER names one
+RAG_STREAMING = {
+    'PROVIDER': config('RAG_STREAMING_PROVIDER', default=''),
+    'CHECKSUM_EVERY': 20,
+    'MAX_PENDING_CHARS': 16384,
+}
+
+# As-you-type search over ws/search/ (see apps/ai_services/live_search.py)
+LIVE_SEARCH = {
+    'DEBOUNCE_MS': config('LIVE_SEARCH_DEBOUNCE_MS', default=150, cast=int),
+    'MAX_RESULTS': 10,
+    'WORKERS': config('LIVE_SEARCH_WORKERS', default=4, cast=int),
+}
+
+# Embedding search over PromptLibrary (see apps/templates/semantic_search.py);
+# BACKEND 'auto' uses hnswlib or faiss when installed, else a NumPy IVF index
+SEMANTIC_SEARCH = {
+    'INDEX_DIR': config('SEMANTIC_INDEX_DIR', default=''),
+    'BACKEND': config('SEMANTIC_SEARCH_BACKEND', default='auto'),
+    'CANDIDATES': 50,
+    'RRF_K': 60,
+}
+
+# ==================================================
+# BILLING ENTITLEMENTS AND QUOTAS
+# ==================================================
+
+# Cached per-user entitlements (see apps/billing/entitlements.py)
+BILLING_ENTITLEMENTS = {
+    'TTL_S': config('BILLING_ENTITLEMENT_TTL_S', default=3600, cast=int),
+    'DAILY_API_CALL_LIMIT': config('BILLING_DAILY_API_CALL_LIMIT', default=50, cast=int),
+    'TRIAL_API_CALL_LIMIT': 3,
+}
+
+# Redis daily quota counters (see apps/billing/quotas.py)
+BILLING_QUOTAS = {
+    'EXPIRY_GRACE_S': 6 * 3600,
+    'FLUSH_BATCH_SIZE': 500,
+}
+
+# ==================================================
+# CELERY BEAT SCHEDULE
+# ==================================================
+
+# Whether this deploy runs a Celery beat and a worker for CELERY_BEAT_SCHEDULE; without them,
+# work those tasks would batch is done inline (see apps/templates/popularity.py)
+PERIODIC_TASKS_ENABLED = config('PERIODIC_TASKS_ENABLED', default=False, cast=bool)
+
+CELERY_BEAT_SCHEDULE = {
+    'recalculate-template-popularity': {
+        'task': 'apps.templates.tasks.recalculate_dirty_popularity',
+        'schedule': config('TEMPLATE_POPULARITY_INTERVAL_S', default=300.0, cast=float),
+    },
+    'roll-up-analytics-events': {
+        'task': 'apps.analytics.tasks.roll_up_analytics_events',
+        'schedule': config('ANALYTICS_ROLLUP_INTERVAL_S', default=300.0, cast=float),
+    },
+    'recompute-dashboard-snapshots': {
+        'task': 'apps.analytics.tasks.recompute_dashboard_snapshots',
+        'schedule': config('DASHBOARD_SNAPSHOT_INTERVAL_S', default=30.0, cast=float),
+    },
+    'flush-quota-counters': {
+        'task': 'apps.billing.tasks.flush_quota_counters',
+        'schedule': config('BILLING_QUOTA_FLUSH_INTERVAL_S', default=60.0, cast=float),
+    },
+    'index-new-prompts': {
+        'task': 'apps.templates.tasks.index_new_prompts',
+        'schedule': config('SEMANTIC_INDEX_INTERVAL_S', default=60.0, cast=float),
+    },
+    'maintain-analytics-partitions': {
+        'task': 'apps.analytics.tasks.maintain_analytics_partitions',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
+
 # ==================================================
 # GRAPHQL CONFIGURATION
 # ==================================================
@@ -498,6 +705,7 @@ if 'graphene_django' in THIRD_PARTY_APPS:
         'SCHEMA': 'apps.prompt_history.schema.schema',
         'MIDDLEWARE': [
             'graphene_django.debug.DjangoDebugMiddleware',
+            'apps.prompt_history.complexity.FieldTimingMiddleware',
         ],
         # Relay connection settings
         'RELAY_CONNECTION_ENFORCE_FIRST_OR_LAST': True,
@@ -510,3 +718,11 @@ if 'graphene_django' in THIRD_PARTY_APPS:
         'MAX_PAGE_SIZE': 100,
         'ATOMIC_MUTATIONS': True,
     }
+
+    # Static query cost budgets (see apps/prompt_history/complexity.py)
+    GRAPHQL_QUERY_COST_LIMITS = {
+        'anonymous': config('GRAPHQL_COST_LIMIT_ANONYMOUS', default=100, cast=int),
+        'authenticated': config('GRAPHQL_COST_LIMIT_AUTHENTICATED', default=5000, cast=int),
+        'staff': config('GRAPHQL_COST_LIMIT_STAFF', default=50000, cast=int),
+        'max_depth': config('GRAPHQL_MAX_DEPTH', default=10, cast=int),
+    }
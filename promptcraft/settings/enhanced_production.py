@@ -493,7 +493,7 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = True
 
-# Task routing
+# Task routing (promptcraft/celery.py sets task_routes after loading settings, so its routes win)
 CELERY_TASK_ROUTES = {
     'research_agent.*': {'queue': 'research'},
     'apps.ai_services.*': {'queue': 'ai'},
@@ -513,7 +513,9 @@ CELERY_TASK_SEND_SENT_EVENT = True
 CELERY_SEND_EVENTS = True
 CELERY_WORKER_SEND_TASK_EVENTS = True
 
-# Beat schedule
+# Beat schedule (docker-compose.production.yml runs the beat and a worker on every routed queue)
+PERIODIC_TASKS_ENABLED = config('PERIODIC_TASKS_ENABLED', default=True, cast=bool)
+
 CELERY_BEAT_SCHEDULE = {
     'cleanup-expired-tokens': {
         'task': 'apps.users.tasks.cleanup_expired_tokens',
@@ -523,6 +525,37 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.analytics.tasks.update_daily_analytics',
         'schedule': 86400.0,  # Daily
     },
+    'recalculate-template-popularity': {
+        'task': 'apps.templates.tasks.recalculate_dirty_popularity',
+        'schedule': config('TEMPLATE_POPULARITY_INTERVAL_S', default=300.0, cast=float),
+    },
+    'roll-up-analytics-events': {
+        'task': 'apps.analytics.tasks.roll_up_analytics_events',
+        'schedule': config('ANALYTICS_ROLLUP_INTERVAL_S', default=300.0, cast=float),
+    },
+    'maintain-analytics-partitions': {
+        'task': 'apps.analytics.tasks.maintain_analytics_partitions',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'recompute-dashboard-snapshots': {
+        'task': 'apps.analytics.tasks.recompute_dashboard_snapshots',
+        'schedule': config('DASHBOARD_SNAPSHOT_INTERVAL_S', default=30.0, cast=float),
+    },
+    'flush-quota-counters': {
+        'task': 'apps.billing.tasks.flush_quota_counters',
+        'schedule': config('BILLING_QUOTA_FLUSH_INTERVAL_S', default=60.0, cast=float),
+    },
+    'index-new-prompts': {
+        'task': 'apps.templates.tasks.index_new_prompts',
+        'schedule': config('SEMANTIC_INDEX_INTERVAL_S', default=60.0, cast=float),
+    },
+}
+
+# The worker writes the semantic index and web processes read it, so INDEX_DIR must be
+# storage both see (docker-compose.production.yml mounts a shared volume there)
+SEMANTIC_SEARCH = {
+    'INDEX_DIR': config('SEMANTIC_INDEX_DIR', default=''),
+    'BACKEND': config('SEMANTIC_SEARCH_BACKEND', default='auto'),
 }
 
 # =============================================================================
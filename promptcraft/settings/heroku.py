@@ -106,6 +106,7 @@ INSTALLED_APPS = [
 # WhiteNoise MUST come right after SecurityMiddleware for static files.
 # We rebuild the order explicitly to avoid insert/append ordering issues.
 MIDDLEWARE = [
+    'apps.core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',           # CORS - must be before CommonMiddleware
@@ -15,6 +15,12 @@ DATABASES = {
     }
 }
 
+# PostgreSQL-only tests (analytics partitioning) run when a server is given
+TEST_DATABASE_URL = config('TEST_DATABASE_URL', default='')
+if TEST_DATABASE_URL:
+    import dj_database_url
+    DATABASES['default'] = dj_database_url.parse(TEST_DATABASE_URL)
+
 # Faster password hashing for testing
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.MD5PasswordHasher',
@@ -39,8 +45,17 @@ CACHES = {
     }
 }
 
+# base.py keeps sessions in a 'sessions' cache alias, which the test CACHES do not define
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
 # Email settings for testing
 EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
 
 # Celery settings for testing
 CELERY_TASK_ALWAYS_EAGER = True  # Run tasks synchronously in tests
+
+# Fail list views that exceed their query budget (see apps.core.query_budget)
+QUERY_BUDGET_STRICT = True
+
+# Flush buffered analytics events inline instead of from a background thread
+ANALYTICS_INGEST = dict(ANALYTICS_INGEST, BACKGROUND_FLUSH=False)
@@ -20,7 +20,7 @@ except ImportError:
 
 # GraphQL optional
 try:
-    from graphene_django.views import GraphQLView
+    from apps.prompt_history.complexity import CostLimitedGraphQLView
     from apps.prompt_history.schema import schema as graphql_schema
     GRAPHQL_AVAILABLE = True
 except ImportError:
@@ -150,7 +150,7 @@ if DRF_SPECTACULAR_AVAILABLE:
 # GraphQL endpoint (optional - requires graphene-django)
 if GRAPHQL_AVAILABLE and graphql_schema:
     urlpatterns.extend([
-        path('api/graphql/', csrf_exempt(GraphQLView.as_view(schema=graphql_schema, graphiql=settings.DEBUG)), name='graphql'),
+        path('api/graphql/', csrf_exempt(CostLimitedGraphQLView.as_view(schema=graphql_schema, graphiql=settings.DEBUG)), name='graphql'),
     ])
 
 urlpatterns.extend([